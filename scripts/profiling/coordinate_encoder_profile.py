@@ -0,0 +1,87 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+## run python $NUPIC/scripts/profiling/coordinate_encoder_profile.py [nFixes]
+
+import sys
+import time
+
+import numpy
+
+from nupic.encoders.geospatial_coordinate import GeospatialCoordinateEncoder
+
+
+
+def syntheticTrack(nFixes, timestep, seed=42):
+  """
+  Generates a GPS track of a vehicle wandering around San Francisco, with
+  its speed changing between walking and driving.
+
+  @param nFixes number of GPS fixes
+  @param timestep time between fixes (in seconds)
+
+  @return list of (speed, longitude, latitude, altitude) tuples
+  """
+  rng = numpy.random.RandomState(seed)
+  longitude, latitude = -122.4194, 37.7749
+  heading = 0.0
+  speed = 10.0
+  track = []
+  for _ in xrange(nFixes):
+    heading += rng.normal(0, 0.2)
+    speed = float(numpy.clip(speed + rng.normal(0, 1.0), 1.0, 30.0))
+    distance = speed * timestep
+    # About 111km per degree of latitude
+    latitude += distance * numpy.cos(heading) / 111000.0
+    longitude += (distance * numpy.sin(heading) /
+                  (111000.0 * numpy.cos(numpy.radians(latitude))))
+    track.append((speed, longitude, latitude, None))
+  return track
+
+
+
+def profileCoordinateEncoder(nFixes, scale=30, timestep=60):
+  track = syntheticTrack(nFixes, timestep)
+
+  encoders = (
+    ("md5, no cache", GeospatialCoordinateEncoder(
+      scale, timestep, n=999, w=25, coordinateCacheSize=0)),
+    ("md5, cache", GeospatialCoordinateEncoder(scale, timestep, n=999, w=25)),
+    ("fast", GeospatialCoordinateEncoder(scale, timestep, n=999, w=25,
+                                         hashing="fast")),
+  )
+
+  for name, encoder in encoders:
+    start = time.time()
+    for fix in track:
+      encoder.encode(fix)
+    elapsed = time.time() - start
+    print "  %-14s %8.3f ms per fix" % (name, 1000.0 * elapsed / nFixes)
+
+
+
+if __name__ == "__main__":
+  nFixes = 1000
+
+  if len(sys.argv) == 2: # nFixes
+    nFixes = int(sys.argv[1])
+
+  profileCoordinateEncoder(nFixes)
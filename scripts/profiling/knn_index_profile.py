@@ -0,0 +1,93 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+## run python $NUPIC/scripts/profiling/knn_index_profile.py [nPatterns nQueries]
+
+import sys
+import time
+
+import numpy
+
+from nupic.algorithms.knn_classifier import KNNClassifier
+
+
+def profileKNN(nPatterns, nQueries, distanceMethod, k=3,
+               inputWidth=2048, numActive=40, numCategories=10):
+  """
+  Compares inference with and without the overlap index of the KNNClassifier.
+
+  Queries are stored patterns with a quarter of their active bits moved. The
+  recall is the fraction of queries for which the indexed classifier finds
+  neighbors at the same distances as the brute-force one.
+
+  @param nPatterns number of patterns stored in the classifiers
+  @param nQueries number of inferences timed
+  @param distanceMethod overlap distance method of the classifiers
+  @param inputWidth number of bits of the patterns
+  """
+  rng = numpy.random.RandomState(42)
+  patterns = [numpy.sort(rng.choice(inputWidth, numActive, replace=False))
+              for _ in xrange(nPatterns)]
+
+  bruteForce = KNNClassifier(k=k, distanceMethod=distanceMethod)
+  indexed = KNNClassifier(k=k, distanceMethod=distanceMethod,
+                          useOverlapIndex=True)
+  for i, pattern in enumerate(patterns):
+    bruteForce.learn(pattern, i % numCategories, isSparse=inputWidth)
+    indexed.learn(pattern, i % numCategories, isSparse=inputWidth)
+
+  queries = []
+  for _ in xrange(nQueries):
+    query = numpy.zeros(inputWidth)
+    active = patterns[rng.randint(nPatterns)]
+    query[active[numActive / 4:]] = 1.0
+    query[rng.choice(inputWidth, numActive / 4, replace=False)] = 1.0
+    queries.append(query)
+
+  results = {}
+  for name, knn in (("brute force", bruteForce), ("indexed", indexed)):
+    start = time.time()
+    results[name] = [knn.infer(query) for query in queries]
+    elapsed = time.time() - start
+    print "  %-12s %8.3f ms per inference" % (name,
+                                              1000.0 * elapsed / nQueries)
+
+  matches = 0
+  for expected, actual in zip(results["brute force"], results["indexed"]):
+    matches += numpy.array_equal(numpy.sort(expected[2])[:k],
+                                 numpy.sort(actual[2])[:k])
+  print "  recall       %8.3f" % (float(matches) / nQueries)
+
+
+
+if __name__ == "__main__":
+  nPatterns = 20000
+  nQueries = 200
+
+  if len(sys.argv) == 3: # nPatterns, nQueries
+    nPatterns = int(sys.argv[1])
+    nQueries = int(sys.argv[2])
+
+  # Spatial pooler columns and temporal memory cells
+  for inputWidth in (2048, 65536):
+    for distanceMethod in ("rawOverlap", "pctOverlapOfInput"):
+      print "%s, %d bits:" % (distanceMethod, inputWidth)
+      profileKNN(nPatterns, nQueries, distanceMethod, inputWidth=inputWidth)
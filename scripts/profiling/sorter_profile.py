@@ -0,0 +1,96 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+## run python $NUPIC/scripts/profiling/sorter_profile.py [nRecords] [workDir]
+## 20000000 records make a dataset of about 2GB
+
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy
+
+from nupic.data.file_record_stream import FileRecordStream
+from nupic.data import sorter
+
+
+
+def writeDataset(filename, nRecords, seed=42):
+  """
+  Writes a dataset of metrics of a few hundred gyms, in time order.
+
+  @param filename name of the dataset file
+  @param nRecords number of records
+  """
+  rng = numpy.random.RandomState(seed)
+  fields = [("timestamp", "datetime", ""),
+            ("gym", "string", ""),
+            ("consumption", "float", ""),
+            ("visits", "int", "")]
+  start = datetime.datetime(2010, 1, 1)
+  with FileRecordStream(filename, write=True, fields=fields) as o:
+    batch = 100000
+    for first in xrange(0, nRecords, batch):
+      n = min(batch, nRecords - first)
+      gyms = rng.randint(0, 500, n)
+      consumption = rng.uniform(0, 100, n)
+      visits = rng.randint(0, 1000, n)
+      o.appendRecords(
+        [start + datetime.timedelta(seconds=first + i), "gym_%d" % gyms[i],
+         float(consumption[i]), int(visits[i])] for i in xrange(n))
+
+
+
+def profileSorter(nRecords, workDir):
+  filename = os.path.join(workDir, "input.csv")
+  outputFile = os.path.join(workDir, "output.csv")
+
+  start = time.time()
+  writeDataset(filename, nRecords)
+  print "Wrote %d records (%.0f MB) in %.1f s" % (
+    nRecords, os.path.getsize(filename) / 2.0**20, time.time() - start)
+
+  for numWorkers in (1, 4):
+    start = time.time()
+    sorter.sort(filename, key=["gym", "timestamp"], outputFile=outputFile,
+                numWorkers=numWorkers, tempDir=workDir)
+    print "  %d worker(s): %8.1f s" % (numWorkers, time.time() - start)
+    os.remove(outputFile)
+
+
+
+if __name__ == "__main__":
+  nRecords = 1000000
+  workDir = None
+
+  if len(sys.argv) >= 2: # nRecords
+    nRecords = int(sys.argv[1])
+  if len(sys.argv) >= 3: # workDir
+    workDir = sys.argv[2]
+
+  workDir = tempfile.mkdtemp(dir=workDir)
+  try:
+    profileSorter(nRecords, workDir)
+  finally:
+    shutil.rmtree(workDir)
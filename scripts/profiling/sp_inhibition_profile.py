@@ -0,0 +1,67 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+## run python $NUPIC/scripts/profiling/sp_inhibition_profile.py [nRuns]
+
+import sys
+import timeit
+
+import numpy
+
+from nupic.algorithms.spatial_pooler import SpatialPooler, realDType
+
+
+
+def profileGlobalInhibition(nColumns, nRuns, density=0.02):
+  """
+  Measures the time SpatialPooler takes to pick the winning columns with
+  global inhibition, for random overlaps with many ties.
+
+  @param nColumns number of columns in SP
+  @param nRuns number of inhibition rounds to time
+  @param density fraction of columns to select
+  @returns the average duration of an inhibition round, in seconds
+  """
+  sp = SpatialPooler(inputDimensions=[32],
+                     columnDimensions=[32],
+                     globalInhibition=True,
+                     stimulusThreshold=1,
+                     seed=42)
+  # Only the number of columns matters for global inhibition
+  sp._numColumns = nColumns
+
+  rng = numpy.random.RandomState(42)
+  overlaps = rng.randint(0, 40, nColumns).astype(realDType)
+
+  timer = timeit.Timer(lambda: sp._inhibitColumnsGlobal(overlaps, density))
+  return timer.timeit(nRuns) / nRuns
+
+
+
+if __name__ == "__main__":
+  runs = 1000
+  # read params from command line
+  if len(sys.argv) == 2: # 1 arg + name
+    runs = int(sys.argv[1])
+
+  for columns in (2048, 4096, 8192, 16384, 32768, 65536):
+    duration = profileGlobalInhibition(columns, runs)
+    print "%6d columns: %.4f ms" % (columns, duration * 1000)
@@ -80,6 +80,24 @@ Every once in a while update estimator with a lot of recent data.
      estimateAnomalyLikelihoods(lots_of_metric_data)
 
 
+Batch Function Usage
+++++++++++++++++++++
+
+:func:`~.anomaly_likelihood.estimateAnomalyLikelihoodsBatch` and
+:func:`~.anomaly_likelihood.updateAnomalyLikelihoodsBatch` compute the same
+likelihoods from numpy arrays of anomaly scores, which is much faster when
+backfilling long histories. A 2D array scores many metrics at once, one metric
+per row, with a list of params, one per metric.
+
+.. code-block:: python
+
+   likelihoods, averagedScores, estimatorParams = \\
+     estimateAnomalyLikelihoodsBatch(scores, metricValues=values)
+
+   likelihoods, averagedScores, estimatorParams = \\
+     updateAnomalyLikelihoodsBatch(moreScores, estimatorParams)
+
+
 PARAMS
 ++++++
 
@@ -115,12 +133,12 @@ structure. Note: the client does not need to know the details of this.
 """
 
 import collections
+import itertools
 import math
 import numbers
 import numpy
 
 from nupic.serializable import Serializable
-from nupic.utils import MovingAverage
 
 try:
   import capnp
@@ -144,8 +162,16 @@ class AnomalyLikelihood(Serializable):
         anomalyProbability = anomalyLikelihood.anomalyProbability(
             value, anomalyScore, timestamp)
 
+  Each call takes constant time. Instead of re-running
+  :func:`estimateAnomalyLikelihoods` over the whole sliding window, the class
+  keeps running statistics of the averaged anomaly scores and metric values
+  in the window, and re-estimates the distribution from them.
   """
 
+  # Number of anomaly scores averaged before estimating their likelihood, as in
+  # estimateAnomalyLikelihoods
+  _AVERAGING_WINDOW = 10
+
 
   def __init__(self,
                claLearningPeriod=None,
@@ -191,6 +217,17 @@ class AnomalyLikelihood(Serializable):
     self._historicalScores = collections.deque(maxlen=historicWindowSize)
     self._distribution = None
 
+    # Moving average of the anomaly scores, and the averaged score of each
+    # record in the sliding window
+    self._recentScores = collections.deque(maxlen=self._AVERAGING_WINDOW)
+    self._recentScoresTotal = 0.0
+    self._averagedScores = collections.deque(maxlen=historicWindowSize)
+
+    # Statistics of the records in the sliding window past the learning period
+    self._scoreStatistics = _RunningStatistics()
+    self._valueStatistics = _RunningStatistics()
+    self._numNonNumericValues = 0
+
 
     if claLearningPeriod != None:
       print("claLearningPeriod is deprecated, use learningPeriod instead.")
@@ -214,6 +251,14 @@ class AnomalyLikelihood(Serializable):
     # pylint: enable=W0212
 
 
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+
+    # Instances pickled before the running statistics were added
+    if "_averagedScores" not in state:
+      self._restoreRunningState()
+
+
   def __str__(self):
     return ("AnomalyLikelihood: %s %s %s %s %s %s" % (
       self._iteration,
@@ -304,6 +349,7 @@ class AnomalyLikelihood(Serializable):
     anomalyLikelihood._probationaryPeriod = proto.probationaryPeriod
     anomalyLikelihood._learningPeriod = proto.learningPeriod
     anomalyLikelihood._reestimationPeriod = proto.reestimationPeriod
+    anomalyLikelihood._restoreRunningState()
     # pylint: enable=W0212
 
     return anomalyLikelihood
@@ -374,31 +420,218 @@ class AnomalyLikelihood(Serializable):
     # We ignore the first probationaryPeriod data points
     if self._iteration < self._probationaryPeriod:
       likelihood = 0.5
+      averagedScore = self._updateMovingAverage(anomalyScore)
     else:
       # On a rolling basis we re-estimate the distribution
       if ( (self._distribution is None) or
            (self._iteration % self._reestimationPeriod == 0) ):
+        self._estimateDistribution()
 
-        numSkipRecords = self._calcSkipRecords(
-          numIngested=self._iteration,
-          windowSize=self._historicalScores.maxlen,
-          learningPeriod=self._learningPeriod)
+      averagedScore = self._updateMovingAverage(anomalyScore)
+      likelihood = 1.0 - self._updateLikelihood(averagedScore)
 
-        _, _, self._distribution = estimateAnomalyLikelihoods(
-          self._historicalScores,
-          skipRecords=numSkipRecords)
+    # Before we exit update historical scores and iteration
+    self._appendToWindow(dataPoint, averagedScore)
+    self._iteration += 1
 
-      likelihoods, _, self._distribution = updateAnomalyLikelihoods(
-        [dataPoint],
-        self._distribution)
+    # Recompute the running statistics each time the window has been replaced,
+    # so that rounding errors don't accumulate
+    if self._iteration % self._historicalScores.maxlen == 0:
+      self._resetStatistics()
 
-      likelihood = 1.0 - likelihoods[0]
+    return likelihood
+
+
+  def _updateMovingAverage(self, anomalyScore):
+    """
+    Adds an anomaly score to the moving average of the anomaly scores, the same
+    way as :meth:`nupic.utils.MovingAverage.compute`.
+
+    :param anomalyScore: the current anomaly score
+    :returns: the averaged anomaly score
+    """
+    if len(self._recentScores) == self._recentScores.maxlen:
+      self._recentScoresTotal -= self._recentScores[0]
+
+    self._recentScores.append(anomalyScore)
+    self._recentScoresTotal += anomalyScore
+
+    if self._distribution is not None:
+      self._distribution["movingAverage"]["total"] = self._recentScoresTotal
+
+    return float(self._recentScoresTotal) / len(self._recentScores)
+
+
+  def _updateLikelihood(self, averagedScore):
+    """
+    Computes the likelihood of an averaged anomaly score with the current
+    distribution, like :func:`updateAnomalyLikelihoods` does for one record.
+
+    :param averagedScore: the averaged anomaly score
+    :returns: the filtered likelihood
+    """
+    likelihood = tailProbability(averagedScore,
+                                 self._distribution["distribution"])
+
+    historicalLikelihoods = self._distribution["historicalLikelihoods"]
+    if historicalLikelihoods:
+      filteredLikelihood = _filterLikelihood(likelihood,
+                                             historicalLikelihoods[-1])
+    else:
+      filteredLikelihood = likelihood
+    historicalLikelihoods.append(likelihood)
+
+    return filteredLikelihood
+
+
+  def _estimateDistribution(self):
+    """
+    Re-estimates the distribution of the averaged anomaly scores in the sliding
+    window, giving the same parameters as :func:`estimateAnomalyLikelihoods`
+    with the records of the learning period skipped.
+    """
+    numRecords = len(self._historicalScores)
+    if numRecords == 0:
+      raise ValueError("Must have at least one anomalyScore")
+    firstRecord = self._iteration - numRecords
+
+    # estimateAnomalyLikelihoods starts its moving average at the beginning of
+    # the window, so the first records of the window have averages over fewer
+    # scores than the ones we keep.
+    windowAverages = []
+    total = 0.0
+    for record in itertools.islice(self._historicalScores,
+                                   min(self._AVERAGING_WINDOW - 1, numRecords)):
+      total += record[2]
+      windowAverages.append(total / (len(windowAverages) + 1))
+
+    scoreStatistics = self._scoreStatistics.copy()
+    for i, average in enumerate(windowAverages):
+      if firstRecord + i >= self._learningPeriod:
+        scoreStatistics.remove(self._averagedScores[i])
+        scoreStatistics.add(average)
+
+    if scoreStatistics.count == 0:
+      distributionParams = nullDistribution()
+    else:
+      distributionParams = _normalDistribution(scoreStatistics.mean,
+                                               scoreStatistics.variance)
+
+      # Flat metric values are not anomalous, see estimateAnomalyLikelihoods
+      if (self._numNonNumericValues == 0 and
+          self._valueStatistics.variance < 1.5e-5):
+        distributionParams = nullDistribution()
+
+    # The moving average and the likelihoods continue from the last records of
+    # the window
+    numRecent = min(self._AVERAGING_WINDOW, numRecords)
+    recentRecords = list(itertools.islice(reversed(self._historicalScores),
+                                          numRecent))[::-1]
+    recentAverages = list(itertools.islice(reversed(self._averagedScores),
+                                           numRecent))[::-1]
+    for i in xrange(numRecords - numRecent, len(windowAverages)):
+      recentAverages[i - numRecords + numRecent] = windowAverages[i]
+
+    self._recentScores = collections.deque(
+      (record[2] for record in recentRecords), maxlen=self._AVERAGING_WINDOW)
+    self._recentScoresTotal = float(sum(self._recentScores))
+
+    self._distribution = {
+      "distribution": distributionParams,
+      "movingAverage": {
+        "historicalValues": self._recentScores,
+        "total": self._recentScoresTotal,
+        "windowSize": self._AVERAGING_WINDOW,
+      },
+      "historicalLikelihoods": collections.deque(
+        (tailProbability(average, distributionParams)
+         for average in recentAverages),
+        maxlen=self._AVERAGING_WINDOW),
+    }
+
+
+  def _appendToWindow(self, dataPoint, averagedScore):
+    """
+    Appends a record to the sliding window and updates the running statistics
+    with the records entering and leaving it.
+
+    :param dataPoint: (timestamp, value, anomalyScore) tuple of the record
+    :param averagedScore: the averaged anomaly score of the record
+    """
+    if len(self._historicalScores) == self._historicalScores.maxlen:
+      self._removeStatistics(
+        self._iteration - len(self._historicalScores),
+        self._historicalScores[0][1], self._averagedScores[0])
 
-    # Before we exit update historical scores and iteration
     self._historicalScores.append(dataPoint)
-    self._iteration += 1
+    self._averagedScores.append(averagedScore)
+    self._addStatistics(self._iteration, dataPoint[1], averagedScore)
 
-    return likelihood
+
+  def _addStatistics(self, recordNum, value, averagedScore):
+    if not isinstance(value, numbers.Number):
+      self._numNonNumericValues += 1
+    # Records of the learning period are left out of the estimate
+    if recordNum >= self._learningPeriod:
+      self._scoreStatistics.add(averagedScore)
+      if isinstance(value, numbers.Number):
+        self._valueStatistics.add(value)
+
+
+  def _removeStatistics(self, recordNum, value, averagedScore):
+    if not isinstance(value, numbers.Number):
+      self._numNonNumericValues -= 1
+    if recordNum >= self._learningPeriod:
+      self._scoreStatistics.remove(averagedScore)
+      if isinstance(value, numbers.Number):
+        self._valueStatistics.remove(value)
+
+
+  def _resetStatistics(self):
+    """
+    Recomputes the running statistics from the records in the sliding window.
+    """
+    self._scoreStatistics = _RunningStatistics()
+    self._valueStatistics = _RunningStatistics()
+    self._numNonNumericValues = 0
+
+    firstRecord = self._iteration - len(self._historicalScores)
+    for i, (record, averagedScore) in enumerate(
+        itertools.izip(self._historicalScores, self._averagedScores)):
+      self._addStatistics(firstRecord + i, record[1], averagedScore)
+
+
+  def _restoreRunningState(self):
+    """
+    Rebuilds the moving average and the running statistics from the sliding
+    window and the distribution, after deserialization.
+    """
+    historicalScores = self._historicalScores
+
+    if self._distribution is None:
+      recentRecords = list(itertools.islice(reversed(historicalScores),
+                                            self._AVERAGING_WINDOW))[::-1]
+      self._recentScores = collections.deque(
+        (record[2] for record in recentRecords), maxlen=self._AVERAGING_WINDOW)
+      self._recentScoresTotal = float(sum(self._recentScores))
+    else:
+      movingAverage = self._distribution["movingAverage"]
+      self._recentScores = collections.deque(movingAverage["historicalValues"],
+                                             maxlen=movingAverage["windowSize"])
+      self._recentScoresTotal = movingAverage["total"]
+      movingAverage["historicalValues"] = self._recentScores
+      self._distribution["historicalLikelihoods"] = collections.deque(
+        self._distribution.get("historicalLikelihoods", [1.0]),
+        maxlen=movingAverage["windowSize"])
+
+    # Averages over the window only, as estimateAnomalyLikelihoods computes them
+    averagedRecords, _, _ = _anomalyScoreMovingAverage(
+      historicalScores, windowSize=self._AVERAGING_WINDOW)
+    self._averagedScores = collections.deque(
+      (record[2] for record in averagedRecords),
+      maxlen=historicalScores.maxlen)
+
+    self._resetStatistics()
 
 
 
@@ -486,13 +719,12 @@ def estimateAnomalyLikelihoods(anomalyScores,
         distributionParams = nullDistribution(verbosity = verbosity)
 
   # Estimate likelihoods based on this distribution
-  likelihoods = numpy.array(dataValues, dtype=float)
-  for i, s in enumerate(dataValues):
-    likelihoods[i] = tailProbability(s, distributionParams)
+  likelihoods = _tailProbabilities(numpy.array(dataValues, dtype=float),
+                                   distributionParams["mean"],
+                                   distributionParams["stdev"])
 
   # Filter likelihood values
-  filteredLikelihoods = numpy.array(
-    _filterLikelihoods(likelihoods) )
+  filteredLikelihoods = _filterLikelihoodArray(likelihoods)
 
   params = {
     "distribution":       distributionParams,
@@ -559,48 +791,8 @@ def updateAnomalyLikelihoods(anomalyScores,
   if len(anomalyScores) == 0:
     raise ValueError("Must have at least one anomalyScore")
 
-  if not isValidEstimatorParams(params):
-    raise ValueError("'params' is not a valid params structure")
-
-  # For backward compatibility.
-  if "historicalLikelihoods" not in params:
-    params["historicalLikelihoods"] = [1.0]
-
-  # Compute moving averages of these new scores using the previous values
-  # as well as likelihood for these scores using the old estimator
-  historicalValues  = params["movingAverage"]["historicalValues"]
-  total             = params["movingAverage"]["total"]
-  windowSize        = params["movingAverage"]["windowSize"]
-
-  aggRecordList = numpy.zeros(len(anomalyScores), dtype=float)
-  likelihoods = numpy.zeros(len(anomalyScores), dtype=float)
-  for i, v in enumerate(anomalyScores):
-    newAverage, historicalValues, total = (
-      MovingAverage.compute(historicalValues, total, v[2], windowSize)
-    )
-    aggRecordList[i] = newAverage
-    likelihoods[i]   = tailProbability(newAverage, params["distribution"])
-
-  # Filter the likelihood values. First we prepend the historical likelihoods
-  # to the current set. Then we filter the values.  We peel off the likelihoods
-  # to return and the last windowSize values to store for later.
-  likelihoods2 = params["historicalLikelihoods"] + list(likelihoods)
-  filteredLikelihoods = _filterLikelihoods(likelihoods2)
-  likelihoods[:] = filteredLikelihoods[-len(likelihoods):]
-  historicalLikelihoods = likelihoods2[-min(windowSize, len(likelihoods2)):]
-
-  # Update the estimator
-  newParams = {
-    "distribution": params["distribution"],
-    "movingAverage": {
-      "historicalValues": historicalValues,
-      "total": total,
-      "windowSize": windowSize,
-    },
-    "historicalLikelihoods": historicalLikelihoods,
-  }
-
-  assert len(newParams["historicalLikelihoods"]) <= windowSize
+  likelihoods, aggRecordList, newParams = updateAnomalyLikelihoodsBatch(
+    [v[2] for v in anomalyScores], params)
 
   if verbosity > 3:
     print("Number of likelihoods:", len(likelihoods))
@@ -611,6 +803,296 @@ def updateAnomalyLikelihoods(anomalyScores,
 
 
 
+def estimateAnomalyLikelihoodsBatch(anomalyScores,
+                                    metricValues=None,
+                                    averagingWindow=10,
+                                    skipRecords=0):
+  """
+  Array version of :func:`estimateAnomalyLikelihoods`. Computes the same
+  likelihoods and params for a series of anomaly scores, or for many series at
+  once.
+
+  :param anomalyScores: numpy array of anomaly scores, or 2D numpy array with
+                        the anomaly scores of one metric per row
+  :param metricValues: optional numpy array of numeric metric values with the
+                       same shape as ``anomalyScores``. Used to detect flat
+                       metrics like :func:`estimateAnomalyLikelihoods` does.
+                       Leave it out for non-numeric metrics.
+  :param averagingWindow: integer number of records to average over
+  :param skipRecords: integer specifying number of records to skip when
+                      estimating distributions
+
+  :returns: 3-tuple consisting of:
+
+            - likelihoods
+
+              numpy array of likelihoods, with the shape of ``anomalyScores``
+
+            - averagedScores
+
+              numpy array of averaged anomaly scores, with the shape of
+              ``anomalyScores``
+
+            - params
+
+              the state of the estimator, as returned by
+              :func:`estimateAnomalyLikelihoods`, or a list with the state of
+              each metric for a 2D ``anomalyScores``
+  """
+  scores = numpy.array(anomalyScores, dtype=float, ndmin=2)
+  if scores.ndim != 2:
+    raise ValueError("anomalyScores must be a 1D or 2D array")
+  if scores.shape[1] == 0:
+    raise ValueError("Must have at least one anomalyScore")
+
+  if metricValues is not None:
+    metricValues = numpy.array(metricValues, dtype=float, ndmin=2)
+    if metricValues.shape != scores.shape:
+      raise ValueError("metricValues must have the shape of anomalyScores")
+
+  numMetrics, numRecords = scores.shape
+
+  averagedScores, historicalValues, totals = _movingAverages(
+    scores, numpy.zeros((numMetrics, 0)), numpy.zeros(numMetrics),
+    averagingWindow)
+
+  # Estimate the distribution of averaged anomaly scores of each metric
+  distributions = []
+  for i in xrange(numMetrics):
+    if numRecords <= skipRecords:
+      distributionParams = nullDistribution()
+    else:
+      distributionParams = estimateNormal(averagedScores[i, skipRecords:])
+
+      # Flat metric values are not anomalous, see estimateAnomalyLikelihoods
+      if metricValues is not None:
+        metricDistribution = estimateNormal(metricValues[i, skipRecords:],
+                                            performLowerBoundCheck=False)
+        if metricDistribution["variance"] < 1.5e-5:
+          distributionParams = nullDistribution()
+
+    distributions.append(distributionParams)
+
+  likelihoods = _tailProbabilities(
+    averagedScores,
+    numpy.array([[d["mean"]] for d in distributions]),
+    numpy.array([[d["stdev"]] for d in distributions]))
+  filteredLikelihoods = _filterLikelihoodArray(likelihoods)
+
+  numHistorical = min(averagingWindow, numRecords)
+  params = [{
+    "distribution": distributions[i],
+    "movingAverage": {
+      "historicalValues": list(historicalValues[i]),
+      "total": totals[i],
+      "windowSize": averagingWindow,
+    },
+    "historicalLikelihoods": list(likelihoods[i, -numHistorical:]),
+  } for i in xrange(numMetrics)]
+
+  if numpy.ndim(anomalyScores) == 1:
+    return filteredLikelihoods[0], averagedScores[0], params[0]
+  return filteredLikelihoods, averagedScores, params
+
+
+
+def updateAnomalyLikelihoodsBatch(anomalyScores, params):
+  """
+  Array version of :func:`updateAnomalyLikelihoods`. Computes the same updated
+  likelihoods for a series of anomaly scores, or for many series at once.
+
+  :param anomalyScores: numpy array of anomaly scores, or 2D numpy array with
+                        the anomaly scores of one metric per row
+  :param params: the params returned by :func:`estimateAnomalyLikelihoods` or
+                 :func:`estimateAnomalyLikelihoodsBatch`, or a list with the
+                 params of each metric for a 2D ``anomalyScores``
+
+  :returns: 3-tuple consisting of:
+
+            - likelihoods
+
+              numpy array of likelihoods, with the shape of ``anomalyScores``
+
+            - averagedScores
+
+              numpy array of averaged anomaly scores, with the shape of
+              ``anomalyScores``
+
+            - params
+
+              the updated state of the estimator, or a list with the updated
+              state of each metric for a 2D ``anomalyScores``
+  """
+  scores = numpy.array(anomalyScores, dtype=float, ndmin=2)
+  if scores.ndim != 2:
+    raise ValueError("anomalyScores must be a 1D or 2D array")
+  if scores.shape[1] == 0:
+    raise ValueError("Must have at least one anomalyScore")
+
+  paramsList = [params] if numpy.ndim(anomalyScores) == 1 else list(params)
+  if len(paramsList) != scores.shape[0]:
+    raise ValueError("Expected one params structure per row of anomalyScores")
+
+  for p in paramsList:
+    if not isValidEstimatorParams(p):
+      raise ValueError("'params' is not a valid params structure")
+
+    # For backward compatibility.
+    if "historicalLikelihoods" not in p:
+      p["historicalLikelihoods"] = [1.0]
+
+  averagedScores = numpy.empty(scores.shape)
+  likelihoods = numpy.empty(scores.shape)
+  newParams = [None] * len(paramsList)
+
+  # Metrics with the same amount of history are computed together
+  groups = collections.defaultdict(list)
+  for i, p in enumerate(paramsList):
+    groups[(len(p["movingAverage"]["historicalValues"]),
+            p["movingAverage"]["windowSize"],
+            len(p["historicalLikelihoods"]))].append(i)
+
+  for ((numHistoricalValues, windowSize, numHistoricalLikelihoods),
+       rows) in groups.iteritems():
+    groupParams = [paramsList[i] for i in rows]
+
+    # Compute moving averages of these new scores using the previous values
+    # as well as likelihood for these scores using the old estimator
+    averages, historicalValues, totals = _movingAverages(
+      scores[rows],
+      numpy.array([p["movingAverage"]["historicalValues"] for p in groupParams],
+                  dtype=float).reshape(len(rows), numHistoricalValues),
+      numpy.array([p["movingAverage"]["total"] for p in groupParams],
+                  dtype=float),
+      windowSize)
+
+    rawLikelihoods = _tailProbabilities(
+      averages,
+      numpy.array([[p["distribution"]["mean"]] for p in groupParams]),
+      numpy.array([[p["distribution"]["stdev"]] for p in groupParams]))
+
+    # Filter the likelihood values, continuing from the historical likelihoods.
+    # We keep the last windowSize values to store for later.
+    allLikelihoods = numpy.hstack((
+      numpy.array([p["historicalLikelihoods"] for p in groupParams],
+                  dtype=float).reshape(len(rows), numHistoricalLikelihoods),
+      rawLikelihoods))
+    filteredLikelihoods = _filterLikelihoodArray(allLikelihoods)
+    numHistorical = min(windowSize, allLikelihoods.shape[1])
+
+    averagedScores[rows] = averages
+    likelihoods[rows] = filteredLikelihoods[:, numHistoricalLikelihoods:]
+
+    for j, i in enumerate(rows):
+      # Update the estimator
+      newParams[i] = {
+        "distribution": groupParams[j]["distribution"],
+        "movingAverage": {
+          "historicalValues": list(historicalValues[j]),
+          "total": totals[j],
+          "windowSize": windowSize,
+        },
+        "historicalLikelihoods": list(allLikelihoods[j, -numHistorical:]),
+      }
+
+  if numpy.ndim(anomalyScores) == 1:
+    return likelihoods[0], averagedScores[0], newParams[0]
+  return likelihoods, averagedScores, newParams
+
+
+
+def _movingAverages(anomalyScores, historicalValues, totals, windowSize):
+  """
+  Computes moving averages of rows of anomaly scores, with the same floating
+  point operations as :meth:`nupic.utils.MovingAverage.compute`, which removes
+  the oldest value from the running total before adding the new one.
+
+  :param anomalyScores: 2D numpy array of anomaly scores, one metric per row
+  :param historicalValues: 2D numpy array of the previous anomaly scores of
+                           each metric, at most ``windowSize`` per row
+  :param totals: numpy array of the sums of the previous anomaly scores
+  :param windowSize: how many values to use in the moving window
+
+  :returns: the averaged scores, the last ``windowSize`` scores and the new
+            totals
+  """
+  windowSize = int(windowSize)
+  numMetrics, numRecords = anomalyScores.shape
+  numHistorical = historicalValues.shape[1]
+  allValues = numpy.hstack((historicalValues, anomalyScores))
+
+  # The running totals are a cumulative sum of the new values, interleaved
+  # with the negated values that drop out of the window once it is full.
+  numFilling = max(0, min(numRecords, windowSize - numHistorical))
+  numSliding = numRecords - numFilling
+  start = numHistorical + numFilling - windowSize
+
+  operations = numpy.empty((numMetrics, 1 + numFilling + 2 * numSliding))
+  operations[:, 0] = totals
+  operations[:, 1:1 + numFilling] = anomalyScores[:, :numFilling]
+  operations[:, 1 + numFilling::2] = -allValues[:, start:start + numSliding]
+  operations[:, 2 + numFilling::2] = anomalyScores[:, numFilling:]
+  runningTotals = numpy.add.accumulate(operations, axis=1)
+
+  newTotals = numpy.hstack((runningTotals[:, 1:1 + numFilling],
+                            runningTotals[:, 2 + numFilling::2]))
+  counts = numpy.minimum(numpy.arange(numHistorical + 1,
+                                      numHistorical + numRecords + 1),
+                         windowSize)
+
+  return (newTotals / counts,
+          allValues[:, -min(windowSize, allValues.shape[1]):],
+          runningTotals[:, -1])
+
+
+
+# Complementary error function of each element of an array, with the same
+# results as math.erfc
+_erfc = numpy.frompyfunc(math.erfc, 1, 1)
+
+
+
+def _tailProbabilities(x, mean, stdev):
+  """
+  Array version of :func:`tailProbability`.
+
+  :param x: numpy array of values
+  :param mean: mean of the normal distribution, or an array that broadcasts
+               against ``x``
+  :param stdev: standard deviation of the normal distribution, or an array that
+                broadcasts against ``x``
+  :returns: numpy array of the tail probabilities of the values
+  """
+  # Gaussian is symmetrical around mean, so flip to get the tail probability
+  x = numpy.where(x < mean, 2 * mean - x, x)
+  z = (x - mean) / stdev
+  return 0.5 * _erfc(z / 1.4142).astype(float)
+
+
+
+def _filterLikelihoodArray(likelihoods,
+                           redThreshold=0.99999, yellowThreshold=0.999):
+  """
+  Array version of :func:`_filterLikelihoods`, filtering each row of a 2D
+  array separately.
+
+  :returns: A numpy array with the filtered likelihoods.
+  """
+  redThreshold    = 1.0 - redThreshold
+  yellowThreshold = 1.0 - yellowThreshold
+
+  likelihoods = numpy.asarray(likelihoods, dtype=float)
+  inRedZone = likelihoods <= redThreshold
+
+  # Values in the redzone after a value in the redzone are lowered to yellow.
+  # The first value is untouched.
+  lowered = numpy.zeros(likelihoods.shape, dtype=bool)
+  lowered[..., 1:] = inRedZone[..., 1:] & inRedZone[..., :-1]
+
+  return numpy.where(lowered, yellowThreshold, likelihoods)
+
+
+
 def _filterLikelihoods(likelihoods,
                        redThreshold=0.99999, yellowThreshold=0.999):
   """
@@ -620,28 +1102,40 @@ def _filterLikelihoods(likelihoods,
 
   :returns: A new list of floats likelihoods containing the filtered values.
   """
-  redThreshold    = 1.0 - redThreshold
-  yellowThreshold = 1.0 - yellowThreshold
-
   # The first value is untouched
   filteredLikelihoods = [likelihoods[0]]
 
   for i, v in enumerate(likelihoods[1:]):
+    filteredLikelihoods.append(
+      _filterLikelihood(v, likelihoods[i], redThreshold, yellowThreshold))
+
+  return filteredLikelihoods
 
-    if v <= redThreshold:
-      # Value is in the redzone
 
-      if likelihoods[i] > redThreshold:
-        # Previous value is not in redzone, so leave as-is
-        filteredLikelihoods.append(v)
-      else:
-        filteredLikelihoods.append(yellowThreshold)
 
+def _filterLikelihood(likelihood, previousLikelihood,
+                      redThreshold=0.99999, yellowThreshold=0.999):
+  """
+  Filter a raw (pre-filtered) likelihood given the raw likelihood of the
+  previous record, see :func:`_filterLikelihoods`.
+
+  :returns: The filtered likelihood.
+  """
+  redThreshold    = 1.0 - redThreshold
+  yellowThreshold = 1.0 - yellowThreshold
+
+  if likelihood <= redThreshold:
+    # Value is in the redzone
+
+    if previousLikelihood > redThreshold:
+      # Previous value is not in redzone, so leave as-is
+      return likelihood
     else:
-      # Value is below the redzone, so leave as-is
-      filteredLikelihoods.append(v)
+      return yellowThreshold
 
-  return filteredLikelihoods
+  else:
+    # Value is below the redzone, so leave as-is
+    return likelihood
 
 
 
@@ -660,9 +1154,7 @@ def _anomalyScoreMovingAverage(anomalyScores,
   *Note:* we only average the anomaly score.
   """
 
-  historicalValues = []
-  total = 0.0
-  averagedRecordList = []    # Aggregated records
+  records = []
   for record in anomalyScores:
 
     # Skip (but log) records without correct number of entries
@@ -671,17 +1163,21 @@ def _anomalyScoreMovingAverage(anomalyScores,
         print("Malformed record:", record)
       continue
 
-    avg, historicalValues, total = (
-      MovingAverage.compute(historicalValues, total, record[2], windowSize)
-      )
+    records.append(record)
+
+  averages, historicalValues, totals = _movingAverages(
+    numpy.array([[record[2] for record in records]], dtype=float),
+    numpy.zeros((1, 0)), numpy.zeros(1), windowSize)
 
+  averagedRecordList = []    # Aggregated records
+  for record, avg in itertools.izip(records, averages[0].tolist()):
     averagedRecordList.append( [record[0], record[1], avg] )
 
     if verbosity > 2:
       print("Aggregating input record:", record)
       print("Result:", [record[0], record[1], avg])
 
-  return averagedRecordList, historicalValues, total
+  return averagedRecordList, historicalValues[0].tolist(), float(totals[0])
 
 
 
@@ -694,10 +1190,20 @@ def estimateNormal(sampleData, performLowerBoundCheck=True):
   :returns: A dict containing the parameters of a normal distribution based on
       the ``sampleData``.
   """
+  return _normalDistribution(numpy.mean(sampleData), numpy.var(sampleData),
+                             performLowerBoundCheck)
+
+
+
+def _normalDistribution(mean, variance, performLowerBoundCheck=True):
+  """
+  :returns: A dict containing the parameters of a normal distribution with the
+      given ``mean`` and ``variance``, see :func:`estimateNormal`.
+  """
   params = {
     "name": "normal",
-    "mean": numpy.mean(sampleData),
-    "variance": numpy.var(sampleData),
+    "mean": mean,
+    "variance": variance,
   }
 
   if performLowerBoundCheck:
@@ -782,3 +1288,50 @@ def isValidEstimatorParams(p):
     return False
 
   return True
+
+
+
+class _RunningStatistics(object):
+  """
+  Mean and variance of a set of samples that can be added and removed one at a
+  time, with Welford's algorithm.
+  """
+
+  def __init__(self):
+    self.count = 0
+    self.mean = 0.0
+    self._sumSquaredDeviations = 0.0
+
+
+  def copy(self):
+    statistics = _RunningStatistics()
+    statistics.count = self.count
+    statistics.mean = self.mean
+    statistics._sumSquaredDeviations = self._sumSquaredDeviations
+    return statistics
+
+
+  @property
+  def variance(self):
+    """Population variance of the samples, 0 when there are none."""
+    if self.count == 0:
+      return 0.0
+    return max(self._sumSquaredDeviations / self.count, 0.0)
+
+
+  def add(self, x):
+    self.count += 1
+    delta = x - self.mean
+    self.mean += delta / self.count
+    self._sumSquaredDeviations += delta * (x - self.mean)
+
+
+  def remove(self, x):
+    self.count -= 1
+    if self.count == 0:
+      self.mean = 0.0
+      self._sumSquaredDeviations = 0.0
+    else:
+      delta = x - self.mean
+      self.mean -= delta / self.count
+      self._sumSquaredDeviations -= delta * (x - self.mean)
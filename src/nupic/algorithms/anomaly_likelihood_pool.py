@@ -0,0 +1,588 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Anomaly likelihoods of many metrics at once.
+
+:class:`AnomalyLikelihoodPool` computes the same likelihoods as one
+:class:`~.anomaly_likelihood.AnomalyLikelihood` per metric, but keeps the state
+of all the metrics in a single numpy array and updates many metrics per call:
+
+.. code-block:: python
+
+    pool = AnomalyLikelihoodPool(storeValues=True)
+    while still_have_data:
+      # Anomaly scores of some of the metrics
+      likelihoods = pool.compute(metricIds, anomalyScores, values)
+
+The whole pool can be saved to a file and loaded back, memory-mapped:
+
+.. code-block:: python
+
+    pool.saveSnapshot("pool.bin")
+    pool = AnomalyLikelihoodPool.loadSnapshot("pool.bin")
+"""
+
+import json
+import struct
+
+import numpy
+
+from nupic.algorithms.anomaly_likelihood import (
+  nullDistribution, _movingAverages, _tailProbabilities)
+from nupic.serializable import Serializable
+
+try:
+  import capnp
+except ImportError:
+  capnp = None
+if capnp:
+  from nupic.algorithms.anomaly_likelihood_pool_capnp import (
+    AnomalyLikelihoodPoolProto)
+
+
+
+# Maximum number of window records gathered at once when re-estimating
+# distributions
+ESTIMATION_BLOCK_SIZE = 2**20
+
+# Columns of the state of each metric
+_ITERATION = 0
+_RECENT_TOTAL = 1
+_NUM_RECENT = 2
+_MEAN = 3
+_STDEV = 4
+_PREVIOUS_LIKELIHOOD = 5
+_HAS_DISTRIBUTION = 6
+_RECENT_SCORES = 7
+
+# Fields of each record in the sliding window
+_SCORE = 0
+_VALUE = 1
+
+# Header of snapshot files, followed by the length of the JSON description
+_SNAPSHOT_MAGIC = "NUPICALP"
+_SNAPSHOT_ALIGNMENT = 64
+
+
+
+class AnomalyLikelihoodPool(Serializable):
+  """
+  Anomaly likelihoods of many metrics, keyed by metric id. Each metric gets the
+  likelihoods of an :class:`~.anomaly_likelihood.AnomalyLikelihood` with the
+  same parameters, to within floating point rounding. Metric ids are strings,
+  so that they are saved and loaded back unchanged.
+
+  The sliding windows of anomaly scores, and optionally of metric values and
+  timestamps, are stored in a preallocated 2D float array with one row per
+  metric, together with the moving averages and estimated distributions.
+
+  :param learningPeriod: (int) the number of iterations required for the
+    algorithm to learn the basic patterns in the dataset
+  :param estimationSamples: (int) the number of reasonable anomaly scores
+    required for the initial estimate of the Gaussian
+  :param historicWindowSize: (int) size of sliding window of historical data
+    points of each metric
+  :param reestimationPeriod: (int) how often the Gaussian of each metric is
+    re-estimated
+  :param storeValues: (bool) whether to keep the metric values. Without them,
+    flat metrics are not detected, as for non-numeric metric values.
+  :param storeTimestamps: (bool) whether to keep the timestamps of the records,
+    as numbers
+  :param capacity: (int) number of metrics to allocate space for. The pool
+    grows as needed.
+  """
+
+  _AVERAGING_WINDOW = 10
+
+
+  def __init__(self,
+               learningPeriod=288,
+               estimationSamples=100,
+               historicWindowSize=8640,
+               reestimationPeriod=100,
+               storeValues=False,
+               storeTimestamps=False,
+               capacity=16):
+    if historicWindowSize < estimationSamples:
+      raise ValueError("estimationSamples exceeds historicWindowSize")
+
+    self._learningPeriod = learningPeriod
+    self._probationaryPeriod = learningPeriod + estimationSamples
+    self._historicWindowSize = historicWindowSize
+    self._reestimationPeriod = reestimationPeriod
+    self._storeValues = storeValues
+    self._storeTimestamps = storeTimestamps
+
+    self._metricIds = []
+    self._rows = {}
+    self._state = self._newState(max(capacity, 1))
+
+
+  def _recordSize(self):
+    return 1 + int(self._storeValues) + int(self._storeTimestamps)
+
+
+  def _numColumns(self):
+    return (_RECENT_SCORES + self._AVERAGING_WINDOW +
+            self._historicWindowSize * self._recordSize())
+
+
+  def _windowColumns(self, recordNums, field):
+    """
+    :returns: the columns of a field of records in the sliding window
+    """
+    return (_RECENT_SCORES + self._AVERAGING_WINDOW +
+            (recordNums % self._historicWindowSize) * self._recordSize() +
+            field)
+
+
+  def _newState(self, numRows):
+    state = numpy.zeros((numRows, self._numColumns()))
+    state[:, _PREVIOUS_LIKELIHOOD] = numpy.nan
+    return state
+
+
+  def __len__(self):
+    return len(self._metricIds)
+
+
+  def __contains__(self, metricId):
+    return metricId in self._rows
+
+
+  def __eq__(self, other):
+    if not isinstance(other, AnomalyLikelihoodPool):
+      return False
+    # pylint: disable=W0212
+    if (self._learningPeriod != other._learningPeriod or
+        self._probationaryPeriod != other._probationaryPeriod or
+        self._historicWindowSize != other._historicWindowSize or
+        self._reestimationPeriod != other._reestimationPeriod or
+        self._storeValues != other._storeValues or
+        self._storeTimestamps != other._storeTimestamps or
+        set(self._metricIds) != set(other._metricIds)):
+      return False
+
+    state = self._state[:len(self)]
+    otherState = other._state[[other._rows[metricId]
+                               for metricId in self._metricIds]]
+    # pylint: enable=W0212
+    return bool(numpy.all((state == otherState) |
+                          (numpy.isnan(state) & numpy.isnan(otherState))))
+
+
+  def __ne__(self, other):
+    return not self == other
+
+
+  def getMetricIds(self):
+    """
+    :returns: (list) the ids of the metrics in the pool
+    """
+    return list(self._metricIds)
+
+
+  def _getRows(self, metricIds):
+    """
+    Gets the rows of the state of metrics, adding the ones that aren't in the
+    pool yet.
+
+    :param metricIds: list of metric ids
+    :returns: numpy array of row indices
+    """
+    newIds = [metricId for metricId in metricIds if metricId not in self._rows]
+    for metricId in newIds:
+      if not isinstance(metricId, str):
+        raise TypeError("Metric ids must be strings, got %r" % (metricId,))
+
+    if newIds:
+      numMetrics = len(self._metricIds) + len(newIds)
+      if numMetrics > self._state.shape[0]:
+        state = self._newState(max(numMetrics, 2 * self._state.shape[0]))
+        state[:len(self._metricIds)] = self._state[:len(self._metricIds)]
+        self._state = state
+
+      for metricId in newIds:
+        self._rows[metricId] = len(self._metricIds)
+        self._metricIds.append(metricId)
+
+    return numpy.array([self._rows[metricId] for metricId in metricIds],
+                       dtype=int)
+
+
+  def removeMetric(self, metricId):
+    """
+    Removes a metric and its state from the pool.
+
+    :param metricId: id of the metric
+    """
+    row = self._rows.pop(metricId)
+    lastRow = len(self._metricIds) - 1
+    lastId = self._metricIds.pop()
+
+    # Move the last metric into the freed row
+    if row != lastRow:
+      self._state[row] = self._state[lastRow]
+      self._metricIds[row] = lastId
+      self._rows[lastId] = row
+
+    self._state[lastRow] = self._newState(1)[0]
+
+
+  def anomalyProbability(self, metricId, value, anomalyScore, timestamp=None):
+    """
+    Computes the probability that the current value plus anomaly score of a
+    metric represents an anomaly, see
+    :meth:`~.anomaly_likelihood.AnomalyLikelihood.anomalyProbability`.
+
+    :param metricId: (str) id of the metric
+    :param value: the current metric value, or None when values aren't stored
+    :param anomalyScore: the current anomaly score
+    :param timestamp: [optional] timestamp of the record, as a number
+    :returns: the anomalyLikelihood for this record.
+    """
+    return float(self.compute(
+      [metricId], [anomalyScore],
+      values=[value] if self._storeValues else None,
+      timestamps=[timestamp] if self._storeTimestamps else None)[0])
+
+
+  def compute(self, metricIds, anomalyScores, values=None, timestamps=None):
+    """
+    Computes the anomaly likelihoods of one new record of each of the given
+    metrics. Metrics that aren't in the pool yet are added.
+
+    :param metricIds: list of distinct metric ids, as strings
+    :param anomalyScores: the current anomaly score of each metric
+    :param values: the current value of each metric. Required when the pool
+                   stores values. Non-numeric values are passed as None or NaN.
+    :param timestamps: the timestamp of each record, as numbers. Required when
+                       the pool stores timestamps.
+    :returns: numpy array with the anomaly likelihood of each metric
+    """
+    metricIds = list(metricIds)
+    if len(set(metricIds)) != len(metricIds):
+      raise ValueError("Each metric can only get one record per call")
+
+    anomalyScores = numpy.asarray(anomalyScores, dtype=float)
+    if anomalyScores.shape != (len(metricIds),):
+      raise ValueError("Expected one anomaly score per metric")
+    if self._storeValues:
+      if values is None:
+        raise ValueError("The pool stores values, they are required")
+      values = numpy.array(values, dtype=float)
+    if self._storeTimestamps:
+      if timestamps is None:
+        raise ValueError("The pool stores timestamps, they are required")
+      timestamps = numpy.array(timestamps, dtype=float)
+
+    rows = self._getRows(metricIds)
+    state = self._state
+    iterations = state[rows, _ITERATION].astype(int)
+
+    # We ignore the first probationaryPeriod data points, and re-estimate the
+    # distribution of the others on a rolling basis
+    active = iterations >= self._probationaryPeriod
+    reestimate = active & ((state[rows, _HAS_DISTRIBUTION] == 0) |
+                           (iterations % self._reestimationPeriod == 0))
+    if reestimate.any():
+      self._estimateDistributions(rows[reestimate])
+
+    averagedScores = self._updateMovingAverages(rows, iterations,
+                                                anomalyScores)
+
+    likelihoods = numpy.full(len(rows), 0.5)
+    if active.any():
+      activeRows = rows[active]
+      rawLikelihoods = _tailProbabilities(averagedScores[active],
+                                          state[activeRows, _MEAN],
+                                          state[activeRows, _STDEV])
+
+      # Only keep sharp increases in likelihood, as _filterLikelihoods does
+      redThreshold = 1.0 - 0.99999
+      yellowThreshold = 1.0 - 0.999
+      lowered = ((rawLikelihoods <= redThreshold) &
+                 (state[activeRows, _PREVIOUS_LIKELIHOOD] <= redThreshold))
+      state[activeRows, _PREVIOUS_LIKELIHOOD] = rawLikelihoods
+      likelihoods[active] = 1.0 - numpy.where(lowered, yellowThreshold,
+                                              rawLikelihoods)
+
+    # Add the records to the sliding windows
+    state[rows, self._windowColumns(iterations, _SCORE)] = anomalyScores
+    if self._storeValues:
+      state[rows, self._windowColumns(iterations, _VALUE)] = values
+    if self._storeTimestamps:
+      state[rows, self._windowColumns(iterations, self._recordSize() - 1)] = (
+        timestamps)
+    state[rows, _ITERATION] = iterations + 1
+
+    return likelihoods
+
+
+  def _updateMovingAverages(self, rows, iterations, anomalyScores):
+    """
+    Adds anomaly scores to the moving averages of metrics, with the operations
+    of :meth:`nupic.utils.MovingAverage.compute`.
+
+    :returns: numpy array of the averaged anomaly scores
+    """
+    state = self._state
+    columns = _RECENT_SCORES + iterations % self._AVERAGING_WINDOW
+
+    totals = state[rows, _RECENT_TOTAL]
+    numRecent = state[rows, _NUM_RECENT]
+    isFull = numRecent == self._AVERAGING_WINDOW
+    totals[isFull] -= state[rows[isFull], columns[isFull]]
+    totals += anomalyScores
+    numRecent = numpy.minimum(numRecent + 1, self._AVERAGING_WINDOW)
+
+    state[rows, columns] = anomalyScores
+    state[rows, _RECENT_TOTAL] = totals
+    state[rows, _NUM_RECENT] = numRecent
+
+    return totals / numRecent
+
+
+  def _estimateDistributions(self, rows):
+    """
+    Re-estimates the distributions of the averaged anomaly scores in the
+    sliding windows of metrics, as
+    :func:`~.anomaly_likelihood.estimateAnomalyLikelihoods` does, and restarts
+    their moving averages and likelihood filters from the last records of the
+    windows.
+
+    :param rows: numpy array of the rows of the metrics
+    """
+    state = self._state
+    iterations = state[rows, _ITERATION].astype(int)
+    numRecords = numpy.minimum(iterations, self._historicWindowSize)
+    firstRecords = iterations - numRecords
+    # Records of the learning period are left out of the estimate
+    numSkipped = numpy.clip(self._learningPeriod - firstRecords, 0, numRecords)
+
+    # Metrics with the same number of records to average and skip are
+    # estimated together, a block of metrics at a time to bound the size of
+    # the temporary arrays
+    for numGroupRecords, numGroupSkipped in sorted(set(zip(numRecords,
+                                                          numSkipped))):
+      inGroup = ((numRecords == numGroupRecords) &
+                 (numSkipped == numGroupSkipped))
+      groupRows = rows[inGroup]
+      groupFirstRecords = firstRecords[inGroup]
+
+      blockSize = max(1, ESTIMATION_BLOCK_SIZE // max(1, numGroupRecords))
+      for start in xrange(0, len(groupRows), blockSize):
+        recordNums = (groupFirstRecords[start:start + blockSize,
+                                        numpy.newaxis] +
+                      numpy.arange(numGroupRecords))
+        self._estimateGroupDistributions(groupRows[start:start + blockSize],
+                                         recordNums, numGroupSkipped)
+
+
+  def _estimateGroupDistributions(self, rows, recordNums, numSkipped):
+    """
+    Re-estimates the distributions of metrics with the same number of records
+    in their sliding windows.
+
+    :param rows: numpy array of the rows of the metrics
+    :param recordNums: 2D numpy array with the record numbers of the sliding
+                       window of each metric, oldest first
+    :param numSkipped: number of records of the learning period in the windows
+    """
+    state = self._state
+    numRows, numRecords = recordNums.shape
+    rowIndices = rows[:, numpy.newaxis]
+
+    scores = state[rowIndices, self._windowColumns(recordNums, _SCORE)]
+    averagedScores, _, _ = _movingAverages(
+      scores, numpy.zeros((numRows, 0)), numpy.zeros(numRows),
+      self._AVERAGING_WINDOW)
+
+    null = nullDistribution()
+    means = numpy.full(numRows, null["mean"])
+    stdevs = numpy.full(numRows, null["stdev"])
+
+    if numRecords > numSkipped:
+      sample = averagedScores[:, numSkipped:]
+
+      # Same lower bounds as estimateNormal
+      means = numpy.maximum(sample.mean(axis=1), 0.03)
+      stdevs = numpy.sqrt(numpy.maximum(sample.var(axis=1), 0.0003))
+
+      # Flat metric values are not anomalous, see estimateAnomalyLikelihoods
+      if self._storeValues:
+        values = state[rowIndices, self._windowColumns(recordNums, _VALUE)]
+        isNumeric = ~numpy.isnan(values).any(axis=1)
+        isFlat = numpy.zeros(numRows, dtype=bool)
+        isFlat[isNumeric] = (values[isNumeric, numSkipped:].var(axis=1) <
+                             1.5e-5)
+        means[isFlat] = null["mean"]
+        stdevs[isFlat] = null["stdev"]
+
+    state[rows, _MEAN] = means
+    state[rows, _STDEV] = stdevs
+    state[rows, _HAS_DISTRIBUTION] = 1
+
+    # The moving average continues from the last scores of the window
+    numRecent = min(self._AVERAGING_WINDOW, numRecords)
+    recentRecordNums = recordNums[:, numRecords - numRecent:]
+    state[rowIndices,
+          _RECENT_SCORES + recentRecordNums % self._AVERAGING_WINDOW] = (
+      scores[:, numRecords - numRecent:])
+    state[rows, _RECENT_TOTAL] = scores[:, numRecords - numRecent:].sum(axis=1)
+    state[rows, _NUM_RECENT] = numRecent
+
+    # The likelihood filter continues from the likelihood of the last record
+    if numRecords > 0:
+      state[rows, _PREVIOUS_LIKELIHOOD] = _tailProbabilities(
+        averagedScores[:, -1], means, stdevs)
+    else:
+      state[rows, _PREVIOUS_LIKELIHOOD] = numpy.nan
+
+
+  def saveSnapshot(self, path):
+    """
+    Saves the whole pool to a file that :meth:`loadSnapshot` can memory-map.
+
+    :param path: path of the file
+    """
+    description = json.dumps({
+      "learningPeriod": self._learningPeriod,
+      "probationaryPeriod": self._probationaryPeriod,
+      "historicWindowSize": self._historicWindowSize,
+      "reestimationPeriod": self._reestimationPeriod,
+      "storeValues": self._storeValues,
+      "storeTimestamps": self._storeTimestamps,
+      "metricIds": self._metricIds,
+    })
+
+    # Pad the description so that the state starts on an aligned offset
+    headerSize = len(_SNAPSHOT_MAGIC) + struct.calcsize("<Q")
+    description += " " * (-(headerSize + len(description)) %
+                          _SNAPSHOT_ALIGNMENT)
+
+    with open(path, "wb") as f:
+      f.write(_SNAPSHOT_MAGIC)
+      f.write(struct.pack("<Q", len(description)))
+      f.write(description)
+      f.write(self._state[:len(self)].astype("<f8").tobytes())
+
+
+  @classmethod
+  def loadSnapshot(cls, path, mmapMode="c"):
+    """
+    Loads a pool saved with :meth:`saveSnapshot`. The state is memory-mapped
+    from the file rather than read into memory.
+
+    :param path: path of the file
+    :param mmapMode: mode of the memory map, see :class:`numpy.memmap`. With
+                     the default copy-on-write mode the file is not modified.
+                     With ``"r+"`` the file is updated in place, until metrics
+                     are added beyond the ones in the file.
+    :returns: the loaded pool
+    """
+    with open(path, "rb") as f:
+      if f.read(len(_SNAPSHOT_MAGIC)) != _SNAPSHOT_MAGIC:
+        raise ValueError("%s is not an anomaly likelihood pool snapshot" %
+                         path)
+      (descriptionSize,) = struct.unpack("<Q", f.read(struct.calcsize("<Q")))
+      description = json.loads(f.read(descriptionSize))
+      offset = f.tell()
+
+    pool = cls._fromDescription(description)
+
+    numMetrics = len(pool._metricIds)
+    if numMetrics > 0:
+      pool._state = numpy.memmap(path, dtype="<f8", mode=mmapMode,
+                                 offset=offset,
+                                 shape=(numMetrics, pool._numColumns()))
+    return pool
+
+
+  @classmethod
+  def _fromDescription(cls, description):
+    # pylint: disable=W0212
+    pool = object.__new__(cls)
+    pool._learningPeriod = description["learningPeriod"]
+    pool._probationaryPeriod = description["probationaryPeriod"]
+    pool._historicWindowSize = description["historicWindowSize"]
+    pool._reestimationPeriod = description["reestimationPeriod"]
+    pool._storeValues = description["storeValues"]
+    pool._storeTimestamps = description["storeTimestamps"]
+
+    # JSON gives back unicode strings
+    pool._metricIds = [metricId.encode("utf-8")
+                       if isinstance(metricId, unicode) else metricId
+                       for metricId in description["metricIds"]]
+    pool._rows = dict((metricId, row)
+                      for row, metricId in enumerate(pool._metricIds))
+    pool._state = pool._newState(max(len(pool._metricIds), 1))
+    # pylint: enable=W0212
+    return pool
+
+
+  @classmethod
+  def getSchema(cls):
+    return AnomalyLikelihoodPoolProto
+
+
+  @classmethod
+  def read(cls, proto):
+    """ capnp deserialization method for the anomaly likelihood pool
+
+    :param proto: (Object) capnp proto object specified in
+                          nupic.algorithms.anomaly_likelihood_pool.capnp
+
+    :returns: (Object) the deserialized AnomalyLikelihoodPool object
+    """
+    # pylint: disable=W0212
+    pool = cls._fromDescription({
+      "learningPeriod": proto.learningPeriod,
+      "probationaryPeriod": proto.probationaryPeriod,
+      "historicWindowSize": proto.historicWindowSize,
+      "reestimationPeriod": proto.reestimationPeriod,
+      "storeValues": proto.storeValues,
+      "storeTimestamps": proto.storeTimestamps,
+      "metricIds": list(proto.metricIds),
+    })
+
+    numMetrics = len(pool._metricIds)
+    pool._state[:numMetrics] = numpy.array(
+      proto.state, dtype=float).reshape(numMetrics, pool._numColumns())
+    # pylint: enable=W0212
+    return pool
+
+
+  def write(self, proto):
+    """ capnp serialization method for the anomaly likelihood pool
+
+    :param proto: (Object) capnp proto object specified in
+                          nupic.algorithms.anomaly_likelihood_pool.capnp
+    """
+    proto.learningPeriod = self._learningPeriod
+    proto.probationaryPeriod = self._probationaryPeriod
+    proto.historicWindowSize = self._historicWindowSize
+    proto.reestimationPeriod = self._reestimationPeriod
+    proto.storeValues = self._storeValues
+    proto.storeTimestamps = self._storeTimestamps
+    proto.metricIds = self._metricIds
+    proto.state = self._state[:len(self)].ravel().tolist()
@@ -0,0 +1,468 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Array-backed implementation of :class:`~nupic.algorithms.connections.Connections`.
+
+Synapse data is kept in flat NumPy arrays (one entry per synapse) instead of
+one Python object per synapse, and the presynaptic index is a CSR-style pair of
+arrays. This keeps memory proportional to the number of synapses and lets
+:meth:`ArrayConnections.computeActivity` run as a handful of vectorized
+operations.
+
+To use it with the :class:`~nupic.algorithms.temporal_memory.TemporalMemory`,
+set :attr:`~nupic.algorithms.temporal_memory.TemporalMemory.connectionsClass`:
+
+::
+
+  class ArrayTemporalMemory(TemporalMemory):
+    connectionsClass = ArrayConnections
+"""
+
+import numpy
+
+from nupic.algorithms.connections import Connections, EPSILON
+
+# Initial number of synapse slots. Storage doubles whenever it is exhausted.
+INITIAL_SYNAPSE_CAPACITY = 1024
+
+# The presynaptic index is rebuilt once the number of synapses created or
+# destroyed since the last rebuild exceeds this fraction of the indexed synapses.
+INDEX_REBUILD_FRACTION = 0.1
+
+
+
+class ArraySegment(object):
+  """
+  Class containing minimal information to identify a unique segment in an
+  :class:`ArrayConnections`.
+
+  :param connections: (:class:`ArrayConnections`) Owner of the segment.
+
+  :param cell: (int) Index of the cell that this segment is on.
+
+  :param flatIdx: (int) The segment's flattened list index.
+
+  :param ordinal: (long) Used to sort segments. The sort order needs to be
+         consistent between implementations so that tie-breaking is consistent
+         when finding the best matching segment.
+  """
+
+  __slots__ = ["cell", "flatIdx", "_synapses", "_ordinal", "_connections"]
+
+  def __init__(self, connections, cell, flatIdx, ordinal):
+    self.cell = cell
+    self.flatIdx = flatIdx
+    # Synapse slot indices into the connections' arrays.
+    self._synapses = []
+    self._ordinal = ordinal
+    self._connections = connections
+
+
+  def __eq__(self, other):
+    """ Explicitly implement this for unit testing. The flatIdx is not designed
+    to be consistent after serialize / deserialize, and the synapses might not
+    enumerate in the same order.
+    """
+    if self.cell != other.cell:
+      return False
+
+    synapses = other._connections.synapsesForSegment(other)
+    return (sorted(self._connections.synapsesForSegment(self),
+                   key=lambda x: x._ordinal) ==
+            sorted(synapses, key=lambda x: x._ordinal))
+
+
+  def __ne__(self, other):
+    return not self.__eq__(other)
+
+
+
+class ArraySynapse(object):
+  """
+  Lightweight handle to a synapse stored in an :class:`ArrayConnections`. It
+  exposes the same attributes as :class:`~nupic.algorithms.connections.Synapse`,
+  reading them from the underlying arrays.
+
+  :param connections: (:class:`ArrayConnections`) Owner of the synapse.
+
+  :param idx: (int) The synapse's slot in the connections' arrays.
+  """
+
+  __slots__ = ["_connections", "_idx"]
+
+  def __init__(self, connections, idx):
+    self._connections = connections
+    self._idx = idx
+
+
+  @property
+  def segment(self):
+    connections = self._connections
+    #pylint: disable=W0212
+    return connections._segmentForFlatIdx[
+      connections._synapseSegment[self._idx]]
+
+
+  @property
+  def presynapticCell(self):
+    #pylint: disable=W0212
+    return int(self._connections._synapsePresynapticCell[self._idx])
+
+
+  @property
+  def permanence(self):
+    #pylint: disable=W0212
+    return float(self._connections._synapsePermanence[self._idx])
+
+
+  @property
+  def _ordinal(self):
+    #pylint: disable=W0212
+    return long(self._connections._synapseOrdinal[self._idx])
+
+
+  def __hash__(self):
+    return hash(self._idx)
+
+
+  def __eq__(self, other):
+    """ Explicitly implement this for unit testing. Allow floating point
+    differences for synapse permanence.
+    """
+    return (self.segment.cell == other.segment.cell and
+            self.presynapticCell == other.presynapticCell and
+            abs(self.permanence - other.permanence) < EPSILON)
+
+
+  def __ne__(self, other):
+    return not self.__eq__(other)
+
+
+
+class ArrayConnections(Connections):
+  """
+  Class to hold data representing the connectivity of a collection of cells,
+  storing synapses in flat arrays. It is a drop-in replacement for
+  :class:`~nupic.algorithms.connections.Connections` and serializes to the same
+  schema. Segment bookkeeping is inherited; segments are
+  :class:`ArraySegment` objects and synapses are :class:`ArraySynapse` handles.
+
+  Synapse ``i`` is described by ``_synapseSegment[i]`` (flatIdx of its segment,
+  or ``-1`` if the slot is free), ``_synapsePresynapticCell[i]``,
+  ``_synapsePermanence[i]`` and ``_synapseOrdinal[i]``.
+
+  The presynaptic index stores the synapse slots sorted by presynaptic cell in
+  ``_presynapticSynapses``, with cell ``c`` owning the range
+  ``_presynapticIndptr[c]:_presynapticIndptr[c+1]``. Synapses created after the
+  last rebuild are kept in a small pending list, and slots of destroyed
+  synapses are only recycled when the index is rebuilt, so stale index entries
+  can be recognized by their ``-1`` segment.
+
+  :param numCells: (int) Number of cells in collection.
+  """
+
+  def __init__(self, numCells):
+    super(ArrayConnections, self).__init__(numCells)
+
+    # Replaced by the presynaptic index below.
+    del self._synapsesForPresynapticCell
+
+    self._synapseSegment = numpy.empty(INITIAL_SYNAPSE_CAPACITY,
+                                       dtype=numpy.int32)
+    self._synapsePresynapticCell = numpy.empty(INITIAL_SYNAPSE_CAPACITY,
+                                               dtype=numpy.int32)
+    self._synapsePermanence = numpy.empty(INITIAL_SYNAPSE_CAPACITY,
+                                          dtype=numpy.float64)
+    self._synapseOrdinal = numpy.empty(INITIAL_SYNAPSE_CAPACITY,
+                                       dtype=numpy.int64)
+    self._nextSynapseIdx = 0
+    self._freeSynapseIdxs = []
+
+    self._presynapticIndptr = numpy.zeros(numCells + 1, dtype=numpy.int64)
+    self._presynapticSynapses = numpy.empty(0, dtype=numpy.int64)
+    self._pendingSynapses = []
+    self._pendingFreeSynapseIdxs = []
+
+
+  def synapsesForSegment(self, segment):
+    """
+    Returns the synapses on a segment.
+
+    :param segment: (:class:`ArraySegment`) Segment
+    :returns: (set) :class:`ArraySynapse` objects representing synapses on the
+              given segment.
+    """
+
+    return set(ArraySynapse(self, idx) for idx in segment._synapses)
+
+
+  def synapsesForPresynapticCell(self, presynapticCell):
+    """
+    Returns the synapses for the source cell that they synapse on.
+
+    :param presynapticCell: (int) Source cell index
+
+    :returns: (set) :class:`ArraySynapse` objects
+    """
+    idxs = self._synapsesForPresynapticCells(
+      numpy.array([presynapticCell], dtype=numpy.int64))
+    return set(ArraySynapse(self, idx) for idx in idxs.tolist())
+
+
+  def _segmentFactory(self, cell, flatIdx, ordinal):
+    """
+    Create the object representing a new segment.
+
+    :returns: (:class:`ArraySegment`) New segment
+    """
+    return ArraySegment(self, cell, flatIdx, ordinal)
+
+
+  def destroySegment(self, segment):
+    """
+    Destroys a segment.
+
+    :param segment: (:class:`ArraySegment`) representing the segment to be
+           destroyed.
+    """
+    for idx in segment._synapses:
+      self._freeSynapse(idx)
+    self._numSynapses -= len(segment._synapses)
+    segment._synapses = []
+
+    # Remove the segment from the cell's list. Compare by identity, since
+    # segment equality is defined by content.
+    segments = self._cells[segment.cell]._segments
+    i = next(i for i, s in enumerate(segments) if s is segment)
+    del segments[i]
+
+    # Free the flatIdx and remove the final reference so the Segment can be
+    # garbage-collected.
+    self._freeFlatIdxs.append(segment.flatIdx)
+    self._segmentForFlatIdx[segment.flatIdx] = None
+
+
+  def createSynapse(self, segment, presynapticCell, permanence):
+    """
+    Creates a new synapse on a segment.
+
+    :param segment: (:class:`ArraySegment`) Segment object for synapse to be
+           synapsed to.
+    :param presynapticCell: (int) Source cell index.
+    :param permanence: (float) Initial permanence of synapse.
+    :returns: (:class:`ArraySynapse`) created synapse
+    """
+    if len(self._freeSynapseIdxs) > 0:
+      idx = self._freeSynapseIdxs.pop()
+    else:
+      if self._nextSynapseIdx == len(self._synapseSegment):
+        self._growSynapseStorage()
+      idx = self._nextSynapseIdx
+      self._nextSynapseIdx += 1
+
+    self._synapseSegment[idx] = segment.flatIdx
+    self._synapsePresynapticCell[idx] = presynapticCell
+    self._synapsePermanence[idx] = permanence
+    self._synapseOrdinal[idx] = self._nextSynapseOrdinal
+    self._nextSynapseOrdinal += 1
+
+    segment._synapses.append(idx)
+    self._pendingSynapses.append(idx)
+
+    self._numSynapses += 1
+
+    return ArraySynapse(self, idx)
+
+
+  def destroySynapse(self, synapse):
+    """
+    Destroys a synapse.
+
+    :param synapse: (:class:`ArraySynapse`) synapse to destroy
+    """
+    idx = synapse._idx
+    segment = self._segmentForFlatIdx[self._synapseSegment[idx]]
+    segment._synapses.remove(idx)
+    self._freeSynapse(idx)
+
+    self._numSynapses -= 1
+
+
+  def updateSynapsePermanence(self, synapse, permanence):
+    """
+    Updates the permanence for a synapse.
+
+    :param synapse: (:class:`ArraySynapse`) to be updated.
+    :param permanence: (float) New permanence.
+    """
+
+    self._synapsePermanence[synapse._idx] = permanence
+
+
+  def computeActivity(self, activePresynapticCells, connectedPermanence):
+    """
+    Compute each segment's number of active synapses for a given input.
+    In the returned arrays, a segment's active synapse count is stored at index
+    ``segment.flatIdx``.
+
+    .. note:: The returned arrays are buffers owned by this instance. They are
+       overwritten by the next call to this method.
+
+    :param activePresynapticCells: (iter) Active cells.
+    :param connectedPermanence: (float) Permanence threshold for a synapse to be
+           considered connected
+
+    :returns: (tuple) (``numActiveConnectedSynapsesForSegment`` [numpy.array],
+                      ``numActivePotentialSynapsesForSegment`` [numpy.array])
+    """
+    cells = numpy.fromiter(activePresynapticCells, dtype=numpy.int64)
+    synapses = self._synapsesForPresynapticCells(cells)
+
+    return self._countActivity(
+      self._synapseSegment[synapses],
+      self._synapsePermanence[synapses] > connectedPermanence - EPSILON)
+
+
+  def _freeSynapse(self, idx):
+    """
+    Marks a synapse slot as unused. The slot is recycled at the next rebuild of
+    the presynaptic index, which may still reference it until then.
+    """
+    self._synapseSegment[idx] = -1
+    self._pendingFreeSynapseIdxs.append(idx)
+
+
+  def _growSynapseStorage(self):
+    """
+    Doubles the capacity of the synapse arrays.
+    """
+    capacity = 2 * len(self._synapseSegment)
+
+    for name in ("_synapseSegment", "_synapsePresynapticCell",
+                 "_synapsePermanence", "_synapseOrdinal"):
+      old = getattr(self, name)
+      new = numpy.empty(capacity, dtype=old.dtype)
+      new[:len(old)] = old
+      setattr(self, name, new)
+
+
+  def _rebuildPresynapticIndex(self):
+    """
+    Rebuilds the CSR presynaptic index from the synapse arrays, and releases
+    the slots of synapses destroyed since the last rebuild.
+    """
+    live = numpy.flatnonzero(self._synapseSegment[:self._nextSynapseIdx] >= 0)
+    presynapticCells = self._synapsePresynapticCell[live]
+
+    # Presynaptic cells aren't required to be cells of this collection, so the
+    # index covers the largest presynaptic cell seen.
+    counts = numpy.bincount(presynapticCells, minlength=self.numCells)
+    self._presynapticIndptr = numpy.zeros(len(counts) + 1, dtype=numpy.int64)
+    numpy.cumsum(counts, out=self._presynapticIndptr[1:])
+    self._presynapticSynapses = live[numpy.argsort(presynapticCells,
+                                                   kind="mergesort")]
+
+    self._pendingSynapses = []
+    self._freeSynapseIdxs += self._pendingFreeSynapseIdxs
+    self._pendingFreeSynapseIdxs = []
+
+
+  def _synapsesForPresynapticCells(self, cells):
+    """
+    Returns the slots of the live synapses whose presynaptic cell is in
+    ``cells``.
+
+    :param cells: (numpy.array) Presynaptic cell indices.
+    :returns: (numpy.array) Synapse slot indices.
+    """
+    numPending = (len(self._pendingSynapses) +
+                  len(self._pendingFreeSynapseIdxs))
+    if numPending > INDEX_REBUILD_FRACTION * len(self._presynapticSynapses):
+      self._rebuildPresynapticIndex()
+
+    indexedCells = cells[cells < len(self._presynapticIndptr) - 1]
+    starts = self._presynapticIndptr[indexedCells]
+    lengths = self._presynapticIndptr[indexedCells + 1] - starts
+    ends = numpy.cumsum(lengths)
+    positions = (numpy.arange(ends[-1] if len(ends) else 0) +
+                 numpy.repeat(starts - ends + lengths, lengths))
+    synapses = self._presynapticSynapses[positions]
+    synapses = synapses[self._synapseSegment[synapses] >= 0]
+
+    if len(self._pendingSynapses) > 0:
+      pending = numpy.array(self._pendingSynapses, dtype=numpy.int64)
+      pending = pending[self._synapseSegment[pending] >= 0]
+      pending = pending[numpy.in1d(self._synapsePresynapticCell[pending],
+                                   cells)]
+      synapses = numpy.concatenate((synapses, pending))
+
+    return synapses
+
+
+  def write(self, proto):
+    """
+    Writes serialized data to proto object.
+
+    :param proto: (DynamicStructBuilder) Proto object
+    """
+    protoCells = proto.init('cells', self.numCells)
+
+    for i in xrange(self.numCells):
+      segments = self._cells[i]._segments
+      protoSegments = protoCells[i].init('segments', len(segments))
+
+      for j, segment in enumerate(segments):
+        idxs = sorted(segment._synapses,
+                      key=lambda idx: self._synapseOrdinal[idx])
+        protoSynapses = protoSegments[j].init('synapses', len(idxs))
+
+        for k, idx in enumerate(idxs):
+          protoSynapses[k].presynapticCell = int(
+            self._synapsePresynapticCell[idx])
+          protoSynapses[k].permanence = float(self._synapsePermanence[idx])
+
+
+  @classmethod
+  def read(cls, proto):
+    """
+    Reads deserialized data from proto object
+
+    :param proto: (DynamicStructBuilder) Proto object
+
+    :returns: (:class:`ArrayConnections`) instance
+    """
+    #pylint: disable=W0212
+    protoCells = proto.cells
+    connections = cls(len(protoCells))
+
+    for cellIdx, protoCell in enumerate(protoCells):
+      for protoSegment in protoCell.segments:
+        segment = connections.createSegment(cellIdx)
+
+        for protoSynapse in protoSegment.synapses:
+          connections.createSynapse(segment, protoSynapse.presynapticCell,
+                                    protoSynapse.permanence)
+
+    connections._rebuildPresynapticIndex()
+
+    #pylint: enable=W0212
+    return connections
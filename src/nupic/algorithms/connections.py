@@ -20,7 +20,8 @@
 # ----------------------------------------------------------------------
 
 from bisect import bisect_left
-from collections import defaultdict
+
+import numpy
 
 from nupic.serializable import Serializable
 try:
@@ -85,13 +86,15 @@ class Synapse(object):
          when finding the min permanence synapse.
   """
 
-  __slots__ = ["segment", "presynapticCell", "permanence", "_ordinal"]
+  __slots__ = ["segment", "presynapticCell", "permanence", "_ordinal",
+               "_presynapticIdx"]
 
   def __init__(self, segment, presynapticCell, permanence, ordinal):
     self.segment = segment
     self.presynapticCell = presynapticCell
     self.permanence = permanence
     self._ordinal = ordinal
+    self._presynapticIdx = -1
 
 
   def __eq__(self, other):
@@ -121,6 +124,42 @@ class CellData(object):
 
 
 
+class PresynapticCellData(object):
+  # Class containing the synapses of a presynaptic cell, with the flatIdx of
+  # their segments and their permanences in parallel arrays so that they can
+  # be gathered without touching the Synapse objects. A synapse's position in
+  # these is stored in its _presynapticIdx. Internal to the Connections
+
+  __slots__ = ["_synapses", "_flatIdxs", "_permanences"]
+
+  def __init__(self):
+    self._synapses = []
+    self._flatIdxs = numpy.zeros(0, dtype="int64")
+    self._permanences = numpy.zeros(0, dtype="float64")
+
+
+  def add(self, synapse):
+    synapse._presynapticIdx = len(self._synapses)
+    self._synapses.append(synapse)
+    self._flatIdxs = numpy.append(self._flatIdxs, synapse.segment.flatIdx)
+    self._permanences = numpy.append(self._permanences, synapse.permanence)
+
+
+  def remove(self, synapse):
+    # Move the last synapse into the freed position.
+    i = synapse._presynapticIdx
+    last = self._synapses.pop()
+    if last is not synapse:
+      self._synapses[i] = last
+      last._presynapticIdx = i
+      self._flatIdxs[i] = self._flatIdxs[-1]
+      self._permanences[i] = self._permanences[-1]
+    self._flatIdxs = self._flatIdxs[:-1]
+    self._permanences = self._permanences[:-1]
+    synapse._presynapticIdx = -1
+
+
+
 def binSearch(arr, val):
   """ 
   Function for running binary search on a sorted list.
@@ -149,7 +188,7 @@ class Connections(Serializable):
     self.numCells = numCells
 
     self._cells = [CellData() for _ in xrange(numCells)]
-    self._synapsesForPresynapticCell = defaultdict(set)
+    self._synapsesForPresynapticCell = {}
     self._segmentForFlatIdx = []
 
     self._numSynapses = 0
@@ -161,6 +200,17 @@ class Connections(Serializable):
     self._nextSynapseOrdinal = long(0)
     self._nextSegmentOrdinal = long(0)
 
+    # Cell and ordinal of each segment, indexed by flatIdx. Used to sort
+    # segments by position without calling segmentPositionSortKey.
+    self._segmentCells = numpy.zeros(0, dtype="int64")
+    self._segmentOrdinals = numpy.zeros(0, dtype="int64")
+
+    # Output buffers of computeActivity, reused between calls.
+    self._numActiveConnectedSynapsesForSegment = numpy.zeros(0,
+                                                             dtype="uint32")
+    self._numActivePotentialSynapsesForSegment = numpy.zeros(0,
+                                                             dtype="uint32")
+
 
   def segmentsForCell(self, cell):
     """ 
@@ -254,7 +304,9 @@ class Connections(Serializable):
 
     :returns: (set) :class:`Synapse` objects
     """
-    return self._synapsesForPresynapticCell[presynapticCell]
+    if presynapticCell not in self._synapsesForPresynapticCell:
+      return set()
+    return set(self._synapsesForPresynapticCell[presynapticCell]._synapses)
 
 
   def createSegment(self, cell):
@@ -276,13 +328,43 @@ class Connections(Serializable):
     ordinal = self._nextSegmentOrdinal
     self._nextSegmentOrdinal += 1
 
-    segment = Segment(cell, flatIdx, ordinal)
+    segment = self._segmentFactory(cell, flatIdx, ordinal)
     cellData._segments.append(segment)
     self._segmentForFlatIdx[flatIdx] = segment
+    self._recordSegmentPosition(segment)
 
     return segment
 
 
+  def _segmentFactory(self, cell, flatIdx, ordinal):
+    """
+    Create the object representing a new segment. Subclasses may override this
+    method to use a different segment class.
+
+    :returns: (:class:`Segment`) New segment
+    """
+    return Segment(cell, flatIdx, ordinal)
+
+
+  def _recordSegmentPosition(self, segment):
+    """
+    Store the segment's cell and ordinal at its flatIdx, growing the arrays
+    geometrically when needed.
+
+    :param segment: (:class:`Segment`) Newly created segment.
+    """
+    if segment.flatIdx >= len(self._segmentCells):
+      capacity = max(self._nextFlatIdx, 2 * len(self._segmentCells))
+      for name in ("_segmentCells", "_segmentOrdinals"):
+        old = getattr(self, name)
+        new = numpy.zeros(capacity, dtype=old.dtype)
+        new[:len(old)] = old
+        setattr(self, name, new)
+
+    self._segmentCells[segment.flatIdx] = segment.cell
+    self._segmentOrdinals[segment.flatIdx] = segment._ordinal
+
+
   def destroySegment(self, segment):
     """
     Destroys a segment.
@@ -321,19 +403,30 @@ class Connections(Serializable):
     self._nextSynapseOrdinal += 1
     segment._synapses.add(synapse)
 
-    self._synapsesForPresynapticCell[presynapticCell].add(synapse)
+    self._addSynapseToPresynapticMap(synapse)
 
     self._numSynapses += 1
 
     return synapse
 
 
+  def _addSynapseToPresynapticMap(self, synapse):
+    inputSynapses = self._synapsesForPresynapticCell.get(
+      synapse.presynapticCell)
+
+    if inputSynapses is None:
+      inputSynapses = PresynapticCellData()
+      self._synapsesForPresynapticCell[synapse.presynapticCell] = inputSynapses
+
+    inputSynapses.add(synapse)
+
+
   def _removeSynapseFromPresynapticMap(self, synapse):
     inputSynapses = self._synapsesForPresynapticCell[synapse.presynapticCell]
 
     inputSynapses.remove(synapse)
 
-    if len(inputSynapses) == 0:
+    if len(inputSynapses._synapses) == 0:
       del self._synapsesForPresynapticCell[synapse.presynapticCell]
 
 
@@ -360,36 +453,74 @@ class Connections(Serializable):
     """
 
     synapse.permanence = permanence
+    inputSynapses = self._synapsesForPresynapticCell[synapse.presynapticCell]
+    inputSynapses._permanences[synapse._presynapticIdx] = permanence
 
 
   def computeActivity(self, activePresynapticCells, connectedPermanence):
     """ 
     Compute each segment's number of active synapses for a given input.
-    In the returned lists, a segment's active synapse count is stored at index
+    In the returned arrays, a segment's active synapse count is stored at index
     ``segment.flatIdx``.
 
+    .. note:: The returned arrays are buffers owned by this instance. They are
+       overwritten by the next call to this method.
+
     :param activePresynapticCells: (iter) Active cells.
     :param connectedPermanence: (float) Permanence threshold for a synapse to be 
            considered connected
 
-    :returns: (tuple) (``numActiveConnectedSynapsesForSegment`` [list],
-                      ``numActivePotentialSynapsesForSegment`` [list])
+    :returns: (tuple) (``numActiveConnectedSynapsesForSegment`` [numpy.array],
+                      ``numActivePotentialSynapsesForSegment`` [numpy.array])
+    """
+    synapsesForPresynapticCell = self._synapsesForPresynapticCell
+    inputs = [synapsesForPresynapticCell[cell]
+              for cell in activePresynapticCells
+              if cell in synapsesForPresynapticCell]
+
+    if len(inputs) > 0:
+      flatIdxs = numpy.concatenate([i._flatIdxs for i in inputs])
+      permanences = numpy.concatenate([i._permanences for i in inputs])
+    else:
+      flatIdxs = numpy.zeros(0, dtype="int64")
+      permanences = numpy.zeros(0, dtype="float64")
+
+    return self._countActivity(flatIdxs,
+                               permanences > connectedPermanence - EPSILON)
+
+
+  def _countActivity(self, flatIdxs, connected):
+    """
+    Counts the active potential and active connected synapses of each segment
+    into the reusable output buffers.
+
+    :param flatIdxs: (numpy.array) Segment flatIdx of every active synapse.
+    :param connected: (numpy.array) Whether each active synapse is connected.
+
+    :returns: (tuple) Views of the output buffers, see :meth:`computeActivity`.
     """
+    numSegments = self._nextFlatIdx
 
-    numActiveConnectedSynapsesForSegment = [0] * self._nextFlatIdx
-    numActivePotentialSynapsesForSegment = [0] * self._nextFlatIdx
+    if len(self._numActivePotentialSynapsesForSegment) < numSegments:
+      capacity = max(numSegments, 2 * len(
+        self._numActivePotentialSynapsesForSegment))
+      self._numActiveConnectedSynapsesForSegment = numpy.zeros(capacity,
+                                                               dtype="uint32")
+      self._numActivePotentialSynapsesForSegment = numpy.zeros(capacity,
+                                                               dtype="uint32")
 
-    threshold = connectedPermanence - EPSILON
+    numActiveConnected = self._numActiveConnectedSynapsesForSegment[:numSegments]
+    numActivePotential = self._numActivePotentialSynapsesForSegment[:numSegments]
 
-    for cell in activePresynapticCells:
-      for synapse in self._synapsesForPresynapticCell[cell]:
-        flatIdx = synapse.segment.flatIdx
-        numActivePotentialSynapsesForSegment[flatIdx] += 1
-        if synapse.permanence > threshold:
-          numActiveConnectedSynapsesForSegment[flatIdx] += 1
+    # numpy.bincount is far faster than numpy.add.at, and rejects a minlength
+    # of 0.
+    minlength = max(numSegments, 1)
+    numActivePotential[:] = numpy.bincount(
+      flatIdxs, minlength=minlength)[:numSegments]
+    numActiveConnected[:] = numpy.bincount(
+      flatIdxs[connected], minlength=minlength)[:numSegments]
 
-    return (numActiveConnectedSynapsesForSegment,
-            numActivePotentialSynapsesForSegment)
+    return numActiveConnected, numActivePotential
 
 
   def numSegments(self, cell=None):
@@ -434,6 +565,23 @@ class Connections(Serializable):
     return segment.cell + (segment._ordinal / float(self._nextSegmentOrdinal))
 
 
+  def segmentsSortedByPosition(self, flatIdxs):
+    """ 
+    Returns the segments with the specified flatIdxs, sorted by cell and then by
+    age. This is the order defined by :meth:`segmentPositionSortKey`, computed
+    with a single vectorized sort.
+
+    :param flatIdxs: (numpy.array) flatIdxs of existing segments.
+    :returns: (list) :class:`Segment` objects
+    """
+    flatIdxs = numpy.asarray(flatIdxs, dtype="int64")
+    order = numpy.lexsort((self._segmentOrdinals[flatIdxs],
+                           self._segmentCells[flatIdxs]))
+
+    segmentForFlatIdx = self._segmentForFlatIdx
+    return [segmentForFlatIdx[i] for i in flatIdxs[order].tolist()]
+
+
   def write(self, proto):
     """ 
     Writes serialized data to proto object.
@@ -487,6 +635,7 @@ class Connections(Serializable):
         connections._segmentForFlatIdx.append(segment)
         connections._nextFlatIdx += 1
         connections._nextSegmentOrdinal += 1
+        connections._recordSegmentPosition(segment)
 
         synapses = segment._synapses
         protoSynapses = protoSegment.synapses
@@ -497,7 +646,7 @@ class Connections(Serializable):
                             ordinal=connections._nextSynapseOrdinal)
           connections._nextSynapseOrdinal += 1
           synapses.add(synapse)
-          connections._synapsesForPresynapticCell[presynapticCell].add(synapse)
+          connections._addSynapseToPresynapticMap(synapse)
 
           connections._numSynapses += 1
 
@@ -507,61 +656,41 @@ class Connections(Serializable):
 
   def __eq__(self, other):
     """ Equality operator for Connections instances.
-    Checks if two instances are functionally identical
+    Checks if two instances are functionally identical. Only the public
+    interface of ``other`` is used, so it may be any connections implementation,
+    such as :class:`~nupic.algorithms.array_connections.ArrayConnections`.
 
     :param other: (:class:`Connections`) Connections instance to compare to
     """
-    #pylint: disable=W0212
+    if self.numCells != other.numCells:
+      return False
+
+    if self.numSynapses() != other.numSynapses():
+      return False
+
+    synapseKey = lambda s: (s.presynapticCell, s.permanence)
+
     for i in xrange(self.numCells):
-      segments = self._cells[i]._segments
-      otherSegments = other._cells[i]._segments
+      segments = self.segmentsForCell(i)
+      otherSegments = other.segmentsForCell(i)
 
       if len(segments) != len(otherSegments):
         return False
 
-      for j in xrange(len(segments)):
-        segment = segments[j]
-        otherSegment = otherSegments[j]
-        synapses = segment._synapses
-        otherSynapses = otherSegment._synapses
+      for segment, otherSegment in zip(segments, otherSegments):
+        synapses = sorted(self.synapsesForSegment(segment), key=synapseKey)
+        otherSynapses = sorted(other.synapsesForSegment(otherSegment),
+                               key=synapseKey)
 
         if len(synapses) != len(otherSynapses):
           return False
 
-        for synapse in synapses:
-          found = False
-          for candidate in otherSynapses:
-            if synapse == candidate:
-              found = True
-              break
-
-          if not found:
+        for synapse, otherSynapse in zip(synapses, otherSynapses):
+          if synapse.presynapticCell != otherSynapse.presynapticCell:
+            return False
+          if abs(synapse.permanence - otherSynapse.permanence) >= EPSILON:
             return False
 
-    if (len(self._synapsesForPresynapticCell) !=
-        len(self._synapsesForPresynapticCell)):
-      return False
-
-    for i in self._synapsesForPresynapticCell.keys():
-      synapses = self._synapsesForPresynapticCell[i]
-      otherSynapses = other._synapsesForPresynapticCell[i]
-      if len(synapses) != len(otherSynapses):
-        return False
-
-      for synapse in synapses:
-        found = False
-        for candidate in otherSynapses:
-          if synapse == candidate:
-            found = True
-            break
-
-        if not found:
-          return False
-
-    if self._numSynapses != other._numSynapses:
-      return False
-
-    #pylint: enable=W0212
     return True
 
 
@@ -23,7 +23,8 @@
 
 import numpy
 
-from nupic.bindings.math import (NearestNeighbor, min_score_per_category)
+from nupic.bindings.math import (NearestNeighbor, min_score_per_category,
+                                 Random as NupicRandom)
 
 from nupic.serializable import Serializable
 
@@ -39,6 +40,8 @@ if capnp:
 
 g_debugPrefix = "KNN"
 KNNCLASSIFIER_VERSION = 1
+EVICTION_POLICIES = ("leastRecentlyUsed", "fifo", "leastRecentlyMatched",
+                     "reservoir")
 
 EPSILON = 0.00001 # constant error threshold to check equality of floats
 EPSILON_ROUND = 5 # Used to round floats
@@ -73,6 +76,139 @@ def _labeledInput(activeInputs, cellsPerCol=32):
 
 
 
+class _OverlapIndex(object):
+  """
+  Inverted index from each input bit to the stored prototypes in which it is
+  non-zero. It computes the same overlaps as
+  ``NearestNeighbor.rightVecSumAtNZ``, the sums of the input values at the
+  non-zero bits of each prototype, but only visits the prototypes that share
+  active bits with the input.
+
+  The postings refer to prototypes by an id that doesn't change when other
+  prototypes are removed. Removed ids are skipped until there are more of
+  them than stored prototypes, at which point the postings are compacted.
+  """
+
+  def __init__(self):
+    # Maps each bit to [ids, length], the ids growing by doubling
+    self._postings = {}
+    self._rowOfId = numpy.zeros(0, dtype=numpy.int64)
+    self._idOfRow = numpy.zeros(0, dtype=numpy.int64)
+    self._numIds = 0
+    self._numRows = 0
+    self._numRemoved = 0
+
+
+  @classmethod
+  def fromMemory(cls, memory):
+    """Indexes all the rows of a NearestNeighbor memory."""
+    index = cls()
+    if memory is not None:
+      for row in xrange(memory.nRows()):
+        index.addRow(memory.rowNonZeros(row)[0])
+    return index
+
+
+  def addRow(self, nz):
+    """Indexes a new prototype, stored after all the others.
+
+    :param nz: indices of the non-zero bits of the prototype
+    """
+    newId = self._numIds
+    if newId == len(self._rowOfId):
+      self._rowOfId = self._grow(self._rowOfId, -1)
+    if self._numRows == len(self._idOfRow):
+      self._idOfRow = self._grow(self._idOfRow, -1)
+    self._rowOfId[newId] = self._numRows
+    self._idOfRow[self._numRows] = newId
+    self._numIds += 1
+    self._numRows += 1
+
+    for bit in nz:
+      posting = self._postings.get(bit)
+      if posting is None:
+        posting = [numpy.empty(4, dtype=numpy.int64), 0]
+        self._postings[bit] = posting
+      ids, length = posting
+      if length == len(ids):
+        posting[0] = ids = self._grow(ids)
+      ids[length] = newId
+      posting[1] = length + 1
+
+
+  def removeRows(self, rows):
+    """Removes prototypes, shifting the rows of the following ones like
+    ``NearestNeighbor.deleteRow`` does.
+
+    :param rows: rows of the prototypes to remove
+    """
+    if len(rows) == 0:
+      return
+    keep = numpy.ones(self._numRows, dtype=bool)
+    keep[rows] = False
+    liveIds = self._idOfRow[:self._numRows]
+    self._rowOfId[liveIds[~keep]] = -1
+    liveIds = liveIds[keep]
+    self._numRows = len(liveIds)
+    self._idOfRow[:self._numRows] = liveIds
+    self._rowOfId[liveIds] = numpy.arange(self._numRows)
+    self._numRemoved += len(rows)
+
+    if self._numRemoved > self._numRows:
+      self._compact()
+
+
+  def overlaps(self, inputPattern):
+    """Returns the overlap of the input with every stored prototype, the sum
+    of the input values at the non-zero bits of the prototype.
+
+    :param inputPattern: dense input
+    """
+    bits = [bit for bit in inputPattern.nonzero()[0] if bit in self._postings]
+    if not bits:
+      return numpy.zeros(self._numRows, dtype=numpy.float32)
+
+    postings = [self._postings[bit] for bit in bits]
+    ids = numpy.concatenate([ids[:length] for ids, length in postings])
+    values = numpy.repeat(inputPattern[bits],
+                          [length for _, length in postings])
+    rows = self._rowOfId[ids]
+    if self._numRemoved > 0:
+      live = rows >= 0
+      rows = rows[live]
+      values = values[live]
+
+    return numpy.bincount(rows, weights=values,
+                          minlength=self._numRows).astype(numpy.float32)
+
+
+  def _compact(self):
+    """Drops the removed ids from the postings and renumbers the ids after
+    the rows."""
+    for bit in self._postings.keys():
+      ids, length = self._postings[bit]
+      rows = self._rowOfId[ids[:length]]
+      live = rows >= 0
+      if live.any():
+        self._postings[bit] = [rows[live], int(live.sum())]
+      else:
+        del self._postings[bit]
+
+    self._rowOfId = numpy.arange(self._numRows, dtype=numpy.int64)
+    self._idOfRow = numpy.arange(self._numRows, dtype=numpy.int64)
+    self._numIds = self._numRows
+    self._numRemoved = 0
+
+
+  @staticmethod
+  def _grow(array, fillValue=0):
+    grown = numpy.empty(max(4, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    grown[len(array):] = fillValue
+    return grown
+
+
+
 class KNNClassifier(Serializable):
   """
   This class implements NuPIC's k Nearest Neighbor Classifier. KNN is very
@@ -171,6 +307,40 @@ class KNNClassifier(Serializable):
       implies all vectors will be stored. A value of 0.1 implies only vectors
       with at least 10% sparsity will be stored
 
+  :param useOverlapIndex: (bool) If True and useSparseMemory is set, an
+      inverted index from the input bits to the stored prototypes is kept.
+      With the overlap distance methods, distances are then only computed and
+      sorted for the prototypes sharing active bits with the input, which
+      are the only ones closer than the maximum distance. All the prototypes
+      are sorted when fewer than k of them share active bits with the input,
+      so the distances are the same as without the index, with ties between
+      equally distant neighbors broken by pattern index
+
+  :param evictionPolicy: (string) Chooses the patterns deleted in the fixed
+      capacity mode. One of:
+
+      - ``leastRecentlyUsed``: the patterns with the oldest rowID passed to
+        :meth:`learn`, which is refreshed when a learned pattern matches them
+      - ``fifo``: the patterns stored first
+      - ``leastRecentlyMatched``: the patterns that were learned, or were among
+        the nearest neighbors of an inference, the longest time ago
+      - ``reservoir``: a uniform sample of all the patterns stored so far is
+        kept, so each new pattern replaces a random one with a decreasing
+        probability
+
+  :param maxPatternsPerCategory: (int) Limits the number of training patterns
+      stored for each category, with patterns of a full category deleted with
+      the evictionPolicy. A value of -1 is no limit
+
+  :param evictionBatchSize: (int) Number of patterns deleted at once when the
+      capacity is exceeded, which amortizes the cost of removing rows from the
+      memory. The stored patterns then vary between maxStoredPatterns -
+      evictionBatchSize + 1 and maxStoredPatterns. Ignored by the reservoir
+      policy, which deletes one pattern per stored pattern
+
+  :param seed: (int) Seed of the random number generator of the reservoir
+      eviction policy
+
   """
 
   def __init__(self, k=1,
@@ -191,7 +361,12 @@ class KNNClassifier(Serializable):
                      maxStoredPatterns=-1,
                      replaceDuplicates=False,
                      cellsPerCol=0,
-                     minSparsity=0.0):
+                     minSparsity=0.0,
+                     useOverlapIndex=False,
+                     evictionPolicy="leastRecentlyUsed",
+                     maxPatternsPerCategory=-1,
+                     evictionBatchSize=1,
+                     seed=42):
 
     self.version = KNNCLASSIFIER_VERSION
 
@@ -220,6 +395,13 @@ class KNNClassifier(Serializable):
     self.cellsPerCol = cellsPerCol
     self.maxStoredPatterns = maxStoredPatterns
     self.minSparsity = minSparsity
+    self.useOverlapIndex = useOverlapIndex
+    assert evictionPolicy in EVICTION_POLICIES
+    self.evictionPolicy = evictionPolicy
+    self.maxPatternsPerCategory = maxPatternsPerCategory
+    assert evictionBatchSize >= 1
+    self.evictionBatchSize = evictionBatchSize
+    self._random = NupicRandom(seed)
     self.clear()
 
 
@@ -235,17 +417,24 @@ class KNNClassifier(Serializable):
     self._iterationIdx = -1
 
     # Fixed capacity KNN
-    if self.maxStoredPatterns > 0:
+    if self.maxStoredPatterns > 0 or self.maxPatternsPerCategory > 0:
       assert self.useSparseMemory, ("Fixed capacity KNN is implemented only "
                                     "in the sparse memory mode")
       self.fixedCapacity = True
       self._categoryRecencyList = []
+      self._patternMatchTimes = []
+      self._matchTime = 0
+      self._numPatternsSeen = 0
+      self._numPatternsSeenPerCategory = {}
     else:
       self.fixedCapacity = False
 
     # Cached value of the store prototype sizes
     self._protoSizes = None
 
+    # Inverted index of the stored prototypes
+    self._rebuildOverlapIndex()
+
     # Used by PCA
     self._s = None
     self._vt = None
@@ -257,6 +446,20 @@ class KNNClassifier(Serializable):
     self._nextTrainingIndices = None
 
 
+  def _rebuildOverlapIndex(self):
+    """Indexes the stored prototypes if useOverlapIndex is set."""
+    if self.useOverlapIndex and self.useSparseMemory:
+      self._overlapIndex = _OverlapIndex.fromMemory(self._Memory)
+    else:
+      self._overlapIndex = None
+
+
+  def _usesOverlapIndex(self):
+    """Whether inference looks for nearest neighbors with the overlap index."""
+    return (self._overlapIndex is not None and self.useSparseMemory and
+            self.distanceMethod != "norm")
+
+
   def _doubleMemoryNumRows(self):
 
     m = 2 * self._Memory.shape[0]
@@ -267,12 +470,14 @@ class KNNClassifier(Serializable):
 
   def _sparsifyVector(self, inputPattern, doWinners=False):
 
-    # Do sparsification, using a relative or absolute threshold
+    # Do sparsification, using a relative or absolute threshold. Without
+    # winners, this also sparsifies each row of a 2D array of patterns.
     if not self.relativeThreshold:
       inputPattern = inputPattern*(abs(inputPattern) > self.sparseThreshold)
     elif self.sparseThreshold > 0:
       inputPattern = inputPattern * \
-        (abs(inputPattern) > (self.sparseThreshold * abs(inputPattern).max()))
+        (abs(inputPattern) > (self.sparseThreshold *
+                              abs(inputPattern).max(axis=-1, keepdims=True)))
 
     # Do winner-take-all
     if doWinners:
@@ -352,29 +557,36 @@ class KNNClassifier(Serializable):
     a potentially slow operation. Second, pattern indices will shift if
     patterns before them are removed.
     """
+    if len(rowsToRemove) == 0:
+      return 0
+
     # Form a numpy array of row indices to be removed
-    removalArray = numpy.array(rowsToRemove)
+    removalArray = numpy.array(rowsToRemove, dtype=numpy.int64)
+    keep = numpy.ones(self._numPatterns, dtype=bool)
+    keep[removalArray] = False
 
     # Remove categories
-    self._categoryList = numpy.delete(numpy.array(self._categoryList),
-                                      removalArray).tolist()
+    self._categoryList = numpy.array(self._categoryList)[keep].tolist()
 
     if self.fixedCapacity:
-      self._categoryRecencyList = numpy.delete(
-        numpy.array(self._categoryRecencyList), removalArray).tolist()
+      self._categoryRecencyList = numpy.array(
+        self._categoryRecencyList)[keep].tolist()
+      self._patternMatchTimes = numpy.array(
+        self._patternMatchTimes, dtype=numpy.int64)[keep].tolist()
 
     # Remove the partition ID, if any for these rows and rebuild the id map.
-    for row in reversed(rowsToRemove):  # Go backwards
-      # Remove these patterns from partitionList
-      self._partitionIdList.pop(row)
+    self._partitionIdList = [partitionId for partitionId, kept in
+                             zip(self._partitionIdList, keep) if kept]
     self._rebuildPartitionIdMap(self._partitionIdList)
 
 
     # Remove actual patterns
     if self.useSparseMemory:
-      # Delete backwards
-      for rowIndex in rowsToRemove[::-1]:
-        self._Memory.deleteRow(rowIndex)
+      # Compacts the memory once for all the rows
+      self._Memory.deleteRows(
+        numpy.unique(removalArray).astype(numpy.uint32))
+      if self._overlapIndex is not None:
+        self._overlapIndex.removeRows(rowsToRemove)
     else:
       self._M = numpy.delete(self._M, removalArray, 0)
 
@@ -393,6 +605,68 @@ class KNNClassifier(Serializable):
     return numRemoved
 
 
+  def _evictPatterns(self, category):
+    """
+    Deletes patterns with the evictionPolicy after a pattern of the given
+    category is stored, if that category or the whole classifier holds too
+    many patterns.
+    """
+    self._numPatternsSeen += 1
+    self._numPatternsSeenPerCategory[category] = (
+      self._numPatternsSeenPerCategory.get(category, 0) + 1)
+
+    rowsToRemove = []
+    if (self.maxPatternsPerCategory > 0 and
+        self._categoryList.count(category) > self.maxPatternsPerCategory):
+      rows = [i for i, c in enumerate(self._categoryList) if c == category]
+      rowsToRemove = self._chooseEvictions(
+        rows, self.maxPatternsPerCategory,
+        self._numPatternsSeenPerCategory[category])
+
+    if (self.maxStoredPatterns > 0 and
+        self._numPatterns - len(rowsToRemove) > self.maxStoredPatterns):
+      removed = set(rowsToRemove)
+      rows = [i for i in xrange(self._numPatterns) if i not in removed]
+      rowsToRemove += self._chooseEvictions(rows, self.maxStoredPatterns,
+                                            self._numPatternsSeen)
+
+    self._removeRows(sorted(rowsToRemove))
+
+
+  def _chooseEvictions(self, rows, capacity, numSeen):
+    """
+    Chooses the patterns to delete among rows, the sorted indices of more than
+    capacity patterns ending with the pattern just stored.
+
+    :param numSeen: number of patterns stored so far into these rows
+    :returns: list of row indices
+    """
+    if self.evictionPolicy == "reservoir":
+      # Keep the new pattern with probability capacity / numSeen
+      if self._random.getReal64() * numSeen < capacity:
+        return [rows[self._random.getUInt32(len(rows) - 1)]]
+      return [rows[-1]]
+
+    numToEvict = min(len(rows) - capacity + self.evictionBatchSize - 1,
+                     len(rows) - 1)
+    if self.evictionPolicy == "fifo":
+      return rows[:numToEvict]
+    if self.evictionPolicy == "leastRecentlyUsed":
+      ages = numpy.array(self._categoryRecencyList)[rows]
+    else:
+      ages = numpy.array(self._patternMatchTimes)[rows]
+    order = numpy.argsort(ages, kind="mergesort")[:numToEvict]
+    return numpy.array(rows)[order].tolist()
+
+
+  def _recordMatches(self, rows):
+    """Refreshes the patterns for the leastRecentlyMatched eviction policy."""
+    if self.fixedCapacity:
+      self._matchTime += 1
+      for row in rows:
+        self._patternMatchTimes[row] = self._matchTime
+
+
   def doIteration(self):
     """
     Utility method to increment the iteration index. Intended for models that
@@ -570,6 +844,7 @@ class KNNClassifier(Serializable):
             self._categoryList[rowIdx] = int(inputCategory)
             if self.fixedCapacity:
               self._categoryRecencyList[rowIdx] = rowID
+              self._recordMatches([rowIdx])
             addRow = False
 
         # Don't add this vector if it matches closely with another we already
@@ -583,6 +858,7 @@ class KNNClassifier(Serializable):
             if self.fixedCapacity:
               rowIdx = dist.argmin()
               self._categoryRecencyList[rowIdx] = rowID
+              self._recordMatches([rowIdx])
 
 
       # If sparsity is too low, we do not want to add this vector
@@ -602,18 +878,17 @@ class KNNClassifier(Serializable):
           self._Memory.addRow(thresholdedInput)
         else:
           self._Memory.addRowNZ(inputPattern, [1]*len(inputPattern))
+        if self._overlapIndex is not None:
+          self._overlapIndex.addRow(
+            self._Memory.rowNonZeros(self._numPatterns)[0])
         self._numPatterns += 1
         self._categoryList.append(int(inputCategory))
         self._addPartitionId(self._numPatterns-1, partitionId)
         if self.fixedCapacity:
           self._categoryRecencyList.append(rowID)
-          if self._numPatterns > self.maxStoredPatterns and \
-            self.maxStoredPatterns > 0:
-            leastRecentlyUsedPattern = numpy.argmin(self._categoryRecencyList)
-            self._Memory.deleteRow(leastRecentlyUsedPattern)
-            self._categoryList.pop(leastRecentlyUsedPattern)
-            self._categoryRecencyList.pop(leastRecentlyUsedPattern)
-            self._numPatterns -= 1
+          self._matchTime += 1
+          self._patternMatchTimes.append(self._matchTime)
+          self._evictPatterns(int(inputCategory))
 
     if self.numSVDDims is not None and self.numSVDSamples > 0 \
           and self._numPatterns == self.numSVDSamples:
@@ -640,7 +915,7 @@ class KNNClassifier(Serializable):
     """
     assert self.useSparseMemory, "Not implemented yet for dense storage"
 
-    overlaps = self._Memory.rightVecSumAtNZ(inputPattern)
+    overlaps = self._overlapsWithProtos(inputPattern)
     return (overlaps, self._categoryList)
 
 
@@ -716,20 +991,27 @@ class KNNClassifier(Serializable):
     else:
       maxCategoryIdx = max(self._categoryList)
       inferenceResult = numpy.zeros(maxCategoryIdx+1)
-      dist = self._getDistances(inputPattern, partitionId=partitionId)
+      dist, candidates = self._getDistancesAndCandidates(
+        inputPattern, partitionId=partitionId)
       validVectorCount = len(self._categoryList) - self._categoryList.count(-1)
 
       # Loop through the indices of the nearest neighbors.
       if self.exact:
         # Is there an exact match in the distances?
-        exactMatches = numpy.where(dist<0.00001)[0]
+        if candidates is None:
+          exactMatches = numpy.where(dist<0.00001)[0]
+        else:
+          exactMatches = candidates[dist[candidates]<0.00001]
         if len(exactMatches) > 0:
           for i in exactMatches[:min(self.k, validVectorCount)]:
             inferenceResult[self._categoryList[i]] += 1.0
+          self._recordMatches(exactMatches[:min(self.k, validVectorCount)])
       else:
-        sorted = dist.argsort()
+        sorted = self._sortNeighbors(dist, candidates,
+                                     min(self.k, validVectorCount))
         for j in sorted[:min(self.k, validVectorCount)]:
           inferenceResult[self._categoryList[j]] += 1.0
+        self._recordMatches(sorted[:min(self.k, validVectorCount)])
 
       # Prepare inference results.
       if inferenceResult.any():
@@ -737,8 +1019,12 @@ class KNNClassifier(Serializable):
         inferenceResult /= inferenceResult.sum()
       else:
         winner = None
-      categoryDist = min_score_per_category(maxCategoryIdx,
-                                            self._categoryList, dist)
+      if candidates is None:
+        categoryDist = min_score_per_category(maxCategoryIdx,
+                                              self._categoryList, dist)
+      else:
+        categoryDist = self._candidateCategoryDistances(maxCategoryIdx, dist,
+                                                        candidates)
       categoryDist.clip(0, 1.0, categoryDist)
 
     if self.verbosity >= 1:
@@ -754,17 +1040,205 @@ class KNNClassifier(Serializable):
     return result
 
 
+  def inferBatch(self, inputPatterns, isSparse=0, partitionIds=None,
+                 batchSize=256):
+    """Finds the categories that best match a batch of input patterns, with
+    the same results as calling :meth:`infer` on each of them. With the overlap
+    distance methods, the overlaps of many patterns with all the prototypes
+    are computed at once.
+
+    :param inputPatterns: (2D array) The patterns to be classified, one dense
+        pattern per row. If isSparse > 0, this should be a list with the
+        sorted indices of the non-zero bits of each pattern instead. Sparse
+        matrices with a ``toarray`` method, like scipy's CSR matrices, are
+        also accepted, and only densified ``batchSize`` rows at a time.
+
+    :param isSparse: (int) 0 if the input patterns are dense, otherwise the
+        number of total bits of each pattern, as in :meth:`learn`
+
+    :param partitionIds: (list) If provided, the partitionId of each input
+        pattern. The training vectors with the same partitionId as a pattern
+        are ignored for that pattern, see :meth:`infer`.
+
+    :param batchSize: (int) Number of patterns processed at once. The
+        temporary arrays hold batchSize rows of distances to all the
+        prototypes.
+
+    :returns: 4-tuple with these keys, with the results of :meth:`infer` for
+        each pattern:
+
+      - ``winners``: A list with the winning category of each pattern, or None
+          where there are no neighbors.
+      - ``inferenceResults``: A 2D array with a row of length numCategories
+          per pattern.
+      - ``dist``: A 2D array with a row of length numPrototypes per pattern.
+      - ``categoryDist``: A 2D array with a row of length numCategories per
+          pattern.
+
+      Rows of patterns that don't meet minSparsity have no winner, a
+      inferenceResult of zeros and distances of 1.0.
+    """
+    if hasattr(inputPatterns, "toarray"):
+      numInputs = inputPatterns.shape[0]
+    elif isSparse > 0:
+      inputPatterns = list(inputPatterns)
+      numInputs = len(inputPatterns)
+    else:
+      inputPatterns = numpy.asarray(inputPatterns, dtype=numpy.float64)
+      numInputs = inputPatterns.shape[0]
+
+    if len(self._categoryList) == 0:
+      # No categories learned yet
+      return ([None] * numInputs, numpy.zeros((numInputs, 1)),
+              numpy.ones((numInputs, 1)), numpy.ones((numInputs, 1)))
+
+    if not self._finishedLearning:
+      self.finishLearning()
+      self._finishedLearning = True
+
+    categories = numpy.array(self._categoryList, dtype=numpy.int64)
+    numCategories = categories.max() + 1
+    if partitionIds is not None:
+      partitionIds = numpy.array(partitionIds, dtype=object)
+
+    winners = []
+    inferenceResults = numpy.zeros((numInputs, numCategories))
+    dist = None
+    categoryDist = numpy.ones((numInputs, numCategories), dtype=numpy.float32)
+    matched = []
+    for start in xrange(0, numInputs, batchSize):
+      stop = min(start + batchSize, numInputs)
+      block = inputPatterns[start:stop]
+      if hasattr(block, "toarray"):
+        block = block.toarray()
+      if isSparse > 0:
+        denseInputs = numpy.zeros((len(block), isSparse))
+        for i, inputPattern in enumerate(block):
+          denseInputs[i, inputPattern] = 1.0
+        block = denseInputs
+      block = numpy.asarray(block, dtype=numpy.float64)
+
+      (blockWinners, inferenceResults[start:stop], blockDist,
+       categoryDist[start:stop], blockMatched) = self._inferBatchBlock(
+         block, categories,
+         partitionIds[start:stop] if partitionIds is not None else None)
+
+      if dist is None:
+        dist = numpy.empty((numInputs, blockDist.shape[1]),
+                           dtype=blockDist.dtype)
+      dist[start:stop] = blockDist
+      winners += blockWinners
+      matched.append(blockMatched)
+
+    if dist is None:
+      dist = numpy.zeros((0, self._numPatterns))
+
+    self._recordMatches(numpy.concatenate(matched) if matched else [])
+
+    return winners, inferenceResults, dist, categoryDist
+
+
+  def _inferBatchBlock(self, inputPatterns, categories, partitionIds):
+    """Computes the results of :meth:`inferBatch` for a block of patterns.
+
+    :param inputPatterns: (2D array) Dense patterns, one per row.
+    :param categories: (numpy.array) The category of each prototype.
+    :param partitionIds: (numpy.array) The partitionId of each pattern, or None.
+
+    :returns: 5-tuple with the winners, inferenceResults, dist and
+        categoryDist of the patterns, and the indices of the prototypes that
+        they matched.
+    """
+    numInputs = inputPatterns.shape[0]
+    numCategories = categories.max() + 1
+
+    # Compute distances
+    projectedInputs = inputPatterns
+    if self._vt is not None and len(self._vt) > 0:
+      projectedInputs = numpy.dot(inputPatterns - self._mean, self._vt.T)
+    sparseInputs = self._sparsifyVector(projectedInputs)
+    dist = self._calcDistanceBatch(sparseInputs)
+
+    # Invalidate results where category is -1
+    if self._specificIndexTraining:
+      dist[:, categories == -1] = numpy.inf
+
+    # Ignore vectors with the partition id of each pattern
+    if partitionIds is not None:
+      for partitionId in set(partitionIds.tolist()):
+        if partitionId is None:
+          continue
+        cols = self._partitionIdMap.get(partitionId, [])
+        if cols:
+          rows = numpy.flatnonzero(partitionIds == partitionId)
+          dist[numpy.ix_(rows, cols)] = numpy.inf
+
+    # Vote with the nearest neighbors of each pattern
+    numNeighbors = min(self.k, len(self._categoryList) -
+                                self._categoryList.count(-1))
+    if self.exact:
+      neighbors = dist < 0.00001
+      neighbors &= neighbors.cumsum(axis=1) <= numNeighbors
+      rows, cols = neighbors.nonzero()
+    else:
+      cols = dist.argsort(axis=1)[:, :numNeighbors]
+      if self._usesOverlapIndex():
+        # Like infer(), break ties by pattern index where the index is used
+        indexed = sparseInputs.any(axis=1)
+        cols[indexed] = dist[indexed].argsort(
+          axis=1, kind="mergesort")[:, :numNeighbors]
+      rows = numpy.repeat(numpy.arange(numInputs), cols.shape[1])
+      cols = cols.ravel()
+    inferenceResults = numpy.bincount(
+      rows * numCategories + categories[cols] % numCategories,
+      minlength=numInputs * numCategories).astype(numpy.float64)
+    inferenceResults = inferenceResults.reshape(numInputs, numCategories)
+
+    votes = inferenceResults.sum(axis=1)
+    hasVotes = votes > 0
+    inferenceResults[hasVotes] /= votes[hasVotes, numpy.newaxis]
+    winners = [winner if hasVote else None for winner, hasVote in
+               zip(inferenceResults.argmax(axis=1), hasVotes)]
+
+    # Distance to the nearest prototype of each category
+    categoryDist = numpy.ones((numInputs, numCategories), dtype=numpy.float32)
+    order = numpy.argsort(categories, kind="mergesort")
+    order = order[categories[order] >= 0]
+    if len(order) > 0:
+      sortedCategories = categories[order]
+      starts = numpy.flatnonzero(numpy.r_[True, sortedCategories[1:] !=
+                                                sortedCategories[:-1]])
+      categoryDist[:, sortedCategories[starts]] = numpy.minimum.reduceat(
+        dist[:, order].astype(numpy.float32), starts, axis=1)
+    categoryDist.clip(0, 1.0, categoryDist)
+
+    # Patterns with insufficient sparsity
+    if self.minSparsity > 0.0:
+      sparsity = ((inputPatterns != 0).sum(axis=1) /
+                  float(inputPatterns.shape[1]))
+      insufficient = sparsity < self.minSparsity
+      for i in numpy.flatnonzero(insufficient):
+        winners[i] = None
+      inferenceResults[insufficient] = 0.0
+      dist[insufficient] = 1.0
+      categoryDist[insufficient] = 1.0
+      cols = cols[~insufficient[rows]]
+
+    return winners, inferenceResults, dist, categoryDist, cols
+
+
   def getClosest(self, inputPattern, topKCategories=3):
     """Returns the index of the pattern that is closest to inputPattern,
     the distances of all patterns to inputPattern, and the indices of the k
     closest categories.
     """
     inferenceResult = numpy.zeros(max(self._categoryList)+1)
-    dist = self._getDistances(inputPattern)
-
-    sorted = dist.argsort()
+    dist, candidates = self._getDistancesAndCandidates(inputPattern)
 
     validVectorCount = len(self._categoryList) - self._categoryList.count(-1)
+    sorted = self._sortNeighbors(
+      dist, candidates, max(min(self.k, validVectorCount), topKCategories))
+
     for j in sorted[:min(self.k, validVectorCount)]:
       inferenceResult[self._categoryList[j]] += 1.0
 
@@ -940,7 +1414,16 @@ class KNNClassifier(Serializable):
       self._partitionIdMap[partitionId] = indices
 
 
-  def _calcDistance(self, inputPattern, distanceNorm=None):
+  def _overlapsWithProtos(self, inputPattern):
+    """Return the overlaps of inputPattern with all stored patterns, using the
+    overlap index when there is one."""
+    if self._overlapIndex is not None:
+      return self._overlapIndex.overlaps(inputPattern)
+    return self._Memory.rightVecSumAtNZ(inputPattern)
+
+
+  def _calcDistance(self, inputPattern, distanceNorm=None,
+                    overlapsWithProtos=None):
     """Calculate the distances from inputPattern to all stored patterns. All
     distances are between 0.0 and 1.0
 
@@ -948,6 +1431,9 @@ class KNNClassifier(Serializable):
         are calculated
 
     :param distanceNorm Degree of the distance norm
+
+    :param overlapsWithProtos The overlaps of inputPattern with all stored
+        patterns, if they were already computed
     """
     if distanceNorm is None:
       distanceNorm = self.distanceNorm
@@ -956,7 +1442,8 @@ class KNNClassifier(Serializable):
     if self.useSparseMemory:
       if self._protoSizes is None:
         self._protoSizes = self._Memory.rowSums()
-      overlapsWithProtos = self._Memory.rightVecSumAtNZ(inputPattern)
+      if overlapsWithProtos is None:
+        overlapsWithProtos = self._overlapsWithProtos(inputPattern)
       inputPatternSum = inputPattern.sum()
 
       if self.distanceMethod == "rawOverlap":
@@ -995,6 +1482,48 @@ class KNNClassifier(Serializable):
     return dist
 
 
+  def _calcDistanceBatch(self, inputPatterns):
+    """Calculate the distances from each row of inputPatterns to all stored
+    patterns, like _calcDistance does for a single pattern.
+
+    The overlaps with the patterns in sparse memory are computed at once, the
+    other distances pattern by pattern.
+
+    :param inputPatterns 2D array with a pattern per row
+    """
+    if not self.useSparseMemory or self.distanceMethod == "norm":
+      dist = [self._calcDistance(inputPattern)
+              for inputPattern in inputPatterns]
+      return numpy.array(dist).reshape(len(inputPatterns), self._numPatterns)
+
+    if self._protoSizes is None:
+      self._protoSizes = self._Memory.rowSums()
+    overlapsWithProtos = self._Memory.rightDenseMatSumAtNZ(
+      inputPatterns.astype(numpy.float32))
+    inputPatternSums = inputPatterns.sum(axis=1).astype(
+      overlapsWithProtos.dtype)[:, numpy.newaxis]
+
+    if self.distanceMethod == "rawOverlap":
+      dist = inputPatternSums - overlapsWithProtos
+    elif self.distanceMethod == "pctOverlapOfInput":
+      dist = inputPatternSums - overlapsWithProtos
+      nonEmpty = inputPatternSums[:, 0] > 0
+      dist[nonEmpty] /= inputPatternSums[nonEmpty]
+    elif self.distanceMethod == "pctOverlapOfProto":
+      overlapsWithProtos /= self._protoSizes
+      dist = 1.0 - overlapsWithProtos
+    elif self.distanceMethod == "pctOverlapOfLarger":
+      maxVal = numpy.maximum(self._protoSizes, inputPatternSums)
+      nonZero = maxVal.all(axis=1)
+      overlapsWithProtos[nonZero] /= maxVal[nonZero]
+      dist = 1.0 - overlapsWithProtos
+    else:
+      raise RuntimeError("Unimplemented distance method %s" %
+        self.distanceMethod)
+
+    return dist
+
+
   def _getDistances(self, inputPattern, partitionId=None):
     """Return the distances from inputPattern to all stored patterns.
 
@@ -1004,6 +1533,23 @@ class KNNClassifier(Serializable):
     :param partitionId If provided, ignore all training vectors with this
         partitionId.
     """
+    return self._getDistancesAndCandidates(inputPattern, partitionId)[0]
+
+
+  def _getDistancesAndCandidates(self, inputPattern, partitionId=None):
+    """Return the distances from inputPattern to all stored patterns, along
+    with the candidate nearest neighbors found with the overlap index.
+
+    :param inputPattern The pattern from which distances to all other patterns
+        are returned
+
+    :param partitionId If provided, ignore all training vectors with this
+        partitionId.
+
+    :returns: (dist, candidates) where candidates are the sorted indices of the
+        patterns sharing active bits with inputPattern, the only ones closer
+        than the maximum distance, or None if the overlap index was not used.
+    """
     if not self._finishedLearning:
       self.finishLearning()
       self._finishedLearning = True
@@ -1014,7 +1560,14 @@ class KNNClassifier(Serializable):
     sparseInput = self._sparsifyVector(inputPattern)
 
     # Compute distances
-    dist = self._calcDistance(sparseInput)
+    candidates = None
+    if self._usesOverlapIndex() and sparseInput.any():
+      overlapsWithProtos = self._overlapIndex.overlaps(sparseInput)
+      candidates = overlapsWithProtos.nonzero()[0]
+      dist = self._calcDistance(sparseInput,
+                                overlapsWithProtos=overlapsWithProtos)
+    else:
+      dist = self._calcDistance(sparseInput)
     # Invalidate results where category is -1
     if self._specificIndexTraining:
       dist[numpy.array(self._categoryList) == -1] = numpy.inf
@@ -1023,7 +1576,69 @@ class KNNClassifier(Serializable):
     if partitionId is not None:
       dist[self._partitionIdMap.get(partitionId, [])] = numpy.inf
 
-    return dist
+    return dist, candidates
+
+
+  @staticmethod
+  def _sortNeighbors(dist, candidates, numNeighbors):
+    """Return the indices of patterns sorted by distance, starting with the
+    numNeighbors nearest ones.
+
+    When at least numNeighbors candidates are at a finite distance, only the
+    candidates as close as the numNeighbors-th nearest one are returned, as
+    all the other patterns are further away. With candidates, ties are broken
+    by pattern index.
+    """
+    if candidates is None:
+      return dist.argsort()
+
+    candidates = candidates[numpy.isfinite(dist[candidates])]
+    if len(candidates) < numNeighbors:
+      return dist.argsort(kind="mergesort")
+
+    candidateDist = dist[candidates]
+    if 0 < numNeighbors < len(candidates):
+      kthDist = numpy.partition(candidateDist,
+                                numNeighbors - 1)[numNeighbors - 1]
+      nearest = candidateDist <= kthDist
+      candidates = candidates[nearest]
+      candidateDist = candidateDist[nearest]
+    return candidates[candidateDist.argsort(kind="mergesort")]
+
+
+  def _candidateCategoryDistances(self, maxCategoryIdx, dist, candidates):
+    """Return the distance from the input to the nearest pattern of each
+    category, like min_score_per_category, from the candidates only.
+
+    The category distances get clipped at 1.0, so only the candidates closer
+    than that are looked at. All the patterns go through
+    min_score_per_category when other patterns are that close too, as with
+    raw overlaps of non-binary inputs, or when the candidates are a large part
+    of the patterns, which makes it faster.
+    """
+    candidates = candidates[dist[candidates] < 1.0]
+    if (len(candidates) > len(dist) / 4 or
+        numpy.count_nonzero(dist < 1.0) > len(candidates)):
+      return min_score_per_category(maxCategoryIdx, self._categoryList, dist)
+
+    categoryDist = numpy.ones(maxCategoryIdx+1, dtype=numpy.float32)
+    if len(candidates) == 0:
+      return categoryDist
+
+    categories = numpy.array([self._categoryList[i]
+                              for i in candidates.tolist()], dtype=numpy.int64)
+    candidateDist = dist[candidates]
+    valid = categories >= 0
+    categories = categories[valid]
+    candidateDist = candidateDist[valid]
+
+    # Sort by category then distance, and keep the first of each category
+    order = numpy.lexsort((candidateDist, categories))
+    categories = categories[order]
+    first = numpy.ones(len(categories), dtype=bool)
+    first[1:] = categories[1:] != categories[:-1]
+    categoryDist[categories[first]] = candidateDist[order][first]
+    return categoryDist
 
 
   def finishLearning(self):
@@ -1133,6 +1748,7 @@ class KNNClassifier(Serializable):
     self._Memory = numpy.zeros((self._numPatterns,self.numSVDDims))
     self._M = self._Memory
     self.useSparseMemory = False
+    self._overlapIndex = None
 
     for i in range(self._numPatterns):
       self._Memory[i] = numpy.dot(self._vt, self._a[i])
@@ -1228,6 +1844,16 @@ class KNNClassifier(Serializable):
     knn.replaceDuplicates = proto.replaceDuplicates
     knn.cellsPerCol = proto.cellsPerCol
     knn.minSparsity = proto.minSparsity
+    knn.useOverlapIndex = proto.useOverlapIndex
+    knn.evictionPolicy = proto.evictionPolicy or "leastRecentlyUsed"
+    knn.maxPatternsPerCategory = proto.maxPatternsPerCategory
+    knn.evictionBatchSize = max(proto.evictionBatchSize, 1)
+    if proto._has("random"):
+      knn._random = NupicRandom()
+      knn._random.read(proto.random)
+    else:
+      # Backward compatibility: written before the eviction policies
+      knn._random = NupicRandom(42)
 
     if knn.numSVDDims == "adaptive":
       knn._adaptiveSVDDims = True
@@ -1246,6 +1872,7 @@ class KNNClassifier(Serializable):
       knn._Memory = None
 
     knn._numPatterns = proto.numPatterns
+    knn._rebuildOverlapIndex()
 
     if len(proto.m) > 0:
       knn._M = numpy.array(proto.m, dtype=numpy.float64)
@@ -1260,6 +1887,26 @@ class KNNClassifier(Serializable):
     knn._iterationIdx = proto.iterationIdx
     knn._finishedLearning = proto.finishedLearning
 
+    if knn.fixedCapacity:
+      knn._categoryRecencyList = list(proto.categoryRecencyList)
+      knn._patternMatchTimes = list(proto.patternMatchTimes)
+      knn._matchTime = proto.matchTime
+      knn._numPatternsSeen = proto.numPatternsSeen
+      knn._numPatternsSeenPerCategory = dict(
+        zip(proto.seenCategories, proto.numPatternsSeenPerCategory))
+
+      # Backward compatibility: protos written before the eviction policies
+      # have none of this state, so pad it the way __setstate__ does.
+      categoryList = knn._categoryList
+      if len(knn._categoryRecencyList) == 0 and knn._numPatterns > 0:
+        knn._categoryRecencyList = [0] * len(categoryList)
+      if len(knn._patternMatchTimes) == 0 and knn._numPatterns > 0:
+        knn._patternMatchTimes = [0] * len(categoryList)
+        knn._matchTime = 0
+        knn._numPatternsSeen = len(categoryList)
+        knn._numPatternsSeenPerCategory = dict(
+          (c, categoryList.count(c)) for c in set(categoryList))
+
     if len(proto.s) > 0:
       knn._s = numpy.array(proto.s, dtype=numpy.float32)
 
@@ -1301,6 +1948,11 @@ class KNNClassifier(Serializable):
     proto.replaceDuplicates = bool(self.replaceDuplicates)
     proto.cellsPerCol = self.cellsPerCol
     proto.minSparsity = self.minSparsity
+    proto.useOverlapIndex = bool(self.useOverlapIndex)
+    proto.evictionPolicy = self.evictionPolicy
+    proto.maxPatternsPerCategory = self.maxPatternsPerCategory
+    proto.evictionBatchSize = self.evictionBatchSize
+    self._random.write(proto.random)
 
     # Write private state
     if self._Memory is  None:
@@ -1325,6 +1977,16 @@ class KNNClassifier(Serializable):
     proto.finishedLearning = bool(self._finishedLearning)
     proto.iterationIdx = self._iterationIdx
 
+    if self.fixedCapacity:
+      proto.categoryRecencyList = self._categoryRecencyList
+      proto.patternMatchTimes = self._patternMatchTimes
+      proto.matchTime = self._matchTime
+      proto.numPatternsSeen = self._numPatternsSeen
+      seenCategories = sorted(self._numPatternsSeenPerCategory)
+      proto.seenCategories = seenCategories
+      proto.numPatternsSeenPerCategory = [
+        self._numPatternsSeenPerCategory[c] for c in seenCategories]
+
     if self._s is not None:
       proto.s = self._s.tolist()
 
@@ -1361,6 +2023,23 @@ class KNNClassifier(Serializable):
     if "minSparsity" not in state:
       state["minSparsity"] = 0.0
 
+    if "useOverlapIndex" not in state:
+      state["useOverlapIndex"] = False
+      state["_overlapIndex"] = None
+
+    if "evictionPolicy" not in state:
+      state["evictionPolicy"] = "leastRecentlyUsed"
+      state["maxPatternsPerCategory"] = -1
+      state["evictionBatchSize"] = 1
+      state["_random"] = NupicRandom(42)
+      if state.get("fixedCapacity"):
+        categoryList = state["_categoryList"]
+        state["_patternMatchTimes"] = [0] * len(categoryList)
+        state["_matchTime"] = 0
+        state["_numPatternsSeen"] = len(categoryList)
+        state["_numPatternsSeenPerCategory"] = dict(
+          (c, categoryList.count(c)) for c in set(categoryList))
+
     self.__dict__.update(state)
 
     # Backward compatibility
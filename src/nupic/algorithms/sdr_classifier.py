@@ -227,11 +227,7 @@ class SDRClassifier(Serializable):
     # Update maxInputIdx and augment weight matrix with zero padding
     if max(patternNZ) > self._maxInputIdx:
       newMaxInputIdx = max(patternNZ)
-      for nSteps in self.steps:
-        self._weightMatrix[nSteps] = numpy.concatenate((
-          self._weightMatrix[nSteps],
-          numpy.zeros(shape=(newMaxInputIdx-self._maxInputIdx,
-                             self._maxBucketIdx+1))), axis=0)
+      self._growWeightMatrices(newMaxInputIdx, self._maxBucketIdx)
       self._maxInputIdx = int(newMaxInputIdx)
 
     # Get classification info
@@ -264,12 +260,7 @@ class SDRClassifier(Serializable):
 
         # Update maxBucketIndex and augment weight matrix with zero padding
         if bucketIdx > self._maxBucketIdx:
-          for nSteps in self.steps:
-            self._weightMatrix[nSteps] = numpy.concatenate((
-              self._weightMatrix[nSteps],
-              numpy.zeros(shape=(self._maxInputIdx+1,
-                                 bucketIdx-self._maxBucketIdx))), axis=1)
-
+          self._growWeightMatrices(self._maxInputIdx, bucketIdx)
           self._maxBucketIdx = int(bucketIdx)
 
         # Update rolling average of actual values if it's a scalar. If it's
@@ -289,13 +280,16 @@ class SDRClassifier(Serializable):
           else:
             self._actualValues[bucketIdx] = actValue
 
-      for (learnRecordNum, learnPatternNZ) in self._patternNZHistory:
-        error = self._calculateError(recordNum, bucketIdxList)
+      # The error for a number of steps only depends on the weights for that
+      # number of steps, which are updated once below, so all the errors can
+      # be computed up front.
+      error = self._calculateError(recordNum, bucketIdxList)
 
+      for (learnRecordNum, learnPatternNZ) in self._patternNZHistory:
         nSteps = recordNum - learnRecordNum
         if nSteps in self.steps:
-          for bit in learnPatternNZ:
-            self._weightMatrix[nSteps][bit, :] += self.alpha * error[nSteps]
+          self._updateWeights(self._weightMatrix[nSteps], learnPatternNZ,
+                              self.alpha * error[nSteps])
 
     # ------------------------------------------------------------------------
     # Verbose print
@@ -475,6 +469,59 @@ class SDRClassifier(Serializable):
     proto.verbosity = self.verbosity
 
 
+  def _growWeightMatrices(self, maxInputIdx, maxBucketIdx):
+    """
+    Pads the weight matrices with zeros so that their shape is
+    (maxInputIdx + 1, maxBucketIdx + 1).
+
+    Each weight matrix is a view of the top-left corner of a larger, zeroed
+    buffer. When the buffer is large enough, growing a matrix only takes a
+    bigger view of it. Otherwise a new buffer is allocated with twice the
+    capacity in each dimension that grows, so that growing one input or bucket
+    at a time doesn't copy the weights every time.
+
+    :param maxInputIdx: the highest input index the matrices must hold
+    :param maxBucketIdx: the highest bucket index the matrices must hold
+    """
+    numRows = int(maxInputIdx) + 1
+    numCols = int(maxBucketIdx) + 1
+
+    for nSteps in self.steps:
+      matrix = self._weightMatrix[nSteps]
+      buf = matrix.base
+
+      if (buf is None or buf.ndim != 2 or
+          buf.ctypes.data != matrix.ctypes.data or
+          buf.strides != matrix.strides or
+          buf.shape[0] < numRows or buf.shape[1] < numCols):
+        capacity = list(matrix.shape)
+        if numRows > capacity[0]:
+          capacity[0] = max(numRows, 2 * capacity[0])
+        if numCols > capacity[1]:
+          capacity[1] = max(numCols, 2 * capacity[1])
+        buf = numpy.zeros(shape=capacity)
+        buf[:matrix.shape[0], :matrix.shape[1]] = matrix
+
+      self._weightMatrix[nSteps] = buf[:numRows, :numCols]
+
+
+  @staticmethod
+  def _updateWeights(weightMatrix, patternNZ, delta):
+    """
+    Adds 'delta' to the rows of the weight matrix of each active input bit.
+
+    :param weightMatrix: numpy array of the weight matrix
+    :param patternNZ: list of the active indices from the output below
+    :param delta: numpy array of the change for each bucket index
+    """
+    bits = numpy.asarray(patternNZ, dtype=int)
+    if numpy.unique(bits).size == bits.size:
+      weightMatrix[bits] += delta
+    else:
+      # A bit that appears several times is updated once for each occurrence
+      numpy.add.at(weightMatrix, bits, delta)
+
+
   def _calculateError(self, recordNum, bucketIdxList):
     """
     Calculate error signal
@@ -19,6 +19,8 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
+import itertools
+
 try:
   import capnp
 except ImportError:
@@ -40,6 +42,8 @@ uintType = "uint32"
 
 VERSION = 3
 PERMANENCE_EPSILON = 0.000001
+# Largest number of permanences the learning methods copy into a dense block
+MAX_PERMANENCE_BLOCK_SIZE = 2**20
 EPSILON_ROUND = 5
 
 
@@ -359,6 +363,16 @@ class SpatialPooler(Serializable):
     # stored separately for efficiency purposes.
     self._connectedCounts = numpy.zeros(numColumns, dtype=realDType)
 
+    # The transpose of 'self._connectedSynapses', whose rows map to input bits
+    # and columns map to cortical columns. It is built on the first call to
+    # computeSparse, and kept in sync with 'self._connectedSynapses' from then
+    # on, so that overlaps can be computed from the active inputs alone.
+    self._connectedSynapsesByInput = None
+
+    # Precomputed neighborhoods of the inputs, looked up by
+    # _getInputNeighborhood.
+    self._inputNeighborhoods = topology.NeighborhoodCache()
+
     # Initialize the set of permanence values for each column. Ensure that
     # each column is connected to enough input bits to allow it to be
     # activated.
@@ -368,6 +382,9 @@ class SpatialPooler(Serializable):
       perm = self._initPermanence(potential, initConnectedPct)
       self._updatePermanencesForColumn(perm, columnIndex, raisePerm=True)
 
+    # The input neighborhoods are only needed to map the potential pools.
+    self._inputNeighborhoods.clear()
+
     self._overlapDutyCycles = numpy.zeros(numColumns, dtype=realDType)
     self._activeDutyCycles = numpy.zeros(numColumns, dtype=realDType)
     self._minOverlapDutyCycles = numpy.zeros(numColumns,
@@ -934,6 +951,50 @@ class SpatialPooler(Serializable):
     activeArray[activeColumns] = 1
 
 
+  def computeSparse(self, activeInputIndices, learn):
+    """
+    Same as :meth:`compute`, for a sparse input. Rather than a dense input
+    vector, this method takes the indices of the input bits that are on, and
+    computes the overlaps from the connected synapses of these inputs only. It
+    returns the indices of the active columns instead of filling a dense array.
+
+    :param activeInputIndices: (iter) The indices of the input bits that are on.
+    :param learn: (bool) Whether learning should be performed, see
+        :meth:`compute`.
+    :returns: (numpy array) The sorted indices of the active columns.
+    """
+    activeInputIndices = numpy.unique(numpy.asarray(activeInputIndices,
+                                                    dtype="int64"))
+    if activeInputIndices.size > 0 and (
+        activeInputIndices[0] < 0 or
+        activeInputIndices[-1] >= self._numInputs):
+      raise ValueError(
+          "Input indices must be in the range [0, %d)" % self._numInputs)
+
+    self._updateBookeepingVars(learn)
+    self._overlaps = self._calculateOverlapSparse(activeInputIndices)
+
+    # Apply boosting when learning is on
+    if learn:
+      self._boostedOverlaps = self._boostFactors * self._overlaps
+    else:
+      self._boostedOverlaps = self._overlaps
+
+    # Apply inhibition to determine the winning columns
+    activeColumns = self._inhibitColumns(self._boostedOverlaps)
+
+    if learn:
+      self._adaptSynapsesSparse(activeInputIndices, activeColumns)
+      self._updateDutyCycles(self._overlaps, activeColumns)
+      self._bumpUpWeakColumns()
+      self._updateBoostFactors()
+      if self._isUpdateRound():
+        self._updateInhibitionRadius()
+        self._updateMinDutyCycles()
+
+    return numpy.sort(activeColumns)
+
+
   def stripUnlearnedColumns(self, activeArray):
     """
     Removes the set of columns who have never been active from the set of
@@ -983,14 +1044,18 @@ class SpatialPooler(Serializable):
     _updateMinDutyCyclesGlobal, here the values can be quite different for
     different columns.
     """
-    for column in xrange(self._numColumns):
-      neighborhood = self._getColumnNeighborhood(column)
-
-      maxActiveDuty = self._activeDutyCycles[neighborhood].max()
-      maxOverlapDuty = self._overlapDutyCycles[neighborhood].max()
+    if not self._hasDefaultColumnTopology():
+      for column in xrange(self._numColumns):
+        neighborhood = self._getColumnNeighborhood(column)
+        maxOverlapDuty = self._overlapDutyCycles[neighborhood].max()
+        self._minOverlapDutyCycles[column] = (maxOverlapDuty *
+                                              self._minPctOverlapDutyCycles)
+      return
 
-      self._minOverlapDutyCycles[column] = (maxOverlapDuty *
-                                            self._minPctOverlapDutyCycles)
+    maxOverlapDuty = self._reduceColumnNeighborhoods(self._overlapDutyCycles,
+                                                     numpy.maximum)
+    self._minOverlapDutyCycles[:] = (maxOverlapDuty.astype(numpy.float64) *
+                                     self._minPctOverlapDutyCycles)
 
 
   def _updateDutyCycles(self, overlaps, activeColumns):
@@ -1164,14 +1229,28 @@ class SpatialPooler(Serializable):
                     survived inhibition.
     """
     inputIndices = numpy.where(inputVector > 0)[0]
+    self._adaptSynapsesSparse(inputIndices, activeColumns)
+
+
+  def _adaptSynapsesSparse(self, activeInputIndices, activeColumns):
+    """
+    Same as _adaptSynapses, with the input given as the indices of the input
+    bits that are on.
+
+    Parameters:
+    ----------------------------
+    :param activeInputIndices:
+                    An array containing the indices of the input bits that are
+                    on.
+    :param activeColumns:
+                    An array containing the indices of the columns that
+                    survived inhibition.
+    """
     permChanges = numpy.zeros(self._numInputs, dtype=realDType)
     permChanges.fill(-1 * self._synPermInactiveDec)
-    permChanges[inputIndices] = self._synPermActiveInc
-    for columnIndex in activeColumns:
-      perm = self._permanences[columnIndex]
-      maskPotential = numpy.where(self._potentialPools[columnIndex] > 0)[0]
-      perm[maskPotential] += permChanges[maskPotential]
-      self._updatePermanencesForColumn(perm, columnIndex, raisePerm=True)
+    permChanges[activeInputIndices] = self._synPermActiveInc
+    self._adaptPermanencesForColumns(activeColumns, permChanges,
+                                     raisePerm=True)
 
 
   def _bumpUpWeakColumns(self):
@@ -1183,11 +1262,84 @@ class SpatialPooler(Serializable):
     """
     weakColumns = numpy.where(self._overlapDutyCycles
                                 < self._minOverlapDutyCycles)[0]
-    for columnIndex in weakColumns:
-      perm = self._permanences[columnIndex].astype(realDType)
-      maskPotential = numpy.where(self._potentialPools[columnIndex] > 0)[0]
-      perm[maskPotential] += self._synPermBelowStimulusInc
-      self._updatePermanencesForColumn(perm, columnIndex, raisePerm=False)
+    permChanges = numpy.empty(self._numInputs, dtype=realDType)
+    permChanges.fill(self._synPermBelowStimulusInc)
+    self._adaptPermanencesForColumns(weakColumns, permChanges,
+                                     raisePerm=False)
+
+
+  def _adaptPermanencesForColumns(self, columnIndices, permChanges,
+                                  raisePerm):
+    """
+    Adds 'permChanges' to the permanences of the potential synapses of several
+    columns, and stores the new permanences. This is equivalent to calling
+    _updatePermanencesForColumn on each column, but each step is applied to all
+    the columns at once, on a dense block of their permanences. Columns are
+    processed in chunks to bound the size of the block.
+
+    Parameters:
+    ----------------------------
+    :param columnIndices: The indices identifying the columns to update.
+    :param permChanges: An array with the change to apply to the permanence of
+                    the synapse to each input bit, if it is in the column's
+                    potential pool.
+    :param raisePerm: A boolean value indicating whether the permanence values
+                    should be raised until a minimum number are synapses are in
+                    a connected state.
+    """
+    chunkSize = max(1, MAX_PERMANENCE_BLOCK_SIZE // self._numInputs)
+    for start in xrange(0, len(columnIndices), chunkSize):
+      columns = columnIndices[start:start + chunkSize]
+
+      perms = numpy.array([self._permanences[c] for c in columns],
+                          dtype=realDType, ndmin=2)
+      potential = numpy.array([self._potentialPools[c] for c in columns],
+                              ndmin=2) > 0
+      perms += potential * permChanges
+
+      if raisePerm:
+        self._raisePermanencesToThreshold(perms, potential)
+      perms[perms < self._synPermTrimThreshold] = 0
+      numpy.clip(perms, self._synPermMin, self._synPermMax, out=perms)
+      connected = perms >= self._synPermConnected - PERMANENCE_EPSILON
+
+      for i, columnIndex in enumerate(columns):
+        if self._connectedSynapsesByInput is not None:
+          self._updateConnectedSynapsesByInput(columnIndex, connected[i])
+        self._permanences.update(columnIndex, perms[i])
+        self._connectedSynapses.replace(columnIndex,
+                                        numpy.flatnonzero(connected[i]))
+      self._connectedCounts[columns] = connected.sum(axis=1)
+
+
+  def _raisePermanencesToThreshold(self, perms, potential):
+    """
+    Same as _raisePermanenceToThreshold, for a block of columns.
+
+    Parameters:
+    ----------------------------
+    :param perms:   A 2D array of permanence values, one row per column.
+    :param potential: A 2D boolean array marking the potential synapses of the
+                    columns.
+    """
+    if (potential.sum(axis=1) < self._stimulusThreshold).any():
+      raise Exception("This is likely due to a " +
+      "value of stimulusThreshold that is too large relative " +
+      "to the input size. [len(mask) < self._stimulusThreshold]")
+
+    numpy.clip(perms, self._synPermMin, self._synPermMax, out=perms)
+    if self._stimulusThreshold <= 0:
+      return
+
+    increment = potential * realDType(self._synPermBelowStimulusInc)
+    rows = numpy.arange(len(perms))
+    while True:
+      numConnected = numpy.count_nonzero(
+        perms[rows] > self._synPermConnected - PERMANENCE_EPSILON, axis=1)
+      rows = rows[numConnected < self._stimulusThreshold]
+      if rows.size == 0:
+        return
+      perms[rows] += increment[rows]
 
 
   def _raisePermanenceToThreshold(self, perm, mask):
@@ -1256,13 +1408,34 @@ class SpatialPooler(Serializable):
       self._raisePermanenceToThreshold(perm, maskPotential)
     perm[perm < self._synPermTrimThreshold] = 0
     numpy.clip(perm, self._synPermMin, self._synPermMax, out=perm)
-    newConnected = numpy.where(perm >=
-                               self._synPermConnected - PERMANENCE_EPSILON)[0]
+    isConnected = perm >= self._synPermConnected - PERMANENCE_EPSILON
+    newConnected = numpy.where(isConnected)[0]
+    if self._connectedSynapsesByInput is not None:
+      self._updateConnectedSynapsesByInput(columnIndex, isConnected)
     self._permanences.update(columnIndex, perm)
     self._connectedSynapses.replace(columnIndex, newConnected)
     self._connectedCounts[columnIndex] = newConnected.size
 
 
+  def _updateConnectedSynapsesByInput(self, columnIndex, isConnected):
+    """
+    Updates the column 'columnIndex' of 'self._connectedSynapsesByInput' with
+    the new set of inputs the column is connected to. Only the inputs whose
+    state changed are touched. Must be called before the column's row of
+    'self._connectedSynapses' is replaced.
+
+    Parameters:
+    ----------------------------
+    :param columnIndex: The index identifying a column.
+    :param isConnected: A boolean array, True for the inputs the column is now
+                    connected to.
+    """
+    wasConnected = self._connectedSynapses[columnIndex].astype("bool")
+    for inputIndex in numpy.flatnonzero(wasConnected != isConnected):
+      self._connectedSynapsesByInput.set(int(inputIndex), int(columnIndex),
+                                         bool(isConnected[inputIndex]))
+
+
   def _initPermConnected(self):
     """
     Returns a randomly generated permanence value for a synapses that is
@@ -1500,10 +1673,16 @@ class SpatialPooler(Serializable):
     # Determine the target activation level for each column
     # The targetDensity is the average activeDutyCycles of the neighboring
     # columns of each column.
-    targetDensity = numpy.zeros(self._numColumns, dtype=realDType)
-    for i in xrange(self._numColumns):
-      maskNeighbors = self._getColumnNeighborhood(i)
-      targetDensity[i] = numpy.mean(self._activeDutyCycles[maskNeighbors])
+    if self._hasDefaultColumnTopology():
+      neighborhoodSums = self._reduceColumnNeighborhoods(
+        self._activeDutyCycles.astype(numpy.float64), numpy.add)
+      targetDensity = (neighborhoodSums /
+                       self._columnNeighborhoodSizes()).astype(realDType)
+    else:
+      targetDensity = numpy.zeros(self._numColumns, dtype=realDType)
+      for i in xrange(self._numColumns):
+        maskNeighbors = self._getColumnNeighborhood(i)
+        targetDensity[i] = numpy.mean(self._activeDutyCycles[maskNeighbors])
 
     self._boostFactors = numpy.exp(
       (targetDensity - self._activeDutyCycles) * self._boostStrength)
@@ -1545,6 +1724,31 @@ class SpatialPooler(Serializable):
     return overlaps
 
 
+  def _calculateOverlapSparse(self, activeInputIndices):
+    """
+    Same as _calculateOverlap, with the input given as the indices of the input
+    bits that are on. Only the connected synapses of these inputs are visited.
+
+    Parameters:
+    ----------------------------
+    :param activeInputIndices: a numpy array of the indices of the input bits
+                    that are on.
+    """
+    if self._connectedSynapsesByInput is None:
+      self._connectedSynapsesByInput = SparseBinaryMatrix(
+        self._connectedSynapses)
+      self._connectedSynapsesByInput.transpose()
+
+    if len(activeInputIndices) == 0:
+      return numpy.zeros(self._numColumns, dtype=realDType)
+
+    connectedColumns = numpy.concatenate(
+      [self._connectedSynapsesByInput.getRowSparse(int(inputIndex))
+       for inputIndex in activeInputIndices])
+    overlaps = numpy.bincount(connectedColumns, minlength=self._numColumns)
+    return overlaps.astype(realDType)
+
+
   def _calculateOverlapPct(self, overlaps):
     return overlaps.astype(realDType) / self._connectedCounts
 
@@ -1598,21 +1802,30 @@ class SpatialPooler(Serializable):
     """
     #calculate num active per inhibition area
     numActive = int(density * self._numColumns)
-
-    # Calculate winners using stable sort algorithm (mergesort)
-    # for compatibility with C++
-    sortedWinnerIndices = numpy.argsort(overlaps, kind='mergesort')
+    if numActive <= 0:
+      return numpy.array([], dtype=int)
+
+    # Select the winners in linear time. They are the same as the last
+    # 'numActive' columns of a stable sort (mergesort) of the overlaps, which
+    # is what the C++ implementation uses: overlaps tied with the weakest
+    # winner are won by the columns with the highest indices.
+    numColumns = len(overlaps)
+    if numActive >= numColumns:
+      winners = numpy.arange(numColumns)
+    else:
+      minWinningOverlap = numpy.partition(overlaps,
+                                          numColumns - numActive)[
+                                            numColumns - numActive]
+      winners = numpy.flatnonzero(overlaps > minWinningOverlap)
+      tied = numpy.flatnonzero(overlaps == minWinningOverlap)
+      winners = numpy.concatenate(
+        (winners, tied[len(tied) - (numActive - len(winners)):]))
 
     # Enforce the stimulus threshold
-    start = len(sortedWinnerIndices) - numActive
-    while start < len(sortedWinnerIndices):
-      i = sortedWinnerIndices[start]
-      if overlaps[i] >= self._stimulusThreshold:
-        break
-      else:
-        start += 1
+    winners = winners[overlaps[winners] >= self._stimulusThreshold]
 
-    return sortedWinnerIndices[start:][::-1]
+    # Strongest first, ties broken by descending index
+    return winners[numpy.lexsort((winners, overlaps[winners]))[::-1]]
 
 
   def _inhibitColumnsLocal(self, overlaps, density):
@@ -1634,6 +1847,8 @@ class SpatialPooler(Serializable):
                     of surviving columns is likely to vary.
     @return list with indices of the winning columns
     """
+    if self._hasDefaultColumnTopology():
+      return self._inhibitColumnsLocalVectorized(overlaps, density)
 
     activeArray = numpy.zeros(self._numColumns, dtype="bool")
 
@@ -1657,6 +1872,196 @@ class SpatialPooler(Serializable):
     return activeArray.nonzero()[0]
 
 
+  def _inhibitColumnsLocalVectorized(self, overlaps, density):
+    """
+    Vectorized equivalent of the per-column loop in _inhibitColumnsLocal, used
+    with the default column topology. Rather than visiting every column and
+    building its neighborhood, it visits every offset within the inhibition
+    radius and compares all columns with their neighbor at that offset at once.
+
+    Ties are resolved like the loop resolves them: a column loses a tie to
+    each tied neighbor with a lower index that has already been selected.
+    Columns whose outcome does not depend on how their ties are resolved are
+    decided in bulk; the remaining ones are decided in column order using their
+    precomputed lists of tied neighbors.
+
+    :param overlaps: an array containing the overlap score for each column.
+    :param density: The fraction of columns to survive inhibition.
+    @return list with indices of the winning columns
+    """
+    columns = numpy.arange(self._numColumns)
+    numBigger = numpy.zeros(self._numColumns, dtype="int32")
+    numTies = numpy.zeros(self._numColumns, dtype="int32")
+
+    for neighbors, exists in self._iterColumnNeighbors(columns):
+      neighborOverlaps = overlaps[neighbors]
+      bigger = neighborOverlaps > overlaps
+      tied = (neighborOverlaps == overlaps) & (neighbors < columns)
+      if exists is not None:
+        bigger &= exists
+        tied &= exists
+      numBigger += bigger
+      numTies += tied
+
+    numActive = (0.5 + density * self._columnNeighborhoodSizes()).astype(int)
+    candidates = ((overlaps >= self._stimulusThreshold) &
+                  (numBigger < numActive))
+
+    # Columns that win even if they lose every tie.
+    activeArray = candidates & (numBigger + numTies < numActive)
+
+    undecided = numpy.flatnonzero(candidates & ~activeArray)
+    if undecided.size > 0:
+      tiedPairs = []
+      undecidedOverlaps = overlaps[undecided]
+      for neighbors, exists in self._iterColumnNeighbors(undecided):
+        tied = ((overlaps[neighbors] == undecidedOverlaps) &
+                (neighbors < undecided))
+        if exists is not None:
+          tied &= exists
+        positions = numpy.flatnonzero(tied)
+        tiedPairs.append((positions, neighbors[positions]))
+
+      positions = numpy.concatenate([pair[0] for pair in tiedPairs])
+      tiedNeighbors = numpy.concatenate([pair[1] for pair in tiedPairs])
+      tiedNeighbors = tiedNeighbors[numpy.argsort(positions, kind="mergesort")]
+      indptr = numpy.zeros(undecided.size + 1, dtype=int)
+      numpy.cumsum(numpy.bincount(positions, minlength=undecided.size),
+                   out=indptr[1:])
+
+      # Every tied neighbor has a lower index, so its own outcome is final by
+      # the time a column is visited.
+      for i, column in enumerate(undecided):
+        numTiesLost = numpy.count_nonzero(
+          activeArray[tiedNeighbors[indptr[i]:indptr[i + 1]]])
+        if numBigger[column] + numTiesLost < numActive[column]:
+          activeArray[column] = True
+
+    return activeArray.nonzero()[0]
+
+
+  def _hasDefaultColumnTopology(self):
+    """
+    Returns True if column neighborhoods come from the topology module over the
+    column dimensions, so that they can be computed for all columns at once.
+    Subclasses that override _getColumnNeighborhood get the per-column code
+    paths instead.
+    """
+    return (type(self)._getColumnNeighborhood.im_func is
+            SpatialPooler._getColumnNeighborhood.im_func and
+            numpy.prod(self._columnDimensions) == self._numColumns)
+
+
+  def _columnNeighborOffsets(self):
+    """
+    Returns, for each column dimension, the offsets from a column to its
+    neighbors along that dimension. A column's neighborhood is every
+    combination of these offsets, in the same order as the neighborhoods
+    returned by _getColumnNeighborhood. With wrapAround the offsets are
+    limited so that no neighbor is visited twice.
+    """
+    radius = self._inhibitionRadius
+    offsets = []
+    for dimension in self._columnDimensions:
+      if self._wrapAround:
+        offsets.append(xrange(-radius, min(radius, dimension - 1 - radius) + 1))
+      else:
+        reach = min(radius, dimension - 1)
+        offsets.append(xrange(-reach, reach + 1))
+    return offsets
+
+
+  def _iterColumnNeighbors(self, columns):
+    """
+    Iterates over the offsets in a column neighborhood. For each offset, yields
+    the neighbor of every column in 'columns' at that offset, along with a
+    boolean array marking which of these neighbors exist. The mask is None
+    when they all do, which is always the case with wrapAround.
+
+    :param columns: (numpy array) The indices of the center columns.
+    """
+    dimensions = self._columnDimensions
+    coordinates = numpy.unravel_index(columns, dimensions)
+    mode = "wrap" if self._wrapAround else "clip"
+
+    for offset in itertools.product(*self._columnNeighborOffsets()):
+      shifted = [coordinate + delta
+                 for coordinate, delta in zip(coordinates, offset)]
+      neighbors = numpy.ravel_multi_index(shifted, dimensions, mode=mode)
+
+      exists = None
+      if not self._wrapAround:
+        for coordinate, delta, dimension in zip(shifted, offset, dimensions):
+          if delta < 0:
+            inside = coordinate >= 0
+          elif delta > 0:
+            inside = coordinate < dimension
+          else:
+            continue
+          exists = inside if exists is None else exists & inside
+
+      yield neighbors, exists
+
+
+  def _columnNeighborhoodSizes(self):
+    """
+    Returns the number of columns in the neighborhood of every column.
+    """
+    radius = self._inhibitionRadius
+    sizes = numpy.ones(tuple(self._columnDimensions), dtype=int)
+    for axis, dimension in enumerate(self._columnDimensions):
+      if self._wrapAround:
+        sizes *= min(2 * radius + 1, dimension)
+      else:
+        coordinates = numpy.arange(dimension)
+        axisSizes = (numpy.minimum(coordinates + radius, dimension - 1) -
+                     numpy.maximum(coordinates - radius, 0) + 1)
+        shape = [1] * self._columnDimensions.size
+        shape[axis] = dimension
+        sizes *= axisSizes.reshape(shape)
+    return sizes.reshape(-1)
+
+
+  def _reduceColumnNeighborhoods(self, values, ufunc):
+    """
+    Reduces 'values' over the neighborhood of every column. Neighborhoods are
+    hypercubes, so the reduction is computed as a sliding window along one
+    column dimension at a time.
+
+    :param values: (numpy array) One value per column.
+    :param ufunc: (numpy ufunc) An associative, commutative binary ufunc, such
+                  as numpy.maximum or numpy.add.
+    @returns (numpy array) The reduction over each column's neighborhood.
+    """
+    dimensions = self._columnDimensions
+    result = numpy.asarray(values).reshape(dimensions)
+    offsets = self._columnNeighborOffsets()
+
+    for axis, dimension in enumerate(dimensions):
+      coordinates = numpy.arange(dimension)
+      shape = [1] * dimensions.size
+      shape[axis] = dimension
+      reduced = None
+      for delta in offsets[axis]:
+        shifted = coordinates + delta
+        if self._wrapAround:
+          window = result.take(shifted % dimension, axis=axis)
+        else:
+          inside = (shifted >= 0) & (shifted < dimension)
+          window = result.take(numpy.clip(shifted, 0, dimension - 1),
+                               axis=axis)
+          # Neighbors past the edge repeat the center value, which leaves
+          # idempotent reductions unchanged and is zeroed out for sums.
+          if ufunc is numpy.add:
+            window = window * inside.reshape(shape)
+          else:
+            window = numpy.where(inside.reshape(shape), window, result)
+        reduced = window if reduced is None else ufunc(reduced, window)
+      result = reduced
+
+    return result.reshape(-1)
+
+
   def _isUpdateRound(self):
     """
     returns true if enough rounds have passed to warrant updates of
@@ -1695,7 +2100,8 @@ class SpatialPooler(Serializable):
     """
     Gets a neighborhood of inputs.
 
-    Simply calls topology.wrappingNeighborhood or topology.neighborhood.
+    Looks up the neighborhood computed by topology.wrappingNeighborhood or
+    topology.neighborhood in the input neighborhood cache.
 
     A subclass can insert different topology behavior by overriding this method.
 
@@ -1705,14 +2111,10 @@ class SpatialPooler(Serializable):
     @returns (1D numpy array of integers)
     The inputs in the neighborhood.
     """
-    if self._wrapAround:
-      return topology.wrappingNeighborhood(centerInput,
-                                           self._potentialRadius,
-                                           self._inputDimensions)
-    else:
-      return topology.neighborhood(centerInput,
-                                   self._potentialRadius,
-                                   self._inputDimensions)
+    return self._inputNeighborhoods.neighborhood(centerInput,
+                                                 self._potentialRadius,
+                                                 self._inputDimensions,
+                                                 self._wrapAround)
 
 
   def _seed(self, seed=-1):
@@ -1738,6 +2140,11 @@ class SpatialPooler(Serializable):
       # the overlaps and boostedOverlaps properties were added in version 3,
       state['_overlaps'] = numpy.zeros(self._numColumns, dtype=realDType)
       state['_boostedOverlaps'] = numpy.zeros(self._numColumns, dtype=realDType)
+    # the input neighborhood cache and the transposed connected synapses
+    # aren't part of older serialized states
+    state.setdefault('_inputNeighborhoods', topology.NeighborhoodCache())
+    state.pop('_columnNeighborhoods', None)
+    state.setdefault('_connectedSynapsesByInput', None)
 
     # update version property to current SP version
     state['_version'] = VERSION
@@ -1829,6 +2236,8 @@ class SpatialPooler(Serializable):
     instance._potentialPct = round(proto.potentialPct,
                                    EPSILON_ROUND)
     instance._inhibitionRadius = proto.inhibitionRadius
+    instance._inputNeighborhoods = topology.NeighborhoodCache()
+    instance._connectedSynapsesByInput = None
     instance._globalInhibition = proto.globalInhibition
     instance._numActiveColumnsPerInhArea = proto.numActiveColumnsPerInhArea
     instance._localAreaDensity = proto.localAreaDensity
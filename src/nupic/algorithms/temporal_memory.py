@@ -24,13 +24,15 @@ Temporal Memory implementation in Python. See
 `numenta.com <https://numenta.com/temporal-memory-algorithm/>`_ for details.
 """
 
+import itertools
 from collections import defaultdict
 from nupic.bindings.math import Random
 from operator import mul
 
+import numpy
+
 from nupic.algorithms.connections import Connections, binSearch
 from nupic.serializable import Serializable
-from nupic.support.group_by import groupby2
 
 try:
   import capnp
@@ -156,13 +158,19 @@ class TemporalMemory(Serializable):
 
 
 
-  @staticmethod
-  def connectionsFactory(*args, **kwargs):
+  # The Connections implementation created by connectionsFactory and used to
+  # read serialized connections. Subclasses may set it to choose a different
+  # implementation, such as ArrayConnections.
+  connectionsClass = Connections
+
+
+  @classmethod
+  def connectionsFactory(cls, *args, **kwargs):
     """
     Create a :class:`~nupic.algorithms.connections.Connections` instance.  
-    :class:`TemporalMemory` subclasses may override this method to choose a 
-    different :class:`~nupic.algorithms.connections.Connections` implementation, 
-    or to augment the instance otherwise returned by the default 
+    :class:`TemporalMemory` subclasses may override this method to augment the
+    instance otherwise returned by the :attr:`connectionsClass`
+    implementation, or set :attr:`connectionsClass` to choose a different
     :class:`~nupic.algorithms.connections.Connections` implementation.
 
     See :class:`~nupic.algorithms.connections.Connections` for constructor 
@@ -170,7 +178,7 @@ class TemporalMemory(Serializable):
 
     :returns: :class:`~nupic.algorithms.connections.Connections` instance
     """
-    return Connections(*args, **kwargs)
+    return cls.connectionsClass(*args, **kwargs)
 
 
   # ==============================
@@ -195,6 +203,73 @@ class TemporalMemory(Serializable):
     self.activateDendrites(learn)
 
 
+  def computeSequence(self, activeColumnSets, resets=None, learn=True,
+                      returnCells=False):
+    """
+    Perform one time step of the Temporal Memory algorithm for each record of
+    a sequence, e.g. when replaying history offline. This is equivalent to
+    calling :meth:`reset` (when requested) and :meth:`compute` for every
+    record, without the per-record call overhead.
+
+    :param activeColumnSets: (iter) Indices of active columns for each record.
+
+    :param resets: (iter) Optional flags, one per record. When a flag is true,
+           :meth:`reset` is called before computing that record. Raises a
+           ValueError when there are not as many flags as records.
+
+    :param learn: (bool) Whether or not learning is enabled.
+
+    :param returnCells: (bool) If true, collect the active and predictive cells
+           of every record.
+
+    :returns: ``None``, or if ``returnCells`` is true, a tuple
+              (``activeCells``, ``predictiveCells``). Each is a CSR pair
+              (``indptr``, ``indices``) of numpy arrays, in which the cells
+              of record ``i`` are ``indices[indptr[i]:indptr[i+1]]``.
+    """
+    activateCells = self.activateCells
+    activateDendrites = self.activateDendrites
+    reset = self.reset
+
+    lengthMismatch = "activeColumnSets and resets must have the same length"
+    missing = object()
+    if resets is None:
+      records = itertools.izip(activeColumnSets, itertools.repeat(False))
+    elif (hasattr(activeColumnSets, "__len__") and hasattr(resets, "__len__")
+          and len(activeColumnSets) != len(resets)):
+      raise ValueError(lengthMismatch)
+    else:
+      # Iterators without a length are checked as they run out
+      records = itertools.izip_longest(activeColumnSets, resets,
+                                       fillvalue=missing)
+
+    activeIndices = []
+    activeIndptr = [0]
+    predictiveIndices = []
+    predictiveIndptr = [0]
+
+    for activeColumns, resetBefore in records:
+      if activeColumns is missing or resetBefore is missing:
+        raise ValueError(lengthMismatch)
+      if resetBefore:
+        reset()
+
+      activateCells(sorted(activeColumns), learn)
+      activateDendrites(learn)
+
+      if returnCells:
+        activeIndices += self.getActiveCells()
+        activeIndptr.append(len(activeIndices))
+        predictiveIndices += self.getPredictiveCells()
+        predictiveIndptr.append(len(predictiveIndices))
+
+    if returnCells:
+      return ((numpy.array(activeIndptr, dtype="uint32"),
+               numpy.array(activeIndices, dtype="uint32")),
+              (numpy.array(predictiveIndptr, dtype="uint32"),
+               numpy.array(predictiveIndices, dtype="uint32")))
+
+
   def activateCells(self, activeColumns, learn=True):
     """
     Calculate the active cells, using the current active columns and dendrite
@@ -221,17 +296,15 @@ class TemporalMemory(Serializable):
     self.activeCells = []
     self.winnerCells = []
 
-    segToCol = lambda segment: int(segment.cell / self.cellsPerColumn)
-    identity = lambda x: x
-
-    for columnData in groupby2(activeColumns, identity,
-                               self.activeSegments, segToCol,
-                               self.matchingSegments, segToCol):
+    for columnData in self._groupByColumn(activeColumns,
+                                          self.activeSegments,
+                                          self.matchingSegments,
+                                          self.cellsPerColumn):
       (column,
-       activeColumns,
+       isActiveColumn,
        columnActiveSegments,
        columnMatchingSegments) = columnData
-      if activeColumns is not None:
+      if isActiveColumn:
         if columnActiveSegments is not None:
           cellsToAdd = self.activatePredictedColumn(column,
                                                     columnActiveSegments,
@@ -261,6 +334,74 @@ class TemporalMemory(Serializable):
                                      prevWinnerCells)
 
 
+  @staticmethod
+  def _groupByColumn(activeColumns, activeSegments, matchingSegments,
+                     cellsPerColumn):
+    """
+    Walks the sorted active columns, active segments and matching segments
+    together, in a single linear pass, grouping them by column. This is the
+    equivalent of :func:`~nupic.support.group_by.groupby2` specialized for the
+    TM, avoiding a key function call per segment.
+
+    :param activeColumns: (list) Sorted active column indices.
+    :param activeSegments: (list) Active segments, sorted by cell.
+    :param matchingSegments: (list) Matching segments, sorted by cell.
+    :param cellsPerColumn: (int) Number of cells per column.
+
+    :returns: (generator) Yields a tuple (``column`` [int],
+              ``isActiveColumn`` [bool], ``columnActiveSegments`` [list or
+              None], ``columnMatchingSegments`` [list or None]) for every
+              column that is active or has active or matching segments.
+    """
+    numActiveColumns = len(activeColumns)
+    numActiveSegments = len(activeSegments)
+    numMatchingSegments = len(matchingSegments)
+    iColumn = iActive = iMatching = 0
+    # Sentinel greater than every column index.
+    end = float("inf")
+
+    while (iColumn < numActiveColumns or
+           iActive < numActiveSegments or
+           iMatching < numMatchingSegments):
+      nextActiveColumn = (activeColumns[iColumn]
+                          if iColumn < numActiveColumns else end)
+      nextActiveSegmentColumn = (
+        activeSegments[iActive].cell // cellsPerColumn
+        if iActive < numActiveSegments else end)
+      nextMatchingSegmentColumn = (
+        matchingSegments[iMatching].cell // cellsPerColumn
+        if iMatching < numMatchingSegments else end)
+
+      column = min(nextActiveColumn, nextActiveSegmentColumn,
+                   nextMatchingSegmentColumn)
+
+      isActiveColumn = nextActiveColumn == column
+      while (iColumn < numActiveColumns and
+             activeColumns[iColumn] == column):
+        iColumn += 1
+
+      columnActiveSegments = None
+      if nextActiveSegmentColumn == column:
+        start = iActive
+        cellEnd = (column + 1) * cellsPerColumn
+        while (iActive < numActiveSegments and
+               activeSegments[iActive].cell < cellEnd):
+          iActive += 1
+        columnActiveSegments = activeSegments[start:iActive]
+
+      columnMatchingSegments = None
+      if nextMatchingSegmentColumn == column:
+        start = iMatching
+        cellEnd = (column + 1) * cellsPerColumn
+        while (iMatching < numMatchingSegments and
+               matchingSegments[iMatching].cell < cellEnd):
+          iMatching += 1
+        columnMatchingSegments = matchingSegments[start:iMatching]
+
+      yield (column, isActiveColumn, columnActiveSegments,
+             columnMatchingSegments)
+
+
   def activateDendrites(self, learn=True):
     """
     Calculate dendrite segment activity, using the current active cells.
@@ -282,22 +423,10 @@ class TemporalMemory(Serializable):
        self.activeCells,
        self.connectedPermanence)
 
-    activeSegments = (
-      self.connections.segmentForFlatIdx(i)
-      for i in xrange(len(numActiveConnected))
-      if numActiveConnected[i] >= self.activationThreshold
-    )
-
-    matchingSegments = (
-      self.connections.segmentForFlatIdx(i)
-      for i in xrange(len(numActivePotential))
-      if numActivePotential[i] >= self.minThreshold
-    )
-
-    self.activeSegments = sorted(activeSegments,
-                                 key=self.connections.segmentPositionSortKey)
-    self.matchingSegments = sorted(matchingSegments,
-                                   key=self.connections.segmentPositionSortKey)
+    self.activeSegments = self.connections.segmentsSortedByPosition(
+      numpy.flatnonzero(numActiveConnected >= self.activationThreshold))
+    self.matchingSegments = self.connections.segmentsSortedByPosition(
+      numpy.flatnonzero(numActivePotential >= self.minThreshold))
     self.numActiveConnectedSynapsesForSegment = numActiveConnected
     self.numActivePotentialSynapsesForSegment = numActivePotential
 
@@ -1181,7 +1310,7 @@ class TemporalMemory(Serializable):
         protoNumActivePotential[i].cell = segment.cell
         idx = self.connections.segmentsForCell(segment.cell).index(segment)
         protoNumActivePotential[i].idxOnCell = idx
-        protoNumActivePotential[i].number = numActivePotentialSynapses
+        protoNumActivePotential[i].number = int(numActivePotentialSynapses)
 
     proto.iteration = self.iteration
 
@@ -1231,7 +1360,8 @@ class TemporalMemory(Serializable):
     tm.maxSegmentsPerCell = int(proto.maxSegmentsPerCell)
     tm.maxSynapsesPerSegment = int(proto.maxSynapsesPerSegment)
 
-    tm.connections = Connections.read(proto.connections)
+    # Read the connections with the implementation chosen by the subclass.
+    tm.connections = cls.connectionsClass.read(proto.connections)
     #pylint: disable=W0212
     tm._random = Random()
     tm._random.read(proto.random)
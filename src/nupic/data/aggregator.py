@@ -21,10 +21,13 @@
 
 from collections import defaultdict
 import datetime
+import itertools
 import os
 from pkg_resources import resource_filename
 import time
 
+import numpy
+
 from nupic.data import SENTINEL_VALUE_FOR_MISSING_DATA
 from nupic.data.field_meta import FieldMetaSpecial
 from nupic.data.file_record_stream import FileRecordStream
@@ -44,10 +47,28 @@ Assumption: aggregated slices fit in memory. All the records that are aggregated
 per period are stored in memory until the next slice starts and are only
 aggregated then. If this assumption is too strong the script will need to write
 slices to a temp storage or use incremental aggregation techniques.
+
+Records may also be aggregated in chunks of columns, as read by
+FileRecordStream.getNextColumns, with Aggregator.nextColumns. The periods of a
+chunk are found with vectorized timestamp arithmetic and the built-in
+aggregation functions are applied to all of them with numpy, with the same
+results as Aggregator.next.
 """
 
 
 
+# Periods longer than this are summed with Python's sum, instead of with one
+# numpy operation per position in the periods
+_MAX_VECTORIZED_PERIOD_LENGTH = 256
+
+# Periods starting after this day of the month can't be shifted by months
+# without checking that the day exists
+_MAX_MONTH_PERIOD_DAY = 28
+
+_MICROSECONDS_PER_DAY = 24 * 60 * 60 * 1000000
+
+
+
 def initFilter(input, filterInfo = None):
   """ Initializes internal filter variables for further processing.
   Returns a tuple (function to call,parameters for the filter call)
@@ -231,6 +252,151 @@ def _aggr_weighted_mean(inList, params):
 
 
 
+def _columnValues(column):
+  """ Returns the values of a masked column as a list, with missing values
+  replaced by SENTINEL_VALUE_FOR_MISSING_DATA.
+  """
+  values = column.data.tolist()
+  mask = numpy.ma.getmaskarray(column)
+  if mask.any():
+    values = [SENTINEL_VALUE_FOR_MISSING_DATA if m else v
+              for v, m in itertools.izip(values, mask.tolist())]
+  return values
+
+
+
+def _sequentialSums(values, starts, lengths):
+  """ Sums consecutive runs of float values from left to right, as Python sums
+  them, so that the results are rounded identically.
+
+  values:  array of the values of all the runs, one after the other
+  starts:  array of the index of the first value of each run
+  lengths: array of the number of values of each run
+  retval:  array of the sum of each run
+  """
+  sums = numpy.zeros(len(starts), dtype=numpy.float64)
+
+  longRuns = lengths > _MAX_VECTORIZED_PERIOD_LENGTH
+  for i in numpy.flatnonzero(longRuns):
+    sums[i] = sum(values[starts[i]:starts[i] + lengths[i]].tolist())
+
+  # Add the values at each position of the short runs at once, with the
+  # longest runs first so that the runs still going on are a prefix
+  shortRuns = numpy.flatnonzero(~longRuns)
+  order = shortRuns[numpy.argsort(-lengths[shortRuns], kind='mergesort')]
+  sortedStarts = starts[order]
+  negativeLengths = -lengths[order]
+  runSums = numpy.zeros(len(order), dtype=numpy.float64)
+  for position in xrange(-negativeLengths[0] if len(order) else 0):
+    numRuns = numpy.searchsorted(negativeLengths, -position)
+    runSums[:numRuns] += values[sortedStarts[:numRuns] + position]
+  sums[order] = runSums
+
+  return sums
+
+
+
+def _monthsAndOffsets(times):
+  """ Splits times in microseconds into the number of months since the epoch
+  and the time since the start of their month, in microseconds.
+  """
+  months = times.view('datetime64[us]').astype('datetime64[M]')
+  offsets = times - months.astype('datetime64[us]').view(numpy.int64)
+  return (months.view(numpy.int64), offsets)
+
+
+
+def _reduceRuns(aggFP, data, mask, starts, lengths):
+  """ Applies a built-in aggregation function to consecutive runs of a column
+  with numpy.
+
+  aggFP:   aggregation function
+  data:    array of the values of all the runs, one after the other
+  mask:    boolean array of the missing values in data
+  starts:  array of the index of the first value of each run
+  lengths: array of the number of values of each run
+  retval:  list of the aggregated value of each run, identical to applying
+           aggFP to the run; None if aggFP can't be applied to data with numpy
+  """
+  counts = numpy.add.reduceat((~mask).astype(numpy.int64), starts)
+
+  if aggFP is _aggr_first or aggFP is _aggr_last:
+    positions = numpy.arange(len(data))
+    if aggFP is _aggr_first:
+      indices = numpy.minimum.reduceat(numpy.where(mask, len(data), positions),
+                                       starts)
+    else:
+      indices = numpy.maximum.reduceat(numpy.where(mask, -1, positions), starts)
+    results = data[numpy.where(counts > 0, indices, 0)]
+    valid = counts > 0
+
+  elif aggFP is _aggr_sum or aggFP is _aggr_mean:
+    if data.dtype.kind == 'b':
+      data = data.astype(numpy.int64)
+
+    if data.dtype.kind == 'i':
+      present = numpy.where(mask, 0, data)
+      # Python integers don't overflow
+      if (len(present) and numpy.abs(present.astype(numpy.float64)).max() *
+          lengths.max() >= 2**62):
+        return None
+      sums = numpy.add.reduceat(present, starts)
+      # Python 2 divides integers with floor division
+      means = sums // numpy.maximum(counts, 1)
+      if aggFP is _aggr_sum:
+        results = sums + means * (lengths - counts)
+      else:
+        results = means
+
+    elif data.dtype.kind == 'f':
+      sums = _sequentialSums(numpy.where(mask, 0.0, data), starts, lengths)
+      means = sums / numpy.maximum(counts, 1)
+      if aggFP is _aggr_sum and mask.any():
+        # Missing values are replaced with the mean, in place
+        results = _sequentialSums(
+          numpy.where(mask, numpy.repeat(means, lengths), data), starts,
+          lengths)
+      elif aggFP is _aggr_sum:
+        results = sums
+      else:
+        results = means
+
+    else:
+      return None
+
+    valid = counts > 0
+
+  elif aggFP is max or aggFP is min:
+    if data.dtype.kind == 'f':
+      # Python's max and min of NaNs and signed zeros depend on their order
+      present = data[~mask]
+      if (numpy.isnan(present).any() or
+          (numpy.signbit(present) & (present == 0)).any()):
+        return None
+      lowest = -numpy.inf
+    elif data.dtype.kind == 'i':
+      lowest = numpy.iinfo(data.dtype).min
+    elif data.dtype.kind == 'b':
+      lowest = False
+    else:
+      return None
+
+    # Missing values compare lower than any other value
+    if aggFP is max:
+      results = numpy.maximum.reduceat(numpy.where(mask, lowest, data), starts)
+      valid = counts > 0
+    else:
+      results = numpy.minimum.reduceat(data, starts)
+      valid = counts == lengths
+
+  else:
+    return None
+
+  return [r if v else None
+          for r, v in itertools.izip(results.tolist(), valid.tolist())]
+
+
+
 class Aggregator(object):
   """
   This class provides context and methods for aggregating records. The caller
@@ -248,6 +414,7 @@ class Aggregator(object):
       ],
    }
 
+  Records can also be aggregated in chunks of columns, with nextColumns().
   """
 
 
@@ -638,22 +805,9 @@ class Aggregator(object):
       if (newSequence or sliceEnded) and len(self._slice) > 0:
         # Create aggregated record
         # print 'Creating aggregate record...'
-
-        # Make first record timestamp as the beginning of the time period,
-        # in case the first record wasn't falling on the beginning of the period
-        for j, f in enumerate(self._fields):
-          index = f[0]
-          if index == self._timeFieldIdx:
-            self._slice[j][0] = self._startTime
-            break
-
-        # Generate the aggregated record
-        outRecord = self._createAggregateRecord()
+        outRecord = self._closeSlice()
         retInputBookmark = self._aggrInputBookmark
 
-        # Reset the slice
-        self._slice = defaultdict(list)
-
 
       # --------------------------------------------------------------------
       # Add current record to slice (Note keeping slices in memory). Each
@@ -697,27 +851,278 @@ class Aggregator(object):
     # Input reached EOF
     # Aggregate one last time in the end if necessary
     elif self._slice:
-
-      # Make first record timestamp as the beginning of the time period,
-      # in case the first record wasn't falling on the beginning of the period
-      for j, f in enumerate(self._fields):
-        index = f[0]
-        if index == self._timeFieldIdx:
-          self._slice[j][0] = self._startTime
-          break
-
-      outRecord = self._createAggregateRecord()
+      outRecord = self._closeSlice()
       retInputBookmark = self._aggrInputBookmark
 
-      self._slice = defaultdict(list)
-
 
     # Return aggregated record
     return (outRecord, retInputBookmark)
 
 
+  def nextColumns(self, columns):
+    """ Aggregates a chunk of input records, given as columns, and returns the
+    aggregated records that the chunk completes. This gives the same records as
+    calling next() with each input record, much faster.
 
-def generateDataset(aggregationInfo, inputFilename, outputFilename=None):
+    Parameters:
+    ------------------------------------------------------------------------
+    columns:  a list with a numpy.ma.MaskedArray of values per input field, as
+              returned by FileRecordStream.getNextColumns, or None if the input
+              has reached EOF (this completes and returns any partially
+              aggregated time period)
+    retval:   list of aggregated records
+
+    The periods of the chunk are found with vectorized timestamp arithmetic and
+    the built-in aggregation functions are applied to all of them at once. The
+    records of a chunk with a filter, out of order timestamps or missing
+    timestamps, and the aggregation functions that can't be computed exactly
+    with numpy, go through the same code as next() instead. Bookmarks are not
+    tracked.
+    """
+    if columns is None:
+      (outRecord, _) = self.next(None, None)
+      return [] if outRecord is None else [outRecord]
+
+    numRecords = len(columns[0])
+    if numRecords == 0:
+      return []
+
+    periods = None
+    if not self._nullAggregation and self._filter is None:
+      periods = self._getPeriods(columns)
+    if periods is None:
+      return self._nextRecords(columns)
+    (newPeriods, periodStarts, lastSequenceId) = periods
+
+    outRecords = []
+
+    # The records before the first new period complete the current slice
+    starts = numpy.flatnonzero(newPeriods)
+    firstStart = starts[0] if len(starts) else numRecords
+    self._appendToSlice(columns, 0, firstStart)
+
+    if len(starts):
+      if self._slice:
+        outRecords.append(self._closeSlice())
+
+      # All the periods but the last one are complete
+      lastStart = starts[-1]
+      if len(starts) > 1:
+        outRecords.extend(self._aggregatePeriods(
+          [column[firstStart:lastStart] for column in columns],
+          starts[:-1] - firstStart, numpy.diff(starts),
+          periodStarts[starts[:-1]]))
+
+      self._appendToSlice(columns, lastStart, numRecords)
+      self._startTime = numpy.datetime64(int(periodStarts[lastStart]),
+                                         'us').tolist()
+      self._endTime = self._getEndTime(self._startTime)
+
+    if self._firstSequenceStartTime is None:
+      self._firstSequenceStartTime = columns[self._timeFieldIdx][0].tolist()
+    self._sequenceId = lastSequenceId
+    self._inIdx += numRecords
+    self._aggrInputBookmark = None
+
+    return outRecords
+
+
+  def _nextRecords(self, columns):
+    """ Aggregates a chunk of input records, given as columns, with next().
+
+    Parameters:
+    ------------------------------------------------------------------------
+    columns:  a list with a numpy.ma.MaskedArray of values per input field
+    retval:   list of aggregated records
+    """
+    outRecords = []
+    for record in itertools.izip(*[_columnValues(c) for c in columns]):
+      (outRecord, _) = self.next(list(record), None)
+      if outRecord is not None:
+        outRecords.append(outRecord)
+    return outRecords
+
+
+  def _getPeriods(self, columns):
+    """ Finds the records of a chunk that start a new aggregation period, like
+    next() does for each record.
+
+    Parameters:
+    ------------------------------------------------------------------------
+    columns:  a list with a numpy.ma.MaskedArray of values per input field
+    retval:   (newPeriods, periodStarts, lastSequenceId), or None if the periods
+              can't be found with vectorized arithmetic
+
+      newPeriods: boolean array of the records that start a new period
+      periodStarts: array of the start time of the period of each record, in
+                    microseconds
+      lastSequenceId: sequence id of the last record
+    """
+    times = columns[self._timeFieldIdx]
+    if numpy.ma.getmaskarray(times).any():
+      return None
+
+    numRecords = len(times)
+    positions = numpy.arange(numRecords)
+    times = times.data.astype('datetime64[us]').view(numpy.int64)
+
+    # ----------------------------------------------------------------------
+    # Find the records that start a new sequence
+    inIndices = self._inIdx + 1 + positions
+    newSequences = inIndices == 0
+
+    if self._resetFieldIdx is not None:
+      resets = columns[self._resetFieldIdx].filled(0)
+      newSequences |= (resets == 1) & (inIndices > 0)
+
+    lastSequenceId = self._sequenceId
+    if self._sequenceIdFieldIdx is not None:
+      sequenceIds = numpy.array(
+        _columnValues(columns[self._sequenceIdFieldIdx]), dtype=object)
+      previousSequenceIds = numpy.empty(numRecords, dtype=object)
+      previousSequenceIds[0] = self._sequenceId
+      previousSequenceIds[1:] = sequenceIds[:-1]
+      newSequences |= numpy.array(sequenceIds != previousSequenceIds,
+                                  dtype=bool)
+      lastSequenceId = sequenceIds[-1]
+
+    # ----------------------------------------------------------------------
+    # The periods of a sequence follow each other from its first record, and
+    # those of the current slice from its start time
+    if self._startTime is None:
+      if not newSequences[0]:
+        return None
+      startTime = 0
+    else:
+      if (not self._aggTimeDelta and
+          self._startTime.day > _MAX_MONTH_PERIOD_DAY):
+        return None
+      if self._endTime != self._getEndTime(self._startTime):
+        # An out of order record moved the end time
+        return None
+      startTime = numpy.datetime64(self._startTime, 'us').astype(numpy.int64)
+
+    sequenceStarts = numpy.maximum.accumulate(
+      numpy.where(newSequences, positions, -1))
+    anchors = numpy.where(sequenceStarts >= 0,
+                          times[numpy.maximum(sequenceStarts, 0)], startTime)
+
+    if self._aggTimeDelta:
+      delta = self._aggTimeDelta
+      period = ((delta.days * 24 * 60 * 60 + delta.seconds) * 1000000 +
+                delta.microseconds)
+      periods = (times - anchors) // period
+      periodStarts = anchors + periods * period
+
+    else:
+      period = 12 * self._aggYears + self._aggMonths
+      (months, offsets) = _monthsAndOffsets(times)
+      (anchorMonths, anchorOffsets) = _monthsAndOffsets(anchors)
+      if (anchorOffsets >= _MAX_MONTH_PERIOD_DAY * _MICROSECONDS_PER_DAY).any():
+        return None
+
+      monthsElapsed = months - anchorMonths
+      periods = monthsElapsed // period
+      periods -= ((monthsElapsed == periods * period) &
+                  (offsets < anchorOffsets)).astype(numpy.int64)
+      periodStarts = (
+        (anchorMonths + periods * period).astype('datetime64[M]')
+        .astype('datetime64[us]').view(numpy.int64) + anchorOffsets)
+
+    # Records before the start of their period are out of order
+    if (periods < 0).any():
+      return None
+    if (~newSequences[1:] & (periods[1:] < periods[:-1])).any():
+      return None
+
+    newPeriods = newSequences.copy()
+    newPeriods[0] |= periods[0] != 0
+    newPeriods[1:] |= periods[1:] != periods[:-1]
+
+    return (newPeriods, periodStarts, lastSequenceId)
+
+
+  def _appendToSlice(self, columns, start, stop):
+    """ Adds the input records from start to stop of a chunk of columns to the
+    current slice.
+    """
+    if start >= stop:
+      return
+    for j, (fieldIdx, _, _) in enumerate(self._fields):
+      self._slice[j].extend(_columnValues(columns[fieldIdx][start:stop]))
+
+
+  def _aggregatePeriods(self, columns, starts, lengths, periodStarts):
+    """ Generates the aggregated records of consecutive periods
+
+    Parameters:
+    ------------------------------------------------------------------------
+    columns:  a list with a numpy.ma.MaskedArray of values per input field,
+              holding all the records of the periods
+    starts:   array of the index of the first record of each period
+    lengths:  array of the number of records of each period
+    periodStarts: array of the start time of each period, in microseconds
+    retval:   list of aggregated records
+    """
+    # Make first record timestamp as the beginning of the time period,
+    # in case the first record wasn't falling on the beginning of the period
+    columns = list(columns)
+    times = columns[self._timeFieldIdx].copy()
+    times[starts] = periodStarts.view('datetime64[us]')
+    columns[self._timeFieldIdx] = times
+
+    fieldValues = []
+    for fieldIdx, aggFP, paramIdx in self._fields:
+      if aggFP is None: # this field is not supposed to be aggregated.
+        continue
+
+      values = None
+      if paramIdx is None:
+        column = columns[fieldIdx]
+        values = _reduceRuns(aggFP, column.data,
+                             numpy.ma.getmaskarray(column), starts, lengths)
+
+      if values is None:
+        inList = _columnValues(columns[fieldIdx])
+        params = (_columnValues(columns[paramIdx])
+                  if paramIdx is not None else None)
+        values = []
+        for start, stop in itertools.izip(starts.tolist(),
+                                          (starts + lengths).tolist()):
+          if params is not None:
+            values.append(aggFP(inList[start:stop], params[start:stop]))
+          else:
+            values.append(aggFP(inList[start:stop]))
+
+      fieldValues.append(values)
+
+    return [list(record) for record in itertools.izip(*fieldValues)]
+
+
+  def _closeSlice(self):
+    """ Generates the aggregated record of the current slice and starts a new
+    slice.
+    """
+    # Make first record timestamp as the beginning of the time period,
+    # in case the first record wasn't falling on the beginning of the period
+    for j, f in enumerate(self._fields):
+      index = f[0]
+      if index == self._timeFieldIdx:
+        self._slice[j][0] = self._startTime
+        break
+
+    # Generate the aggregated record
+    outRecord = self._createAggregateRecord()
+
+    # Reset the slice
+    self._slice = defaultdict(list)
+
+    return outRecord
+
+
+
+def generateDataset(aggregationInfo, inputFilename, outputFilename=None,
+                    chunkSize=10000):
   """Generate a dataset of aggregated values
 
   Parameters:
@@ -743,6 +1148,8 @@ def generateDataset(aggregationInfo, inputFilename, outputFilename=None):
   outputFilename: name for the output file. If not given, a name will be
         generated based on the input filename and the aggregation params
 
+  chunkSize: number of input records read and aggregated at once
+
   retval: Name of the generated output file. This will be the same as the input
       file name if no aggregation needed to be performed
 
@@ -821,16 +1228,13 @@ def generateDataset(aggregationInfo, inputFilename, outputFilename=None):
   # -------------------------------------------------------------------------
   # Write all aggregated records to the output
   while True:
-    inRecord = inputObj.getNextRecord()
+    inColumns = inputObj.getNextColumns(chunkSize)
 
-    (aggRecord, aggBookmark) = aggregator.next(inRecord, None)
+    outputObj.appendRecords(aggregator.nextColumns(inColumns))
 
-    if aggRecord is None and inRecord is None:
+    if inColumns is None:
       break
 
-    if aggRecord is not None:
-      outputObj.appendRecord(aggRecord)
-
   return outputFilename
 
 
@@ -0,0 +1,716 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Memory-mapped binary implementation of a record stream
+
+:class:`~.binary_record_stream.BinaryRecordStream` reads records from a binary
+record store, which holds the same fields as a NuPIC CSV file but is parsed only
+once. Convert a CSV file read by :class:`~.file_record_stream.FileRecordStream`
+with :func:`~.binary_record_stream.convertCsv`:
+
+.. code-block:: python
+
+  convertCsv("data.csv", "data.nbr")
+
+  with BinaryRecordStream("data.nbr") as s:
+    for r in s:
+      print r
+
+A record store is a directory with a ``header.json`` file and one fixed-width
+binary file per column, which are memory-mapped when reading:
+
+- int, float, bool and datetime fields are ``int64``, ``float64``, ``bool``
+  and ``datetime64[us]`` columns.
+- string fields are ``int32`` codes into a dictionary of the distinct strings,
+  kept in the header. Missing strings have the code -1.
+- list and sdr fields are a flat ``int32`` column of the concatenated values,
+  and an ``int64`` column of the offsets of each record in it.
+- fields with missing values also have a ``bool`` column of their mask.
+- a ``uint8`` column marks the first record of each sequence, as
+  :class:`~.record_stream.ModelRecordEncoder` sets ``_reset`` from the reset
+  and sequence id fields.
+
+Since records have a fixed position in every column, seeking to a bookmark, or
+from the end, is O(1), and :meth:`~.BinaryRecordStream.getColumn` slices a
+column without copying it.
+"""
+
+import copy
+import itertools
+import json
+import os
+
+import numpy
+
+from nupic.data import SENTINEL_VALUE_FOR_MISSING_DATA
+from nupic.data.field_meta import FieldMetaInfo, FieldMetaType, FieldMetaSpecial
+from nupic.data.file_record_stream import FileRecordStream
+from nupic.data.record_stream import RecordStreamIface, _getFieldIndexBySpecial
+
+
+
+# Version of the record store format
+_FORMAT_VERSION = 1
+
+_HEADER_FILE = "header.json"
+
+_RESETS_FILE = "resets"
+
+# Storage dtype of the values of each field type
+_VALUE_DTYPES = {FieldMetaType.integer: "int64",
+                 FieldMetaType.float: "float64",
+                 FieldMetaType.boolean: "bool",
+                 FieldMetaType.datetime: "datetime64[us]",
+                 FieldMetaType.string: "int32",
+                 FieldMetaType.list: "int32",
+                 FieldMetaType.sdr: "int32"}
+
+# Field types stored as a flat column of values and a column of offsets
+_RAGGED_TYPES = (FieldMetaType.list, FieldMetaType.sdr)
+
+
+
+def _valuesFile(fieldIdx):
+  return "%d.values" % fieldIdx
+
+
+
+def _offsetsFile(fieldIdx):
+  return "%d.offsets" % fieldIdx
+
+
+
+def _maskFile(fieldIdx):
+  return "%d.mask" % fieldIdx
+
+
+
+def _columnValues(column):
+  """ Returns the values of a masked column as a list, with missing values
+  replaced by :const:`~nupic.data.SENTINEL_VALUE_FOR_MISSING_DATA`.
+  """
+  values = column.data.tolist()
+  mask = numpy.ma.getmaskarray(column)
+  if mask.any():
+    values = [SENTINEL_VALUE_FOR_MISSING_DATA if m else v
+              for v, m in itertools.izip(values, mask.tolist())]
+  return values
+
+
+
+def _objectArray(values):
+  """ Returns a 1D object array of values, which may themselves be lists.
+  """
+  array = numpy.empty(len(values), dtype=object)
+  for i, value in enumerate(values):
+    array[i] = value
+  return array
+
+
+
+def _sequenceResets(fields, columns, previousSequenceId):
+  """ Computes which records of a chunk start a sequence, like
+  :meth:`~.record_stream.ModelRecordEncoder.encode` computes ``_reset``.
+
+  :param fields: (list) of :class:`~.field_meta.FieldMetaInfo`
+  :param columns: (list) of masked columns of the chunk
+  :param previousSequenceId: sequence id of the record before the chunk
+  :returns: (tuple) a ``uint8`` array of resets, and the sequence id of the
+            last record of the chunk
+  """
+  resetIdx = _getFieldIndexBySpecial(fields, FieldMetaSpecial.reset)
+  sequenceIdx = _getFieldIndexBySpecial(fields, FieldMetaSpecial.sequence)
+  numRecords = len(columns[0]) if columns else 0
+
+  if resetIdx is not None:
+    resets = columns[resetIdx].filled(0) != 0
+  elif sequenceIdx is not None and numRecords > 0:
+    sequenceIds = _objectArray(_columnValues(columns[sequenceIdx]))
+    previous = numpy.empty(numRecords, dtype=object)
+    previous[0] = previousSequenceId
+    previous[1:] = sequenceIds[:-1]
+    resets = numpy.array(sequenceIds != previous, dtype=bool)
+    previousSequenceId = sequenceIds[-1]
+  else:
+    resets = numpy.zeros(numRecords, dtype=bool)
+
+  return resets.astype(numpy.uint8), previousSequenceId
+
+
+
+def convertCsv(csvPath, path, chunkSize=10000, missingValues=None):
+  """
+  Converts a CSV file in the format of
+  :class:`~.file_record_stream.FileRecordStream` to a binary record store, for
+  :class:`~.binary_record_stream.BinaryRecordStream`.
+
+  :param csvPath: (string) path of the CSV file
+  :param path: (string) path of the record store directory to create
+  :param chunkSize: (int) number of records parsed at once
+  :param missingValues: (list) text values that stand for missing data, as for
+                        :class:`~.file_record_stream.FileRecordStream`
+  :returns: (int) number of records in the store
+  """
+  os.mkdir(path)
+
+  with FileRecordStream(csvPath, missingValues=missingValues) as source:
+    fields = source.getFields()
+    types = [f.type for f in fields]
+
+    files = {}
+    for i, fieldType in enumerate(types):
+      files[_valuesFile(i)] = open(os.path.join(path, _valuesFile(i)), "wb")
+      files[_maskFile(i)] = open(os.path.join(path, _maskFile(i)), "wb")
+      if fieldType in _RAGGED_TYPES:
+        files[_offsetsFile(i)] = open(os.path.join(path, _offsetsFile(i)),
+                                      "wb")
+        numpy.zeros(1, dtype=numpy.int64).tofile(files[_offsetsFile(i)])
+    files[_RESETS_FILE] = open(os.path.join(path, _RESETS_FILE), "wb")
+
+    dictionaries = [{} for _ in fields]
+    hasMissing = [False] * len(fields)
+    offsets = [0] * len(fields)
+    previousSequenceId = -1
+    numRecords = 0
+
+    try:
+      while True:
+        columns = source.getNextColumns(chunkSize)
+        if columns is None:
+          break
+
+        for i, (fieldType, column) in enumerate(itertools.izip(types,
+                                                                columns)):
+          mask = numpy.ma.getmaskarray(column)
+          hasMissing[i] = hasMissing[i] or bool(mask.any())
+          mask.tofile(files[_maskFile(i)])
+
+          if fieldType == FieldMetaType.string:
+            dictionary = dictionaries[i]
+            codes = [-1 if m else dictionary.setdefault(v, len(dictionary))
+                     for v, m in itertools.izip(column.data.tolist(),
+                                                mask.tolist())]
+            numpy.array(codes, dtype=numpy.int32).tofile(
+              files[_valuesFile(i)])
+
+          elif fieldType in _RAGGED_TYPES:
+            lists = [[] if m else v
+                     for v, m in itertools.izip(column.data.tolist(),
+                                                mask.tolist())]
+            lengths = numpy.array([len(l) for l in lists], dtype=numpy.int64)
+            numpy.array(list(itertools.chain.from_iterable(lists)),
+                        dtype=numpy.int32).tofile(files[_valuesFile(i)])
+            (offsets[i] + numpy.cumsum(lengths)).tofile(files[_offsetsFile(i)])
+            offsets[i] += int(lengths.sum())
+
+          else:
+            column.data.astype(_VALUE_DTYPES[fieldType]).tofile(
+              files[_valuesFile(i)])
+
+        resets, previousSequenceId = _sequenceResets(fields, columns,
+                                                     previousSequenceId)
+        resets.tofile(files[_RESETS_FILE])
+        numRecords += len(resets)
+
+    finally:
+      for f in files.itervalues():
+        f.close()
+
+  for i in xrange(len(fields)):
+    if not hasMissing[i]:
+      os.remove(os.path.join(path, _maskFile(i)))
+
+  header = {
+    "version": _FORMAT_VERSION,
+    "numRecords": numRecords,
+    "fields": [list(f) for f in fields],
+    "hasMissing": hasMissing,
+    "dictionaries": [sorted(d, key=d.get) if t == FieldMetaType.string
+                     else None
+                     for d, t in itertools.izip(dictionaries, types)]
+  }
+  with open(os.path.join(path, _HEADER_FILE), "w") as f:
+    json.dump(header, f)
+
+  return numRecords
+
+
+
+class BinaryRecordStream(RecordStreamIface):
+  """
+  Memory-mapped, read-only RecordStream implementation over a record store
+  created by :func:`~.binary_record_stream.convertCsv`.
+
+  Records are the same as :class:`~.file_record_stream.FileRecordStream`
+  returns for the CSV file the store was converted from.
+
+  :param streamID:
+      record store directory
+  :param bookmark:
+      a reference to the previous reader, if passed in, the records will be
+      returned starting from the point where bookmark was requested. Either
+      bookmark or firstRecord can be specified, not both.
+  :param firstRecord:
+      0-based index of the first record to start reading from. Either bookmark
+      or firstRecord can be specified, not both.
+  """
+
+
+  def __init__(self, streamID, bookmark=None, firstRecord=None):
+    super(BinaryRecordStream, self).__init__()
+
+    # Only bookmark or firstRow can be specified, not both
+    if bookmark is not None and firstRecord is not None:
+      raise RuntimeError(
+          "Only bookmark or firstRecord can be specified, not both")
+
+    self._filename = streamID
+
+    with open(os.path.join(self._filename, _HEADER_FILE)) as f:
+      header = json.load(f)
+
+    if header["version"] != _FORMAT_VERSION:
+      raise Exception("Invalid record store format version %r in %s" % (
+        header["version"], self._filename))
+
+    self._numRecords = header["numRecords"]
+    self._fields = [FieldMetaInfo(str(name), str(fieldType), str(special))
+                    for name, fieldType, special in header["fields"]]
+    self._hasMissing = header["hasMissing"]
+
+    # The CSV reader returns byte strings. The last entry is for missing
+    # strings, which have the code -1.
+    self._dictionaries = [
+      None if d is None else _objectArray([s.encode("utf-8") for s in d] +
+                                          [SENTINEL_VALUE_FOR_MISSING_DATA])
+      for d in header["dictionaries"]]
+
+    self._open()
+
+    self.rewindAtEOF = False
+
+    if bookmark is not None:
+      self._recordCount = self._getStartRow(bookmark)
+    elif firstRecord is not None:
+      self._recordCount = firstRecord
+    else:
+      self._recordCount = 0
+
+    # Dictionary to store record statistics (min and max of scalars for now)
+    self._stats = None
+
+
+  def _map(self, name, dtype, count):
+    """ Memory-maps a column of the record store.
+    """
+    if count == 0:
+      # Empty files can't be mapped
+      return numpy.zeros(0, dtype=dtype)
+    return numpy.asarray(numpy.memmap(os.path.join(self._filename, name),
+                                      dtype=dtype, mode="r", shape=(count,)))
+
+
+  def _open(self):
+    """ Memory-maps the columns of the record store.
+    """
+    self._values = []
+    self._offsets = []
+    self._masks = []
+    for i, field in enumerate(self._fields):
+      if field.type in _RAGGED_TYPES:
+        offsets = self._map(_offsetsFile(i), numpy.int64, self._numRecords + 1)
+        self._offsets.append(offsets)
+        numValues = int(offsets[-1]) if len(offsets) else 0
+      else:
+        self._offsets.append(None)
+        numValues = self._numRecords
+      self._values.append(self._map(_valuesFile(i), _VALUE_DTYPES[field.type],
+                                    numValues))
+      self._masks.append(self._map(_maskFile(i), bool, self._numRecords)
+                         if self._hasMissing[i] else None)
+    self._resets = self._map(_RESETS_FILE, numpy.uint8, self._numRecords)
+
+
+  def __getstate__(self):
+    d = dict()
+    d.update(self.__dict__)
+    for name in ("_values", "_offsets", "_masks", "_resets"):
+      del d[name]
+    return d
+
+
+  def __setstate__(self, state):
+    self.__dict__ = state
+    self._open()
+
+
+  def close(self):
+    """
+    Closes the stream.
+    """
+    self._values = None
+    self._offsets = None
+    self._masks = None
+    self._resets = None
+
+
+  def rewind(self):
+    """
+    Put us back at the beginning of the store again.
+    """
+    super(BinaryRecordStream, self).rewind()
+    self._recordCount = 0
+
+
+  def getColumn(self, fieldIdx, start=None, stop=None):
+    """ Returns a slice of the stored values of a field, without copying them.
+
+    The values are those described in :mod:`~.binary_record_stream`: string
+    fields return their dictionary codes, and list and sdr fields the flat
+    values of the records in the slice. Use
+    :meth:`~.BinaryRecordStream.getNextColumns` for the decoded values.
+
+    :param fieldIdx: (int) index of the field
+    :param start: (int) index of the first record, or None for the first record
+    :param stop: (int) index after the last record, or None for the end
+    :returns: (numpy.array) read-only view of the values
+    """
+    start, stop, _ = slice(start, stop).indices(self._numRecords)
+    stop = max(start, stop)
+    offsets = self._offsets[fieldIdx]
+    if offsets is not None:
+      start, stop = offsets[start], offsets[stop]
+    return self._values[fieldIdx][start:stop]
+
+
+  def getMask(self, fieldIdx, start=None, stop=None):
+    """ Returns a slice of the missing value mask of a field, without copying
+    it.
+
+    :param fieldIdx: (int) index of the field
+    :param start: (int) index of the first record, or None for the first record
+    :param stop: (int) index after the last record, or None for the end
+    :returns: (numpy.array) read-only view of the mask, or None if the field
+              has no missing values.
+    """
+    if self._masks[fieldIdx] is None:
+      return None
+    return self._masks[fieldIdx][start:stop]
+
+
+  def getResets(self, start=None, stop=None):
+    """ Returns which records start a sequence, without copying them. This is
+    the ``_reset`` value of :meth:`~.RecordStreamIface.getNextRecordDict`.
+
+    :param start: (int) index of the first record, or None for the first record
+    :param stop: (int) index after the last record, or None for the end
+    :returns: (numpy.array) read-only ``uint8`` view of the resets
+    """
+    return self._resets[start:stop]
+
+
+  def _getColumns(self, start, stop):
+    """ Returns the records from ``start`` to ``stop`` as masked columns.
+    """
+    columns = []
+    for i, field in enumerate(self._fields):
+      mask = self.getMask(i, start, stop)
+      if mask is None:
+        mask = numpy.ma.nomask
+
+      if field.type == FieldMetaType.string:
+        data = self._dictionaries[i][self.getColumn(i, start, stop)]
+      elif field.type in _RAGGED_TYPES:
+        offsets = self._offsets[i][start:stop + 1].tolist()
+        values = self.getColumn(i, start, stop)
+        base = offsets[0]
+        data = _objectArray([values[a - base:b - base].tolist()
+                             for a, b in itertools.izip(offsets[:-1],
+                                                        offsets[1:])])
+        if mask is not numpy.ma.nomask:
+          data[mask] = SENTINEL_VALUE_FOR_MISSING_DATA
+      else:
+        data = self.getColumn(i, start, stop)
+
+      columns.append(numpy.ma.masked_array(data, mask=mask, copy=False))
+
+    return columns
+
+
+  def getNextRecord(self, useCache=True):
+    """ Returns next available data record from the store.
+
+    :returns: a data row (a list) if available; None, if no more records in the
+              store (End of Stream - EOS).
+    """
+    if self._recordCount >= self._numRecords:
+      if not self.rewindAtEOF:
+        return None
+      if self._numRecords == 0:
+        raise Exception("The source configured to reset at EOF but "
+                        "'%s' appears to be empty" % self._filename)
+      self.rewind()
+
+    columns = self._getColumns(self._recordCount, self._recordCount + 1)
+    self._recordCount += 1
+    return [_columnValues(column)[0] for column in columns]
+
+
+  def getNextColumns(self, numRecords):
+    """ Returns up to ``numRecords`` records from the store, as typed columns,
+    like :meth:`~.file_record_stream.FileRecordStream.getNextColumns`.
+    Numeric, bool and datetime columns are views of the store. The source is
+    not rewound at EOF.
+
+    :param numRecords: (int) maximum number of records to read
+    :returns: a list with a :class:`numpy.ma.MaskedArray` per field, or None if
+              there are no more records in the store.
+    """
+    start = self._recordCount
+    stop = min(start + numRecords, self._numRecords)
+    if start >= stop:
+      return None
+
+    self._recordCount = stop
+    return self._getColumns(start, stop)
+
+
+  def iterRecords(self, chunkSize=10000):
+    """ Iterates over the remaining records of the store, reading them in
+    chunks with :meth:`~.BinaryRecordStream.getNextColumns`.
+
+    :param chunkSize: (int) number of records read at once
+    :returns: an iterator over the records
+    """
+    while True:
+      columns = self.getNextColumns(chunkSize)
+      if columns is None:
+        return
+
+      for record in itertools.izip(*[_columnValues(c) for c in columns]):
+        yield list(record)
+
+
+  def appendRecord(self, record):
+    """ Not implemented. Record stores are created with
+    :func:`~.binary_record_stream.convertCsv`.
+    """
+    raise NotImplementedError("BinaryRecordStream is read-only")
+
+
+  def appendRecords(self, records, progressCB=None):
+    """ Not implemented. Record stores are created with
+    :func:`~.binary_record_stream.convertCsv`.
+    """
+    raise NotImplementedError("BinaryRecordStream is read-only")
+
+
+  def getBookmark(self):
+    """
+    Gets a bookmark or anchor to the current position.
+
+    :returns: an anchor to the current position in the data. Passing this
+              anchor to a constructor makes the current position to be the first
+              returned record.
+    """
+    rowDict = dict(filepath=os.path.realpath(self._filename),
+                   currentRow=self._recordCount)
+    return json.dumps(rowDict)
+
+
+  def recordsExistAfter(self, bookmark):
+    """
+    Returns whether there are more records from current position. ``bookmark``
+    is not used in this implementation.
+
+    :return: True if there are records left after current position.
+    """
+    return (self.getDataRowCount() - self.getNextRecordIdx()) > 0
+
+
+  def seekFromEnd(self, numRecords):
+    """
+    Seeks to ``numRecords`` from the end and returns a bookmark to the new
+    position.
+
+    :param numRecords: how far to seek from end of the store.
+    :return: bookmark to desired location.
+    """
+    self._recordCount = max(0, self._numRecords - numRecords)
+    return self.getBookmark()
+
+
+  def setAutoRewind(self, autoRewind):
+    """
+    Controls whether :meth:`~.BinaryRecordStream.getNextRecord` should
+    automatically rewind the source when EOF is reached.
+
+    :param autoRewind: (bool)
+    """
+    self.rewindAtEOF = autoRewind
+
+
+  def getStats(self):
+    """
+    Computes the min and max of the int and float fields, like
+    :meth:`~.file_record_stream.FileRecordStream.getStats`.
+
+    :returns: a dictionary of stats, with ``min`` and ``max`` lists of values
+              per field (None for non-scalar fields).
+    """
+    if self._stats is None:
+      self._stats = dict(min=[], max=[])
+      for i, field in enumerate(self._fields):
+        minValue = maxValue = None
+        if field.type in (FieldMetaType.integer, FieldMetaType.float):
+          column = numpy.ma.masked_array(self.getColumn(i),
+                                         mask=self.getMask(i))
+          if column.count() > 0:
+            minValue = column.min().item()
+            maxValue = column.max().item()
+        self._stats['min'].append(minValue)
+        self._stats['max'].append(maxValue)
+
+    return self._stats
+
+
+  def clearStats(self):
+    """ Resets stats collected so far.
+    """
+    self._stats = None
+
+
+  def getError(self):
+    """
+    Not implemented. Record stores do not provide storage for the error
+    information
+    """
+    return None
+
+
+  def setError(self, error):
+    """
+    Not implemented. Record stores do not provide storage for the error
+    information
+    """
+    return
+
+
+  def isCompleted(self):
+    """ Not implemented. A record store is always considered completed."""
+    return True
+
+
+  def setCompleted(self, completed=True):
+    """ Not implemented: a record store is always considered completed, nothing
+    to do.
+    """
+    return
+
+
+  def getFieldNames(self):
+    """
+    :returns: (list) field names associated with the data.
+    """
+    return [f.name for f in self._fields]
+
+
+  def getFields(self):
+    """
+    :returns: a sequence of :class:`~.FieldMetaInfo`
+              ``name``/``type``/``special`` tuples for each field in the stream.
+    """
+    return copy.copy(self._fields)
+
+
+  def _getStartRow(self, bookmark):
+    """ Extracts start row from the bookmark information
+    """
+    bookMarkDict = json.loads(bookmark)
+
+    realpath = os.path.realpath(self._filename)
+
+    bookMarkFile = bookMarkDict.get('filepath', None)
+
+    if bookMarkFile != realpath:
+      print ("Ignoring bookmark due to mismatch between store's "
+             "realpath vs. bookmark; realpath: %r; bookmark: %r") % (
+        realpath, bookMarkDict)
+      return 0
+    else:
+      return bookMarkDict['currentRow']
+
+
+  def getNextRecordIdx(self):
+    """
+    :returns: (int) the index of the record that will be read next from
+              :meth:`~.BinaryRecordStream.getNextRecord`.
+    """
+    return self._recordCount
+
+
+  def getDataRowCount(self):
+    """
+    :returns: (int) count of records in the store
+    """
+    return self._numRecords
+
+
+  def setTimeout(self, timeout):
+    pass
+
+
+  def flush(self):
+    """ Not implemented: record stores are read-only, nothing to do.
+    """
+    return
+
+
+  def __enter__(self):
+    """Context guard - enter
+
+    Just return the object
+    """
+    return self
+
+
+  def __exit__(self, yupe, value, traceback):
+    """Context guard - exit
+
+    Ensures that the store is always closed at the end of the 'with' block.
+    Lets exceptions propagate.
+    """
+    self.close()
+
+
+  def __iter__(self):
+    """Support for the iterator protocol. Return itself"""
+    return self
+
+
+  def next(self):
+    """Implement the iterator protocol """
+    record = self.getNextRecord()
+    if record is None:
+      raise StopIteration
+
+    return record
@@ -71,19 +71,158 @@ protocol so you may read its contents using a for loop:
   for r in f:
     print r
 
+Large files are faster to read in chunks of typed columns, with
+:meth:`~.file_record_stream.FileRecordStream.getNextColumns`, or in chunks
+converted back to records, with
+:meth:`~.file_record_stream.FileRecordStream.iterRecords`:
+
+.. code-block:: python
+
+  for r in f.iterRecords():
+    print r
+
+Starting from a bookmark or ``firstRecord``, seeking from the end and counting
+rows use an index of the byte offsets of the rows of the file, so they don't
+scan it again. For files of 1 MB or more, the index is saved next to the file
+with a ``.index.npy`` suffix, and rebuilt when the size or modification time of
+the file changes.
+
 """
 
 import os
 import csv
 import copy
+import itertools
 import json
+import tempfile
+
+import numpy
 
 from nupic.data.field_meta import FieldMetaInfo, FieldMetaType, FieldMetaSpecial
 from nupic.data import SENTINEL_VALUE_FOR_MISSING_DATA
 from nupic.data.record_stream import RecordStreamIface
 from nupic.data.utils import (intOrNone, floatOrNone, parseBool, parseTimestamp,
-    serializeTimestamp, serializeTimestampNoMS, escape, unescape, parseSdr,
-    serializeSdr, parseStringList, stripList)
+    parseTimestamps, serializeTimestamp, serializeTimestampNoMS, escape,
+    unescape, parseSdr, serializeSdr, parseStringList, stripList)
+
+
+
+def _objectArray(values):
+  """ Returns a 1D object array of values, which may themselves be lists.
+  """
+  array = numpy.empty(len(values), dtype=object)
+  for i, value in enumerate(values):
+    array[i] = value
+  return array
+
+
+
+def _parseColumn(values, fieldType, adapter, missingValues):
+  """ Converts the text values of a field to a typed masked array, where the
+  mask marks the missing values.
+
+  :param values: (sequence of strings) text values of the field
+  :param fieldType: (string) one of the :class:`~.fieldmeta.FieldMetaType`
+                    values
+  :param adapter: (function) converts a single text value of the field
+  :param missingValues: (set) text values that stand for missing data
+  :returns: (numpy.ma.MaskedArray)
+  """
+  missing = [v in missingValues for v in values]
+  if fieldType == FieldMetaType.integer:
+    # Like intOrNone, read 'None' and 'NULL' as missing
+    missing = [m or v.strip() in ("None", "NULL")
+               for v, m in itertools.izip(values, missing)]
+  elif fieldType == FieldMetaType.float:
+    # Like floatOrNone, read 'None' as missing
+    missing = [m or v == "None" for v, m in itertools.izip(values, missing)]
+
+  if any(missing):
+    default = "1970-01-01" if fieldType == FieldMetaType.datetime else "0"
+    present = [default if m else v for v, m in itertools.izip(values, missing)]
+  else:
+    present = values
+
+  if fieldType == FieldMetaType.integer:
+    data = numpy.array(map(int, present), dtype=numpy.int64)
+  elif fieldType == FieldMetaType.float:
+    data = numpy.array(map(float, present), dtype=numpy.float64)
+  elif fieldType == FieldMetaType.boolean:
+    data = numpy.array(map(parseBool, present), dtype=bool)
+  elif fieldType == FieldMetaType.datetime:
+    data = parseTimestamps(present)
+  elif fieldType == FieldMetaType.string:
+    # Strings are immutable, so repeated values can share their conversion
+    parsed = dict((v, adapter(v)) for v in set(values))
+    data = _objectArray([None if m else parsed[v]
+                         for v, m in itertools.izip(values, missing)])
+  else:
+    data = _objectArray([None if m else adapter(v)
+                         for v, m in itertools.izip(values, missing)])
+
+  return numpy.ma.masked_array(data, mask=numpy.array(missing, dtype=bool))
+
+
+
+def _lineOffsets(filename, blockSize=2**24):
+  """ Finds the byte offsets at which the rows of a csv file start.
+
+  Rows normally are lines, which are found by searching for newlines. Files
+  that contain quotes may have values with line breaks in them, so their rows
+  are found with the csv reader instead.
+
+  :param filename: (string) path of the file
+  :param blockSize: (int) number of bytes searched for newlines at once
+  :returns: (numpy.array) of ``int64`` offsets, one per row, as counted by the
+            csv reader
+  """
+  offsets = [numpy.zeros(1, dtype=numpy.int64)]
+  position = 0
+  lastByte = None
+  with open(filename, 'rb') as f:
+    while True:
+      block = f.read(blockSize)
+      if not block:
+        break
+      if '"' in block:
+        return _csvRowOffsets(filename)
+      newlines = numpy.flatnonzero(
+        numpy.frombuffer(block, dtype=numpy.uint8) == ord('\n'))
+      offsets.append(newlines.astype(numpy.int64) + (position + 1))
+      position += len(block)
+      lastByte = block[-1]
+
+  offsets = numpy.concatenate(offsets)
+  if position == 0 or lastByte == '\n':
+    # There is no line after the last newline, nor in an empty file
+    offsets = offsets[:-1]
+  return offsets
+
+
+
+def _csvRowOffsets(filename):
+  """ Finds the byte offsets at which the rows of a csv file start, by reading
+  them with the csv reader.
+
+  :param filename: (string) path of the file
+  :returns: (numpy.array) of ``int64`` offsets, one per row
+  """
+  with open(filename, 'rb') as f:
+    # The csv reader pulls whole lines, so the position after a row is the end
+    # of its last line
+    position = [0]
+    def readLines():
+      for line in iter(f.readline, ''):
+        position[0] += len(line)
+        yield line
+
+    offsets = []
+    start = 0
+    for _ in csv.reader(readLines(), dialect="excel"):
+      offsets.append(start)
+      start = position[0]
+
+  return numpy.array(offsets, dtype=numpy.int64)
 
 
 
@@ -148,6 +287,12 @@ class FileRecordStream(RecordStreamIface):
   # Private: file mode for opening file for reading
   _FILE_READ_MODE = 'r'
 
+  # Private: suffix of the sidecar file that stores the line index of a file
+  _INDEX_FILE_SUFFIX = '.index.npy'
+
+  # Private: files smaller than this only keep their line index in memory
+  _INDEX_FILE_MIN_SIZE = 2**20
+
 
   def __init__(self, streamID, write=False, fields=None, missingValues=None,
                bookmark=None, includeMS=True, firstRecord=None):
@@ -276,6 +421,10 @@ class FileRecordStream(RecordStreamIface):
 
     self._missingValues = missingValues
 
+    # Byte offsets of the lines of the file, built on demand
+    self._lineIndex = None
+    self._lineIndexSignature = None
+
     #
     # If the bookmark is set, we need to skip over first N records
     #
@@ -286,9 +435,8 @@ class FileRecordStream(RecordStreamIface):
     else:
       rowsToSkip = 0
 
-    while rowsToSkip > 0:
-      self.next()
-      rowsToSkip -= 1
+    if rowsToSkip > 0:
+      self._seekToRecord(rowsToSkip)
 
 
     # Dictionary to store record statistics (min and max of scalars for now)
@@ -300,6 +448,8 @@ class FileRecordStream(RecordStreamIface):
     d.update(self.__dict__)
     del d['_reader']
     del d['_file']
+    d['_lineIndex'] = None
+    d['_lineIndexSignature'] = None
     return d
 
 
@@ -387,6 +537,91 @@ class FileRecordStream(RecordStreamIface):
     return record
 
 
+  def getNextColumns(self, numRecords):
+    """ Reads up to ``numRecords`` records from the file, as typed columns.
+
+    This is much faster than reading the same records with
+    :meth:`~.FileRecordStream.getNextRecord`, and advances the stream in the
+    same way. Blank lines are skipped. The source is not rewound at EOF.
+
+    Each column is a :class:`numpy.ma.MaskedArray` whose mask marks the missing
+    values. Integer fields are ``int64``, float fields ``float64``, bool fields
+    ``bool`` and datetime fields ``datetime64[us]``. The other fields are
+    ``object`` arrays of the values :meth:`~.FileRecordStream.getNextRecord`
+    returns.
+
+    :param numRecords: (int) maximum number of records to read
+    :returns: a list with a column per field, or None if there are no more
+              records in the file.
+    """
+    assert self._file is not None
+    assert self._mode == self._FILE_READ_MODE
+
+    rows = list(itertools.islice(self._reader, numRecords))
+    if not rows:
+      return None
+
+    firstRecordIdx = self._recordCount
+    self._recordCount += len(rows)
+
+    lines = [row for row in rows if row]
+    for i, line in enumerate(rows):
+      if line and len(line) != self._fieldCount:
+        raise ValueError("Record %d of %s has %d fields, expected %d" % (
+          firstRecordIdx + i, self._filename, len(line), self._fieldCount))
+
+    if lines:
+      columns = zip(*lines)
+    else:
+      columns = [()] * self._fieldCount
+
+    missingValues = set(self._missingValues)
+    return [_parseColumn(values, field.type, adapter, missingValues)
+            for values, field, adapter in itertools.izip(columns, self._fields,
+                                                         self._adapters)]
+
+
+  def iterRecords(self, chunkSize=10000, numRecords=None):
+    """ Iterates over the remaining records of the file, reading them in chunks
+    with :meth:`~.FileRecordStream.getNextColumns`.
+
+    The records are the lists :meth:`~.FileRecordStream.getNextRecord` returns,
+    with missing values replaced by
+    :const:`~nupic.data.SENTINEL_VALUE_FOR_MISSING_DATA`.
+
+    :param chunkSize: (int) number of records read at once
+    :param numRecords: (int) maximum number of records read, or None to read
+                       all the remaining records. Blank lines count as records,
+                       as they do for :meth:`~.FileRecordStream.getNextRecordIdx`.
+    :returns: an iterator over the records
+    """
+    if numRecords is not None:
+      lastRecordIdx = self._recordCount + numRecords
+
+    while True:
+      if numRecords is not None:
+        chunkSize = min(chunkSize, lastRecordIdx - self._recordCount)
+        if chunkSize <= 0:
+          return
+
+      columns = self.getNextColumns(chunkSize)
+      if columns is None:
+        return
+
+      values = []
+      for column in columns:
+        columnValues = column.data.tolist()
+        mask = numpy.ma.getmaskarray(column)
+        if mask.any():
+          columnValues = [SENTINEL_VALUE_FOR_MISSING_DATA if m else v
+                          for v, m in itertools.izip(columnValues,
+                                                     mask.tolist())]
+        values.append(columnValues)
+
+      for record in itertools.izip(*values):
+        yield list(record)
+
+
   def appendRecord(self, record):
     """
     Saves the record in the underlying csv file.
@@ -468,7 +703,9 @@ class FileRecordStream(RecordStreamIface):
     :param numRecords: how far to seek from end of file.
     :return: bookmark to desired location.
     """
-    self._file.seek(self._getTotalLineCount() - numRecords)
+    assert self._mode == self._FILE_READ_MODE
+
+    self._seekToRecord(max(0, self.getDataRowCount() - numRecords))
     return self.getBookmark()
 
 
@@ -677,13 +914,89 @@ class FileRecordStream(RecordStreamIface):
       return bookMarkDict['currentRow']
 
 
+  def _getLineIndex(self):
+    """ Returns the byte offsets of the rows of the file.
+
+    The index is built once, kept in memory and, for large files, in a sidecar
+    file next to the file. It is rebuilt when the size or modification time of
+    the file changes.
+    """
+    stat = os.stat(self._filename)
+    signature = (stat.st_size, int(stat.st_mtime * 1000000))
+    if self._lineIndex is not None and self._lineIndexSignature == signature:
+      return self._lineIndex
+
+    # The sidecar index starts with the signature of the file it indexes
+    indexFilename = self._filename + self._INDEX_FILE_SUFFIX
+    useIndexFile = stat.st_size >= self._INDEX_FILE_MIN_SIZE
+    index = None
+    if useIndexFile:
+      try:
+        index = numpy.load(indexFilename, mmap_mode='r')
+        if tuple(index[:2].tolist()) != signature:
+          index = None
+      except (IOError, ValueError, EOFError):
+        index = None
+
+    if index is None:
+      index = numpy.concatenate((numpy.array(signature, dtype=numpy.int64),
+                                 _lineOffsets(self._filename)))
+      if useIndexFile:
+        self._saveLineIndex(indexFilename, index)
+
+    self._lineIndex = index[2:]
+    self._lineIndexSignature = signature
+    return self._lineIndex
+
+
+  @staticmethod
+  def _saveLineIndex(indexFilename, index):
+    """ Saves the sidecar index. It is written to a temporary file that is
+    then renamed, so that concurrent readers never load a partial index.
+    """
+    try:
+      fd, tempFilename = tempfile.mkstemp(
+        suffix='.tmp', prefix=os.path.basename(indexFilename) + '.',
+        dir=os.path.dirname(os.path.abspath(indexFilename)))
+    except (IOError, OSError):
+      # Read-only location, the index is only kept in memory
+      return
+
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        numpy.save(f, index)
+      os.rename(tempFilename, indexFilename)
+    except (IOError, OSError):
+      os.remove(tempFilename)
+
+
+  def _seekToRecord(self, recordIdx):
+    """ Moves the file to a record, so that it is the next one read. Records
+    past the end of the file move it to the end.
+
+    :param recordIdx: (int) 0-based index of the record
+    """
+    lineIndex = self._getLineIndex()
+    lineIdx = self._NUM_HEADER_ROWS + recordIdx
+    if lineIdx < len(lineIndex):
+      self._file.seek(int(lineIndex[lineIdx]))
+    else:
+      self._file.seek(0, os.SEEK_END)
+      recordIdx = max(0, len(lineIndex) - self._NUM_HEADER_ROWS)
+
+    self._recordCount = recordIdx
+
+
   def _getTotalLineCount(self):
     """ Returns:  count of ALL lines in dataset, including header lines
     """
-    # Flush the file before we open it again to count lines
     if self._mode == self._FILE_WRITE_MODE:
-      self._file.flush()
-    return sum(1 for line in open(self._filename, self._FILE_READ_MODE))
+      # The header lines are written with the first record
+      if self._recordCount == 0:
+        return 0
+      return self._recordCount + self._NUM_HEADER_ROWS
+
+    return len(self._getLineIndex())
 
 
   def getNextRecordIdx(self):
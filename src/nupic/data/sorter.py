@@ -19,13 +19,18 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
+import collections
+import heapq
+import multiprocessing
 import os
+import shutil
 import sys
+import tempfile
+import warnings
 from operator import itemgetter
 
-import psutil
-
 from nupic.support import title
+from nupic.data.field_meta import FieldMetaInfo, FieldMetaSpecial
 from nupic.data.file_record_stream import FileRecordStream
 
 
@@ -35,154 +40,268 @@ from nupic.data.file_record_stream import FileRecordStream
 - It allows sorting of datasets that don't fit in memory
 - It allows selecting a subset of the original fields
 
-The sorter uses merge sort ()
+The sorter uses an external merge sort: it sorts chunks of the dataset that
+fit in memory, optionally in parallel, writes them to chunk files in a private
+temporary directory and merges them with a heap.
 
 """
-def sort(filename, key, outputFile, fields=None, watermark=1024 * 1024 * 100):
+
+# Number of records read from each chunk file at once while merging
+_MERGE_BUFFER_SIZE = 1000
+
+# Maximum number of chunk files merged at once. More chunk files are merged in
+# several passes.
+_MAX_MERGE_FILES = 128
+
+
+
+def sort(filename, key, outputFile, fields=None, watermark=None,
+         maxChunkRecords=1000000, maxChunkBytes=256 * 1024 * 1024,
+         numWorkers=1, tempDir=None):
   """Sort a potentially big file
 
   filename - the input file (standard File format)
   key - a list of field names to sort by
   outputFile - the name of the output file
   fields - a list of fields that should be included (all fields if None)
-  watermark - when available memory goes bellow the watermark create a new chunk
-
-  sort() works by reading as records from the file into memory
-  and calling _sortChunk() on each chunk. In the process it gets
-  rid of unneeded fields if any. Once all the chunks have been sorted and
-  written to chunk files it calls _merge() to merge all the chunks into a
-  single sorted file.
+  watermark - deprecated and ignored. The chunks used to end when the available
+    memory went below the watermark, they are now bounded by maxChunkRecords
+    and maxChunkBytes.
+  maxChunkRecords - maximum number of records sorted in memory at once
+  maxChunkBytes - maximum size, in bytes of the input file, of the records
+    sorted in memory at once
+  numWorkers - number of processes sorting and writing chunks in parallel
+  tempDir - directory of the temporary directory of chunk files (the default
+    temporary directory if None)
+
+  sort() reads the input file once, in chunks of consecutive records that fit
+  the memory budget, getting rid of unneeded fields if any, and calls
+  _sortChunk() on each chunk as it fills. _sortChunk() sorts the records of
+  its chunk and writes them to a chunk file. With more than one worker, the
+  chunks are sorted by a pool of processes while the next chunks are read, and
+  up to numWorkers chunks wait for a worker. Once all the chunks have been
+  sorted it calls _mergeFiles() to merge all the chunks into a single sorted
+  file.
 
   Note, that sort() gets a key that contains field names, which it converts
   into field indices for _sortChunk() becuase _sortChunk() doesn't need to know
   the field name.
 
-  sort() figures out by itself how many chunk files to use by reading records
-  from the file until the low watermark value of availabel memory is hit and
-  then it sorts the current records, generates a chunk file, clears the sorted
-  records and starts on a new chunk.
-
-  The key field names are turned into indices
+  The sort is stable: records with the same key keep their order in the input
+  file.
   """
+  if watermark is not None:
+    warnings.warn("The watermark argument of sort() is ignored, use "
+                  "maxChunkRecords and maxChunkBytes instead.",
+                  DeprecationWarning)
+
   if fields is not None:
     assert set(key).issubset(set([f[0] for f in fields]))
 
   with FileRecordStream(filename) as f:
 
-
     # Find the indices of the requested fields
     if fields:
       fieldNames = [ff[0] for ff in fields]
       indices = [f.getFieldNames().index(name) for name in fieldNames]
       assert len(indices) == len(fields)
     else:
-      fileds = f.getFields()
+      fields = f.getFields()
       fieldNames = f.getFieldNames()
       indices = None
 
-    # turn key fields to key indices
-    key = [fieldNames.index(name) for name in key]
+    numRecords = f.getDataRowCount()
+
+  # turn key fields to key indices
+  key = [fieldNames.index(name) for name in key]
+
+  # The budget in bytes is converted to records with the average size of the
+  # records of the input file. The chunks themselves are read in one pass.
+  chunkSize = maxChunkRecords
+  if maxChunkBytes is not None and numRecords > 0:
+    recordSize = float(os.path.getsize(filename)) / numRecords
+    chunkSize = min(chunkSize, int(maxChunkBytes / recordSize))
+  chunkSize = max(1, chunkSize)
+
+  workDir = tempfile.mkdtemp(prefix='sorter_', dir=tempDir)
+  try:
+    chunks = ((records, key, fields, os.path.join(workDir, 'chunk_%d.csv' % i))
+              for i, records in enumerate(_readChunks(filename, indices,
+                                                      chunkSize)))
+
+    if numWorkers > 1 and numRecords > chunkSize:
+      chunkFiles = _sortChunksInPool(chunks, numWorkers)
+    else:
+      chunkFiles = [_sortChunk(*args) for args in chunks]
+
+    # Merge the chunk files in several passes if there are too many to open
+    # them all at once
+    mergeIndex = 0
+    while len(chunkFiles) > _MAX_MERGE_FILES:
+      mergedFiles = []
+      for i in xrange(0, len(chunkFiles), _MAX_MERGE_FILES):
+        mergedFile = os.path.join(workDir, 'merge_%d.csv' % mergeIndex)
+        mergeIndex += 1
+        _mergeFiles(key, chunkFiles[i:i + _MAX_MERGE_FILES], mergedFile,
+                    _chunkFields(fields))
+        mergedFiles.append(mergedFile)
+      chunkFiles = mergedFiles
+
+    # Marge all the files
+    _mergeFiles(key, chunkFiles, outputFile, fields)
+
+  finally:
+    shutil.rmtree(workDir)
+
+
+
+def _chunkFields(fields):
+  """Fields of the chunk files
+
+  The chunk files hold records sorted by an arbitrary key, so their fields
+  aren't special: FileRecordStream would check that their sequences and
+  timestamps are in order.
+  """
+  return [FieldMetaInfo(f[0], f[1], FieldMetaSpecial.none) for f in fields]
+
+
+
+def _readChunks(filename, indices, chunkSize):
+  """Reads the input file in chunks of records
+
+  filename - the input file
+  indices - the indices of the requested fields (all fields if None)
+  chunkSize - the number of records of each chunk
 
-    chunk = 0
-    records = []
-    for i, r in enumerate(f):
+  _readChunks() reads the input file sequentially and yields lists of up to
+  chunkSize records, keeping only the fields requested by the user.
+  """
+  records = []
+  with FileRecordStream(filename) as f:
+    for r in f.iterRecords():
       # Select requested fields only
       if indices:
-        temp = []
-        for i in indices:
-          temp.append(r[i])
-        r = temp
-      # Store processed record
+        r = [r[i] for i in indices]
       records.append(r)
+      if len(records) == chunkSize:
+        yield records
+        records = []
 
-      # Check memory
-      available_memory = psutil.avail_phymem()
+  if records:
+    yield records
 
-      # If bellow the watermark create a new chunk, reset and keep going
-      if available_memory < watermark:
-        _sortChunk(records, key, chunk, fields)
-        records = []
-        chunk += 1
 
-    # Sort and write the remainder
-    if len(records) > 0:
-      _sortChunk(records, key, chunk, fields)
-      chunk += 1
 
-    # Marge all the files
-    _mergeFiles(key, chunk, outputFile, fields)
+def _sortChunksInPool(chunks, numWorkers):
+  """Sort chunks of records with a pool of processes
+
+  chunks - an iterable of the arguments of _sortChunk()
+  numWorkers - the number of processes
+
+  The chunks are handed to the pool as they are read, and at most numWorkers
+  of them are pending at once, so that reading doesn't get ahead of the
+  workers. Returns the names of the chunk files, in the order of the chunks.
+  """
+  pool = multiprocessing.Pool(numWorkers)
+  try:
+    chunkFiles = []
+    pending = collections.deque()
+    for args in chunks:
+      if len(pending) == numWorkers:
+        chunkFiles.append(pending.popleft().get())
+      pending.append(pool.apply_async(_sortChunk, args))
+    chunkFiles.extend(result.get() for result in pending)
+  finally:
+    pool.close()
+    pool.join()
+
+  return chunkFiles
+
+
 
-def _sortChunk(records, key, chunkIndex, fields):
+def _sortChunk(records, key, fields, chunkFile):
   """Sort in memory chunk of records
 
-  records - a list of records read from the original dataset
+  records - the records of the chunk
   key - a list of indices to sort the records by
-  chunkIndex - the index of the current chunk
+  fields - the fields of the records of the chunk
+  chunkFile - the name of the chunk file
 
-  The records contain only the fields requested by the user.
-
-  _sortChunk() will write the sorted records to a standard File
-  named "chunk_<chunk index>.csv" (chunk_0.csv, chunk_1.csv,...).
+  _sortChunk() sorts the records of the chunk and writes them to the chunk
+  file. Returns the name of the chunk file.
   """
-  title(additional='(key=%s, chunkIndex=%d)' % (str(key), chunkIndex))
-
-  assert len(records) > 0
+  title(additional='(key=%s, chunkFile=%s)' % (str(key), chunkFile))
 
   # Sort the current records
   records.sort(key=itemgetter(*key))
 
   # Write to a chunk file
-  if chunkIndex is not None:
-    filename = 'chunk_%d.csv' % chunkIndex
-    with FileRecordStream(filename, write=True, fields=fields) as o:
-      for r in records:
-        o.appendRecord(r)
+  with FileRecordStream(chunkFile, write=True,
+                        fields=_chunkFields(fields)) as o:
+    o.appendRecords(records)
+
+  assert os.path.getsize(chunkFile) > 0
 
-    assert os.path.getsize(filename) > 0
+  return chunkFile
 
-  return records
 
-def _mergeFiles(key, chunkCount, outputFile, fields):
+
+def _mergeFiles(key, chunkFiles, outputFile, fields):
   """Merge sorted chunk files into a sorted output file
 
-  chunkCount - the number of available chunk files
+  key - a list of indices to sort the records by
+  chunkFiles - the names of the sorted chunk files, in the order of their
+    records in the input file
   outputFile the name of the sorted output file
+  fields - the fields of the output file
 
-  _mergeFiles()
-
+  _mergeFiles() keeps the next record of each chunk file in a heap, ordered
+  by key and then by chunk file so that the merge is stable. The chunk files
+  are read, and the output file written, in batches of records.
   """
   title()
 
-  # Open all chun files
-  files = [FileRecordStream('chunk_%d.csv' % i) for i in range(chunkCount)]
-
-  # Open output file
-  with FileRecordStream(outputFile, write=True, fields=fields) as o:
-    # Open all chunk files
-    files = [FileRecordStream('chunk_%d.csv' % i) for i in range(chunkCount)]
-    records = [f.getNextRecord() for f in files]
-
-    # This loop will run until all files are exhausted
-    while not all(r is None for r in records):
-      # Cleanup None values (files that were exhausted)
-      indices = [i for i,r in enumerate(records) if r is not None]
-      records = [records[i] for i in indices]
-      files = [files[i] for i in indices]
-
-      # Find the current record
-      r = min(records, key=itemgetter(*key))
-      # Write it to the file
-      o.appendRecord(r)
-
-      # Find the index of file that produced the current record
-      index = records.index(r)
-      # Read a new record from the file
-      records[index] = files[index].getNextRecord()
-
-  # Cleanup chunk files
-  for i, f in enumerate(files):
-    f.close()
-    os.remove('chunk_%d.csv' % i)
+  getKey = itemgetter(*key)
+
+  files = [FileRecordStream(chunkFile) for chunkFile in chunkFiles]
+  try:
+    readers = [f.iterRecords(chunkSize=_MERGE_BUFFER_SIZE) for f in files]
+
+    # Heap of (key, chunk index, record) of the next record of each chunk
+    heap = []
+    for i, reader in enumerate(readers):
+      for r in reader:
+        heap.append((getKey(r), i, r))
+        break
+    heapq.heapify(heap)
+
+    # Open output file
+    with FileRecordStream(outputFile, write=True, fields=fields) as o:
+      buffer = []
+      while heap:
+        (_, i, r) = heap[0]
+        buffer.append(r)
+
+        # Replace the current record with the next one from its chunk file
+        for nextRecord in readers[i]:
+          heapq.heapreplace(heap, (getKey(nextRecord), i, nextRecord))
+          break
+        else:
+          heapq.heappop(heap)
+
+        if len(buffer) == _MERGE_BUFFER_SIZE:
+          o.appendRecords(buffer)
+          buffer = []
+
+      o.appendRecords(buffer)
+
+  finally:
+    # Cleanup chunk files
+    for f, chunkFile in zip(files, chunkFiles):
+      f.close()
+      os.remove(chunkFile)
+
+
 
 def writeTestFile(testFile, fields, big):
   if big:
@@ -202,7 +321,6 @@ def writeTestFile(testFile, fields, big):
     print '.'; o.appendRecord([2,4,5, payload])
 
 def test(long):
-  import shutil
   from tempfile import gettempdir
 
   print 'Running sorter self-test...'
@@ -228,19 +346,14 @@ def test(long):
   if not os.path.isfile(testFile):
     writeTestFile(testFile, fields, big=long)
 
-  # Set watermark here to 300MB bellow current available memory. That ensures
-  # multiple chunk files in the big testcase
-
-  mem = psutil.avail_phymem()
-  watermark = mem - 300 * 1024 * 1024
-
-  print 'Test sorting by f1 and f2, watermak:', watermark
+  # Sort chunks of 3 records, that ensures multiple chunk files
+  print 'Test sorting by f1 and f2'
   results = []
   sort(testFile,
        key=['f1', 'f2'],
        fields=fields,
        outputFile='f1_f2.csv',
-       watermark=watermark)
+       maxChunkRecords=3)
   with FileRecordStream('f1_f2.csv') as f:
     for r in f:
       results.append(r[:3])
@@ -256,15 +369,14 @@ def test(long):
     [2, 4, 5],
   ]
 
-  mem = psutil.avail_phymem()
-  watermark = mem - 300 * 1024 * 1024
-  print 'Test sorting by f2 and f1, watermark:', watermark
+  print 'Test sorting by f2 and f1, in parallel'
   results = []
   sort(testFile,
        key=['f2', 'f1'],
        fields=fields,
        outputFile='f2_f1.csv',
-       watermark=watermark)
+       maxChunkRecords=3,
+       numWorkers=2)
   with FileRecordStream('f2_f1.csv') as f:
     for r in f:
       results.append(r[:3])
@@ -279,15 +391,13 @@ def test(long):
     [2, 4, 5],
   ]
 
-  mem = psutil.avail_phymem()
-  watermark = mem - 300 * 1024 * 1024
-  print 'Test sorting by f3 and f2, watermark:', watermark
+  print 'Test sorting by f3 and f2'
   results = []
   sort(testFile,
        key=['f3', 'f2'],
        fields=fields,
        outputFile='f3_f2.csv',
-       watermark=watermark)
+       maxChunkRecords=3)
   with FileRecordStream('f3_f2.csv') as f:
     for r in f:
       results.append(r[:3])
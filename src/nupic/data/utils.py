@@ -24,7 +24,10 @@ Collection of utilities to process input data
 """
 
 import datetime
+import re
 import string
+
+import numpy
 # Workaround for this error:
 #  "ImportError: Failed to import _strptime because the import lockis held by
 #     another thread"
@@ -68,6 +71,40 @@ def parseTimestamp(s):
 
 
 
+# Timestamps in DATETIME_FORMATS that are also valid ISO 8601 strings for numpy
+_ISO_TIMESTAMP = re.compile(r"^\d{4}-\d\d-\d\d"
+                            r"(?: \d\d:\d\d(?::\d\d(?:\.\d{1,6})?)?"
+                            r"|T\d\d:\d\d:\d\d)?$")
+
+
+
+def parseTimestamps(values):
+  """
+  Parses a sequence of textual datetimes, as
+  :func:`~nupic.data.utils.parseTimestamp` would parse each of them.
+
+  When all of the values are in one of the ISO 8601 formats of
+  :const:`~nupic.data.utils.DATETIME_FORMATS`, they are parsed at once by numpy.
+  Otherwise each distinct value is parsed with
+  :func:`~nupic.data.utils.parseTimestamp`.
+
+  :param values: (sequence of strings) input time texts
+  :return: (numpy.array) of ``datetime64[us]``
+  """
+  values = [v.strip() for v in values]
+  match = _ISO_TIMESTAMP.match
+  if all(match(v) for v in values):
+    try:
+      return numpy.array(values, dtype="datetime64[us]")
+    except ValueError:
+      # Out of range dates and times, parseTimestamp reports them
+      pass
+
+  parsed = dict((v, parseTimestamp(v)) for v in set(values))
+  return numpy.array([parsed[v] for v in values], dtype="datetime64[us]")
+
+
+
 def serializeTimestamp(t):
   """
   Turns a datetime object into a string.
@@ -93,6 +93,7 @@ class AdaptiveScalarEncoder(ScalarEncoder):
 
     # Invalidate the bucket values cache so that they get recomputed
     self._bucketValues = None
+    self.clearCache()
 
 
   def setFieldStats(self, fieldName, fieldStats):
@@ -181,6 +182,45 @@ class AdaptiveScalarEncoder(ScalarEncoder):
 
     super(AdaptiveScalarEncoder, self).encodeIntoArray(input, output)
 
+
+  def _getCachedActiveBits(self, input):
+    """
+    [overrides nupic.encoders.base.Encoder._getCachedActiveBits]
+
+    The range is adapted to each input before looking up its encoding, and
+    the cache is cleared whenever the range changes.
+    """
+    if self._cacheKey(input) is None:
+      return None
+
+    self._adaptRange(input, self._learningEnabled)
+    return super(AdaptiveScalarEncoder, self)._getCachedActiveBits(input)
+
+
+  def encodeIntoIndices(self, input, offset=0, learn=None):
+    """
+    [overrides nupic.encoders.base.Encoder.encodeIntoIndices]
+    """
+    if learn is None:
+      learn = self._learningEnabled
+
+    activeBits = None
+    if learn == self._learningEnabled:
+      activeBits = self._getCachedActiveBits(input)
+    if activeBits is None:
+      self._adaptRange(input, learn)
+      activeBits = self._computeActiveBits(input)
+    return activeBits + offset
+
+
+  def _adaptRange(self, input, learn):
+    """
+    Counts the input and adapts the range to it, like :meth:`encodeIntoArray`.
+    """
+    self.recordNum +=1
+    if input != SENTINEL_VALUE_FOR_MISSING_DATA and not math.isnan(input):
+      self._setMinAndMax(input, learn)
+
   def getBucketInfo(self, buckets):
     """
     [overrides nupic.encoders.scalar.ScalarEncoder.getBucketInfo]
@@ -21,7 +21,7 @@
 
 """Classes for encoding different types into SDRs for HTM input."""
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 
 import numpy
 
@@ -76,8 +76,10 @@ class Encoder(Serializable):
   .. note:: The Encoder superclass implements:
 
   - :func:`~nupic.encoders.base.Encoder.encode`
+  - :func:`~nupic.encoders.base.Encoder.encodeIntoIndices`
   - :func:`~nupic.encoders.base.Encoder.pprintHeader`
   - :func:`~nupic.encoders.base.Encoder.pprint`
+  - :func:`~nupic.encoders.base.Encoder.setCacheSize`
 
   .. warning:: The following methods and properties must be implemented by
      subclasses:
@@ -120,6 +122,7 @@ class Encoder(Serializable):
     # Default behavior should be a noop.
     if hasattr(self, "_learningEnabled"):
       self._learningEnabled = learningEnabled
+    self.clearCache()
 
 
   def setFieldStats(self, fieldName, fieldStatistics):
@@ -147,10 +150,119 @@ class Encoder(Serializable):
     :return: a numpy array with the encoded representation of inputData
     """
     output = numpy.zeros((self.getWidth(),), dtype=defaultDtype)
-    self.encodeIntoArray(inputData, output)
+    activeBits = self._getCachedActiveBits(inputData)
+    if activeBits is None:
+      self.encodeIntoArray(inputData, output)
+    else:
+      output[activeBits] = 1
     return output
 
 
+  def encodeIntoIndices(self, inputData, offset=0):
+    """
+    Sparse alternative to :meth:`.encodeIntoArray`, returning the indices of
+    the active bits of the encoding instead of writing a dense array.
+
+    :param inputData: Data to encode. This should be validated by the encoder.
+    :param offset: (int) added to each index, to place the encoding within a
+           larger encoding
+    :return: sorted numpy array with the indices of the active bits, plus
+             offset
+    """
+    activeBits = self._getCachedActiveBits(inputData)
+    if activeBits is None:
+      activeBits = self._computeActiveBits(inputData)
+    return activeBits + offset
+
+
+  def setCacheSize(self, cacheSize):
+    """
+    Enables a cache of the encodings of the most recently encoded values, which
+    avoids recomputing them for streams that repeat a small set of values. The
+    cache is used by :meth:`.encode` and by
+    :meth:`~nupic.encoders.multi.MultiEncoder.encodeIntoArray`, and keeps the
+    active bits of the encodings of up to ``cacheSize`` hashable values,
+    dropping the least recently used ones. It is cleared when the encoding of
+    values may change, e.g. when learning is turned on or off.
+
+    :param cacheSize: (int) number of encodings kept, 0 disables the cache
+    """
+    if cacheSize > 0:
+      self._encodingCache = OrderedDict()
+    else:
+      self._encodingCache = None
+    self._cacheSize = cacheSize
+    self._cacheHits = 0
+    self._cacheMisses = 0
+
+
+  def clearCache(self):
+    """Forgets the encodings kept by the cache enabled with
+    :meth:`.setCacheSize`."""
+    if getattr(self, "_encodingCache", None) is not None:
+      self._encodingCache.clear()
+
+
+  def getCacheStats(self):
+    """
+    :return: dict with the number of ``hits`` and ``misses`` of the cache
+             enabled with :meth:`.setCacheSize`, and its current ``size``
+    """
+    cache = getattr(self, "_encodingCache", None)
+    return {"hits": getattr(self, "_cacheHits", 0),
+            "misses": getattr(self, "_cacheMisses", 0),
+            "size": len(cache) if cache is not None else 0}
+
+
+  def _cacheKey(self, inputData):
+    """
+    Returns the key of inputData in the cache, or None if the cache is disabled
+    or the encoding of inputData can't be cached.
+    """
+    if getattr(self, "_encodingCache", None) is None:
+      return None
+    try:
+      hash(inputData)
+    except TypeError:
+      return None
+    # Equal values of different types, like 1 and "1", may be encoded
+    # differently
+    return (type(inputData), inputData)
+
+
+  def _getCachedActiveBits(self, inputData):
+    """
+    Returns the sorted indices of the active bits of the encoding of inputData,
+    taken from the cache when it was encoded recently, or None if the cache
+    can't be used.
+    """
+    key = self._cacheKey(inputData)
+    if key is None:
+      return None
+
+    cache = self._encodingCache
+    activeBits = cache.pop(key, None)
+    if activeBits is not None:
+      self._cacheHits += 1
+    else:
+      self._cacheMisses += 1
+      activeBits = self._computeActiveBits(inputData)
+      if len(cache) >= self._cacheSize:
+        cache.popitem(last=False)
+    cache[key] = activeBits
+    return activeBits
+
+
+  def _computeActiveBits(self, inputData):
+    """
+    Encodes inputData, returning the sorted indices of its active bits.
+    Subclasses override this to encode without a dense array.
+    """
+    output = numpy.zeros((self.getWidth(),), dtype=defaultDtype)
+    self.encodeIntoArray(inputData, output)
+    return output.nonzero()[0]
+
+
   def getScalarNames(self, parentFieldName=''):
     """
     Return the field names for each of the scalar values returned by
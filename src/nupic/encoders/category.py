@@ -134,6 +134,14 @@ class CategoryEncoder(Encoder):
       print "decoded:", self.decodedToStr(self.decode(output))
 
 
+  def _computeActiveBits(self, input):
+    """ See method description in base.py """
+    if input == SENTINEL_VALUE_FOR_MISSING_DATA:
+      return numpy.array([], dtype=numpy.int64)
+    # if not found, we encode category 0
+    return self.encoder.encodeIntoIndices(self.categoryToIndex.get(input, 0))
+
+
   def decode(self, encoded, parentFieldName=''):
     """ See the function description in base.py
     """
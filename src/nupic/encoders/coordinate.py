@@ -35,6 +35,26 @@ if capnp:
   from nupic.encoders.coordinate_capnp import CoordinateEncoderProto
 
 
+
+HASHING_MODES = ("md5", "fast")
+
+# Constants of the splitmix64 finalizer used by the "fast" hashing mode
+_GOLDEN_GAMMA = numpy.uint64(0x9E3779B97F4A7C15)
+_MIX_MULTIPLIER_1 = numpy.uint64(0xBF58476D1CE4E5B9)
+_MIX_MULTIPLIER_2 = numpy.uint64(0x94D049BB133111EB)
+
+
+
+def _mix64(z):
+  """
+  Applies the splitmix64 finalizer to each element of a uint64 array.
+  """
+  z = (z ^ (z >> numpy.uint64(30))) * _MIX_MULTIPLIER_1
+  z = (z ^ (z >> numpy.uint64(27))) * _MIX_MULTIPLIER_2
+  return z ^ (z >> numpy.uint64(31))
+
+
+
 class CoordinateEncoder(Encoder):
   """
   Given a coordinate in an N-dimensional space, and a radius around
@@ -60,9 +80,24 @@ class CoordinateEncoder(Encoder):
   5. This results in a final SDR with exactly W bits active (barring chance hash
      collisions).
 
+  Two hash functions are available, selected with the `hashing` parameter:
+
+  - "md5" (default) hashes the string representation of each coordinate with
+    MD5 and seeds a `Random` with it. It produces the same encodings as
+    previous versions of the encoder. The orders and bits of recently seen
+    coordinates are kept in a cache of up to `coordinateCacheSize` entries,
+    as successive inputs often have overlapping neighborhoods.
+  - "fast" hashes the whole neighborhood at once with a splitmix64 style
+    integer hash. It is much faster, but its encodings differ from the "md5"
+    ones, so models trained with one mode can't be run with the other.
+
+  :param hashing: (string) Hash function, one of `HASHING_MODES`
+  :param coordinateCacheSize: (int) Maximum number of coordinates whose order
+         and bit are cached by the "md5" hashing. 0 disables the cache.
   """
 
-  def __init__(self, w=21, n=1000, name=None, verbosity=0):
+  def __init__(self, w=21, n=1000, name=None, verbosity=0, hashing="md5",
+               coordinateCacheSize=10000):
     # Validate inputs
     if (w <= 0) or (w % 2 == 0):
       raise ValueError("w must be an odd positive integer")
@@ -72,10 +107,18 @@ class CoordinateEncoder(Encoder):
                        "good results we recommend n be strictly greater "
                        "than 11*w")
 
+    if hashing not in HASHING_MODES:
+      raise ValueError("Unknown hashing mode: %r. Expected one of %s"
+                       % (hashing, HASHING_MODES))
+
     self.w = w
     self.n = n
     self.verbosity = verbosity
     self.encoders = None
+    self.hashing = hashing
+    self.coordinateCacheSize = coordinateCacheSize
+    self._coordinateCache = {}
+    self._neighborOffsets = {}
 
     if name is None:
       name = "[%s:%s]" % (self.n, self.w)
@@ -107,17 +150,115 @@ class CoordinateEncoder(Encoder):
     """
     (coordinate, radius) = inputData
 
+    output[:] = 0
+    output[self._activeBitsForCoordinate(coordinate, radius)] = 1
+
+
+  def _computeActiveBits(self, inputData):
+    """
+    See `nupic.encoders.base.Encoder` for more information.
+    """
+    (coordinate, radius) = inputData
+    return self._activeBitsForCoordinate(coordinate, radius)
+
+
+  def _activeBitsForCoordinate(self, coordinate, radius):
+    """
+    Returns the sorted indices of the active bits encoding a coordinate.
+
+    @param coordinate (numpy.array) N-dimensional integer coordinate
+    @param radius (int) Radius around `coordinate`
+
+    @return (numpy.array) Indices of the active bits
+    """
     assert isinstance(radius, int), ("Expected integer radius, got: {} ({})"
                                      .format(radius, type(radius)))
 
-    neighbors = self._neighbors(coordinate, radius)
-    winners = self._topWCoordinates(neighbors, self.w)
+    if getattr(self, "hashing", "md5") == "fast":
+      neighbors = (numpy.asarray(coordinate, dtype=numpy.int64) +
+                   self._getNeighborOffsets(radius, len(coordinate)))
+      orders, bits = self._fastOrdersAndBits(neighbors, self.n)
+    else:
+      neighbors = self._neighbors(coordinate, radius)
+      orders, bits = self._cachedOrdersAndBits(neighbors)
 
-    bitFn = lambda coordinate: self._bitForCoordinate(coordinate, self.n)
-    indices = numpy.array([bitFn(w) for w in winners])
+    winners = numpy.argsort(orders)[-self.w:]
+    return numpy.unique(bits[winners])
 
-    output[:] = 0
-    output[indices] = 1
+
+  def _cachedOrdersAndBits(self, neighbors):
+    """
+    Returns the "md5" orders and bits of coordinates, looking them up in the
+    coordinate cache first.
+
+    @param neighbors (numpy.array) A 2D numpy array, where each element
+                                   is a coordinate
+    @return (tuple) Orders (numpy.array of floats) and bits (numpy.array of
+                    ints) of the coordinates
+    """
+    if not hasattr(self, "_coordinateCache"):
+      self._coordinateCache = {}
+    cache = self._coordinateCache
+    cacheSize = getattr(self, "coordinateCacheSize", 0)
+
+    orders = numpy.empty(len(neighbors), dtype=numpy.float64)
+    bits = numpy.empty(len(neighbors), dtype=numpy.int64)
+    for i, coordinate in enumerate(neighbors.tolist()):
+      key = tuple(coordinate)
+      value = cache.get(key)
+      if value is None:
+        seed = self._hashCoordinate(coordinate)
+        value = (Random(seed).getReal64(), Random(seed).getUInt32(self.n))
+        if cacheSize > 0:
+          # Start over when full, which is cheaper than tracking recency
+          if len(cache) >= cacheSize:
+            cache.clear()
+          cache[key] = value
+      orders[i], bits[i] = value
+
+    return orders, bits
+
+
+  def _getNeighborOffsets(self, radius, dimensions):
+    """
+    Returns the offsets of the coordinates within `radius` of a coordinate,
+    in the order of `_neighbors`.
+    """
+    if not hasattr(self, "_neighborOffsets"):
+      self._neighborOffsets = {}
+    offsets = self._neighborOffsets.get((radius, dimensions))
+    if offsets is None:
+      offsets = self._neighbors(numpy.zeros(dimensions, dtype=numpy.int64),
+                                radius)
+      offsets = offsets.reshape(-1, dimensions).astype(numpy.int64)
+      self._neighborOffsets[(radius, dimensions)] = offsets
+    return offsets
+
+
+  @staticmethod
+  def _fastOrdersAndBits(coordinates, n):
+    """
+    Returns the "fast" orders and bits of coordinates.
+
+    Each coordinate is hashed to a 64 bit integer by mixing in its components
+    one at a time. The top 53 bits of the hash give the order, and a second
+    mix of the hash gives the bit.
+
+    @param coordinates (numpy.array) A 2D integer numpy array, where each
+                                     element is a coordinate
+    @param n (int) The number of available bits in the SDR
+    @return (tuple) Orders (numpy.array of floats in [0, 1)) and bits
+                    (numpy.array of ints) of the coordinates
+    """
+    coordinates = numpy.asarray(coordinates).astype(numpy.int64)
+    hashes = numpy.zeros(len(coordinates), dtype=numpy.uint64)
+    for component in coordinates.T.astype(numpy.uint64):
+      hashes = _mix64((hashes ^ component) + _GOLDEN_GAMMA)
+
+    orders = (hashes >> numpy.uint64(11)).astype(numpy.float64) * 2.0 ** -53
+    bits = (_mix64(hashes + _GOLDEN_GAMMA) %
+            numpy.uint64(n)).astype(numpy.int64)
+    return orders, bits
 
 
   @staticmethod
@@ -193,6 +334,8 @@ class CoordinateEncoder(Encoder):
     string = "CoordinateEncoder:"
     string += "\n  w:   {w}".format(w=self.w)
     string += "\n  n:   {n}".format(n=self.n)
+    string += "\n  hashing: {hashing}".format(
+      hashing=getattr(self, "hashing", "md5"))
     return string
 
   @classmethod
@@ -208,6 +351,11 @@ class CoordinateEncoder(Encoder):
     encoder.verbosity = proto.verbosity
     encoder.name = proto.name
     encoder.encoders = None
+    # Protos written before the hashing modes were added used MD5
+    encoder.hashing = proto.hashing or "md5"
+    encoder.coordinateCacheSize = 10000
+    encoder._coordinateCache = {}
+    encoder._neighborOffsets = {}
     return encoder
 
 
@@ -216,3 +364,4 @@ class CoordinateEncoder(Encoder):
     proto.n = self.n
     proto.verbosity = self.verbosity
     proto.name = self.name
+    proto.hashing = getattr(self, "hashing", "md5")
@@ -23,8 +23,10 @@ import datetime
 
 import numpy
 
+from collections import namedtuple
+
 from nupic.data import SENTINEL_VALUE_FOR_MISSING_DATA
-from nupic.encoders.base import Encoder
+from nupic.encoders.base import Encoder, defaultDtype
 from nupic.encoders.scalar import ScalarEncoder
 try:
   import capnp
@@ -33,6 +35,10 @@ except ImportError:
 if capnp:
   from nupic.encoders.date_capnp import DateEncoderProto
 
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+_MICROSECONDS_PER_DAY = 86400 * 1000000
+
+_Calendar = namedtuple("_Calendar", ["firstDay", "weekdays", "nearHoliday"])
 
 
 class DateEncoder(Encoder):
@@ -83,6 +89,10 @@ class DateEncoder(Encoder):
       - Each holiday is either (month, day) or (year, month, day).
         The former will use the same month day every year eg: (12, 25) for Christmas.
         The latter will be a one off holiday eg: (2018, 4, 1) for Easter Sunday 2018
+
+  The weekday of each day and whether it is next to a holiday are computed
+  once per year seen, so most dates are encoded without going through the
+  holidays. :meth:`encodeBatch` encodes whole arrays of dates at once.
   """
 
 
@@ -92,6 +102,7 @@ class DateEncoder(Encoder):
     self.width = 0
     self.description = []
     self.name = name
+    self._calendars = {}
 
     # This will contain a list of (name, encoder, offset) tuples for use by
     #  the decode() method
@@ -310,38 +321,149 @@ class DateEncoder(Encoder):
         customDay = 0
       values.append(customDay)
     if self.holidayEncoder is not None:
-      # A "continuous" binary value. = 1 on the holiday itself and smooth ramp
-      #  0->1 on the day before the holiday and 1->0 on the day after the holiday.
-      # Currently the only holiday we know about is December 25
-      # holidays is a list of holidays that occur on a fixed date every year
-      if len(self.holidays) == 0:
-        holidays = [(12, 25)]
+      calendar = self._getCalendar(timetuple.tm_year)
+      if calendar.nearHoliday[timetuple.tm_yday - 1]:
+        values.append(self._getHolidayValue(input))
       else:
-        holidays = self.holidays
-      val = 0
-      for h in holidays:
-        # hdate is midnight on the holiday
-        if len(h) == 3:
-          hdate = datetime.datetime(h[0], h[1], h[2], 0, 0, 0)
-        else:
-          hdate = datetime.datetime(timetuple.tm_year, h[0], h[1], 0, 0, 0)
-        if input > hdate:
-          diff = input - hdate
-          if diff.days == 0:
-            # return 1 on the holiday itself
-            val = 1
-            break
-          elif diff.days == 1:
-            # ramp smoothly from 1 -> 0 on the next day
-            val = 1.0 - (float(diff.seconds) / 86400)
-            break
-        else:
-          diff = hdate - input
-          if diff.days == 0:
-            # ramp smoothly from 0 -> 1 on the previous day
-            val = 1.0 - (float(diff.seconds) / 86400)
+        values.append(0)
+
+    if self.timeOfDayEncoder is not None:
+      values.append(timeOfDay)
+
+    return values
+
+
+  def _getHolidays(self):
+    # Currently the only holiday we know about is December 25
+    # holidays is a list of holidays that occur on a fixed date every year
+    if len(self.holidays) == 0:
+      return [(12, 25)]
+    return self.holidays
+
+
+  def _getHolidayValue(self, input):
+    """
+    A "continuous" binary value. = 1 on the holiday itself and smooth ramp
+    0->1 on the day before the holiday and 1->0 on the day after the holiday.
+    """
+    val = 0
+    for h in self._getHolidays():
+      # hdate is midnight on the holiday
+      if len(h) == 3:
+        hdate = datetime.datetime(h[0], h[1], h[2], 0, 0, 0)
+      else:
+        hdate = datetime.datetime(input.year, h[0], h[1], 0, 0, 0)
+      if input > hdate:
+        diff = input - hdate
+        if diff.days == 0:
+          # return 1 on the holiday itself
+          val = 1
+          break
+        elif diff.days == 1:
+          # ramp smoothly from 1 -> 0 on the next day
+          val = 1.0 - (float(diff.seconds) / 86400)
+          break
+      else:
+        diff = hdate - input
+        if diff.days == 0:
+          # ramp smoothly from 0 -> 1 on the previous day
+          val = 1.0 - (float(diff.seconds) / 86400)
+
+    return val
+
+
+  def _getCalendar(self, year):
+    """
+    Returns the per-day features of a year, computed the first time the year
+    is seen.
+
+    :param year: (int) year of the calendar
+    :returns: (_Calendar) with the first day of the year in days since the
+              epoch, and arrays indexed by the day of the year with the
+              weekday (monday = 0) and whether the day is a holiday or the
+              day before or after one
+    """
+    if not hasattr(self, "_calendars"):
+      self._calendars = {}
+    calendar = self._calendars.get(year)
+    if calendar is not None:
+      return calendar
+
+    firstDay = datetime.date(year, 1, 1).toordinal() - _EPOCH_ORDINAL
+    numDays = datetime.date(year, 12, 31).toordinal() - _EPOCH_ORDINAL + 1 - \
+              firstDay
+    days = numpy.arange(firstDay, firstDay + numDays)
+    # The epoch, January 1st 1970, is a thursday
+    weekdays = (days + 3) % 7
+
+    nearHoliday = numpy.zeros(numDays, dtype=bool)
+    if self.holidayEncoder is not None:
+      for h in self._getHolidays():
+        try:
+          if len(h) == 3:
+            holidays = [datetime.date(h[0], h[1], h[2])]
+          else:
+            # The days next to holidays of adjacent years may fall in this one
+            holidays = [datetime.date(y, h[0], h[1])
+                        for y in (year - 1, year, year + 1)]
+        except ValueError:
+          # Leave invalid holidays, like February 29th on other years than
+          # leap years, to the exact computation
+          nearHoliday[:] = True
+          break
+        for holiday in holidays:
+          dayOfYear = holiday.toordinal() - _EPOCH_ORDINAL - firstDay
+          nearHoliday[max(dayOfYear - 1, 0):max(dayOfYear + 2, 0)] = True
+
+    calendar = _Calendar(firstDay, weekdays, nearHoliday)
+    self._calendars[year] = calendar
+    return calendar
+
+
+  def _getScalarsBatch(self, days, minutes, inputs):
+    """
+    Returns the scalar values of each sub-field for arrays of dates, with the
+    same values as :meth:`getEncodedValues`.
 
-      values.append(val)
+    :param days: (numpy.array) days since the epoch of the dates
+    :param minutes: (numpy.array) minutes since midnight of the dates
+    :param inputs: (numpy.array) the dates as datetime64
+    :returns: list with an array of values per sub-field
+    """
+    years = days.astype("datetime64[D]").astype("datetime64[Y]").astype(
+      numpy.int64) + 1970
+    dayOfYear = numpy.empty(len(days), dtype=numpy.int64)
+    weekdays = numpy.empty(len(days), dtype=numpy.int64)
+    nearHoliday = numpy.empty(len(days), dtype=bool)
+    for year in numpy.unique(years):
+      calendar = self._getCalendar(int(year))
+      inYear = years == year
+      dayOfYear[inYear] = days[inYear] - calendar.firstDay
+      weekdays[inYear] = calendar.weekdays[dayOfYear[inYear]]
+      nearHoliday[inYear] = calendar.nearHoliday[dayOfYear[inYear]]
+
+    timeOfDay = minutes // 60 + (minutes % 60) / 60.0
+
+    values = []
+    if self.seasonEncoder is not None:
+      values.append(dayOfYear)
+
+    if self.dayOfWeekEncoder is not None:
+      values.append(weekdays + timeOfDay / 24.0)
+
+    if self.weekendEncoder is not None:
+      # saturday, sunday or friday evening
+      values.append(((weekdays == 6) | (weekdays == 5) |
+                     ((weekdays == 4) & (timeOfDay > 18))).astype(numpy.int64))
+
+    if self.customDaysEncoder is not None:
+      values.append(numpy.in1d(weekdays, self.customDays).astype(numpy.int64))
+
+    if self.holidayEncoder is not None:
+      holiday = numpy.zeros(len(days))
+      for i in numpy.flatnonzero(nearHoliday):
+        holiday[i] = self._getHolidayValue(inputs[i].item())
+      values.append(holiday)
 
     if self.timeOfDayEncoder is not None:
       values.append(timeOfDay)
@@ -349,6 +471,37 @@ class DateEncoder(Encoder):
     return values
 
 
+  def encodeBatch(self, inputs):
+    """
+    Encodes many dates at once, with the same encodings as :meth:`encode`.
+    Each distinct value of each sub-field is encoded once.
+
+    :param inputs: (numpy.array) datetime64 array of dates, or a list of
+           datetime. NaT or None are missing values, encoded with no active
+           bits.
+    :returns: (numpy.array) 2D array with the encoding of each date per row
+    """
+    inputs = numpy.asarray(inputs, dtype="datetime64[us]")
+    output = numpy.zeros((len(inputs), self.width), dtype=defaultDtype)
+
+    microseconds = inputs.astype(numpy.int64)
+    # NaT is stored as the smallest int64
+    valid = microseconds != numpy.iinfo(numpy.int64).min
+    inputs = inputs[valid]
+    microseconds = microseconds[valid]
+    days = microseconds // _MICROSECONDS_PER_DAY
+    minutes = (microseconds - days * _MICROSECONDS_PER_DAY) // 60000000
+
+    allValues = self._getScalarsBatch(days, minutes, inputs)
+    for (name, encoder, offset), values in zip(self.encoders, allValues):
+      uniqueValues, inverse = numpy.unique(values, return_inverse=True)
+      encodings = numpy.array([encoder.encode(value.item())
+                               for value in uniqueValues], dtype=defaultDtype)
+      output[valid, offset:offset + encoder.getWidth()] = encodings[inverse]
+
+    return output
+
+
   def getScalars(self, input):
     """
     See method description in :meth:`~.nupic.encoders.base.Encoder.getScalars`.
@@ -402,6 +555,23 @@ class DateEncoder(Encoder):
         encoder.encodeIntoArray(scalars[i], output[offset:])
 
 
+  def _computeActiveBits(self, input):
+    """ See method description in base.py """
+
+    if input == SENTINEL_VALUE_FOR_MISSING_DATA:
+      return numpy.array([], dtype=numpy.int64)
+
+    if not isinstance(input, datetime.datetime):
+      raise ValueError("Input is type %s, expected datetime. Value: %s" % (
+          type(input), str(input)))
+
+    # Encode each sub-field at its offset
+    scalars = self.getScalars(input)
+    return numpy.concatenate([
+      encoder.encodeIntoIndices(scalars[i], offset)
+      for i, (name, encoder, offset) in enumerate(self.encoders)])
+
+
   def getDescription(self):
     return self.description
 
@@ -21,6 +21,8 @@
 
 import numbers
 
+import numpy
+
 from nupic.data import SENTINEL_VALUE_FOR_MISSING_DATA
 from nupic.encoders.adaptive_scalar import AdaptiveScalarEncoder
 from nupic.encoders.base import EncoderResult
@@ -83,10 +85,37 @@ class DeltaEncoder(AdaptiveScalarEncoder):
       return output
 
 
+  def encodeIntoIndices(self, input, offset=0, learn=None):
+    """[Encoder class method override]"""
+    if not isinstance(input, numbers.Number):
+      raise TypeError(
+          "Expected a scalar input but got input of type %s" % type(input))
+
+    if learn is None:
+      learn =  self._learningEnabled
+    if input == SENTINEL_VALUE_FOR_MISSING_DATA:
+      return numpy.array([], dtype=numpy.int64)
+
+    #make the first delta zero so that the delta ranges are not messed up.
+    if self._prevAbsolute==None:
+      self._prevAbsolute= input
+    delta = input - self._prevAbsolute
+    activeBits = self._adaptiveScalarEnc.encodeIntoIndices(delta, offset, learn)
+    if not self._stateLock:
+      self._prevAbsolute = input
+      self._prevDelta = delta
+    return activeBits
+
+
   def setStateLock(self, lock):
     self._stateLock = lock
 
 
+  def _cacheKey(self, input):
+    # The encoding depends on the previous input, so it is never cached
+    return None
+
+
   def setFieldStats(self, fieldName, fieldStatistics):
     pass
 
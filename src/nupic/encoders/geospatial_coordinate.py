@@ -51,6 +51,9 @@ class GeospatialCoordinateEncoder(CoordinateEncoder):
   :param: scale (int) Scale of the map, as measured by distance between two
           coordinates (in meters per dimensional unit)
   :param: timestep (int) Time between readings (in seconds)
+  :param: hashing (string) Hash function, see `CoordinateEncoder`
+  :param: coordinateCacheSize (int) Size of the cache of coordinate orders
+          and bits, see `CoordinateEncoder`
   """
 
   def __init__(self,
@@ -59,11 +62,16 @@ class GeospatialCoordinateEncoder(CoordinateEncoder):
                w=21,
                n=1000,
                name=None,
-               verbosity=0):
-    super(GeospatialCoordinateEncoder, self).__init__(w=w,
-                                                      n=n,
-                                                      name=name,
-                                                      verbosity=verbosity)
+               verbosity=0,
+               hashing="md5",
+               coordinateCacheSize=10000):
+    super(GeospatialCoordinateEncoder, self).__init__(
+      w=w,
+      n=n,
+      name=name,
+      verbosity=verbosity,
+      hashing=hashing,
+      coordinateCacheSize=coordinateCacheSize)
 
     self.scale = scale
     self.timestep = timestep
@@ -87,6 +95,25 @@ class GeospatialCoordinateEncoder(CoordinateEncoder):
                              latitude (float), altitude (float)
     :param: output (numpy.array) Stores encoded SDR in this numpy array
     """
+    super(GeospatialCoordinateEncoder, self).encodeIntoArray(
+     self._coordinateAndRadius(inputData), output)
+
+
+  def _computeActiveBits(self, inputData):
+    """
+    See `nupic.encoders.base.Encoder` for more information.
+    """
+    return self._activeBitsForCoordinate(*self._coordinateAndRadius(inputData))
+
+
+  def _coordinateAndRadius(self, inputData):
+    """
+    Returns the coordinate and radius encoding a position and speed.
+
+    :param: inputData (tuple) Contains speed (float), longitude (float),
+                             latitude (float), altitude (float)
+    :returns: (tuple) coordinate (numpy.array) and radius (int)
+    """
     altitude = None
     if len(inputData) == 4:
       (speed, longitude, latitude, altitude) = inputData
@@ -94,8 +121,7 @@ class GeospatialCoordinateEncoder(CoordinateEncoder):
       (speed, longitude, latitude) = inputData
     coordinate = self.coordinateForPosition(longitude, latitude, altitude)
     radius = self.radiusForSpeed(speed)
-    super(GeospatialCoordinateEncoder, self).encodeIntoArray(
-     (coordinate, radius), output)
+    return coordinate, radius
 
 
   def coordinateForPosition(self, longitude, latitude, altitude=None):
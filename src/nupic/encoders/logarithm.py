@@ -177,6 +177,16 @@ class LogEncoder(Encoder):
         print "decoded:", self.decodedToStr(self.decode(output))
 
 
+  def _computeActiveBits(self, inpt):
+    """
+    See the function description in base.py
+    """
+    scaledVal = self._getScaledValue(inpt)
+    if scaledVal is None:
+      return numpy.array([], dtype=numpy.int64)
+    return self.encoder.encodeIntoIndices(scaledVal)
+
+
   def decode(self, encoded, parentFieldName=''):
     """
     See the function description in base.py
@@ -19,6 +19,8 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
+import numpy
+
 from nupic.encoders.base import Encoder
 from nupic.encoders import (ScalarEncoder,
                             AdaptiveScalarEncoder,
@@ -103,7 +105,25 @@ class MultiEncoder(Encoder):
 
   def encodeIntoArray(self, obj, output):
     for name, encoder, offset in self.encoders:
-        encoder.encodeIntoArray(self._getInputValue(obj, name), output[offset:])
+      value = self._getInputValue(obj, name)
+      activeBits = encoder._getCachedActiveBits(value)
+      if activeBits is None:
+        encoder.encodeIntoArray(value, output[offset:])
+      else:
+        # Write the cached encoding directly
+        output[offset:offset + encoder.getWidth()] = 0
+        output[offset + activeBits] = 1
+
+
+  def encodeIntoIndices(self, obj, offset=0):
+    """
+    Concatenates the active bits of the encodings of each field, see
+    :meth:`~nupic.encoders.base.Encoder.encodeIntoIndices`.
+    """
+    return numpy.concatenate([
+      encoder.encodeIntoIndices(self._getInputValue(obj, name),
+                                offset + encoderOffset)
+      for name, encoder, encoderOffset in self.encoders])
 
 
   def getDescription(self):
@@ -121,6 +141,30 @@ class MultiEncoder(Encoder):
     return
 
 
+  def setCacheSize(self, cacheSize):
+    """Enables the encoding cache of each sub-encoder, see
+    :meth:`~nupic.encoders.base.Encoder.setCacheSize`."""
+    for name, encoder, offset in self.encoders:
+      encoder.setCacheSize(cacheSize)
+
+
+  def clearCache(self):
+    for name, encoder, offset in self.encoders:
+      encoder.clearCache()
+
+
+  def getCacheStats(self):
+    """
+    :return: dict with the cache statistics summed over the sub-encoders, see
+             :meth:`~nupic.encoders.base.Encoder.getCacheStats`
+    """
+    stats = {"hits": 0, "misses": 0, "size": 0}
+    for name, encoder, offset in self.encoders:
+      for key, value in encoder.getCacheStats().iteritems():
+        stats[key] += value
+    return stats
+
+
   def encodeField(self, fieldName, value):
     for name, encoder, offset in self.encoders:
       if name == fieldName:
@@ -97,6 +97,19 @@ class PassThroughEncoder(Encoder):
       print "decoded:", self.decodedToStr(self.decode(outputVal))
 
 
+  def _computeActiveBits(self, inputVal):
+    """See method description in base.py"""
+    if len(inputVal) != self.n:
+      raise ValueError("Different input (%i) and output (%i) sizes." % (
+          len(inputVal), self.n))
+
+    if self.w is not None and sum(inputVal) != self.w:
+      raise ValueError("Input has %i bits but w was set to %i." % (
+          sum(inputVal), self.w))
+
+    return numpy.flatnonzero(inputVal)
+
+
   def decode(self, encoded, parentFieldName=""):
     """See the function description in base.py"""
 
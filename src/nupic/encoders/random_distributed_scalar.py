@@ -257,6 +257,20 @@ class RandomDistributedScalarEncoder(Encoder):
       output[self.mapBucketIndexToNonZeroBits(bucketIdx)] = 1
 
 
+  def _computeActiveBits(self, x):
+    """ See method description in base.py """
+
+    if x is not None and not isinstance(x, numbers.Number):
+      raise TypeError(
+          "Expected a scalar input but got input of type %s" % type(x))
+
+    bucketIdx = self.getBucketIndices(x)[0]
+    if bucketIdx is None:
+      return numpy.array([], dtype=numpy.int64)
+    return numpy.sort(self.mapBucketIndexToNonZeroBits(bucketIdx)).astype(
+      numpy.int64)
+
+
   def _createBucket(self, index):
     """
     Create the given bucket index. Recursively create as many in-between
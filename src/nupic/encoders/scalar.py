@@ -468,6 +468,31 @@ class ScalarEncoder(Encoder):
       print "input desc:", self.decodedToStr(self.decode(output))
 
 
+  def _computeActiveBits(self, input):
+    """ See method description in base.py """
+
+    if input is not None and not isinstance(input, numbers.Number):
+      raise TypeError(
+          "Expected a scalar input but got input of type %s" % type(input))
+
+    if type(input) is float and math.isnan(input):
+      input = SENTINEL_VALUE_FOR_MISSING_DATA
+
+    bucketIdx = self._getFirstOnBit(input)[0]
+    if bucketIdx is None:
+      # None is returned for missing value
+      return numpy.array([], dtype=numpy.int64)
+
+    activeBits = numpy.arange(bucketIdx, bucketIdx + 2*self.halfwidth + 1)
+    if self.periodic:
+      # Handle the edges by wrapping around
+      return numpy.sort(activeBits % self.n)
+
+    assert activeBits[0] >= 0
+    assert activeBits[-1] < self.n
+    return activeBits
+
+
   def decode(self, encoded, parentFieldName=''):
     """ See the function description in base.py
     """
@@ -251,6 +251,14 @@ class SDRCategoryEncoder(Encoder):
       print "decoded:", self.decodedToStr(self.decode(output))
 
 
+  def _computeActiveBits(self, input):
+    """ See method description in base.py """
+    if input == SENTINEL_VALUE_FOR_MISSING_DATA:
+      return numpy.array([], dtype=numpy.int64)
+    index = self.getBucketIndices(input)[0]
+    return self.sdrs[index].nonzero()[0]
+
+
   def decode(self, encoded, parentFieldName=''):
     """ See the function description in base.py
     """
@@ -80,3 +80,22 @@ class SparsePassThroughEncoder(pass_through.PassThroughEncoder):
                 value.dtype))
       raise
     super(SparsePassThroughEncoder, self).encodeIntoArray(denseInput, output)
+
+
+  def _computeActiveBits(self, value):
+    """ See method description in base.py """
+    if (isinstance(value, numpy.ndarray) and
+        not numpy.issubdtype(value.dtype, numpy.integer)):
+      raise ValueError(
+          "Numpy array must have integer dtype but got {}".format(value.dtype))
+
+    activeBits = numpy.asarray(value, dtype=numpy.int64)
+    if ((activeBits < -self.n) | (activeBits >= self.n)).any():
+      raise IndexError("Index out of range for an output of %i bits" % self.n)
+    activeBits = numpy.unique(activeBits % self.n)
+
+    if self.w is not None and len(activeBits) != self.w:
+      raise ValueError("Input has %i bits but w was set to %i." % (
+          len(activeBits), self.w))
+
+    return activeBits
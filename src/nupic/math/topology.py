@@ -150,3 +150,123 @@ def wrappingNeighborhood(centerIndex, radius, dimensions):
 
   coords = numpy.array(list(itertools.product(*intervals)))
   return numpy.ravel_multi_index(coords.T, dimensions)
+
+
+class NeighborhoodCache(object):
+  """
+  Precomputes the neighborhood of every point in a coordinate system, so that
+  looking up a neighborhood is an array slice. The neighborhoods are the same,
+  in the same order, as the ones returned by :meth:`neighborhood` and
+  :meth:`wrappingNeighborhood`.
+
+  The cache holds the neighborhoods for one (dimensions, radius, wrapAround)
+  key at a time, and recomputes them when it is queried with a different key.
+  They are stored in a 2D array with one row per center, padded with -1 where
+  truncated neighborhoods are smaller than the largest one.
+
+  :param maxSize: (int) The largest number of entries the 2D array may have.
+         Beyond this size the neighborhoods are computed on every call instead.
+  """
+
+  def __init__(self, maxSize=2**22):
+    self.maxSize = maxSize
+    self.clear()
+
+
+  def clear(self):
+    """
+    Forgets the cached neighborhoods.
+    """
+    self._key = None
+    self._indices = None
+    self._sizes = None
+
+
+  def neighborhood(self, centerIndex, radius, dimensions, wrapAround=False):
+    """
+    Get the points in the neighborhood of a point.
+
+    :param centerIndex: (int) The index of the point.
+
+    :param radius: (int) The radius of this neighborhood about the
+           ``centerIndex``.
+
+    :param dimensions: (indexable sequence) The dimensions of the world outside
+           this neighborhood.
+
+    :param wrapAround: (bool) Whether the neighborhood wraps around the edges,
+           like :meth:`wrappingNeighborhood`, or is truncated, like
+           :meth:`neighborhood`.
+
+    :returns: (numpy array) The points in the neighborhood, including
+              ``centerIndex``. The array is read-only.
+    """
+    key = (tuple(int(dimension) for dimension in dimensions),
+           int(radius), bool(wrapAround))
+    if key != self._key:
+      self._build(key)
+
+    if self._indices is None or not 0 <= centerIndex < len(self._sizes):
+      if wrapAround:
+        return wrappingNeighborhood(centerIndex, radius, dimensions)
+      return neighborhood(centerIndex, radius, dimensions)
+
+    return self._indices[centerIndex, :self._sizes[centerIndex]]
+
+
+  def _build(self, key):
+    dimensions, radius, wrapAround = key
+    self.clear()
+    self._key = key
+
+    offsets = []
+    for dimension in dimensions:
+      if wrapAround:
+        offsets.append(numpy.arange(-radius,
+                                    min(radius, dimension - 1 - radius) + 1))
+      else:
+        reach = min(radius, dimension - 1)
+        offsets.append(numpy.arange(-reach, reach + 1))
+
+    numPoints = int(numpy.prod(dimensions))
+    numOffsets = int(numpy.prod([len(o) for o in offsets]))
+    if numPoints * numOffsets > self.maxSize:
+      return
+
+    # Offsets vary fastest along the last dimension, like itertools.product.
+    offsetGrid = numpy.meshgrid(*offsets, indexing="ij")
+    centers = numpy.unravel_index(numpy.arange(numPoints), dimensions)
+
+    indices = numpy.zeros((numPoints, numOffsets), dtype=int)
+    valid = numpy.ones((numPoints, numOffsets), dtype=bool)
+    for center, offset, dimension in zip(centers, offsetGrid, dimensions):
+      coordinates = center[:, numpy.newaxis] + offset.reshape(1, -1)
+      if wrapAround:
+        coordinates %= dimension
+      else:
+        valid &= (coordinates >= 0) & (coordinates < dimension)
+      indices *= dimension
+      indices += coordinates
+
+    sizes = valid.sum(axis=1)
+    if not wrapAround:
+      # Move the points outside the edges to the end of each row, keeping the
+      # order of the remaining ones.
+      order = numpy.argsort(~valid, axis=1, kind="mergesort")
+      rows = numpy.arange(numPoints)[:, numpy.newaxis]
+      indices = indices[rows, order]
+      indices[numpy.arange(numOffsets) >= sizes[:, numpy.newaxis]] = -1
+
+    indices.flags.writeable = False
+    self._indices = indices
+    self._sizes = sizes
+
+
+  def __getstate__(self):
+    # The neighborhoods are cheap to recompute, so they aren't serialized.
+    return {"maxSize": self.maxSize}
+
+
+  def __setstate__(self, state):
+    self.maxSize = state["maxSize"]
+    self.clear()
@@ -0,0 +1,234 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""Unit tests for the anomaly likelihood pool."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+try:
+  import capnp
+except ImportError:
+  capnp = None
+if capnp:
+  from nupic.algorithms.anomaly_likelihood_pool_capnp import (
+    AnomalyLikelihoodPoolProto)
+
+from nupic.algorithms.anomaly_likelihood import AnomalyLikelihood
+from nupic.algorithms.anomaly_likelihood_pool import AnomalyLikelihoodPool
+
+
+
+PARAMS = dict(learningPeriod=20,
+              estimationSamples=30,
+              historicWindowSize=60,
+              reestimationPeriod=7)
+
+
+
+def _records(seed, numMetrics, numRecords):
+  """
+  Generates records of several metrics, with some categorical and some flat
+  metrics.
+
+  :returns: list with a (metricIds, values, anomalyScores) tuple per step
+  """
+  rng = numpy.random.RandomState(seed)
+  steps = []
+  for i in xrange(numRecords):
+    metrics = [m for m in xrange(numMetrics) if rng.rand() < 0.8]
+    values = []
+    for m in metrics:
+      if m % 4 == 0 and i < 150:
+        values.append("category")
+      elif m % 3 == 0:
+        values.append(3.0)
+      else:
+        values.append(rng.normal(10, 2))
+    anomalyScores = [1.0 if rng.rand() < 0.02 else rng.beta(0.5, 3)
+                     for _ in metrics]
+    steps.append((metrics, values, anomalyScores))
+  return steps
+
+
+
+def _numericValues(values):
+  return [value if isinstance(value, float) else None for value in values]
+
+
+
+class AnomalyLikelihoodPoolTest(unittest.TestCase):
+
+
+  def setUp(self):
+    self.tempDir = tempfile.mkdtemp()
+
+
+  def tearDown(self):
+    shutil.rmtree(self.tempDir)
+
+
+  def testMatchesAnomalyLikelihood(self):
+    pool = AnomalyLikelihoodPool(storeValues=True, capacity=2, **PARAMS)
+    likelihoods = [AnomalyLikelihood(**PARAMS) for _ in xrange(8)]
+
+    for i, (metrics, values, anomalyScores) in enumerate(_records(42, 8, 400)):
+      results = pool.compute(["metric%d" % m for m in metrics], anomalyScores,
+                             _numericValues(values))
+
+      expected = [likelihoods[m].anomalyProbability(value, anomalyScore, i)
+                  for m, value, anomalyScore in zip(metrics, values,
+                                                    anomalyScores)]
+      numpy.testing.assert_allclose(results, expected, rtol=0, atol=1e-9)
+
+    self.assertEqual(sorted(pool.getMetricIds()),
+                     ["metric%d" % m for m in xrange(8)])
+
+
+  def testWithoutValues(self):
+    """ Without values, metrics are treated like non-numeric ones. """
+    pool = AnomalyLikelihoodPool(**PARAMS)
+    likelihood = AnomalyLikelihood(**PARAMS)
+
+    rng = numpy.random.RandomState(42)
+    for i in xrange(300):
+      anomalyScore = rng.beta(0.5, 3)
+      self.assertAlmostEqual(
+        pool.anomalyProbability("metric", None, anomalyScore),
+        likelihood.anomalyProbability("category", anomalyScore, i),
+        places=9)
+
+
+  def testRemoveMetric(self):
+    pool = AnomalyLikelihoodPool(storeValues=True, **PARAMS)
+    likelihoods = [AnomalyLikelihood(**PARAMS) for _ in xrange(4)]
+
+    for i, (metrics, values, anomalyScores) in enumerate(_records(42, 4, 300)):
+      if i == 100:
+        pool.removeMetric("metric0")
+        likelihoods[0] = AnomalyLikelihood(**PARAMS)
+        self.assertNotIn("metric0", pool)
+        self.assertEqual(3, len(pool))
+
+      results = pool.compute(["metric%d" % m for m in metrics], anomalyScores,
+                             _numericValues(values))
+
+      expected = [likelihoods[m].anomalyProbability(value, anomalyScore, i)
+                  for m, value, anomalyScore in zip(metrics, values,
+                                                    anomalyScores)]
+      numpy.testing.assert_allclose(results, expected, rtol=0, atol=1e-9)
+
+
+  def testInvalidInput(self):
+    pool = AnomalyLikelihoodPool(storeValues=True, **PARAMS)
+
+    with self.assertRaises(ValueError):
+      pool.compute(["a", "a"], [0.1, 0.2], [1.0, 2.0])
+    with self.assertRaises(ValueError):
+      pool.compute(["a", "b"], [0.1], [1.0, 2.0])
+    with self.assertRaises(ValueError):
+      pool.compute(["a"], [0.1])
+    with self.assertRaises(ValueError):
+      AnomalyLikelihoodPool(estimationSamples=100, historicWindowSize=50)
+
+    # Metric ids are strings, and a rejected call leaves the pool unchanged
+    for metricIds in (["a", 1], ["a", (1, 2)], ["a", u"b"]):
+      with self.assertRaises(TypeError):
+        pool.compute(metricIds, [0.1, 0.2], [1.0, 2.0])
+    self.assertEqual(0, len(pool))
+
+
+  def testSnapshot(self):
+    pool = AnomalyLikelihoodPool(storeValues=True, storeTimestamps=True,
+                                 **PARAMS)
+    steps = _records(42, 6, 300)
+
+    for i, (metrics, values, anomalyScores) in enumerate(steps[:200]):
+      pool.compute(["metric%d" % m for m in metrics], anomalyScores,
+                   _numericValues(values), timestamps=[i] * len(metrics))
+
+    path = os.path.join(self.tempDir, "pool.bin")
+    pool.saveSnapshot(path)
+    loaded = AnomalyLikelihoodPool.loadSnapshot(path)
+    self.assertIsInstance(loaded._state, numpy.memmap)
+    self.assertEqual(pool, loaded)
+    self.assertEqual(pool.getMetricIds(), loaded.getMetricIds())
+    self.assertTrue(all(type(metricId) is str
+                        for metricId in loaded.getMetricIds()))
+
+    for i, (metrics, values, anomalyScores) in enumerate(steps[200:]):
+      metricIds = ["metric%d" % m for m in metrics]
+      numpy.testing.assert_array_equal(
+        pool.compute(metricIds, anomalyScores, _numericValues(values),
+                     timestamps=[i] * len(metrics)),
+        loaded.compute(metricIds, anomalyScores, _numericValues(values),
+                       timestamps=[i] * len(metrics)))
+    self.assertEqual(pool, loaded)
+
+    # Copy-on-write leaves the file as it was, and "r+" updates it in place
+    updated = AnomalyLikelihoodPool.loadSnapshot(path, mmapMode="r+")
+    self.assertNotEqual(pool, updated)
+    for i, (metrics, values, anomalyScores) in enumerate(steps[200:]):
+      updated.compute(["metric%d" % m for m in metrics], anomalyScores,
+                      _numericValues(values), timestamps=[i] * len(metrics))
+    del updated
+    self.assertEqual(pool, AnomalyLikelihoodPool.loadSnapshot(path))
+
+
+  @unittest.skipUnless(
+    capnp, "pycapnp is not installed, skipping serialization test.")
+  def testWriteRead(self):
+    pool = AnomalyLikelihoodPool(storeValues=True, **PARAMS)
+    steps = _records(42, 6, 300)
+
+    for metrics, values, anomalyScores in steps[:200]:
+      pool.compute(["metric%d" % m for m in metrics], anomalyScores,
+                   _numericValues(values))
+
+    proto1 = AnomalyLikelihoodPoolProto.new_message()
+    pool.write(proto1)
+
+    # Write the proto to a temp file and read it back into a new proto
+    with tempfile.TemporaryFile() as f:
+      proto1.write(f)
+      f.seek(0)
+      proto2 = AnomalyLikelihoodPoolProto.read(f)
+
+    pool2 = AnomalyLikelihoodPool.read(proto2)
+    self.assertEqual(pool, pool2)
+    self.assertEqual(pool.getMetricIds(), pool2.getMetricIds())
+    self.assertTrue(all(type(metricId) is str
+                        for metricId in pool2.getMetricIds()))
+
+    for metrics, values, anomalyScores in steps[200:]:
+      metricIds = ["metric%d" % m for m in metrics]
+      numpy.testing.assert_array_equal(
+        pool.compute(metricIds, anomalyScores, _numericValues(values)),
+        pool2.compute(metricIds, anomalyScores, _numericValues(values)))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -173,29 +173,22 @@ class AnomalyLikelihoodClassTest(TestCaseBase):
 
   def testdWindowSizeImpactOnEstimateAnomalyLikelihoodsArgs(self):
 
-    # Verify that AnomalyLikelihood's historicWindowSize plays nice with args
-    # passed to estimateAnomalyLikelihoods"""
+    # Verify that AnomalyLikelihood's historicWindowSize plays nice with the
+    # records the distribution is estimated from"""
 
-    originalEstimateAnomalyLikelihoods = an.estimateAnomalyLikelihoods
+    originalEstimateDistribution = an.AnomalyLikelihood._estimateDistribution
 
     estimationArgs = []
 
-    def estimateAnomalyLikelihoodsWrap(anomalyScores,
-                                       averagingWindow=10,
-                                       skipRecords=0,
-                                       verbosity=0):
-      estimationArgs.append((tuple(anomalyScores), skipRecords))
+    def estimateDistributionWrap(self):
+      estimationArgs.append(tuple(self._historicalScores))
+      originalEstimateDistribution(self)
 
-      return originalEstimateAnomalyLikelihoods(anomalyScores,
-                                                averagingWindow=averagingWindow,
-                                                skipRecords=skipRecords,
-                                                verbosity=verbosity)
 
-
-    estimateAnomalyLikelihoodsPatch = mock.patch(
-      "nupic.algorithms.anomaly_likelihood.estimateAnomalyLikelihoods",
-      side_effect=estimateAnomalyLikelihoodsWrap, autospec=True)
-    with estimateAnomalyLikelihoodsPatch as estimateAnomalyLikelihoodsMock:
+    estimateDistributionPatch = mock.patch.object(
+      an.AnomalyLikelihood, "_estimateDistribution",
+      side_effect=estimateDistributionWrap, autospec=True)
+    with estimateDistributionPatch as estimateAnomalyLikelihoodsMock:
       l = an.AnomalyLikelihood(claLearningPeriod=2,
                                estimationSamples=2,
                                historicWindowSize=3)
@@ -217,20 +210,23 @@ class AnomalyLikelihoodClassTest(TestCaseBase):
       l.anomalyProbability(50, 0.5, timestamp=5)
       self.assertEqual(estimateAnomalyLikelihoodsMock.call_count, 1)
       # NOTE: we cannot use mock's assert_called_with, because the sliding
-      # window container changes in-place after estimateAnomalyLikelihoods is
-      # called
-      scores, numSkip = estimationArgs.pop()
+      # window container changes in-place after the distribution is estimated
+      scores = estimationArgs.pop()
       self.assertEqual(scores, ((2, 20, 0.2), (3, 30, 0.3), (4, 40, 0.4)))
-      self.assertEqual(numSkip, 1)
+
+      # The first record is still in the learning period and is skipped
+      _, _, params = an.estimateAnomalyLikelihoods(scores, skipRecords=1)
+      for key in ("mean", "variance", "stdev"):
+        self.assertAlmostEqual(l._distribution["distribution"][key],
+                               params["distribution"][key])
 
 
   def testReestimationPeriodArg(self):
     estimateAnomalyLikelihoodsWrap = mock.Mock(
-      wraps=an.estimateAnomalyLikelihoods,
-      autospec=True)
+      wraps=an.AnomalyLikelihood._estimateDistribution)
 
-    estimateAnomalyLikelihoodsPatch = mock.patch(
-      "nupic.algorithms.anomaly_likelihood.estimateAnomalyLikelihoods",
+    estimateAnomalyLikelihoodsPatch = mock.patch.object(
+      an.AnomalyLikelihood, "_estimateDistribution",
       side_effect=estimateAnomalyLikelihoodsWrap, autospec=True)
     with estimateAnomalyLikelihoodsPatch:
       l = an.AnomalyLikelihood(claLearningPeriod=2,
@@ -256,22 +252,17 @@ class AnomalyLikelihoodClassTest(TestCaseBase):
 
 
   def testAnomalyProbabilityResultsDuringProbationaryPeriod(self):
-    originalUpdateAnomalyLikelihoods = an.updateAnomalyLikelihoods
-
-    def updateAnomalyLikelihoodsWrap(anomalyScores, params, verbosity=0):
-      likelihoods, avgRecordList, params = originalUpdateAnomalyLikelihoods(
-        anomalyScores=anomalyScores,
-        params=params,
-        verbosity=verbosity)
+    originalUpdateLikelihood = an.AnomalyLikelihood._updateLikelihood
 
-      self.assertEqual(len(likelihoods), 1)
+    def updateLikelihoodWrap(self, averagedScore):
+      originalUpdateLikelihood(self, averagedScore)
 
-      return [0.1], avgRecordList, params
+      return 0.1
 
 
-    updateAnomalyLikelihoodsPatch = mock.patch(
-      "nupic.algorithms.anomaly_likelihood.updateAnomalyLikelihoods",
-      side_effect=updateAnomalyLikelihoodsWrap, autospec=True)
+    updateAnomalyLikelihoodsPatch = mock.patch.object(
+      an.AnomalyLikelihood, "_updateLikelihood",
+      side_effect=updateLikelihoodWrap, autospec=True)
     with updateAnomalyLikelihoodsPatch:
       l = an.AnomalyLikelihood(claLearningPeriod=2,
                                estimationSamples=2,
@@ -287,6 +278,58 @@ class AnomalyLikelihoodClassTest(TestCaseBase):
       self.assertEqual(l.anomalyProbability(10, 0.1, timestamp=6), 0.9)
 
 
+  def testMatchesEstimateAndUpdateFunctions(self):
+    """ The running estimate gives the same likelihoods as re-estimating the
+    distribution over the sliding window with estimateAnomalyLikelihoods and
+    updating it with updateAnomalyLikelihoods.
+    """
+    learningPeriod = 20
+    historicWindowSize = 60
+    reestimationPeriod = 7
+    l = an.AnomalyLikelihood(learningPeriod=learningPeriod,
+                             estimationSamples=30,
+                             historicWindowSize=historicWindowSize,
+                             reestimationPeriod=reestimationPeriod)
+
+    rng = numpy.random.RandomState(42)
+    historicalScores = []
+    params = None
+    for i in xrange(500):
+      # Categories at first, then numbers with a flat stretch
+      if i < 120:
+        value = "abc"[i % 3]
+      elif 250 <= i < 350:
+        value = 3.0
+      else:
+        value = rng.normal(10, 2)
+      anomalyScore = 1.0 if rng.rand() < 0.02 else rng.beta(0.5, 3)
+      dataPoint = (i, value, anomalyScore)
+
+      if i < learningPeriod + 30:
+        expected = 0.5
+      else:
+        if params is None or i % reestimationPeriod == 0:
+          skipRecords = an.AnomalyLikelihood._calcSkipRecords(
+            i, historicWindowSize, learningPeriod)
+          _, _, params = an.estimateAnomalyLikelihoods(historicalScores,
+                                                       skipRecords=skipRecords)
+        likelihoods, _, params = an.updateAnomalyLikelihoods([dataPoint],
+                                                             params)
+        expected = 1.0 - likelihoods[0]
+
+      historicalScores = (historicalScores + [dataPoint])[-historicWindowSize:]
+
+      self.assertAlmostEqual(l.anomalyProbability(value, anomalyScore, i),
+                             expected, places=9)
+
+    # The state survives a round trip through pickle
+    restored = pickle.loads(pickle.dumps(l))
+    self.assertEqual(l, restored)
+    for i in xrange(500, 600):
+      self.assertEqual(l.anomalyProbability(1.0, 0.5, i),
+                       restored.anomalyProbability(1.0, 0.5, i))
+
+
   def testEquals(self):
     l = an.AnomalyLikelihood(claLearningPeriod=2, estimationSamples=2)
     l2 = an.AnomalyLikelihood(claLearningPeriod=2, estimationSamples=2)
@@ -831,6 +874,80 @@ class AnomalyLikelihoodAlgorithmTest(TestCaseBase):
                      msg="Failure in case (iii), list 3")
 
 
+  def testEstimateAnomalyLikelihoodsBatch(self):
+    """
+    The batch estimate gives the same results as estimateAnomalyLikelihoods,
+    for one metric and for several metrics at once.
+    """
+    data = [_generateSampleData(mean=0.3, variance=0.05)[0:500],
+            _generateSampleData(mean=0.1, variance=0.01)[0:500],
+            _generateSampleData(metricMean=42.0, metricVariance=1e-10)[0:500]]
+
+    scores = numpy.array([[r[2] for r in records] for records in data])
+    values = numpy.array([[r[1] for r in records] for records in data])
+
+    likelihoods, averagedScores, params = an.estimateAnomalyLikelihoodsBatch(
+      scores, metricValues=values, averagingWindow=5, skipRecords=20)
+    self.assertEqual(likelihoods.shape, scores.shape)
+    self.assertEqual(averagedScores.shape, scores.shape)
+    self.assertEqual(len(params), len(data))
+
+    for i, records in enumerate(data):
+      expectedLikelihoods, expectedRecords, expectedParams = (
+        an.estimateAnomalyLikelihoods(records, averagingWindow=5,
+                                      skipRecords=20))
+      numpy.testing.assert_array_equal(likelihoods[i], expectedLikelihoods)
+      numpy.testing.assert_array_equal(averagedScores[i],
+                                       [r[2] for r in expectedRecords])
+      self.assertEqual(params[i], expectedParams)
+
+      # One dimensional scores give the results of a single metric
+      metricLikelihoods, _, metricParams = an.estimateAnomalyLikelihoodsBatch(
+        scores[i], metricValues=values[i], averagingWindow=5, skipRecords=20)
+      numpy.testing.assert_array_equal(metricLikelihoods, expectedLikelihoods)
+      self.assertEqual(metricParams, expectedParams)
+
+    # The flat metric gets the null distribution
+    self.assertDictEqual(params[2]["distribution"], an.nullDistribution())
+
+
+  def testUpdateAnomalyLikelihoodsBatch(self):
+    """
+    The batch update gives the same results as updateAnomalyLikelihoods, for
+    metrics with different amounts of history.
+    """
+    data = [_generateSampleData(mean=0.2)[0:1000] for _ in xrange(3)]
+
+    paramsList = [
+      an.estimateAnomalyLikelihoods(data[0][0:600])[2],
+      an.estimateAnomalyLikelihoods(data[1][0:600])[2],
+      an.estimateAnomalyLikelihoods(data[2][0:4])[2],
+    ]
+    paramsList[1]["historicalLikelihoods"] = []
+
+    scores = numpy.array([[r[2] for r in records[600:]] for records in data])
+    likelihoods, averagedScores, newParams = an.updateAnomalyLikelihoodsBatch(
+      scores, copy.deepcopy(paramsList))
+
+    for i, records in enumerate(data):
+      expectedLikelihoods, expectedAverages, expectedParams = (
+        an.updateAnomalyLikelihoods(records[600:], paramsList[i]))
+      numpy.testing.assert_array_equal(likelihoods[i], expectedLikelihoods)
+      numpy.testing.assert_array_equal(averagedScores[i], expectedAverages)
+      self.assertEqual(newParams[i], expectedParams)
+
+    # Continuing one record at a time gives the same results as all at once
+    params = paramsList[0]
+    for j, record in enumerate(data[0][600:]):
+      recordLikelihoods, _, params = an.updateAnomalyLikelihoods([record],
+                                                                 params)
+      self.assertEqual(recordLikelihoods[0], likelihoods[0, j])
+    self.assertEqual(params, newParams[0])
+
+    with self.assertRaises(ValueError):
+      an.updateAnomalyLikelihoodsBatch(scores, paramsList[:2])
+
+
 
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,129 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import unittest
+
+import numpy
+
+from nupic.algorithms.array_connections import ArrayConnections
+from nupic.algorithms.connections import Connections
+from nupic.algorithms.temporal_memory import TemporalMemory
+
+
+
+class ArrayTemporalMemory(TemporalMemory):
+  connectionsClass = ArrayConnections
+
+
+
+class ArrayConnectionsTest(unittest.TestCase):
+
+  def testReuseSynapseSlotsAfterIndexRebuild(self):
+    """ Destroyed synapse slots are recycled once the presynaptic index has been
+        rebuilt, without leaving stale entries behind.
+    """
+    connections = ArrayConnections(1024)
+    segment = connections.createSegment(10)
+
+    synapses = [connections.createSynapse(segment, cell, .85)
+                for cell in xrange(100, 110)]
+    connections.computeActivity([100], .5)
+
+    for synapse in synapses[:5]:
+      connections.destroySynapse(synapse)
+    connections.computeActivity([100], .5)
+
+    for cell in xrange(200, 205):
+      connections.createSynapse(segment, cell, .85)
+
+    (numActiveConnected,
+     numActivePotential) = connections.computeActivity(
+       range(100, 110) + range(200, 205), .5)
+
+    self.assertEqual(10, numActiveConnected[segment.flatIdx])
+    self.assertEqual(10, numActivePotential[segment.flatIdx])
+    self.assertEqual(set(range(105, 110) + range(200, 205)),
+                     set(s.presynapticCell
+                         for s in connections.synapsesForSegment(segment)))
+
+
+  def testMatchesPythonTemporalMemory(self):
+    """ A TemporalMemory backed by ArrayConnections computes exactly the same
+        cells and connections as one backed by the default Connections.
+    """
+    params = dict(columnDimensions=(64,),
+                  cellsPerColumn=4,
+                  activationThreshold=3,
+                  minThreshold=2,
+                  maxNewSynapseCount=6,
+                  predictedSegmentDecrement=0.01,
+                  maxSegmentsPerCell=4,
+                  maxSynapsesPerSegment=8,
+                  seed=42)
+    tm = TemporalMemory(**params)
+    arrayTM = ArrayTemporalMemory(**params)
+
+    rng = numpy.random.RandomState(42)
+    sequence = [sorted(rng.choice(64, 5, replace=False)) for _ in xrange(10)]
+
+    for _ in xrange(5):
+      for activeColumns in sequence:
+        tm.compute(activeColumns)
+        arrayTM.compute(activeColumns)
+
+        self.assertEqual(tm.getActiveCells(), arrayTM.getActiveCells())
+        self.assertEqual(tm.getWinnerCells(), arrayTM.getWinnerCells())
+        self.assertEqual(tm.getPredictiveCells(),
+                         arrayTM.getPredictiveCells())
+      tm.reset()
+      arrayTM.reset()
+
+    self.assertGreater(arrayTM.connections.numSynapses(), 0)
+    self.assertEqual(arrayTM.connections, tm.connections)
+    self.assertEqual(tm.connections, arrayTM.connections)
+
+
+  def testEqualityWithConnections(self):
+    connections = Connections(1024)
+    arrayConnections = ArrayConnections(1024)
+
+    for c in (connections, arrayConnections):
+      segment1 = c.createSegment(10)
+      c.createSynapse(segment1, 150, 0.85)
+      c.createSynapse(segment1, 151, 0.15)
+      segment2 = c.createSegment(20)
+      c.createSynapse(segment2, 80, 0.3)
+
+    self.assertTrue(connections == arrayConnections)
+    self.assertTrue(arrayConnections == connections)
+    self.assertFalse(connections != arrayConnections)
+    self.assertFalse(arrayConnections != connections)
+
+    connections.updateSynapsePermanence(
+      list(connections.synapsesForPresynapticCell(80))[0], 0.5)
+
+    self.assertNotEqual(connections, arrayConnections)
+    self.assertNotEqual(arrayConnections, connections)
+
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -28,13 +28,18 @@ except ImportError:
 if capnp:
   from nupic.proto import ConnectionsProto_capnp
 
+from nupic.algorithms.array_connections import ArrayConnections
 from nupic.algorithms.connections import Connections
 
 
 class ConnectionsTest(unittest.TestCase):
 
+  # The Connections implementation under test. Subclasses of this test case
+  # run every test with another implementation.
+  connectionsClass = Connections
+
   def testCreateSegment(self):
-    connections = Connections(1024)
+    connections = self.connectionsClass(1024)
 
     segment1 = connections.createSegment(10)
     self.assertEqual(segment1.cell, 10)
@@ -50,7 +55,7 @@ class ConnectionsTest(unittest.TestCase):
     """ Creates a segment, destroys it, and makes sure it got destroyed along
         with all of its synapses.
     """
-    connections = Connections(1024)
+    connections = self.connectionsClass(1024)
 
     connections.createSegment(10)
     segment2 = connections.createSegment(20)
@@ -80,7 +85,7 @@ class ConnectionsTest(unittest.TestCase):
     """ Creates a segment, creates a number of synapses on it, destroys a
         synapse, and makes sure it got destroyed.
     """
-    connections = Connections(1024)
+    connections = self.connectionsClass(1024)
 
     segment = connections.createSegment(20)
     synapse1 = connections.createSynapse(segment, 80, .85)
@@ -106,7 +111,7 @@ class ConnectionsTest(unittest.TestCase):
         either side of them and verifies that existing Segment and Synapse
         instances still point to the same segment / synapse as before.
     """
-    connections = Connections(1024)
+    connections = self.connectionsClass(1024)
     segment1 = connections.createSegment(11)
     connections.createSegment(12)
     segment3 = connections.createSegment(13)
@@ -138,7 +143,7 @@ class ConnectionsTest(unittest.TestCase):
     """ Destroy a segment that has a destroyed synapse and a non-destroyed
         synapse. Make sure nothing gets double-destroyed.
     """
-    connections = Connections(1024)
+    connections = self.connectionsClass(1024)
 
     segment1 = connections.createSegment(11)
     segment2 = connections.createSegment(12)
@@ -165,7 +170,7 @@ class ConnectionsTest(unittest.TestCase):
         synapse. Create a new segment in the same place. Make sure its synapse
         count is correct.
     """
-    connections = Connections(1024)
+    connections = self.connectionsClass(1024)
 
     segment = connections.createSegment(11)
 
@@ -188,7 +193,7 @@ class ConnectionsTest(unittest.TestCase):
     """ Creates a synapse and updates its permanence, and makes sure that its
         data was correctly updated.
     """
-    connections = Connections(1024)
+    connections = self.connectionsClass(1024)
     segment = connections.createSegment(10)
     synapse = connections.createSynapse(segment, 50, .34)
 
@@ -203,7 +208,7 @@ class ConnectionsTest(unittest.TestCase):
         activity for a collection of cells with no activity returns the right
         activity data.
     """
-    connections = Connections(1024)
+    connections = self.connectionsClass(1024)
 
     # Cell with 1 segment.
     # Segment with:
@@ -234,10 +239,99 @@ class ConnectionsTest(unittest.TestCase):
     self.assertEqual(3, numActivePotential[segment2a.flatIdx])
 
 
+  def testComputeActivityReusesOutputBuffers(self):
+    """ Computes activity twice and makes sure the second call resets the
+        counts of the first one, including after new segments were added.
+    """
+    connections = self.connectionsClass(1024)
+
+    segment1 = connections.createSegment(10)
+    connections.createSynapse(segment1, 150, .85)
+    connections.createSynapse(segment1, 151, .15)
+
+    (numActiveConnected,
+     numActivePotential) = connections.computeActivity([150, 151], .5)
+    self.assertEqual([1], list(numActiveConnected))
+    self.assertEqual([2], list(numActivePotential))
+
+    segment2 = connections.createSegment(20)
+    connections.createSynapse(segment2, 80, .85)
+
+    (numActiveConnected,
+     numActivePotential) = connections.computeActivity([80], .5)
+    self.assertEqual(0, numActiveConnected[segment1.flatIdx])
+    self.assertEqual(0, numActivePotential[segment1.flatIdx])
+    self.assertEqual(1, numActiveConnected[segment2.flatIdx])
+    self.assertEqual(1, numActivePotential[segment2.flatIdx])
+
+    (numActiveConnected,
+     numActivePotential) = connections.computeActivity([], .5)
+    self.assertEqual([0, 0], list(numActiveConnected))
+    self.assertEqual([0, 0], list(numActivePotential))
+
+
+  def testComputeActivityAfterDestroys(self):
+    """ Destroys synapses and segments that share a presynaptic cell with
+        others, updates the permanence of the remaining ones, and makes sure
+        the activity follows every change.
+    """
+    connections = self.connectionsClass(1024)
+
+    segments = [connections.createSegment(cell) for cell in (10, 20, 30)]
+    synapses = [connections.createSynapse(segment, 80, .15)
+                for segment in segments]
+    connections.createSynapse(segments[2], 81, .85)
+
+    connections.destroySynapse(synapses[0])
+    connections.updateSynapsePermanence(synapses[2], .85)
+
+    (numActiveConnected,
+     numActivePotential) = connections.computeActivity([80], .5)
+    self.assertEqual([0, 0, 1], list(numActiveConnected))
+    self.assertEqual([0, 1, 1], list(numActivePotential))
+
+    connections.destroySegment(segments[1])
+    connections.updateSynapsePermanence(synapses[2], .15)
+
+    (numActiveConnected,
+     numActivePotential) = connections.computeActivity([80, 81], .5)
+    self.assertEqual([0, 0, 1], list(numActiveConnected))
+    self.assertEqual([0, 0, 2], list(numActivePotential))
+    self.assertEqual(set([synapses[2]]),
+                     connections.synapsesForPresynapticCell(80))
+
+
+  def testSegmentsSortedByPosition(self):
+    """ Creates segments out of order, recycles a flatIdx, and makes sure the
+        segments are sorted like segmentPositionSortKey sorts them.
+    """
+    connections = self.connectionsClass(1024)
+
+    segment1 = connections.createSegment(20)
+    segment2 = connections.createSegment(10)
+    segment3 = connections.createSegment(20)
+    connections.destroySegment(segment2)
+    segment4 = connections.createSegment(5)
+    segment5 = connections.createSegment(10)
+
+    segments = [segment1, segment3, segment4, segment5]
+    # Give every segment a distinct synapse, so that segments compare unequal.
+    for i, segment in enumerate(segments):
+      connections.createSynapse(segment, i, .5)
+    flatIdxs = [segment.flatIdx for segment in segments]
+
+    self.assertEqual(
+      sorted(segments, key=connections.segmentPositionSortKey),
+      connections.segmentsSortedByPosition(flatIdxs))
+    self.assertEqual([segment4, segment5, segment1, segment3],
+                     connections.segmentsSortedByPosition(flatIdxs))
+    self.assertEqual([], connections.segmentsSortedByPosition([]))
+
+
   @unittest.skipUnless(
     capnp, "pycapnp is not installed, skipping serialization test.")
   def testWriteRead(self):
-    c1 = Connections(1024)
+    c1 = self.connectionsClass(1024)
 
     # Add data before serializing
     s1 = c1.createSegment(0)
@@ -267,11 +361,16 @@ class ConnectionsTest(unittest.TestCase):
       proto2 = ConnectionsProto_capnp.ConnectionsProto.read(f)
 
     # Load the deserialized proto
-    c2 = Connections.read(proto2)
+    c2 = self.connectionsClass.read(proto2)
 
     # Check that the two connections objects are functionally equal
     self.assertEqual(c1, c2)
 
 
+
+class ArrayConnectionsTest(ConnectionsTest):
+  connectionsClass = ArrayConnections
+
+
 if __name__ == '__main__':
   unittest.main()
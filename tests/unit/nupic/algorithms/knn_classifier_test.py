@@ -20,6 +20,7 @@
 # ----------------------------------------------------------------------
 
 import numpy as np
+import pickle
 import tempfile
 import unittest
 
@@ -506,6 +507,260 @@ class KNNClassifierTest(unittest.TestCase):
     self.assertEquals(cat, 1)
 
 
+  def testOverlapIndexMatchesBruteForce(self):
+    """Tests that the overlap index finds the same distances and neighbors as
+    comparing the input with all the stored patterns"""
+    dimensionality = 200
+    rng = np.random.RandomState(42)
+
+    for distanceMethod in ("rawOverlap", "pctOverlapOfInput",
+                           "pctOverlapOfProto", "pctOverlapOfLarger"):
+      for maxStoredPatterns in (-1, 30):
+        params = {"distanceMethod": distanceMethod, "k": 3,
+                  "maxStoredPatterns": maxStoredPatterns}
+        classifier = KNNClassifier(**params)
+        indexed = KNNClassifier(useOverlapIndex=True, **params)
+
+        for i in xrange(200):
+          pattern = np.sort(rng.choice(dimensionality, rng.randint(5, 15),
+                                       replace=False))
+          category = rng.randint(4)
+          classifier.learn(pattern, category, isSparse=dimensionality)
+          indexed.learn(pattern, category, isSparse=dimensionality)
+          if i % 60 == 59:
+            classifier.removeCategory(category)
+            indexed.removeCategory(category)
+
+          denseInput = np.zeros(dimensionality)
+          denseInput[rng.choice(dimensionality, 10, replace=False)] = 1.0
+          _, _, dist, categoryDist = classifier.infer(denseInput)
+          _, _, indexedDist, indexedCategoryDist = indexed.infer(denseInput)
+          np.testing.assert_array_equal(dist, indexedDist)
+          np.testing.assert_array_equal(categoryDist, indexedCategoryDist)
+
+          if i >= 10:
+            _, _, topCategories = classifier.getClosest(denseInput)
+            _, _, indexedTopCategories = indexed.getClosest(denseInput)
+            self.assertEqual([d for _, d in topCategories],
+                             [d for _, d in indexedTopCategories])
+
+
+  def testOverlapIndexNonBinaryValues(self):
+    """Tests that the overlap index sums the input values at the non-zero
+    bits of the patterns, like the brute-force overlaps"""
+    classifier = KNNClassifier(distanceMethod="rawOverlap")
+    indexed = KNNClassifier(distanceMethod="rawOverlap", useOverlapIndex=True)
+    for pattern in ([1.0, 0.0, 2.0, 0.0, 0.0], [0.0, 1.0, 1.5, 0.0, 1.0]):
+      classifier.learn(np.array(pattern), 0)
+      indexed.learn(np.array(pattern), 0)
+
+    inputPattern = np.array([0.5, 0.0, 3.0, 0.0, 0.0])
+    overlaps, _ = indexed.getOverlaps(inputPattern)
+    np.testing.assert_array_equal(overlaps, [3.5, 3.0])
+    np.testing.assert_array_equal(overlaps,
+                                  classifier.getOverlaps(inputPattern)[0])
+    np.testing.assert_array_equal(indexed.infer(inputPattern)[2],
+                                  classifier.infer(inputPattern)[2])
+
+
+  def testOverlapIndexFallback(self):
+    """Tests inference with the overlap index when fewer than k patterns
+    overlap the input, and after pickling"""
+    dimensionality = 40
+    a = np.array([1, 3, 7, 11, 13, 17, 19, 23, 29], dtype=np.int32)
+    b = np.array([2, 4, 8, 12, 14, 18, 20, 28, 30], dtype=np.int32)
+    c = np.array([5, 6, 9, 10, 15, 16], dtype=np.int32)
+
+    classifier = KNNClassifier(k=3, distanceMethod="pctOverlapOfInput",
+                               useOverlapIndex=True)
+    classifier.learn(a, 0, isSparse=dimensionality)
+    classifier.learn(b, 1, isSparse=dimensionality)
+    classifier.learn(c, 1, isSparse=dimensionality)
+    classifier = pickle.loads(pickle.dumps(classifier))
+
+    denseA = np.zeros(dimensionality)
+    denseA[a] = 1.0
+    cat, inferenceResult, dist, categoryDist = classifier.infer(denseA)
+    self.assertEquals(cat, 1)
+    np.testing.assert_array_equal(inferenceResult, [1.0 / 3, 2.0 / 3])
+    np.testing.assert_array_equal(dist, [0.0, 1.0, 1.0])
+    np.testing.assert_array_equal(categoryDist, [0.0, 1.0])
+
+    # An input without active bits is compared with all the patterns
+    cat, _, dist, _ = classifier.infer(np.zeros(dimensionality))
+    np.testing.assert_array_equal(dist, [0.0, 0.0, 0.0])
+
+
+  def testInferBatch(self):
+    """Tests that inferBatch gives the same results as infer on each
+    pattern"""
+    dimensionality = 100
+    rng = np.random.RandomState(42)
+
+    for params in ({"distanceMethod": "rawOverlap", "k": 3},
+                   {"distanceMethod": "pctOverlapOfLarger", "k": 3},
+                   {"distanceMethod": "pctOverlapOfInput", "exact": True},
+                   {"distanceMethod": "norm", "minSparsity": 0.05}):
+      classifier = KNNClassifier(**params)
+      for i in xrange(100):
+        pattern = np.sort(rng.choice(dimensionality, rng.randint(3, 12),
+                                     replace=False))
+        classifier.learn(pattern, rng.randint(4), isSparse=dimensionality,
+                         partitionId=i % 3)
+
+      patterns = [np.sort(rng.choice(dimensionality, rng.randint(0, 12),
+                                     replace=False))
+                  for _ in xrange(30)]
+      partitionIds = [rng.choice([None, 0, 1, 2]) for _ in patterns]
+      winners, inferenceResults, dist, categoryDist = classifier.inferBatch(
+        patterns, isSparse=dimensionality, partitionIds=partitionIds)
+
+      for i, (pattern, partitionId) in enumerate(zip(patterns, partitionIds)):
+        denseInput = np.zeros(dimensionality)
+        denseInput[pattern] = 1.0
+        expected = classifier.infer(denseInput, partitionId=partitionId)
+        self.assertEqual(expected[0], winners[i])
+        if len(pattern) < 5 and "minSparsity" in params:
+          # infer returns single elements for insufficient sparsity
+          self.assertFalse(inferenceResults[i].any())
+          self.assertTrue((dist[i] == 1.0).all())
+          continue
+        np.testing.assert_array_equal(expected[1], inferenceResults[i])
+        np.testing.assert_array_equal(expected[2], dist[i])
+        np.testing.assert_array_equal(expected[3], categoryDist[i])
+
+
+  def testInferBatchInBlocks(self):
+    """Tests that the results don't depend on batchSize, and that sparse
+    matrices are only densified a block at a time"""
+
+    class RowSlicedMatrix(object):
+      # Sparse matrix stand-in that records how many rows are densified
+      def __init__(self, dense, densifiedRows):
+        self.dense = dense
+        self.shape = dense.shape
+        self.densifiedRows = densifiedRows
+
+      def __getitem__(self, rows):
+        return RowSlicedMatrix(self.dense[rows], self.densifiedRows)
+
+      def toarray(self):
+        self.densifiedRows.append(self.shape[0])
+        return self.dense.copy()
+
+    dimensionality = 50
+    rng = np.random.RandomState(42)
+    classifier = KNNClassifier(distanceMethod="rawOverlap", k=3)
+    for i in xrange(40):
+      pattern = np.sort(rng.choice(dimensionality, 5, replace=False))
+      classifier.learn(pattern, rng.randint(4), isSparse=dimensionality,
+                       partitionId=i % 3)
+
+    patterns = (rng.rand(25, dimensionality) < 0.1).astype(np.float64)
+    partitionIds = [rng.choice([None, 0, 1, 2]) for _ in patterns]
+    expected = classifier.inferBatch(patterns, partitionIds=partitionIds)
+
+    densifiedRows = []
+    actual = classifier.inferBatch(RowSlicedMatrix(patterns, densifiedRows),
+                                   partitionIds=partitionIds, batchSize=7)
+    self.assertEqual([7, 7, 7, 4], densifiedRows)
+    self.assertEqual(expected[0], actual[0])
+    for expectedArray, actualArray in zip(expected[1:], actual[1:]):
+      np.testing.assert_array_equal(expectedArray, actualArray)
+
+    winners, inferenceResults, dist, categoryDist = classifier.inferBatch(
+      np.zeros((0, dimensionality)))
+    self.assertEqual([], winners)
+    self.assertEqual((0, 40), dist.shape)
+
+
+  def testInferBatchWithoutPatterns(self):
+    classifier = KNNClassifier(distanceMethod="rawOverlap")
+    winners, inferenceResults, dist, categoryDist = classifier.inferBatch(
+      np.zeros((2, 10)))
+    self.assertEqual([None, None], winners)
+    self.assertEqual((2, 1), inferenceResults.shape)
+    self.assertEqual((2, 1), dist.shape)
+    self.assertEqual((2, 1), categoryDist.shape)
+
+
+  def testEvictionPolicies(self):
+    """Tests which patterns are kept by the fixed capacity eviction
+    policies"""
+    dimensionality = 20
+    kept = {}
+    for evictionPolicy in ("leastRecentlyUsed", "fifo"):
+      classifier = KNNClassifier(maxStoredPatterns=5,
+                                 evictionPolicy=evictionPolicy)
+      for i in xrange(10):
+        classifier.learn([i], 0, isSparse=dimensionality, rowID=100 - i)
+      self.assertEqual(5, classifier._numPatterns)
+      kept[evictionPolicy] = classifier._categoryRecencyList
+
+    # Decreasing row ids make each new pattern the least recently used one
+    self.assertEqual([100, 99, 98, 97, 96], kept["leastRecentlyUsed"])
+    self.assertEqual([95, 94, 93, 92, 91], kept["fifo"])
+
+    classifier = KNNClassifier(k=1, distanceMethod="rawOverlap",
+                               maxStoredPatterns=3,
+                               evictionPolicy="leastRecentlyMatched")
+    for i in xrange(3):
+      classifier.learn([i], 0, isSparse=dimensionality, rowID=i)
+    denseInput = np.zeros(dimensionality)
+    denseInput[0] = 1.0
+    classifier.infer(denseInput)
+    classifier.learn([3], 0, isSparse=dimensionality, rowID=3)
+    self.assertEqual([0, 2, 3], classifier._categoryRecencyList)
+    classifier.inferBatch([[2]], isSparse=dimensionality)
+    classifier.learn([4], 0, isSparse=dimensionality, rowID=4)
+    self.assertEqual([2, 3, 4], classifier._categoryRecencyList)
+
+
+  def testEvictionBatchSize(self):
+    classifier = KNNClassifier(maxStoredPatterns=5, evictionPolicy="fifo",
+                               evictionBatchSize=3)
+    numPatterns = [classifier.learn([i], 0, isSparse=20, rowID=i,
+                                    partitionId=i % 2)
+                   for i in xrange(10)]
+    self.assertEqual([1, 2, 3, 4, 5, 3, 4, 5, 3, 4], numPatterns)
+    self.assertEqual([6, 7, 8, 9], classifier._categoryRecencyList)
+    self.assertEqual([0, 1, 0, 1], classifier.getPartitionIdList())
+    self.assertEqual([0, 2], classifier.getPatternIndicesWithPartitionId(0))
+
+
+  def testEvictionPerCategory(self):
+    classifier = KNNClassifier(maxPatternsPerCategory=2, maxStoredPatterns=5,
+                               evictionPolicy="fifo")
+    categories = [0, 0, 0, 1, 1, 1, 2, 2, 0]
+    for i, category in enumerate(categories):
+      classifier.learn([i], category, isSparse=20, rowID=i)
+    self.assertEqual([4, 5, 6, 7, 8], classifier._categoryRecencyList)
+    self.assertEqual([1, 1, 2, 2, 0], classifier._categoryList)
+
+
+  def testEvictionReservoir(self):
+    """Tests that the reservoir policy keeps a uniform sample of the patterns,
+    and that its state is kept when pickling"""
+    dimensionality = 2000
+    classifier = KNNClassifier(maxStoredPatterns=100,
+                               evictionPolicy="reservoir", seed=7)
+    for i in xrange(1000):
+      classifier.learn([i], 0, isSparse=dimensionality, rowID=i)
+    self.assertEqual(100, classifier._numPatterns)
+
+    keptFirstHalf = sum(1 for rowID in classifier._categoryRecencyList
+                        if rowID < 500)
+    self.assertGreater(keptFirstHalf, 30)
+    self.assertLess(keptFirstHalf, 70)
+
+    copy = pickle.loads(pickle.dumps(classifier))
+    for i in xrange(1000, 1200):
+      classifier.learn([i], 0, isSparse=dimensionality, rowID=i)
+      copy.learn([i], 0, isSparse=dimensionality, rowID=i)
+    self.assertEqual(classifier._categoryRecencyList,
+                     copy._categoryRecencyList)
+
+
   @unittest.skipUnless(
       capnp, "pycapnp is not installed, skipping serialization test.")
   def testWriteRead(self):
@@ -548,6 +803,45 @@ class KNNClassifierTest(unittest.TestCase):
                           knnDeserialized.getPartitionIdList())
 
 
+  @unittest.skipUnless(
+      capnp, "pycapnp is not installed, skipping serialization test.")
+  def testReadProtoWithoutEvictionState(self):
+    """Reads a fixed capacity KNN written before the eviction policies"""
+    knn = KNNClassifier(maxStoredPatterns=3)
+    for i, category in enumerate([0, 1, 1]):
+      knn.learn([i], category, isSparse=20, rowID=i)
+
+    proto = KNNClassifierProto.new_message()
+    knn.write(proto)
+    # Remove everything the older schema did not have
+    for field in ("evictionPolicy", "random", "categoryRecencyList",
+                  "patternMatchTimes", "seenCategories",
+                  "numPatternsSeenPerCategory"):
+      proto.disown(field)
+    proto.maxPatternsPerCategory = 0
+    proto.evictionBatchSize = 0
+    proto.matchTime = 0
+    proto.numPatternsSeen = 0
+
+    with tempfile.TemporaryFile() as f:
+      proto.write(f)
+      f.seek(0)
+      knnDeserialized = KNNClassifier.read(KNNClassifierProto.read(f))
+
+    self.assertEqual("leastRecentlyUsed", knnDeserialized.evictionPolicy)
+    self.assertEqual(1, knnDeserialized.evictionBatchSize)
+    self.assertEqual([0, 0, 0], knnDeserialized._categoryRecencyList)
+    self.assertEqual([0, 0, 0], knnDeserialized._patternMatchTimes)
+    self.assertEqual(3, knnDeserialized._numPatternsSeen)
+    self.assertEqual({0: 1, 1: 2},
+                     knnDeserialized._numPatternsSeenPerCategory)
+
+    # The classifier keeps learning and evicting
+    knnDeserialized.learn([3], 0, isSparse=20, rowID=3)
+    self.assertEqual(3, knnDeserialized._numPatterns)
+    self.assertEqual(4, knnDeserialized._numPatternsSeen)
+
+
 
 if __name__ == "__main__":
   unittest.main()
@@ -789,6 +789,54 @@ class SDRClassifierTest(unittest.TestCase):
     self.assertAlmostEqual(result2[0][1], 1.0, places=1)
 
 
+  def testLearningMatchesPerBitUpdates(self):
+    """ Learning with growing inputs and buckets, and with repeated bits in the
+    input pattern, gives the same weights as updating one bit at a time.
+    """
+    steps = [1, 3]
+    alpha = 0.1
+    c = self._classifier(steps, alpha, 0.1, 0)
+
+    rng = numpy.random.RandomState(42)
+    expected = dict((nSteps, numpy.zeros((1, 1))) for nSteps in steps)
+    history = []
+    for recordNum in xrange(60):
+      # Grow the input space and the number of buckets as records come in
+      patternNZ = list(rng.randint(0, 10 + 4 * recordNum, size=8))
+      patternNZ.append(patternNZ[0])
+      bucketIdx = int(rng.randint(0, 2 + recordNum / 5))
+
+      c.compute(recordNum=recordNum, patternNZ=patternNZ,
+                classification={"bucketIdx": bucketIdx, "actValue": bucketIdx},
+                learn=True, infer=False)
+
+      numRows = max(max(patternNZ) + 1, expected[1].shape[0])
+      numCols = max(bucketIdx + 1, expected[1].shape[1])
+      for nSteps in steps:
+        weights = numpy.zeros((numRows, numCols))
+        weights[:expected[nSteps].shape[0],
+                :expected[nSteps].shape[1]] = expected[nSteps]
+        expected[nSteps] = weights
+
+      history.append((recordNum, patternNZ))
+      history = history[-(max(steps) + 1):]
+      for learnRecordNum, learnPatternNZ in history:
+        nSteps = recordNum - learnRecordNum
+        if nSteps in steps:
+          weights = expected[nSteps]
+          activations = weights[learnPatternNZ].sum(axis=0)
+          distribution = numpy.exp(activations - activations.max())
+          distribution /= distribution.sum()
+          target = numpy.zeros(weights.shape[1])
+          target[bucketIdx] = 1
+          for bit in learnPatternNZ:
+            weights[bit, :] += alpha * (target - distribution)
+
+    for nSteps in steps:
+      numpy.testing.assert_allclose(c._weightMatrix[nSteps], expected[nSteps],
+                                    rtol=0, atol=1e-12)
+
+
   def testSoftMaxOverflow(self):
     """
     Test if the softmax normalization overflows
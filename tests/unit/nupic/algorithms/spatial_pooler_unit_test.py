@@ -24,6 +24,7 @@
 
 import numbers
 import numpy
+import pickle
 import tempfile
 import unittest
 from copy import copy
@@ -48,6 +49,15 @@ realDType = GetNTAReal()
 
 
 
+class PerColumnTopologySpatialPooler(SpatialPooler):
+  """SpatialPooler that computes its column neighborhoods one at a time."""
+
+  def _getColumnNeighborhood(self, centerColumn):
+    return super(PerColumnTopologySpatialPooler,
+                 self)._getColumnNeighborhood(centerColumn)
+
+
+
 class SpatialPoolerTest(unittest.TestCase):
   """Unit Tests for SpatialPooler class."""
 
@@ -147,6 +157,57 @@ class SpatialPoolerTest(unittest.TestCase):
       self.assertEqual(list(perm), list(potential))
 
 
+  def testComputeSparseMatchesCompute(self):
+    """Checks that computeSparse activates the same columns and learns the same
+    permanences as compute, given the same input."""
+    randomState = getNumpyRandomGenerator()
+    for globalInhibition in (True, False):
+      params = dict(inputDimensions=[100],
+                    columnDimensions=[64],
+                    potentialRadius=20,
+                    globalInhibition=globalInhibition,
+                    numActiveColumnsPerInhArea=5,
+                    stimulusThreshold=1,
+                    boostStrength=2.0,
+                    seed=getSeed())
+      sp = SpatialPooler(**params)
+      sparseSP = SpatialPooler(**params)
+
+      activeArray = numpy.zeros(sp.getNumColumns())
+      for i in xrange(60):
+        activeInputs = randomState.choice(100, 10, replace=False)
+        inputVector = numpy.zeros(100)
+        inputVector[activeInputs] = 1
+        learn = (i % 3 != 2)
+
+        sp.compute(inputVector, learn, activeArray)
+        activeColumns = sparseSP.computeSparse(activeInputs, learn)
+
+        self.assertListEqual(list(activeArray.nonzero()[0]),
+                             list(activeColumns))
+        numpy.testing.assert_array_equal(sp.getOverlaps(),
+                                         sparseSP.getOverlaps())
+
+      for column in xrange(sp.getNumColumns()):
+        numpy.testing.assert_array_equal(sp._permanences.getRow(column),
+                                         sparseSP._permanences.getRow(column))
+        numpy.testing.assert_array_equal(
+          sparseSP._connectedSynapses.getRow(column),
+          sparseSP._connectedSynapsesByInput.getCol(column))
+
+
+  def testComputeSparseInvalidInput(self):
+    sp = SpatialPooler(inputDimensions=[10], columnDimensions=[5],
+                       stimulusThreshold=1)
+
+    with self.assertRaises(ValueError):
+      sp.computeSparse([3, 10], True)
+    with self.assertRaises(ValueError):
+      sp.computeSparse([-1, 3], True)
+
+    self.assertEqual([], list(sp.computeSparse([], False)))
+
+
   def testZeroOverlap_NoStimulusThreshold_GlobalInhibition(self):
     """When stimulusThreshold is 0, allow columns without any overlap to become
     active. This test focuses on the global inhibition code path."""
@@ -891,6 +952,41 @@ class SpatialPoolerTest(unittest.TestCase):
       self.assertAlmostEqual(trueAvgConnectedSpan[i], connectedSpan)
 
 
+  def testAdaptPermanencesForColumnsMatchesPerColumn(self):
+    """Checks that updating the permanences of several columns at once gives
+    the same result as updating them one by one."""
+    randomState = getNumpyRandomGenerator()
+    for raisePerm in (True, False):
+      sp = SpatialPooler(inputDimensions=[40],
+                         columnDimensions=[30],
+                         potentialRadius=10,
+                         stimulusThreshold=3,
+                         seed=getSeed())
+      reference = pickle.loads(pickle.dumps(sp))
+
+      columns = numpy.sort(randomState.choice(30, 12, replace=False))
+      # Mostly decrements, so that some columns need their permanences raised
+      permChanges = randomState.uniform(-0.3, 0.1, 40).astype(realDType)
+
+      sp._adaptPermanencesForColumns(columns, permChanges, raisePerm)
+      for columnIndex in columns:
+        perm = reference._permanences[columnIndex]
+        maskPotential = numpy.where(
+          reference._potentialPools[columnIndex] > 0)[0]
+        perm[maskPotential] += permChanges[maskPotential]
+        reference._updatePermanencesForColumn(perm, columnIndex, raisePerm)
+
+      for columnIndex in xrange(30):
+        numpy.testing.assert_array_equal(
+          reference._permanences.getRow(columnIndex),
+          sp._permanences.getRow(columnIndex))
+        numpy.testing.assert_array_equal(
+          reference._connectedSynapses.getRow(columnIndex),
+          sp._connectedSynapses.getRow(columnIndex))
+      numpy.testing.assert_array_equal(reference._connectedCounts,
+                                       sp._connectedCounts)
+
+
   def testBumpUpWeakColumns(self):
     sp = SpatialPooler(inputDimensions=[8],
                       columnDimensions=[5])
@@ -1394,6 +1490,29 @@ class SpatialPoolerTest(unittest.TestCase):
     self.assertListEqual(trueActive, sorted(active))
 
 
+  def testInhibitColumnsGlobalMatchesStableSort(self):
+    """
+    Tests that global inhibition picks the winners of a stable sort of the
+    overlaps, in the same order, including when there are many ties.
+    """
+    sp = self._sp
+    randomState = getNumpyRandomGenerator()
+    sp._numColumns = 200
+    sp._stimulusThreshold = 2
+    for _ in xrange(100):
+      overlaps = randomState.randint(0, 6, sp._numColumns).astype(realDType)
+      density = randomState.uniform(0, 0.5)
+
+      numActive = int(density * sp._numColumns)
+      sortedWinners = numpy.argsort(overlaps, kind="mergesort")
+      sortedWinners = sortedWinners[len(overlaps) - numActive:][::-1]
+      trueActive = [i for i in sortedWinners
+                    if overlaps[i] >= sp._stimulusThreshold]
+
+      active = list(sp._inhibitColumnsGlobal(overlaps, density))
+      self.assertListEqual(trueActive, active)
+
+
   def testInhibitColumnsLocal(self):
     sp = self._sp
     density = 0.5
@@ -1451,6 +1570,47 @@ class SpatialPoolerTest(unittest.TestCase):
     self.assertListEqual(trueActive, sorted(active))
 
 
+  def testVectorizedLocalNeighborhoodsMatchPerColumn(self):
+    randomState = getNumpyRandomGenerator()
+    for columnDimensions in ([13], [6, 9], [3, 4, 5]):
+      for wrapAround in (True, False):
+        for inhibitionRadius in (1, 2, 5):
+          params = dict(inputDimensions=columnDimensions,
+                        columnDimensions=columnDimensions,
+                        potentialRadius=2,
+                        globalInhibition=False,
+                        numActiveColumnsPerInhArea=3,
+                        stimulusThreshold=1,
+                        boostStrength=3.0,
+                        wrapAround=wrapAround,
+                        seed=getSeed())
+          sp = SpatialPooler(**params)
+          reference = PerColumnTopologySpatialPooler(**params)
+          for pooler in (sp, reference):
+            pooler.setInhibitionRadius(inhibitionRadius)
+            pooler.setMinPctOverlapDutyCycles(0.2)
+
+          numColumns = sp.getNumColumns()
+          for _ in xrange(5):
+            # Small integer overlaps, so that there are many ties.
+            overlaps = randomState.randint(0, 4, numColumns).astype(realDType)
+            for density in (0.1, 0.3, 0.5):
+              self.assertListEqual(
+                list(reference._inhibitColumnsLocal(overlaps, density)),
+                list(sp._inhibitColumnsLocal(overlaps, density)))
+
+            dutyCycles = randomState.random_sample(numColumns)
+            for pooler in (sp, reference):
+              pooler.setOverlapDutyCycles(dutyCycles)
+              pooler.setActiveDutyCycles(dutyCycles[::-1].copy())
+              pooler._updateMinDutyCyclesLocal()
+              pooler._updateBoostFactorsLocal()
+            numpy.testing.assert_array_equal(reference._minOverlapDutyCycles,
+                                             sp._minOverlapDutyCycles)
+            numpy.testing.assert_allclose(reference._boostFactors,
+                                          sp._boostFactors, rtol=1e-5)
+
+
   @unittest.skipUnless(
       capnp, "pycapnp is not installed, skipping serialization test.")
   def testWriteRead(self):
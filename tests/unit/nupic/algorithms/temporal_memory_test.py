@@ -23,6 +23,7 @@ import copy
 import tempfile
 import unittest
 
+from nupic.algorithms.array_connections import ArrayConnections
 from nupic.algorithms.temporal_memory import TemporalMemory
 from nupic.data.generators.pattern_machine import PatternMachine
 from nupic.data.generators.sequence_machine import SequenceMachine
@@ -36,22 +37,31 @@ if capnp:
 
 
 
+class ArrayTemporalMemory(TemporalMemory):
+  connectionsClass = ArrayConnections
+
+
+
 class TemporalMemoryTest(unittest.TestCase):
 
+  # The TemporalMemory under test. Subclasses of this test case run every test
+  # with another Connections implementation.
+  temporalMemoryClass = TemporalMemory
+
   def testInitInvalidParams(self):
     # Invalid columnDimensions
     kwargs = {"columnDimensions": [], "cellsPerColumn": 32}
-    self.assertRaises(ValueError, TemporalMemory, **kwargs)
+    self.assertRaises(ValueError, self.temporalMemoryClass, **kwargs)
 
     # Invalid cellsPerColumn
     kwargs = {"columnDimensions": [2048], "cellsPerColumn": 0}
-    self.assertRaises(ValueError, TemporalMemory, **kwargs)
+    self.assertRaises(ValueError, self.temporalMemoryClass, **kwargs)
     kwargs = {"columnDimensions": [2048], "cellsPerColumn": -10}
-    self.assertRaises(ValueError, TemporalMemory, **kwargs)
+    self.assertRaises(ValueError, self.temporalMemoryClass, **kwargs)
 
 
   def testActivateCorrectlyPredictiveCells(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=4,
       activationThreshold=3,
@@ -82,7 +92,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testBurstUnpredictedColumns(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=4,
       activationThreshold=3,
@@ -104,7 +114,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testZeroActiveColumns(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=4,
       activationThreshold=3,
@@ -141,7 +151,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testPredictedActiveCellsAreAlwaysWinners(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=4,
       activationThreshold=3,
@@ -176,7 +186,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testReinforceCorrectlyActiveSegments(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=4,
       activationThreshold=3,
@@ -210,7 +220,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testReinforceSelectedMatchingSegmentInBurstingColumn(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=4,
       activationThreshold=3,
@@ -254,7 +264,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testNoChangeToNonselectedMatchingSegmentsInBurstingColumn(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=4,
       activationThreshold=3,
@@ -297,7 +307,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testNoChangeToMatchingSegmentsInPredictedActiveColumn(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=4,
       activationThreshold=3,
@@ -348,7 +358,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testNoNewSegmentIfNotEnoughWinnerCells(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=4,
       activationThreshold=3,
@@ -371,7 +381,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testNewSegmentAddSynapsesToSubsetOfWinnerCells(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=4,
       activationThreshold=3,
@@ -408,7 +418,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testNewSegmentAddSynapsesToAllWinnerCells(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=4,
       activationThreshold=3,
@@ -448,7 +458,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testMatchingSegmentAddSynapsesToSubsetOfWinnerCells(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=1,
       activationThreshold=3,
@@ -485,7 +495,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testMatchingSegmentAddSynapsesToAllWinnerCells(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=1,
       activationThreshold=3,
@@ -527,7 +537,7 @@ class TemporalMemoryTest(unittest.TestCase):
     The number of grown synapses is calculated from the "matching segment"
     overlap, not the "active segment" overlap.
     """
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=1,
       activationThreshold=2,
@@ -561,7 +571,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testDestroyWeakSynapseOnWrongPrediction(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=4,
       activationThreshold=3,
@@ -594,7 +604,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testDestroyWeakSynapseOnActiveReinforce(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=4,
       activationThreshold=3,
@@ -627,7 +637,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testRecycleWeakestSynapseToMakeRoomForNewSynapse(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=1,
       activationThreshold=3,
@@ -669,7 +679,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testRecycleLeastRecentlyActiveSegmentToMakeRoomForNewSegment(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=1,
       activationThreshold=3,
@@ -719,7 +729,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testDestroySegmentsWithTooFewSynapsesToBeMatching(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=4,
       activationThreshold=3,
@@ -750,7 +760,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testPunishMatchingSegmentsInInactiveColumns(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=4,
       activationThreshold=3,
@@ -802,7 +812,7 @@ class TemporalMemoryTest(unittest.TestCase):
     grewOnCell1 = False
     grewOnCell2 = False
     for seed in xrange(100):
-      tm = TemporalMemory(
+      tm = self.temporalMemoryClass(
         columnDimensions=[32],
         cellsPerColumn=4,
         activationThreshold=3,
@@ -866,7 +876,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testConnectionsNeverChangeWhenLearningDisabled(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=4,
       activationThreshold=3,
@@ -907,7 +917,7 @@ class TemporalMemoryTest(unittest.TestCase):
     """ Destroy some segments then verify that the maxSegmentsPerCell is still
         correctly applied.
     """
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=1,
       activationThreshold=3,
@@ -942,7 +952,7 @@ class TemporalMemoryTest(unittest.TestCase):
     """ Hit the maxSegmentsPerCell threshold multiple times. Make sure it
         works more than once.
     """
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32],
       cellsPerColumn=1,
       activationThreshold=3,
@@ -967,7 +977,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testColumnForCell1D(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[2048],
       cellsPerColumn=5
     )
@@ -978,7 +988,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testColumnForCell2D(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[64, 64],
       cellsPerColumn=4
     )
@@ -989,7 +999,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testColumnForCellInvalidCell(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[64, 64],
       cellsPerColumn=4
     )
@@ -1007,7 +1017,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testCellsForColumn1D(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[2048],
       cellsPerColumn=5
     )
@@ -1016,7 +1026,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testCellsForColumn2D(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[64, 64],
       cellsPerColumn=4
     )
@@ -1025,7 +1035,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testCellsForColumnInvalidColumn(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[64, 64],
       cellsPerColumn=4
     )
@@ -1043,7 +1053,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testNumberOfColumns(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[64, 64],
       cellsPerColumn=32
     )
@@ -1051,7 +1061,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testNumberOfCells(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[64, 64],
       cellsPerColumn=32
     )
@@ -1059,7 +1069,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testMapCellsToColumns(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[100],
       cellsPerColumn=4
     )
@@ -1070,7 +1080,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testMaxSegmentsPerCellGetter(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[64,64],
       cellsPerColumn=32,
       maxSegmentsPerCell=200
@@ -1079,7 +1089,7 @@ class TemporalMemoryTest(unittest.TestCase):
 
 
   def testMaxSynapsesPerSegmentGetter(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=[32,32],
       cellsPerColumn=16,
       maxSynapsesPerSegment=150
@@ -1087,6 +1097,67 @@ class TemporalMemoryTest(unittest.TestCase):
     self.assertEqual(tm.getMaxSynapsesPerSegment(), 150)
 
 
+  def testComputeSequenceMatchesCompute(self):
+    params = dict(columnDimensions=[32],
+                  cellsPerColumn=4,
+                  activationThreshold=3,
+                  initialPermanence=.5,
+                  connectedPermanence=.5,
+                  minThreshold=2,
+                  maxNewSynapseCount=4,
+                  seed=42)
+    tm1 = self.temporalMemoryClass(**params)
+    tm2 = self.temporalMemoryClass(**params)
+
+    sequence = [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9, 10, 11]] * 4
+    resets = [i % 4 == 0 for i in xrange(len(sequence))]
+
+    expectedActive = []
+    expectedPredictive = []
+    for activeColumns, reset in zip(sequence, resets):
+      if reset:
+        tm1.reset()
+      tm1.compute(activeColumns)
+      expectedActive.append(tm1.getActiveCells())
+      expectedPredictive.append(tm1.getPredictiveCells())
+
+    ((activeIndptr, activeIndices),
+     (predictiveIndptr, predictiveIndices)) = tm2.computeSequence(
+       sequence, resets, returnCells=True)
+
+    self.assertEqual(len(sequence) + 1, len(activeIndptr))
+    for i in xrange(len(sequence)):
+      self.assertEqual(
+        expectedActive[i],
+        list(activeIndices[activeIndptr[i]:activeIndptr[i + 1]]))
+      self.assertEqual(
+        expectedPredictive[i],
+        list(predictiveIndices[predictiveIndptr[i]:predictiveIndptr[i + 1]]))
+
+    self.assertGreater(len(predictiveIndices), 0)
+    self.assertEqual(tm1, tm2)
+    self.assertIsNone(tm2.computeSequence(sequence))
+
+
+  def testComputeSequenceResetsLengthMismatch(self):
+    tm = self.temporalMemoryClass(columnDimensions=[32], cellsPerColumn=4)
+    sequence = [[0, 1, 2], [3, 4, 5], [6, 7, 8]]
+
+    with self.assertRaises(ValueError):
+      tm.computeSequence(sequence, [True, False])
+    with self.assertRaises(ValueError):
+      tm.computeSequence(sequence, [True, False, False, True])
+    self.assertEqual([], tm.getActiveCells())
+
+    with self.assertRaises(ValueError):
+      tm.computeSequence(iter(sequence), iter([True, False]))
+    with self.assertRaises(ValueError):
+      tm.computeSequence(iter(sequence), iter([True, False, False, True]))
+
+    self.assertIsNone(tm.computeSequence(iter(sequence),
+                                         iter([True, False, False])))
+
+
   def serializationTestPrepare(self, tm):
     # Create an active segment and two matching segments.
     # Destroy a few to exercise the code.
@@ -1181,7 +1252,7 @@ class TemporalMemoryTest(unittest.TestCase):
   @unittest.skipUnless(
     capnp, "pycapnp is not installed, skipping serialization test.")
   def testWriteRead(self):
-    tm1 = TemporalMemory(
+    tm1 = self.temporalMemoryClass(
       columnDimensions=(32,),
       cellsPerColumn=4,
       activationThreshold=3,
@@ -1207,15 +1278,17 @@ class TemporalMemoryTest(unittest.TestCase):
       proto2 = TemporalMemoryProto_capnp.TemporalMemoryProto.read(f)
 
     # Load the deserialized proto
-    tm2 = TemporalMemory.read(proto2)
+    tm2 = self.temporalMemoryClass.read(proto2)
 
+    self.assertIs(self.temporalMemoryClass.connectionsClass,
+                  type(tm2.connections))
     self.assertEqual(tm1, tm2)
     self.serializationTestVerify(tm2)
 
 
   @unittest.skip("Manually enable this when you want to use it.")
   def testWriteTestFile(self):
-    tm = TemporalMemory(
+    tm = self.temporalMemoryClass(
       columnDimensions=(32,),
       cellsPerColumn=4,
       activationThreshold=3,
@@ -1242,10 +1315,15 @@ class TemporalMemoryTest(unittest.TestCase):
       proto = TemporalMemoryProto_capnp.TemporalMemoryProto.read(f)
 
     # Load the deserialized proto
-    tm = TemporalMemory.read(proto)
+    tm = self.temporalMemoryClass.read(proto)
 
     self.serializationTestVerify(tm)
 
 
+
+class ArrayConnectionsTemporalMemoryTest(TemporalMemoryTest):
+  temporalMemoryClass = ArrayTemporalMemory
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -21,9 +21,57 @@
 
 """Unit tests for aggregator module."""
 
+import datetime
+import filecmp
+import os
+import random
+import shutil
+import tempfile
+
+import numpy
+from pkg_resources import resource_filename
 import unittest2 as unittest
 
 from nupic.data import aggregator
+from nupic.data.field_meta import FieldMetaInfo, FieldMetaType, FieldMetaSpecial
+from nupic.data.file_record_stream import FileRecordStream
+
+
+
+def _toColumns(records, dtypes):
+  """Converts records to masked columns, as FileRecordStream reads them."""
+  columns = []
+  for values, dtype in zip(zip(*records), dtypes):
+    mask = numpy.array([v is None for v in values], dtype=bool)
+    if dtype == object:
+      data = numpy.empty(len(values), dtype=object)
+      data[:] = values
+    else:
+      default = datetime.datetime(1970, 1, 1) if dtype[0] == 'd' else 0
+      data = numpy.array([default if v is None else v for v in values],
+                         dtype=dtype)
+    columns.append(numpy.ma.masked_array(data, mask=mask))
+  return columns
+
+
+
+def _generateDatasetPerRecord(aggregationInfo, inputFilename, outputFilename):
+  """Aggregates a file one record at a time, as generateDataset did before it
+  read chunks of columns."""
+  inputObj = FileRecordStream(inputFilename)
+  a = aggregator.Aggregator(aggregationInfo=aggregationInfo,
+                            inputFields=inputObj.getFields())
+  with FileRecordStream(outputFilename, write=True,
+                        fields=inputObj.getFields()) as outputObj:
+    while True:
+      inRecord = inputObj.getNextRecord()
+      (aggRecord, _) = a.next(inRecord, None)
+      if aggRecord is None and inRecord is None:
+        break
+      if aggRecord is not None:
+        outputObj.appendRecord(aggRecord)
+  inputObj.close()
+
 
 
 class AggregatorTest(unittest.TestCase):
@@ -50,5 +98,118 @@ class AggregatorTest(unittest.TestCase):
     self.assertAlmostEqual(result, 1.0, places=7)
 
 
+  def testNextColumns(self):
+    fields = [FieldMetaInfo('timestamp', FieldMetaType.datetime,
+                            FieldMetaSpecial.timestamp),
+              FieldMetaInfo('sid', FieldMetaType.string,
+                            FieldMetaSpecial.sequence),
+              FieldMetaInfo('sum', FieldMetaType.float, FieldMetaSpecial.none),
+              FieldMetaInfo('mean', FieldMetaType.float, FieldMetaSpecial.none),
+              FieldMetaInfo('isum', FieldMetaType.integer,
+                            FieldMetaSpecial.none),
+              FieldMetaInfo('imean', FieldMetaType.integer,
+                            FieldMetaSpecial.none),
+              FieldMetaInfo('max', FieldMetaType.float, FieldMetaSpecial.none),
+              FieldMetaInfo('min', FieldMetaType.integer,
+                            FieldMetaSpecial.none),
+              FieldMetaInfo('last', FieldMetaType.string,
+                            FieldMetaSpecial.none),
+              FieldMetaInfo('mode', FieldMetaType.integer,
+                            FieldMetaSpecial.none)]
+    dtypes = ['datetime64[us]', object, 'float64', 'float64', 'int64', 'int64',
+              'float64', 'int64', object, 'int64']
+    functions = [('sum', 'sum'), ('mean', 'mean'), ('isum', 'sum'),
+                 ('imean', 'mean'), ('max', 'max'), ('min', 'min'),
+                 ('last', 'last'), ('mode', 'mode')]
+
+    rng = random.Random(42)
+    def maybeMissing(value):
+      return None if rng.random() < 0.1 else value
+
+    records = []
+    t = datetime.datetime(2010, 1, 3, 5, 7)
+    for i in xrange(2000):
+      t += datetime.timedelta(minutes=rng.choice([1, 7, 20, 61, 1500]))
+      records.append([t, 'seq%d' % (i // 700),
+                      maybeMissing(rng.uniform(-1, 1)),
+                      maybeMissing(rng.random()),
+                      maybeMissing(rng.randint(-100, 100)),
+                      maybeMissing(rng.randint(-100, 100)),
+                      maybeMissing(rng.uniform(-10, 10)),
+                      maybeMissing(rng.randint(0, 5)),
+                      maybeMissing(rng.choice(['a', 'b', 'c'])),
+                      maybeMissing(rng.randint(0, 3))])
+    # An out of order record
+    outOfOrder = list(records[1000])
+    outOfOrder[0] -= datetime.timedelta(days=5)
+    records.insert(1010, outOfOrder)
+
+    for period in (dict(minutes=45), dict(hours=3, seconds=30), dict(days=2),
+                   dict(months=1), dict(years=1, months=1)):
+      aggregationInfo = dict(period, fields=functions)
+
+      expected = []
+      a = aggregator.Aggregator(aggregationInfo, fields)
+      for record in records + [None]:
+        (outRecord, _) = a.next(record and list(record), None)
+        if outRecord is not None:
+          expected.append(outRecord)
+
+      for chunkSize in (1, 13, 5000):
+        actual = []
+        a = aggregator.Aggregator(aggregationInfo, fields)
+        for start in xrange(0, len(records), chunkSize):
+          actual.extend(a.nextColumns(
+            _toColumns(records[start:start + chunkSize], dtypes)))
+        actual.extend(a.nextColumns(None))
+
+        self.assertEqual(expected, actual,
+                         "period %r, chunkSize %d" % (period, chunkSize))
+
+
+  def testGenerateDatasetMatchesPerRecordAggregation(self):
+    # generateDataset looks its input up in nupic.datafiles
+    dataDir = resource_filename("nupic.datafiles", "")
+    tmpDir = tempfile.mkdtemp(dir=dataDir)
+    try:
+      inputFilename = os.path.join(tmpDir, "input.csv")
+      fields = [("timestamp", "datetime", "T"),
+                ("reset", "int", "R"),
+                ("consumption", "float", ""),
+                ("visits", "int", ""),
+                ("gym", "string", "")]
+      rng = random.Random(42)
+      t = datetime.datetime(2010, 1, 3, 5, 7)
+      with FileRecordStream(inputFilename, write=True, fields=fields) as o:
+        for i in xrange(3000):
+          t += datetime.timedelta(minutes=rng.choice([1, 7, 20, 61, 1500]))
+          o.appendRecord([t, int(i % 1000 == 0),
+                          rng.choice([rng.uniform(0, 100), None]),
+                          rng.randint(0, 1000),
+                          rng.choice(["gym_a", "gym_b", None])])
+
+      functions = [("consumption", "sum"), ("visits", "mean"),
+                   ("gym", "last")]
+      for period in (dict(hours=3), dict(days=2), dict(months=1)):
+        aggregationInfo = dict(period, fields=functions)
+        expectedFilename = os.path.join(tmpDir, "expected.csv")
+        _generateDatasetPerRecord(aggregationInfo, inputFilename,
+                                  expectedFilename)
+
+        for chunkSize in (1, 13, 10000):
+          outputFilename = os.path.join(tmpDir, "output_%d.csv" % chunkSize)
+          self.assertEqual(outputFilename, aggregator.generateDataset(
+            aggregationInfo, os.path.relpath(inputFilename, dataDir),
+            outputFilename, chunkSize=chunkSize))
+          self.assertTrue(
+            filecmp.cmp(expectedFilename, outputFilename, shallow=False),
+            "period %r, chunkSize %d" % (period, chunkSize))
+          os.remove(outputFilename)
+          os.remove(outputFilename + ".please_wait")
+        os.remove(expectedFilename)
+    finally:
+      shutil.rmtree(tmpDir)
+
+
 if __name__ == '__main__':
   unittest.main()
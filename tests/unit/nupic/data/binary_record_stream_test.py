@@ -0,0 +1,173 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from datetime import datetime
+
+import numpy
+
+from nupic.data.binary_record_stream import BinaryRecordStream, convertCsv
+from nupic.data.field_meta import FieldMetaInfo, FieldMetaType, FieldMetaSpecial
+from nupic.data.file_record_stream import FileRecordStream
+
+
+
+class BinaryRecordStreamTest(unittest.TestCase):
+
+
+  def setUp(self):
+    self.tmpDir = tempfile.mkdtemp()
+    self.csvPath = os.path.join(self.tmpDir, "data.csv")
+    self.storePath = os.path.join(self.tmpDir, "data.nbr")
+
+    fields = [FieldMetaInfo('timestamp', FieldMetaType.datetime,
+                            FieldMetaSpecial.timestamp),
+              FieldMetaInfo('sid', FieldMetaType.string,
+                            FieldMetaSpecial.sequence),
+              FieldMetaInfo('integer', FieldMetaType.integer,
+                            FieldMetaSpecial.none),
+              FieldMetaInfo('real', FieldMetaType.float,
+                            FieldMetaSpecial.none),
+              FieldMetaInfo('flag', FieldMetaType.boolean,
+                            FieldMetaSpecial.none),
+              FieldMetaInfo('categories', FieldMetaType.list,
+                            FieldMetaSpecial.category)]
+    records = (
+      [datetime(2010, 3, 1), 'seq,1', 5, 6.5, True, [1, 2]],
+      [datetime(2010, 3, 2), 'seq,1', 8, 7.5, False, [3]],
+      [datetime(2010, 3, 3, 10, 30), 'seq_2', '', 8.5, True, [1]],
+      [datetime(2010, 3, 4), 'seq_2', 12, '', False, []],
+      [datetime(2010, 3, 5), 'seq_3', -87657496599, 6.5, True, [2, 4, 5]])
+
+    with FileRecordStream(self.csvPath, write=True, fields=fields) as s:
+      for r in records:
+        s.appendRecord(list(r))
+
+    with FileRecordStream(self.csvPath) as s:
+      self.expected = list(s)
+
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpDir)
+
+
+  def testRecordsMatchCsv(self):
+    self.assertEqual(5, convertCsv(self.csvPath, self.storePath, chunkSize=2))
+
+    with BinaryRecordStream(self.storePath) as s:
+      with FileRecordStream(self.csvPath) as csv:
+        self.assertEqual(csv.getFields(), s.getFields())
+        self.assertEqual(csv.getStats(), s.getStats())
+      self.assertEqual(5, s.getDataRowCount())
+      self.assertEqual(self.expected, list(s))
+      self.assertIsNone(s.getNextRecord())
+
+      s.rewind()
+      self.assertEqual(self.expected, list(s.iterRecords(chunkSize=2)))
+
+      s.rewind()
+      self.assertEqual([1, 0, 1, 0, 1], s.getResets().tolist())
+      for reset in s.getResets():
+        self.assertEqual(reset, s.getNextRecordDict()['_reset'])
+
+
+  def testBookmarks(self):
+    convertCsv(self.csvPath, self.storePath)
+
+    with BinaryRecordStream(self.storePath) as s:
+      s.getNextRecord()
+      s.getNextRecord()
+      bookmark = s.getBookmark()
+      self.assertTrue(s.recordsExistAfter(bookmark))
+
+      bookmark = s.seekFromEnd(1)
+      self.assertEqual(4, s.getNextRecordIdx())
+      self.assertEqual(self.expected[4], s.getNextRecord())
+      self.assertFalse(s.recordsExistAfter(s.getBookmark()))
+
+      s.setAutoRewind(True)
+      self.assertEqual(self.expected[0], s.getNextRecord())
+
+      s.seekFromEnd(2)
+      s = pickle.loads(pickle.dumps(s))
+      self.assertEqual(self.expected[3], s.getNextRecord())
+
+    with BinaryRecordStream(self.storePath, bookmark=bookmark) as s:
+      self.assertEqual(self.expected[4:], list(s))
+
+    with BinaryRecordStream(self.storePath, firstRecord=3) as s:
+      self.assertEqual(self.expected[3:], list(s))
+
+
+  def testColumns(self):
+    convertCsv(self.csvPath, self.storePath)
+
+    with BinaryRecordStream(self.storePath) as s:
+      integers = s.getColumn(2, 1, 4)
+      self.assertEqual(numpy.int64, integers.dtype)
+      self.assertFalse(integers.flags.writeable)
+      self.assertEqual([8, 12], integers[[0, 2]].tolist())
+      self.assertEqual([False, True, False], s.getMask(2, 1, 4).tolist())
+      self.assertIsNone(s.getMask(0))
+
+      self.assertEqual([0, 0, 1, 1, 2], s.getColumn(1).tolist())
+      self.assertEqual([3, 1, 2, 4, 5], s.getColumn(5, 1).tolist())
+
+      s.getNextRecord()
+      columns = s.getNextColumns(3)
+      self.assertEqual(numpy.dtype('datetime64[us]'), columns[0].dtype)
+      self.assertEqual(datetime(2010, 3, 3, 10, 30), columns[0][1].tolist())
+      self.assertEqual(['seq,1', 'seq_2', 'seq_2'], columns[1].tolist())
+      # Empty lists are missing values, as in FileRecordStream
+      self.assertEqual([[3], [1], None], columns[5].tolist())
+      self.assertEqual([False, False, True],
+                       numpy.ma.getmaskarray(columns[5]).tolist())
+      self.assertEqual([False, True, False],
+                       numpy.ma.getmaskarray(columns[2]).tolist())
+
+      self.assertEqual(self.expected[4], s.getNextRecord())
+      self.assertIsNone(s.getNextColumns(3))
+
+
+  def testEmptyCsv(self):
+    with FileRecordStream(self.csvPath) as s:
+      fields = s.getFields()
+
+    # FileRecordStream only writes the header with the first record
+    with open(self.csvPath, "w") as f:
+      for line in zip(*fields):
+        f.write(",".join(line) + "\n")
+
+    self.assertEqual(0, convertCsv(self.csvPath, self.storePath))
+    with BinaryRecordStream(self.storePath) as s:
+      self.assertEqual(fields, s.getFields())
+      self.assertIsNone(s.getNextRecord())
+      self.assertEqual(0, len(s.getColumn(5)))
+
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -19,10 +19,14 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
+import os
 import tempfile
 import unittest
 
 from datetime import datetime
+
+import numpy
+
 from nupic.data import SENTINEL_VALUE_FOR_MISSING_DATA
 from nupic.data.field_meta import FieldMetaInfo, FieldMetaType, FieldMetaSpecial
 from nupic.data.file_record_stream import FileRecordStream
@@ -286,6 +290,168 @@ class TestFileRecordStream(unittest.TestCase):
     o.close()
 
 
+  def testGetNextColumns(self):
+    filename = _getTempFileName()
+    fields = [FieldMetaInfo('timestamp', FieldMetaType.datetime,
+                            FieldMetaSpecial.timestamp),
+              FieldMetaInfo('name', FieldMetaType.string,
+                            FieldMetaSpecial.none),
+              FieldMetaInfo('integer', FieldMetaType.integer,
+                            FieldMetaSpecial.none),
+              FieldMetaInfo('real', FieldMetaType.float,
+                            FieldMetaSpecial.none),
+              FieldMetaInfo('flag', FieldMetaType.boolean,
+                            FieldMetaSpecial.none),
+              FieldMetaInfo('categories', FieldMetaType.list,
+                            FieldMetaSpecial.category)]
+    records = (
+      [datetime(2010, 3, 1), 'rec,1', 5, 6.5, True, [1, 2]],
+      [datetime(2010, 3, 2), '', 8, 7.5, False, [3]],
+      [datetime(2010, 3, 3, 10, 30), 'rec_3', '', 8.5, True, [1]],
+      [datetime(2010, 3, 4), 'rec_4', 12, '', False, []],
+      [datetime(2010, 3, 5), 'rec_5', -87657496599, 6.5, True, [2]])
+
+    with FileRecordStream(filename, write=True, fields=fields) as s:
+      for r in records:
+        s.appendRecord(list(r))
+
+    try:
+      with FileRecordStream(filename) as s:
+        expected = list(s)
+
+      with FileRecordStream(filename) as s:
+        self.assertEqual(expected[0], s.getNextRecord())
+        columns = s.getNextColumns(3)
+        self.assertEqual(4, s.getNextRecordIdx())
+
+        self.assertEqual(len(fields), len(columns))
+        self.assertEqual(numpy.dtype('datetime64[us]'), columns[0].dtype)
+        self.assertEqual(numpy.int64, columns[2].dtype)
+        self.assertEqual(numpy.float64, columns[3].dtype)
+        self.assertEqual(bool, columns[4].dtype)
+        self.assertEqual(datetime(2010, 3, 3, 10, 30), columns[0][1].tolist())
+        self.assertEqual([False, True, False],
+                         numpy.ma.getmaskarray(columns[2]).tolist())
+        self.assertEqual([False, False, True],
+                         numpy.ma.getmaskarray(columns[3]).tolist())
+        self.assertEqual(['', 'rec_3', 'rec_4'],
+                         columns[1].filled('').tolist())
+        self.assertEqual([[3], [1], None], columns[5].tolist())
+
+        self.assertEqual(expected[4], s.getNextRecord())
+        self.assertIsNone(s.getNextColumns(3))
+
+      with FileRecordStream(filename) as s:
+        self.assertEqual(expected, list(s.iterRecords(chunkSize=2)))
+    finally:
+      os.remove(filename)
+
+
+  def testSeek(self):
+    filename = _getTempFileName()
+    indexFilename = filename + FileRecordStream._INDEX_FILE_SUFFIX
+    fields = [FieldMetaInfo('name', FieldMetaType.string,
+                            FieldMetaSpecial.none),
+              FieldMetaInfo('integer', FieldMetaType.integer,
+                            FieldMetaSpecial.none)]
+    records = [['rec_%d' % i, i] for i in xrange(10)]
+
+    with FileRecordStream(filename, write=True, fields=fields) as s:
+      s.appendRecords(records)
+
+    try:
+      with FileRecordStream(filename) as s:
+        self.assertEqual(10, s.getDataRowCount())
+        bookmark = s.seekFromEnd(3)
+        self.assertEqual(7, s.getNextRecordIdx())
+        self.assertEqual(records[7:], list(s))
+        self.assertFalse(os.path.exists(indexFilename))
+
+        s.seekFromEnd(20)
+        self.assertEqual(records, list(s))
+
+      with FileRecordStream(filename, bookmark=bookmark) as s:
+        self.assertEqual(records[7:], list(s))
+
+      with FileRecordStream(filename, firstRecord=4) as s:
+        self.assertEqual(4, s.getNextRecordIdx())
+        self.assertEqual(records[4:], list(s))
+
+      with FileRecordStream(filename, firstRecord=12) as s:
+        self.assertEqual(10, s.getNextRecordIdx())
+        self.assertIsNone(s.getNextRecord())
+
+      # Large files keep their index in a sidecar file, rebuilt when they change
+      minSize = FileRecordStream._INDEX_FILE_MIN_SIZE
+      FileRecordStream._INDEX_FILE_MIN_SIZE = 0
+      try:
+        with FileRecordStream(filename, firstRecord=2) as s:
+          self.assertEqual(records[2], s.getNextRecord())
+        self.assertTrue(os.path.exists(indexFilename))
+        # The index is written to a temporary file that is then renamed
+        indexBasename = os.path.basename(indexFilename)
+        self.assertEqual(
+          [], [f for f in os.listdir(os.path.dirname(indexFilename))
+               if f.startswith(indexBasename + '.')])
+
+        with open(filename, 'a') as f:
+          f.write('rec_10,10\n')
+        os.utime(filename, (0, 0))
+
+        with FileRecordStream(filename, firstRecord=9) as s:
+          self.assertEqual(11, s.getDataRowCount())
+          self.assertEqual([records[9], ['rec_10', 10]], list(s))
+      finally:
+        FileRecordStream._INDEX_FILE_MIN_SIZE = minSize
+    finally:
+      os.remove(filename)
+      if os.path.exists(indexFilename):
+        os.remove(indexFilename)
+
+
+  def testSeekQuotedLineBreaks(self):
+    filename = _getTempFileName()
+    indexFilename = filename + FileRecordStream._INDEX_FILE_SUFFIX
+    records = [['n%d' % i, i + 1] for i in xrange(10)]
+    records[3][0] = 'multi\nline 3'
+    records[7][0] = 'quoted "7",\n\nend'
+
+    # The writer escapes line breaks, but other csv files may quote them
+    with open(filename, 'w') as f:
+      f.write('name,integer\nstring,int\n,\n')
+      for name, integer in records:
+        f.write('"%s",%d\n' % (name.replace('"', '""'), integer))
+
+    minSize = FileRecordStream._INDEX_FILE_MIN_SIZE
+    try:
+      # With the index in memory and in a sidecar file
+      for indexFileMinSize in (minSize, 0):
+        FileRecordStream._INDEX_FILE_MIN_SIZE = indexFileMinSize
+
+        with FileRecordStream(filename) as s:
+          self.assertEqual(10, s.getDataRowCount())
+          self.assertEqual(records, list(s))
+          s.seekFromEnd(3)
+          self.assertEqual(7, s.getNextRecordIdx())
+          self.assertEqual(records[7:], list(s))
+
+        for firstRecord in xrange(11):
+          with FileRecordStream(filename, firstRecord=firstRecord) as s:
+            self.assertEqual(records[firstRecord:], list(s))
+
+        with FileRecordStream(filename) as s:
+          for _ in xrange(5):
+            s.getNextRecord()
+          bookmark = s.getBookmark()
+        with FileRecordStream(filename, bookmark=bookmark) as s:
+          self.assertEqual(records[5:], list(s))
+    finally:
+      FileRecordStream._INDEX_FILE_MIN_SIZE = minSize
+      os.remove(filename)
+      if os.path.exists(indexFilename):
+        os.remove(indexFilename)
+
+
   def testMissingValues(self):
 
     print "Beginning Missing Data test..."
@@ -0,0 +1,140 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""Unit tests for sorter module."""
+
+import os
+import random
+import shutil
+import tempfile
+import unittest2 as unittest
+import warnings
+
+from nupic.data import sorter
+from nupic.data.file_record_stream import FileRecordStream
+
+
+
+class SorterTest(unittest.TestCase):
+
+
+  def setUp(self):
+    self.tmpDir = tempfile.mkdtemp()
+    self.inputFile = os.path.join(self.tmpDir, 'input.csv')
+    self.outputFile = os.path.join(self.tmpDir, 'output.csv')
+
+    self.fields = [('f1', 'int', ''), ('f2', 'float', ''),
+                   ('name', 'string', '')]
+    rng = random.Random(42)
+    self.records = [[rng.randint(0, 5), rng.choice([0.5, 1.5, None]),
+                     'rec_%d' % i] for i in xrange(100)]
+    with FileRecordStream(self.inputFile, write=True, fields=self.fields) as o:
+      o.appendRecords(self.records)
+
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpDir)
+
+
+  def _readOutput(self):
+    with FileRecordStream(self.outputFile) as f:
+      return list(f)
+
+
+  def testSort(self):
+    # The sort is stable
+    expected = sorted(self.records, key=lambda r: (r[1], r[0]))
+
+    for maxChunkRecords in (1000, 7):
+      for numWorkers in (1, 3):
+        sorter.sort(self.inputFile, key=['f2', 'f1'],
+                    outputFile=self.outputFile,
+                    maxChunkRecords=maxChunkRecords, numWorkers=numWorkers,
+                    tempDir=self.tmpDir)
+        self.assertEqual(expected, self._readOutput())
+        # The chunk files are removed
+        self.assertEqual(['input.csv', 'output.csv'],
+                         sorted(f for f in os.listdir(self.tmpDir)
+                                if not f.endswith('.npy')))
+
+
+  def testSortFieldsSubsetInSeveralMergePasses(self):
+    maxMergeFiles = sorter._MAX_MERGE_FILES
+    sorter._MAX_MERGE_FILES = 3
+    try:
+      sorter.sort(self.inputFile, key=['f1'], outputFile=self.outputFile,
+                  fields=[('name', 'string', ''), ('f1', 'int', '')],
+                  maxChunkRecords=4)
+    finally:
+      sorter._MAX_MERGE_FILES = maxMergeFiles
+
+    expected = sorted(([r[2], r[0]] for r in self.records),
+                      key=lambda r: r[1])
+    self.assertEqual(expected, self._readOutput())
+
+
+  def testMaxChunkBytes(self):
+    recordSize = os.path.getsize(self.inputFile) / 103.0
+    sorter.sort(self.inputFile, key=['name'], outputFile=self.outputFile,
+                maxChunkBytes=int(10 * recordSize))
+    self.assertEqual(sorted(self.records, key=lambda r: r[2]),
+                     self._readOutput())
+
+
+  def testSortQuotedLineBreaks(self):
+    records = [[i % 4, 'n%d' % i] for i in xrange(10)]
+    records[3][1] = 'multi\nline 3'
+    records[7][1] = 'multi\n\nline 7'
+    # The writer escapes line breaks, but other csv files may quote them
+    with open(self.inputFile, 'w') as f:
+      f.write('f1,name\nint,string\n,\n')
+      for f1, name in records:
+        f.write('%d,"%s"\n' % (f1, name))
+
+    expected = sorted(records, key=lambda r: r[0])
+    for numWorkers in (1, 3):
+      sorter.sort(self.inputFile, key=['f1'], outputFile=self.outputFile,
+                  maxChunkRecords=3, numWorkers=numWorkers)
+      output = self._readOutput()
+      self.assertEqual(len(records), len(output))
+      self.assertEqual(expected, output)
+
+
+  def testWatermarkIsDeprecated(self):
+    expected = sorted(self.records, key=lambda r: r[0])
+
+    with warnings.catch_warnings(record=True) as caught:
+      warnings.simplefilter('always')
+      sorter.sort(self.inputFile, key=['f1'], outputFile=self.outputFile,
+                  watermark=1024 * 1024 * 100)
+      self.assertEqual(expected, self._readOutput())
+      sorter.sort(self.inputFile, ['f1'], self.outputFile, None,
+                  1024 * 1024 * 100)
+      self.assertEqual(expected, self._readOutput())
+
+    watermarkWarnings = [w for w in caught if 'watermark' in str(w.message)]
+    self.assertEqual([DeprecationWarning, DeprecationWarning],
+                     [w.category for w in watermarkWarnings])
+
+
+
+if __name__ == '__main__':
+  unittest.main()
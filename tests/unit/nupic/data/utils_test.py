@@ -45,6 +45,22 @@ class UtilsTest(TestCaseBase):
     for timestamp, dt in expectedResults:
       self.assertEqual(utils.parseTimestamp(timestamp), dt)
 
+  def testParseTimestamps(self):
+    timestamps = ['2011-09-08T05:30:32', '2011-09-08 05:30:32.920000',
+                  ' 2011-09-08 05:30 ', '2011-09-08']
+    self.assertEqual(utils.parseTimestamps(timestamps).tolist(),
+                     [utils.parseTimestamp(t) for t in timestamps])
+
+    # Formats numpy doesn't parse like parseTimestamp
+    timestamps = ['2011-09-08 5:30:32:92', '2011-09-08T05:30:32Z',
+                  '2011-09-08 05:30:32.920000']
+    self.assertEqual(utils.parseTimestamps(timestamps).tolist(),
+                     [utils.parseTimestamp(t) for t in timestamps])
+
+    for timestamp in ('2011', 'today', '2011-02-30', ''):
+      with self.assertRaises(ValueError):
+        utils.parseTimestamps(['2011-09-08', timestamp])
+
   def testSerializeTimestamp(self):
     self.assertEqual(
         utils.serializeTimestamp(datetime(2011, 9, 8, 5, 30, 32, 920000)),
@@ -210,6 +210,22 @@ class AdaptiveScalarTest(unittest.TestCase):
                       "should be equivalent to initialization."))
 
 
+  def testEncodingCache(self):
+    """Cached encodings are dropped when the range changes"""
+    cached = AdaptiveScalarEncoder(name="scalar", n=14, w=5, minval=1,
+                                   maxval=10, periodic=False, forced=True)
+    cached.setCacheSize(10)
+
+    for value in (5, 5, 8, 20, 5, 8, -10, 5):
+      self.assertTrue(numpy.array_equal(cached.encode(value),
+                                        self._l.encode(value)))
+      self.assertEqual((cached.minval, cached.maxval),
+                       (self._l.minval, self._l.maxval))
+    self.assertEqual(cached.recordNum, self._l.recordNum)
+    self.assertEqual({"hits": 1, "misses": 7, "size": 2},
+                     cached.getCacheStats())
+
+
   @unittest.skipUnless(
       capnp, "pycapnp is not installed, skipping serialization test.")
   def testReadWrite(self):
@@ -208,6 +208,16 @@ class CategoryEncoderTest(unittest.TestCase):
 
 
 
+  def testEncodeIntoIndices(self):
+    """The active indices are the non-zero bits of the dense encoding"""
+    e = CategoryEncoder(w=3, categoryList=["ES", "GB", "US"], forced=True)
+    for v in ("ES", "GB", "US", "NA", SENTINEL_VALUE_FOR_MISSING_DATA):
+      expected = e.encode(v).nonzero()[0]
+      self.assertEqual(expected.tolist(), e.encodeIntoIndices(v).tolist())
+      self.assertEqual((expected + 5).tolist(),
+                       e.encodeIntoIndices(v, 5).tolist())
+
+
   @unittest.skipUnless(
       capnp, "pycapnp is not installed, skipping serialization test.")
   def testReadWrite(self):
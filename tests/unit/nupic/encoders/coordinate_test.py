@@ -181,6 +181,55 @@ class CoordinateEncoderTest(unittest.TestCase):
       encoder.encode((coordinate, float(radius)))
 
 
+  def testCachedHashing(self):
+    encoder = CoordinateEncoder(name="coordinate", n=999, w=21,
+                                coordinateCacheSize=50)
+    uncached = CoordinateEncoder(name="coordinate", n=999, w=21,
+                                 coordinateCacheSize=0)
+
+    for x in xrange(10):
+      coordinate = np.array([100 + x, 200])
+      winners = CoordinateEncoder._topWCoordinates(
+        CoordinateEncoder._neighbors(coordinate, 3), 21)
+      expected = np.unique([CoordinateEncoder._bitForCoordinate(c, 999)
+                            for c in winners])
+
+      self.assertTrue(np.array_equal(
+        encoder._activeBitsForCoordinate(coordinate, 3), expected))
+      self.assertTrue(np.array_equal(
+        uncached._activeBitsForCoordinate(coordinate, 3), expected))
+      self.assertLessEqual(len(encoder._coordinateCache), 50)
+
+    self.assertEqual(len(uncached._coordinateCache), 0)
+
+
+  def testFastHashing(self):
+    encoder = CoordinateEncoder(name="coordinate", n=999, w=21,
+                                hashing="fast")
+
+    coordinate = np.array([100, 200])
+    output1 = encode(encoder, coordinate, 5)
+    # At most w bits, fewer on chance hash collisions
+    self.assertLessEqual(np.sum(output1), 21)
+    self.assertGreater(np.sum(output1), 18)
+    self.assertTrue(np.array_equal(encode(encoder, coordinate, 5), output1))
+
+    orders, bits = CoordinateEncoder._fastOrdersAndBits(
+      np.array([[100, 200], [-100, 200], [200, 100]]), 999)
+    self.assertEqual(len(set(orders.tolist())), 3)
+    self.assertTrue(((orders >= 0) & (orders < 1)).all())
+    self.assertTrue(((bits >= 0) & (bits < 999)).all())
+
+    # Nearby coordinates still share most of their bits
+    output2 = encode(encoder, np.array([101, 200]), 5)
+    self.assertGreater(overlap(output1, output2), 0.7)
+    output3 = encode(encoder, np.array([1000, 2000]), 5)
+    self.assertLess(overlap(output1, output3), 0.2)
+
+    with self.assertRaises(ValueError):
+      CoordinateEncoder(n=999, w=21, hashing="sha1")
+
+
   def testEncodeSaturateArea(self):
     n = 1999
     w = 25
@@ -305,6 +354,7 @@ class CoordinateEncoderTest(unittest.TestCase):
     self.assertEqual(encoder.n, self.encoder.n)
     self.assertEqual(encoder.name, self.encoder.name)
     self.assertEqual(encoder.verbosity, self.encoder.verbosity)
+    self.assertEqual(encoder.hashing, self.encoder.hashing)
 
     coordinate = np.array([100, 200])
     radius = 5
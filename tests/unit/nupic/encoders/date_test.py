@@ -197,6 +197,25 @@ class DateEncoderTest(unittest.TestCase):
         self.assertNotEqual(d.weekday(), 0)
 
 
+  def testEncodeBatch(self):
+    """Batch encodings are the same as the encodings of each date"""
+    e = DateEncoder(season=5, dayOfWeek=5, weekend=5, timeOfDay=5,
+                    customDays=(5, ["Monday", "fri"]), holiday=5,
+                    holidays=[(1, 1), (12, 25), (2018, 4, 1)])
+    start = datetime.datetime(2016, 12, 23, 17, 45, 30, 250)
+    dates = [start + datetime.timedelta(minutes=97 * i) for i in xrange(700)]
+    dates += [datetime.datetime(2017, 12, 31, 12),
+              datetime.datetime(2018, 1, 1),
+              datetime.datetime(2018, 4, 2, 23, 59),
+              SENTINEL_VALUE_FOR_MISSING_DATA]
+    expected = numpy.array([e.encode(d) for d in dates])
+
+    self.assertTrue(numpy.array_equal(e.encodeBatch(dates), expected))
+    self.assertTrue(numpy.array_equal(
+      e.encodeBatch(numpy.array(dates, dtype="datetime64[us]")), expected))
+    self.assertFalse(expected[-1].any())
+
+
   @unittest.skipUnless(
       capnp, "pycapnp is not installed, skipping serialization test.")
   def testReadWrite(self):
@@ -25,6 +25,7 @@ import numpy as np
 import tempfile
 import unittest
 
+from nupic.data import SENTINEL_VALUE_FOR_MISSING_DATA
 from nupic.encoders.delta import (DeltaEncoder,
                                   AdaptiveScalarEncoder)
 
@@ -110,6 +111,33 @@ class DeltaEncoderTest(unittest.TestCase):
                 "with scalar encoder.")
 
 
+  def testEncodeIntoIndices(self):
+    """The active indices are the non-zero bits of the dense encoding, and the
+    previous value is updated the same way"""
+    sparse = DeltaEncoder(w=21, n=100, forced=True)
+    feedIn = [1, 10, 4, 7, 9, 6, 3, 1]
+    for i, v in enumerate(feedIn):
+      if i == 5:
+        self._dencoder.setStateLock(True)
+        sparse.setStateLock(True)
+      expected = self._dencoder.encode(v).nonzero()[0]
+      self.assertEqual(expected.tolist(),
+                       sparse.encodeIntoIndices(v).tolist())
+      self.assertEqual(self._dencoder._prevAbsolute, sparse._prevAbsolute)
+      self.assertEqual(self._dencoder._prevDelta, sparse._prevDelta)
+
+    expected = self._dencoder.encode(5).nonzero()[0]
+    self.assertEqual((expected + 5).tolist(),
+                     sparse.encodeIntoIndices(5, 5).tolist())
+
+    # Missing values are rejected by both paths, without changing the state
+    with self.assertRaises(TypeError):
+      self._dencoder.encode(SENTINEL_VALUE_FOR_MISSING_DATA)
+    with self.assertRaises(TypeError):
+      sparse.encodeIntoIndices(SENTINEL_VALUE_FOR_MISSING_DATA)
+    self.assertEqual(self._dencoder._prevAbsolute, sparse._prevAbsolute)
+
+
   @unittest.skipUnless(
       capnp, "pycapnp is not installed, skipping serialization test.")
   def testReadWrite(self):
@@ -160,13 +160,45 @@ class GeospatialCoordinateEncoderTest(unittest.TestCase):
     self.assertGreater(overlap1, overlap2)
 
 
+  def testEncodeIntoArrayFastHashing(self):
+    scale = 30  # meters
+    timestep = 60  #seconds
+    speed = 2.5  # meters per second
+    encoder = GeospatialCoordinateEncoder(scale, timestep,
+                                          n=999,
+                                          w=25,
+                                          hashing="fast")
+    encoding1 = encode(encoder, speed, -122.229194, 37.486782)
+    encoding2 = encode(encoder, speed, -122.229294, 37.486882)
+    encoding3 = encode(encoder, speed, -122.229294, 37.486982)
+
+    self.assertLessEqual(encoding1.sum(), 25)
+    self.assertGreater(overlap(encoding1, encoding2),
+                       overlap(encoding1, encoding3))
+
+
+  def testEncodeIntoIndices(self):
+    """The active indices are the non-zero bits of the dense encoding"""
+    encoder = GeospatialCoordinateEncoder(30, 60, n=999, w=25)
+    for inputData in ((2.5, -122.229194, 37.486782),
+                      (0, -122.229294, 37.486882),
+                      (25, -122.229294, 37.486982, 1000),
+                      (2.5, 0, 0, None)):
+      expected = encoder.encode(inputData).nonzero()[0]
+      self.assertEqual(expected.tolist(),
+                       encoder.encodeIntoIndices(inputData).tolist())
+      self.assertEqual((expected + 5).tolist(),
+                       encoder.encodeIntoIndices(inputData, 5).tolist())
+
+
   @unittest.skipUnless(
       capnp, "pycapnp is not installed, skipping serialization test.")
   def testReadWrite(self):
     scale = 30 # meters
     timestep = 60 # seconds
     speed = 2.5 # meters per second
-    original = GeospatialCoordinateEncoder(scale, timestep, n=999, w=25)
+    original = GeospatialCoordinateEncoder(scale, timestep, n=999, w=25,
+                                           hashing="fast")
     encode(original, speed, -122.229194, 37.486782, 0)
     encode(original, speed, -122.229294, 37.486882, 100)
 
@@ -186,6 +218,7 @@ class GeospatialCoordinateEncoderTest(unittest.TestCase):
     self.assertEqual(encoder.n, original.n)
     self.assertEqual(encoder.name, original.name)
     self.assertEqual(encoder.verbosity, original.verbosity)
+    self.assertEqual(encoder.hashing, original.hashing)
 
     # Compare a new value with the original and deserialized.
     encoding3 = encode(original, speed, -122.229294, 37.486982, 1000)
@@ -274,6 +274,18 @@ class LogEncoderTest(unittest.TestCase):
     self.assertAlmostEqual(le.encoder.resolution, expectedResolution)
 
 
+  def testEncodeIntoIndices(self):
+    """The active indices are the non-zero bits of the dense encoding"""
+    le = LogEncoder(w=5, resolution=0.1, minval=1, maxval=10000, name="amount",
+                    forced=True)
+    for v in (None, SENTINEL_VALUE_FOR_MISSING_DATA, 0, 1, 2.5, 100, 10000,
+              20000):
+      expected = le.encode(v).nonzero()[0]
+      self.assertEqual(expected.tolist(), le.encodeIntoIndices(v).tolist())
+      self.assertEqual((expected + 5).tolist(),
+                       le.encodeIntoIndices(v, 5).tolist())
+
+
   @unittest.skipUnless(
       capnp, "pycapnp is not installed, skipping serialization test.")
   def testReadWrite(self):
@@ -21,6 +21,7 @@
 
 """Unit tests for multi- encoder"""
 
+import datetime
 import numpy
 import tempfile
 import unittest2 as unittest
@@ -90,6 +91,74 @@ class MultiEncoderTest(unittest.TestCase):
     self.assertEqual(topDownOut[2].encoding.sum(), 3)
 
 
+  def testEncodeIntoIndices(self):
+    """The active indices are the non-zero bits of the dense encoding"""
+    def _encoder():
+      return MultiEncoder({
+        "date": dict(fieldname="date", type="DateEncoder", timeOfDay=(5, 1),
+                     weekend=5, forced=True),
+        "value": dict(fieldname="value", type="AdaptiveScalarEncoder", n=50,
+                      w=5, forced=True),
+        "category": dict(fieldname="category", type="SDRCategoryEncoder",
+                         n=50, w=5, forced=True),
+        "position": dict(fieldname="position", type="CoordinateEncoder",
+                         n=100, w=5)})
+
+    dense = _encoder()
+    sparse = _encoder()
+    rng = numpy.random.RandomState(42)
+    start = datetime.datetime(2017, 3, 1)
+    for i in xrange(100):
+      value = {"date": start + datetime.timedelta(hours=5 * i),
+               "value": rng.normal(10, 5) if i % 10 else None,
+               "category": rng.choice(["a", "b", "c", None]),
+               "position": (rng.randint(-10, 10, 2), rng.randint(1, 3))}
+      expected = dense.encode(value).nonzero()[0]
+      self.assertEqual(expected.tolist(),
+                       sparse.encodeIntoIndices(value).tolist())
+
+
+  def testEncodingCache(self):
+    """Cached encodings are the same as the computed ones"""
+    def _encoder():
+      e = MultiEncoder()
+      e.addEncoder("dow",
+                   ScalarEncoder(w=3, resolution=1, minval=1, maxval=8,
+                                 periodic=True, name="day of week",
+                                 forced=True))
+      e.addEncoder("myval",
+                   AdaptiveScalarEncoder(n=50, w=5, name="aux", forced=True))
+      e.addEncoder("category",
+                   SDRCategoryEncoder(n=50, w=5, name="category",
+                                      forced=True))
+      return e
+
+    cached = _encoder()
+    cached.setCacheSize(4)
+    uncached = _encoder()
+
+    rng = numpy.random.RandomState(42)
+    output = numpy.zeros(cached.getWidth(), dtype="uint8")
+    for i in xrange(200):
+      if i == 100:
+        cached.setLearning(False)
+        uncached.setLearning(False)
+      value = DictObj(dow=rng.randint(1, 8), myval=rng.randint(0, 5) * (i / 20),
+                      category=rng.choice(["a", "b", "c", None]))
+      cached.encodeIntoArray(value, output)
+      self.assertTrue(numpy.array_equal(output, uncached.encode(value)))
+      self.assertTrue(numpy.array_equal(cached.encodeField("dow", value.dow),
+                                        uncached.encodeField("dow", value.dow)))
+
+    stats = cached.getCacheStats()
+    self.assertEqual(200 * 4, stats["hits"] + stats["misses"])
+    self.assertGreater(stats["hits"], 500)
+    self.assertLessEqual(stats["size"], 3 * 4)
+
+    cached.clearCache()
+    self.assertEqual(0, cached.getCacheStats()["size"])
+
+
 
   @unittest.skipUnless(
       capnp, "pycapnp is not installed, skipping serialization test.")
@@ -126,6 +126,23 @@ class PassThroughEncoderTest(unittest.TestCase):
     self.assertEqual(c[0], 0.8)
 
 
+  def testEncodeIntoIndices(self):
+    """The active indices are the non-zero bits of the dense encoding"""
+    e = self._encoder(self.n, name=self.name)
+    for bitmap in ([0,0,0,1,0,0,0,0,0],
+                   [1,0,0,1,0,1,0,0,1],
+                   numpy.array([0,1,1,0,0,0,0,0,1], dtype=numpy.uint8),
+                   [0]*self.n):
+      expected = e.encode(bitmap).nonzero()[0]
+      self.assertEqual(expected.tolist(), e.encodeIntoIndices(bitmap).tolist())
+      self.assertEqual((expected + 5).tolist(),
+                       e.encodeIntoIndices(bitmap, 5).tolist())
+
+    e = self._encoder(self.n, 2, name=self.name)
+    with self.assertRaises(ValueError):
+      e.encodeIntoIndices([0,0,0,1,0,0,0,0,0])
+
+
   @unittest.skipUnless(
       capnp, "pycapnp is not installed, skipping serialization test.")
   def testReadWrite(self):
@@ -454,6 +454,19 @@ class RandomDistributedScalarEncoderTest(unittest.TestCase):
       encoder.encode("String")
 
 
+  def testEncodeIntoIndices(self):
+    """The active indices are the non-zero bits of the dense encoding"""
+    encoder = RandomDistributedScalarEncoder(name="encoder", resolution=1.0,
+                                             w=23, n=500)
+    for v in (None, float("nan"), SENTINEL_VALUE_FOR_MISSING_DATA, 0, 1.0,
+              7.3, -50, 250):
+      expected = encoder.encode(v).nonzero()[0]
+      self.assertEqual(expected.tolist(),
+                       encoder.encodeIntoIndices(v).tolist())
+      self.assertEqual((expected + 5).tolist(),
+                       encoder.encodeIntoIndices(v, 5).tolist())
+
+
   @unittest.skipUnless(
       capnp, "pycapnp is not installed, skipping serialization test.")
   def testWriteRead(self):
@@ -379,6 +379,24 @@ class ScalarEncoderTest(unittest.TestCase):
       encoder.encode("String")
 
 
+  def testEncodeIntoIndices(self):
+    """The active indices are the non-zero bits of the dense encoding"""
+    nonPeriodic = ScalarEncoder(name="enc", n=14, w=3, minval=1, maxval=8,
+                                periodic=False, forced=True)
+    for encoder in (self._l, nonPeriodic):
+      for v in (None, float("nan"), 1, 1.5, 4.7, 7.9):
+        expected = encoder.encode(v).nonzero()[0]
+        self.assertEqual(expected.tolist(),
+                         encoder.encodeIntoIndices(v).tolist())
+        self.assertEqual((expected + 5).tolist(),
+                         encoder.encodeIntoIndices(v, 5).tolist())
+
+    # Periodic encodings wrap around
+    self.assertEqual([0, 1, 13], self._l.encodeIntoIndices(1).tolist())
+    with self.assertRaises(TypeError):
+      nonPeriodic.encodeIntoIndices("String")
+
+
   def testGetBucketInfoIntResolution(self):
     """Ensures that passing resolution as an int doesn't truncate values."""
     encoder = ScalarEncoder(w=3, resolution=1, minval=1, maxval=8,
@@ -133,6 +133,23 @@ class SparsePassThroughEncoderTest(unittest.TestCase):
     self.assertEqual(c[0], 0.8)
 
 
+  def testEncodeIntoIndices(self):
+    """The active indices are the non-zero bits of the dense encoding"""
+    e = self._encoder(self.n, name=self.name)
+    for bitmap in ([2,7,15,18,23],
+                   [23,2,18],
+                   numpy.array([0,24], dtype=numpy.int32),
+                   []):
+      expected = e.encode(bitmap).nonzero()[0]
+      self.assertEqual(expected.tolist(), e.encodeIntoIndices(bitmap).tolist())
+      self.assertEqual((expected + 5).tolist(),
+                       e.encodeIntoIndices(bitmap, 5).tolist())
+
+    e = self._encoder(self.n, 3, name=self.name)
+    with self.assertRaises(ValueError):
+      e.encodeIntoIndices([2])
+
+
   @unittest.skipUnless(
       capnp, "pycapnp is not installed, skipping serialization test.")
   def testReadWrite(self):
@@ -23,10 +23,13 @@
 
 import unittest
 
+import numpy
+
 from nupic.math.topology import (coordinatesFromIndex,
                                  indexFromCoordinates,
                                  neighborhood,
-                                 wrappingNeighborhood)
+                                 wrappingNeighborhood,
+                                 NeighborhoodCache)
 
 class TestTopology(unittest.TestCase):
 
@@ -340,3 +343,39 @@ class TestTopology(unittest.TestCase):
       dimensions = (10, 1, 1),
       radius = 1,
       expected = ((4, 0, 0), (5, 0, 0), (6, 0, 0)))
+
+
+  # ===========================================================================
+  # NEIGHBORHOOD CACHE
+  # ===========================================================================
+
+  def testNeighborhoodCacheMatchesNeighborhoods(self):
+    cache = NeighborhoodCache()
+
+    for dimensions in ((7,), (5, 6), (3, 1, 4)):
+      numPoints = numpy.prod(dimensions)
+      for radius in (0, 1, 2, 5):
+        for centerIndex in xrange(numPoints):
+          numpy.testing.assert_array_equal(
+            neighborhood(centerIndex, radius, dimensions),
+            cache.neighborhood(centerIndex, radius, dimensions))
+          numpy.testing.assert_array_equal(
+            wrappingNeighborhood(centerIndex, radius, dimensions),
+            cache.neighborhood(centerIndex, radius, dimensions,
+                               wrapAround=True))
+
+
+  def testNeighborhoodCacheIsReadOnly(self):
+    cache = NeighborhoodCache()
+    points = cache.neighborhood(5, 1, (10,))
+
+    with self.assertRaises(ValueError):
+      points[0] = 0
+
+
+  def testNeighborhoodCacheTooLarge(self):
+    cache = NeighborhoodCache(maxSize=10)
+
+    numpy.testing.assert_array_equal(
+      wrappingNeighborhood(0, 1, (100, 80)),
+      cache.neighborhood(0, 1, (100, 80), wrapAround=True))